@@ -0,0 +1,593 @@
+"""
+MIFARE Classic Tool - ACR1252U Edition
+Headless command-line interface: python -m cli <command>
+
+Built on the core package only, so it starts without Qt or a display.
+Results are printed to stdout as JSON; logging goes to stderr.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config.constants import (
+    AppSettings, APDUCommands, DEFAULT_KEY, DEFAULT_KEYS, KEY_TYPE_A, KEY_TYPE_B, MIFARE_1K_SECTORS,
+    MIFARE_BLOCK_SIZE
+)
+from core.authentication import AuthenticationManager
+from core.card_operations import CardOperations
+from core.data_utils import get_block_sector
+from core.key_cache import KeyCache, TAG_KEY_TYPES
+from core.key_diversification import DIVERSIFIERS, KeyMap
+from core.reader_manager import ReaderManager
+from core.reader_service import key_map_from_dict, key_map_to_dict
+
+logger = logging.getLogger("cli")
+
+EXIT_OK = 0
+EXIT_FAILED = 1  # the card operation did not succeed
+EXIT_NO_READER = 3
+EXIT_NO_CARD = 4
+
+VAULT_PASSPHRASE_ENV = "MCT_VAULT_PASSPHRASE"
+BRIDGE_TOKEN_ENV = "MCT_BRIDGE_TOKEN"
+
+class CliError(Exception):
+    """Raised to end a command with a message and exit code"""
+
+    def __init__(self, message: str, exit_code: int = EXIT_FAILED):
+        super().__init__(message)
+        self.exit_code = exit_code
+
+def parse_sectors(spec: Optional[str]) -> Optional[List[int]]:
+    """Parse a sector list such as "0-3,8" (None for all sectors)"""
+    if not spec:
+        return None
+    sectors = set()
+    try:
+        for part in spec.split(","):
+            first, _, last = part.strip().partition("-")
+            sectors.update(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid sector list: {spec}")
+    return sorted(sectors)
+
+def parse_positive(text: str) -> int:
+    """Parse a count of at least 1"""
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"Must be a whole number of at least 1: {text}")
+    return value
+
+def parse_key(text: str) -> bytes:
+    """Parse a 6-byte hex key"""
+    text = text.replace(" ", "").replace(":", "")
+    try:
+        key = bytes.fromhex(text)
+    except ValueError:
+        key = b""
+    if len(key) != 6:
+        raise argparse.ArgumentTypeError(f"Key must be 12 hex characters: {text}")
+    return key
+
+def parse_key_type(text: str) -> int:
+    """Parse key type A or B"""
+    key_type = TAG_KEY_TYPES.get(text.upper())
+    if key_type is None:
+        raise argparse.ArgumentTypeError(f"Key type must be A or B: {text}")
+    return key_type
+
+def load_key_map(path: Path) -> KeyMap:
+    """Load keys from a key map JSON file ({"sector": {"A": key}}) or from a dump file"""
+    from core.dump_formats import DumpFormatError, load_image
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict) and data and all(str(sector).isdigit() for sector in data):
+            return key_map_from_dict(data)
+    except (UnicodeDecodeError, ValueError):
+        pass
+    except KeyError as e:
+        raise CliError(f"Invalid key type in {path}: {e}")
+    try:
+        return load_image(path).key_map
+    except (DumpFormatError, ValueError) as e:
+        raise CliError(f"No key map in {path}: {e}")
+
+def build_key_map(args, sectors: List[int]) -> KeyMap:
+    """Combine --key and --keys into a key map for sectors"""
+    key_map: KeyMap = {}
+    if args.key is not None:
+        for sector in sectors:
+            key_map[sector] = {args.key_type: args.key}
+    if getattr(args, "keys", None):
+        for sector, keys in load_key_map(args.keys).items():
+            key_map.setdefault(sector, {}).update(keys)
+    return key_map
+
+def output(result) -> None:
+    """Print a command result as JSON"""
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+
+class Session:
+    """Reader, card operations and authentication for one command"""
+
+    def __init__(self, args):
+        self.started = time.perf_counter()
+        self.reader_manager = ReaderManager()
+        if args.remote:
+            host, _, port = args.remote.partition(":")
+            connected = self.reader_manager.connect_remote(host, int(port or AppSettings.BRIDGE_PORT),
+                                                           monitor=False, token=bridge_token())
+        else:
+            connected = self.reader_manager.connect(args.reader, monitor=False)
+        if not connected:
+            raise CliError("Reader not available", EXIT_NO_READER)
+        self.connect_ms = round((time.perf_counter() - self.started) * 1000, 3)
+
+        self.card_operations = CardOperations(self.reader_manager)
+        key_cache = None if args.no_cache else KeyCache()
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations, key_cache)
+
+    def wait_for_card(self, timeout: float) -> bytes:
+        """Detect the card in the field, polling up to timeout seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            uid = self.reader_manager.poll_card_uid()
+            if uid is not None:
+                self.card_operations.set_detected_card(uid)
+                return uid
+            if time.monotonic() >= deadline:
+                raise CliError("No card in the field", EXIT_NO_CARD)
+            time.sleep(AppSettings.PRODUCTION_POLL_INTERVAL / 1000.0)
+
+    def sector_count(self) -> int:
+        """Get number of sectors of the card in the field"""
+        return self.card_operations.card_info.get_sector_count()
+
+    def close(self) -> None:
+        """Release the reader"""
+        if self.auth_manager.key_cache:
+            self.auth_manager.key_cache.save()
+        self.reader_manager.disconnect()
+
+# Commands
+
+def cmd_detect(session: Session, args) -> int:
+    """Report reader and card"""
+    uid = session.wait_for_card(args.wait)
+    card_info = session.card_operations.card_info
+    atr = session.reader_manager.get_atr()
+    output({
+        "reader": session.reader_manager.get_reader_info(),
+        "uid": uid.hex().upper(),
+        "card_type": card_info.get_card_type_name(),
+        "sectors": card_info.get_sector_count(),
+        "atr": atr.hex().upper() if atr is not None else None,
+        "timings": {"connect_ms": session.connect_ms,
+                    "first_card_ms": round((time.perf_counter() - session.started) * 1000, 3)}
+    })
+    return EXIT_OK
+
+def cmd_read(session: Session, args) -> int:
+    """Read blocks, one authentication batch per sector"""
+    uid = session.wait_for_card(args.wait)
+    blocks = sorted(set(args.block))
+    by_sector: Dict[int, List[int]] = {}
+    for block in blocks:
+        by_sector.setdefault(get_block_sector(block), []).append(block)
+
+    data, failed = {}, []
+    for sector, sector_blocks in sorted(by_sector.items()):
+        commands = [APDUCommands.READ_BINARY + [block, MIFARE_BLOCK_SIZE] for block in sector_blocks]
+        results = session.auth_manager.authenticate_and_send(sector, args.key_type, args.key, commands) or []
+        for block, (response, sw1, sw2) in zip(sector_blocks, results):
+            if sw1 == 0x90 and sw2 == 0x00:
+                data[str(block)] = bytes(response).hex().upper()
+        failed.extend(block for block in sector_blocks if str(block) not in data)
+
+    output({"uid": uid.hex().upper(), "blocks": data, "failed_blocks": failed})
+    return EXIT_FAILED if failed else EXIT_OK
+
+def cmd_write(session: Session, args) -> int:
+    """Write one block"""
+    try:
+        data = bytes.fromhex(args.data)
+    except ValueError:
+        raise CliError(f"Data is not hex: {args.data}")
+    if len(data) != MIFARE_BLOCK_SIZE:
+        raise CliError(f"Data must be {MIFARE_BLOCK_SIZE} bytes")
+
+    uid = session.wait_for_card(args.wait)
+    sector = get_block_sector(args.block)
+    if not session.auth_manager.authenticate_sector(sector, args.key_type, args.key):
+        raise CliError(f"Authentication failed for sector {sector}")
+    written = session.card_operations.write_block(args.block, data)
+    output({"uid": uid.hex().upper(), "block": args.block, "written": written})
+    return EXIT_OK if written else EXIT_FAILED
+
+def cmd_dump(session: Session, args) -> int:
+    """Read the card into an image, printed or saved as a dump file"""
+    from core.dump import DumpEngine
+    from core.dump_formats import DumpFormatError, save_image
+
+    uid = session.wait_for_card(args.wait)
+    sectors = args.sectors or list(range(session.sector_count()))
+    engine = DumpEngine(session.card_operations, session.auth_manager)
+    image = engine.dump(build_key_map(args, sectors), sectors)
+
+    result = {"uid": uid.hex().upper(), "report": engine.last_report}
+    if args.output:
+        try:
+            save_image(image, args.output, args.format)
+        except (OSError, DumpFormatError) as e:
+            raise CliError(f"Could not save dump: {e}")
+        result["output"] = str(args.output)
+    else:
+        result["blocks"] = {str(block): image.get_block(block).hex().upper()
+                            for block in range(image.block_count) if image.has_block(block)}
+        result["key_map"] = key_map_to_dict(image.key_map)
+    output(result)
+    return EXIT_OK if not engine.last_report["failed_sectors"] else EXIT_FAILED
+
+def cmd_keymap(session: Session, args) -> int:
+    """Find working keys per sector among cached, given and default keys"""
+    uid = session.wait_for_card(args.wait)
+    sectors = args.sectors or list(range(session.sector_count()))
+    known = session.auth_manager.get_key_map()
+    extra = load_key_map(args.keys) if args.keys else {}
+    key_map: KeyMap = {}
+    for sector in sectors:
+        for key_type in (KEY_TYPE_A, KEY_TYPE_B):
+            candidates = [keys[key_type] for keys in (known.get(sector, {}), extra.get(sector, {}))
+                          if key_type in keys] + DEFAULT_KEYS
+            for key in dict.fromkeys(candidates):
+                if session.auth_manager.authenticate_sector(sector, key_type, key):
+                    key_map.setdefault(sector, {})[key_type] = key
+                    break
+
+    result = key_map_to_dict(key_map)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    output({"uid": uid.hex().upper(), "key_map": result,
+            "unknown_sectors": [sector for sector in sectors if sector not in key_map]})
+    return EXIT_OK if len(key_map) == len(sectors) else EXIT_FAILED
+
+def cmd_restore(session: Session, args) -> int:
+    """Write the blocks (and trailers) of a dump file to the card"""
+    from core.card_template import CardTemplate, TemplateError, compile_template
+    from core.dump_formats import DumpFormatError, load_image
+
+    try:
+        image = load_image(args.image)
+    except (OSError, DumpFormatError) as e:
+        raise CliError(f"Could not load dump: {e}")
+    try:
+        template = CardTemplate.from_image(image, name=str(args.image), default_key=args.key,
+                                           trailers=not args.no_trailers)
+    except TemplateError as e:
+        raise CliError(f"Dump cannot be restored: {e}")
+    current_keys = load_key_map(args.keys) if args.keys else {}
+    for sector, sector_template in template.sectors.items():
+        sector_template.auth_keys = dict(current_keys.get(sector, {}))
+    try:
+        program = compile_template(template)
+    except TemplateError as e:
+        raise CliError(f"Dump cannot be restored: {e}")
+
+    uid = session.wait_for_card(args.wait)
+    session.auth_manager.clear_loaded_keys()
+    result = program.run(session.reader_manager, uid)
+    output({
+        "uid": uid.hex().upper(),
+        "success": result.success,
+        "apdu_count": result.apdu_count,
+        "failed_step": repr(result.failed_step) if result.failed_step else None
+    })
+    return EXIT_OK if result.success else EXIT_FAILED
+
+def cmd_bench(session: Session, args) -> int:
+    """Time repeated dumps and card reactivation"""
+    from core.dump import DumpEngine
+
+    session.wait_for_card(args.wait)
+    first_card_ms = round((time.perf_counter() - session.started) * 1000, 3)
+    sectors = args.sectors or list(range(session.sector_count()))
+    key_map = build_key_map(args, sectors)
+    engine = DumpEngine(session.card_operations, session.auth_manager)
+
+    dumps = []
+    for _ in range(args.iterations):
+        image = engine.dump(key_map, sectors)
+        dumps.append(engine.last_report["elapsed_ms"])
+        if image.captured_block_count() == 0:
+            break
+
+    result = {
+        "connect_ms": session.connect_ms,
+        "first_card_ms": first_card_ms,
+        "dump_ms": dumps,
+        "dump_average_ms": round(sum(dumps) / len(dumps), 3) if dumps else None,
+        "apdu_latency": session.reader_manager.apdu_latency.to_dict()
+    }
+    if args.reactivation:
+        result["reactivation"] = session.reader_manager.measure_reactivation(args.reactivation)
+    output(result)
+    return EXIT_OK
+
+def cmd_metrics(session: Session, args) -> int:
+    """Report reader information and measured latencies of this process"""
+    session.reader_manager.poll_card_uid()
+    output({
+        "reader": session.reader_manager.get_reader_info(),
+        "apdu_latency": session.reader_manager.apdu_latency.to_dict(),
+        "reactivation": session.reader_manager.get_reactivation_stats(),
+        "transport": (session.reader_manager.connection.to_dict()
+                      if hasattr(session.reader_manager.connection, "to_dict") else None),
+        "timings": {"connect_ms": session.connect_ms}
+    })
+    return EXIT_OK
+
+def service_metrics(args) -> int:
+    """Report metrics of a running reader service"""
+    from core.reader_service import ReaderServiceClient, ReaderServiceError
+    try:
+        with ReaderServiceClient(args.service) as client:
+            output(client.call("metrics"))
+    except (OSError, ReaderServiceError) as e:
+        raise CliError(f"Reader service not available: {e}", EXIT_NO_READER)
+    return EXIT_OK
+
+def cmd_watch(session: Session, args) -> int:
+    """Publish one NDJSON record per card tap"""
+    from core.card_events import ContinuousReader, EventPublisher, StreamSink, UnixSocketSink
+
+    sectors = args.sectors or list(range(MIFARE_1K_SECTORS))
+    try:
+        sink = UnixSocketSink(args.socket) if args.socket else StreamSink(sys.stdout.buffer)
+    except OSError as e:
+        raise CliError(f"Cannot serve events: {e}")
+    publisher = EventPublisher(sink)
+    reader = ContinuousReader(session.card_operations, session.auth_manager, publisher, sectors,
+                              build_key_map(args, sectors), include_keys=args.include_keys)
+    try:
+        stats = reader.run(args.max_events)
+    except KeyboardInterrupt:
+        stats = publisher.to_dict()
+    finally:
+        publisher.close()
+    logger.info(f"Watch finished: {stats}")
+    return EXIT_OK
+
+def read_passphrase(prompt: str, confirm: bool = False) -> str:
+    """Get the vault passphrase from the environment or the terminal"""
+    passphrase = os.environ.get(VAULT_PASSPHRASE_ENV)
+    if passphrase is not None:
+        return passphrase
+    import getpass
+    passphrase = getpass.getpass(prompt)
+    if confirm and getpass.getpass("Repeat passphrase: ") != passphrase:
+        raise CliError("Passphrases do not match")
+    return passphrase
+
+def cmd_vault(args) -> int:
+    """Create the key vault and manage its key sets and masters"""
+    from core.key_vault import KeySet, KeyVault
+
+    key_vault = KeyVault(args.vault)
+    if args.action == "create":
+        if key_vault.exists():
+            raise CliError(f"Key vault already exists: {key_vault.vault_file}")
+        passphrase = read_passphrase("New vault passphrase: ", confirm=True)
+        if not passphrase or not key_vault.create(passphrase):
+            raise CliError("Could not create the key vault")
+    else:
+        if not key_vault.exists():
+            raise CliError(f"No key vault at {key_vault.vault_file} (create it with: vault create)")
+        if not key_vault.unlock(read_passphrase("Vault passphrase: ")):
+            raise CliError("Wrong passphrase or damaged vault file")
+
+    try:
+        if args.action == "add-key-set":
+            try:
+                key_vault.put_key_set(KeySet.from_file(args.name, args.file))
+            except (OSError, ValueError) as e:
+                raise CliError(f"Could not import key set: {e}")
+        elif args.action == "add-master":
+            try:
+                key_vault.put_master(args.name, args.algorithm, bytes.fromhex(args.master_key),
+                                     system_identifier=bytes.fromhex(args.system_id))
+            except ValueError as e:
+                raise CliError(f"Invalid master: {e}")
+        elif args.action == "remove":
+            if not (key_vault.remove_key_set(args.name) | key_vault.remove_master(args.name)):
+                raise CliError(f"Unknown key set or master: {args.name}")
+        if args.action in ("add-key-set", "add-master", "remove"):
+            key_vault.save()
+
+        output({"vault": str(key_vault.vault_file),
+                "key_sets": key_vault.list_key_sets(),
+                "masters": key_vault.list_masters()})
+        return EXIT_OK
+    finally:
+        key_vault.lock()
+
+def _serve_until_interrupted() -> None:
+    """Block until Ctrl-C"""
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+def cmd_service(session: Session, args) -> int:
+    """Share the reader with local clients over a Unix socket"""
+    from core.reader_service import ReaderService, ReaderServiceError
+    service = ReaderService(session.card_operations, session.auth_manager, args.socket)
+    try:
+        service.start()
+    except ReaderServiceError as e:
+        raise CliError(str(e))
+    try:
+        _serve_until_interrupted()
+    finally:
+        service.stop()
+    return EXIT_OK
+
+def bridge_token() -> Optional[bytes]:
+    """Get the shared bridge token from the environment"""
+    token = os.environ.get(BRIDGE_TOKEN_ENV)
+    return token.encode("utf-8") if token else None
+
+def cmd_bridge(session: Session, args) -> int:
+    """Expose the reader to remote machines over TCP"""
+    from core.remote_reader import ReaderBridgeAgent
+    host, _, port = args.listen.rpartition(":")
+    try:
+        agent = ReaderBridgeAgent(session.reader_manager, host or AppSettings.BRIDGE_HOST, int(port),
+                                  token=bridge_token(), allow_unauthenticated=args.allow_unauthenticated)
+    except ValueError as e:
+        raise CliError(f"{e} (set {BRIDGE_TOKEN_ENV} or pass --allow-unauthenticated)")
+    with agent:
+        _serve_until_interrupted()
+    return EXIT_OK
+
+# Argument parsing
+
+def add_key_arguments(parser: argparse.ArgumentParser, default_key: Optional[bytes] = DEFAULT_KEY,
+                      key_file: bool = True) -> None:
+    """Add --key/--key-type (and --keys) options"""
+    parser.add_argument("--key", type=parse_key, default=default_key,
+                        help="sector key as 12 hex characters" +
+                             (" (default FFFFFFFFFFFF)" if default_key is not None else ""))
+    parser.add_argument("--key-type", type=parse_key_type, default=KEY_TYPE_A, help="A (default) or B")
+    if key_file:
+        parser.add_argument("--keys", type=Path, help="key map JSON or dump file with per-sector keys")
+
+def build_parser() -> argparse.ArgumentParser:
+    """Create the argument parser"""
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Headless MIFARE Classic tool for the ACR1252U")
+    parser.add_argument("--reader", help="PC/SC reader name (default: first ACR1252U)")
+    parser.add_argument("--remote", metavar="HOST[:PORT]", help=f"use a reader behind a bridge agent (token from {BRIDGE_TOKEN_ENV})")
+    parser.add_argument("--no-cache", action="store_true", help="do not use or update the per-card key cache")
+    parser.add_argument("--wait", type=float, default=0.0, metavar="SECONDS",
+                        help="wait this long for a card (default: card must already be present)")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="log warnings to stderr (-vv info, -vvv debug)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("detect", help="show reader and card").set_defaults(handler=cmd_detect)
+
+    read = commands.add_parser("read", help="read blocks")
+    read.add_argument("block", type=int, nargs="+")
+    add_key_arguments(read, key_file=False)
+    read.set_defaults(handler=cmd_read)
+
+    write = commands.add_parser("write", help="write one block")
+    write.add_argument("block", type=int)
+    write.add_argument("data", help="16 bytes as 32 hex characters")
+    add_key_arguments(write, key_file=False)
+    write.set_defaults(handler=cmd_write)
+
+    dump = commands.add_parser("dump", help="read the whole card (or --sectors)")
+    dump.add_argument("--sectors", type=parse_sectors, help="e.g. 0-3,8")
+    dump.add_argument("-o", "--output", type=Path, help="dump file (.mfd/.bin/.mct/.dump/.eml/.json)")
+    dump.add_argument("--format", help="dump format instead of the file extension")
+    add_key_arguments(dump)
+    dump.set_defaults(handler=cmd_dump)
+
+    keymap = commands.add_parser("keymap", help="find working keys per sector")
+    keymap.add_argument("--sectors", type=parse_sectors)
+    keymap.add_argument("-o", "--output", type=Path, help="save the key map as JSON (usable with --keys)")
+    keymap.add_argument("--keys", type=Path, help="key map JSON or dump file with keys to try first")
+    keymap.set_defaults(handler=cmd_keymap)
+
+    restore = commands.add_parser("restore", help="write a dump file to the card")
+    restore.add_argument("image", type=Path)
+    restore.add_argument("--no-trailers", action="store_true", help="write data blocks only, keep keys")
+    add_key_arguments(restore)
+    restore.set_defaults(handler=cmd_restore)
+
+    bench = commands.add_parser("bench", help="time dumps and card reactivation")
+    bench.add_argument("--iterations", type=parse_positive, default=5)
+    bench.add_argument("--sectors", type=parse_sectors)
+    bench.add_argument("--reactivation", type=int, default=0, metavar="SAMPLES")
+    add_key_arguments(bench)
+    bench.set_defaults(handler=cmd_bench)
+
+    metrics = commands.add_parser("metrics", help="reader information and latencies")
+    metrics.add_argument("--service", type=Path, nargs="?", const=Path(AppSettings.SERVICE_SOCKET_PATH),
+                         help="query a running reader service instead")
+    metrics.set_defaults(handler=cmd_metrics)
+
+    watch = commands.add_parser("watch", help="stream one NDJSON record per card tap")
+    watch.add_argument("--sectors", type=parse_sectors)
+    watch.add_argument("--socket", type=Path, help="serve records on a Unix socket instead of stdout")
+    watch.add_argument("--max-events", type=int)
+    watch.add_argument("--include-keys", action="store_true", help="publish trailer keys instead of zeros")
+    add_key_arguments(watch)
+    watch.set_defaults(handler=cmd_watch)
+
+    service = commands.add_parser("service", help="run the reader service daemon")
+    service.add_argument("--socket", type=Path, default=Path(AppSettings.SERVICE_SOCKET_PATH))
+    service.set_defaults(handler=cmd_service)
+
+    vault = commands.add_parser("vault", help="create the key vault and manage its key sets")
+    vault.add_argument("--vault", type=Path, help="vault file (default ~/.mifare_classic_tool/keys.vault)")
+    actions = vault.add_subparsers(dest="action", required=True)
+    actions.add_parser("create", help="create a new empty vault")
+    actions.add_parser("list", help="list key sets and masters")
+    add_key_set = actions.add_parser("add-key-set", help="add or replace a key set from a file")
+    add_key_set.add_argument("name")
+    add_key_set.add_argument("file", type=Path, help="key set or key map JSON, or a dump file")
+    add_master = actions.add_parser("add-master", help="add or replace a diversification master")
+    add_master.add_argument("name")
+    add_master.add_argument("--algorithm", default="aes-cmac", choices=sorted(DIVERSIFIERS))
+    add_master.add_argument("--master-key", required=True, help="master key as hex")
+    add_master.add_argument("--system-id", default="", help="system identifier as hex")
+    remove = actions.add_parser("remove", help="remove a key set or master")
+    remove.add_argument("name")
+    vault.set_defaults(handler=cmd_vault, needs_reader=False)
+
+    bridge = commands.add_parser("bridge", help="serve the reader to remote machines")
+    bridge.add_argument("--listen", default=f"{AppSettings.BRIDGE_HOST}:{AppSettings.BRIDGE_PORT}",
+                        metavar="HOST:PORT")
+    bridge.add_argument("--allow-unauthenticated", action="store_true",
+                        help=f"accept clients without the {BRIDGE_TOKEN_ENV} token on a non-loopback address")
+    bridge.set_defaults(handler=cmd_bridge)
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    args = build_parser().parse_args(argv)
+    # Quiet by default: failures are part of the JSON result or the error line
+    level = {0: logging.CRITICAL, 1: logging.WARNING, 2: logging.INFO}.get(args.verbose, logging.DEBUG)
+    logging.basicConfig(stream=sys.stderr, level=level,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    try:
+        if args.command == "metrics" and args.service:
+            return service_metrics(args)
+        if not getattr(args, "needs_reader", True):
+            return args.handler(args)
+        session = Session(args)
+        try:
+            return args.handler(session, args)
+        finally:
+            session.close()
+    except CliError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return e.exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
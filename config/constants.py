@@ -3,6 +3,8 @@ MIFARE Classic Tool Constants
 Contains all APDU commands, card constants, and application settings
 """
 
+import os
+
 # MIFARE Classic Card Constants
 MIFARE_CLASSIC_1K_SIZE = 1024
 MIFARE_CLASSIC_4K_SIZE = 4096
@@ -36,6 +38,12 @@ KEY_TYPE_NAMES = {
 # Default Keys
 DEFAULT_KEY = bytes([0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF])
 TRANSPORT_KEY = bytes([0xA0, 0xA1, 0xA2, 0xA3, 0xA4, 0xA5])
+DEFAULT_KEYS = [
+    DEFAULT_KEY,
+    TRANSPORT_KEY,
+    bytes([0x00, 0x00, 0x00, 0x00, 0x00, 0x00]),  # All zeros
+    bytes([0xA0, 0xB0, 0xC0, 0xD0, 0xE0, 0xF0]),  # Another common key
+]
 
 # ACR1252U Specific Constants
 ACR1252U_READER_NAME = "ACS ACR1252 1S CL Reader PICC"
@@ -49,6 +57,7 @@ class APDUCommands:
     GET_FIRMWARE_VERSION = [0xE0, 0x00, 0x00, 0x18, 0x00]
     LED_CONTROL = [0xE0, 0x00, 0x00, 0x29, 0x01]
     BUZZER_CONTROL = [0xE0, 0x00, 0x00, 0x28, 0x01]
+    ANTENNA_FIELD_CONTROL = [0xE0, 0x00, 0x00, 0x25, 0x01]  # + 0x00 (off) / 0x01 (on)
     
     # PICC Commands
     GET_UID = [0xFF, 0xCA, 0x00, 0x00, 0x00]
@@ -68,6 +77,14 @@ LED_RED_ON = 0x01
 LED_GREEN_ON = 0x02
 LED_BOTH_ON = 0x03
 
+# Antenna Field Values
+ANTENNA_FIELD_OFF = 0x00
+ANTENNA_FIELD_ON = 0x01
+
+# Card Reactivation Methods
+REACTIVATION_FIELD_RESET = "field_reset"
+REACTIVATION_RECONNECT = "reconnect"
+
 # Error Codes
 class ErrorCodes:
     """Standard error codes for the application"""
@@ -77,6 +94,13 @@ class ErrorCodes:
     CARD_NOT_FOUND = 0x6200
     INVALID_BLOCK = 0x6A00
 
+def _runtime_dir() -> str:
+    """Per-user directory for sockets: $XDG_RUNTIME_DIR, else one under the config directory"""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return runtime_dir
+    return os.path.join(os.path.expanduser("~"), ".mifare_classic_tool", "run")
+
 # Application Settings
 class AppSettings:
     """Application-wide settings"""
@@ -89,6 +113,44 @@ class AppSettings:
     # Operation Timeouts (milliseconds)
     READER_CONNECT_TIMEOUT = 5000
     CARD_OPERATION_TIMEOUT = 3000
+    RF_RESET_TIME = 5  # RF field off time for card reactivation
+    
+    # Initial APDU latency estimates (milliseconds), refined by measurement
+    ESTIMATED_LOAD_KEY_TIME = 2
+    ESTIMATED_AUTH_TIME = 8
+    ESTIMATED_READ_TIME = 6
+    ESTIMATED_WRITE_TIME = 12
+    
+    # Per-card key cache
+    KEY_CACHE_FAILURE_TTL = 24 * 3600  # seconds a rejected key is skipped for the same card
+    KEY_CACHE_MAX_AGE = 30 * 24 * 3600  # seconds a card's known keys are kept after their last use
+    KEY_CACHE_MAX_CARDS = 1000  # cards kept; the least recently used are dropped first
+    
+    # Production encoding
+    PRODUCTION_POLL_INTERVAL = 10  # milliseconds between card presence polls
+    PRODUCTION_REMOVAL_POLLS = 2  # consecutive empty polls that count as removal
+    PRODUCTION_RATE_WINDOW = 60  # seconds of history for the cards/minute rate
+    SIGNAL_BEEP_SUCCESS = 5  # buzzer duration in 10 ms units
+    SIGNAL_BEEP_FAILURE = 30
+    
+    # Continuous read mode
+    EVENT_BUFFER_SIZE = 256  # card events held for slow consumers before the oldest is dropped
+    EVENT_SEND_TIMEOUT = 500  # milliseconds before a stalled socket consumer is disconnected
+    EVENT_LATENCY_WINDOW = 1000  # recent events kept for latency percentiles
+    
+    # Reader service daemon
+    SERVICE_SOCKET_PATH = os.path.join(_runtime_dir(), "mifare-reader.sock")  # created 0700 when missing
+    SERVICE_POLL_INTERVAL = 50  # milliseconds between presence polls while idle
+    SERVICE_CLIENT_QUEUE = 64  # pending requests per client before it is told the service is busy
+    SERVICE_SEND_TIMEOUT = 500  # milliseconds before a client not reading its responses is disconnected
+    
+    # Remote reader bridge
+    BRIDGE_HOST = "127.0.0.1"  # agent bind address; other interfaces need a token or an explicit opt-in
+    BRIDGE_PORT = 9425
+    BRIDGE_CONNECT_TIMEOUT = 3000  # milliseconds to reach the agent
+    BRIDGE_RESPONSE_TIMEOUT = 10000  # milliseconds to wait for one request's response
+    BRIDGE_RECONNECT_ATTEMPTS = 3  # reconnects before a request fails
+    BRIDGE_RECONNECT_DELAY = 200  # milliseconds before the first reconnect, doubled per attempt
     
     # Validation Settings
     MAX_KEY_INPUT_LENGTH = 12  # for hex input (6 bytes = 12 hex chars)
@@ -31,7 +31,8 @@ class Settings:
             "operations": {
                 "confirm_write_operations": True,
                 "confirm_key_changes": True,
-                "auto_authenticate_on_read": True
+                "auto_authenticate_on_read": True,
+                "remember_card_keys": True
             },
             "logging": {
                 "level": "INFO",
@@ -0,0 +1,212 @@
+"""
+MIFARE Classic Access Conditions
+Table-driven encoder/decoder for sector trailer access bits
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, MIFARE_BLOCK_SIZE
+
+# Key permission masks
+ACCESS_NEVER = 0x00
+ACCESS_KEY_A = 0x01
+ACCESS_KEY_B = 0x02
+ACCESS_KEY_AB = ACCESS_KEY_A | ACCESS_KEY_B
+
+KEY_TYPE_MASKS = {KEY_TYPE_A: ACCESS_KEY_A, KEY_TYPE_B: ACCESS_KEY_B}
+
+ACCESS_MASK_NAMES = {
+    ACCESS_NEVER: "never",
+    ACCESS_KEY_A: "Key A",
+    ACCESS_KEY_B: "Key B",
+    ACCESS_KEY_AB: "Key A|B"
+}
+
+# Data block operations
+OP_READ = "read"
+OP_WRITE = "write"
+OP_INCREMENT = "increment"
+OP_DECREMENT = "decrement"
+
+# Sector trailer operations
+OP_READ_KEY_A = "read_key_a"
+OP_WRITE_KEY_A = "write_key_a"
+OP_READ_ACCESS = "read_access"
+OP_WRITE_ACCESS = "write_access"
+OP_READ_KEY_B = "read_key_b"
+OP_WRITE_KEY_B = "write_key_b"
+
+DATA_OPERATIONS = (OP_READ, OP_WRITE, OP_INCREMENT, OP_DECREMENT)
+TRAILER_OPERATIONS = (OP_READ_KEY_A, OP_WRITE_KEY_A, OP_READ_ACCESS,
+                      OP_WRITE_ACCESS, OP_READ_KEY_B, OP_WRITE_KEY_B)
+
+# Conditions are the 3-bit value C1C2C3 (C1 is the most significant bit)
+_N, _A, _B, _AB = ACCESS_NEVER, ACCESS_KEY_A, ACCESS_KEY_B, ACCESS_KEY_AB
+
+# read, write, increment, decrement
+DATA_BLOCK_PERMISSIONS: Dict[int, Tuple[int, int, int, int]] = {
+    0b000: (_AB, _AB, _AB, _AB),  # transport configuration
+    0b010: (_AB, _N, _N, _N),
+    0b100: (_AB, _B, _N, _N),
+    0b110: (_AB, _B, _B, _AB),    # value block
+    0b001: (_AB, _N, _N, _AB),    # value block
+    0b011: (_B, _B, _N, _N),
+    0b101: (_B, _N, _N, _N),
+    0b111: (_N, _N, _N, _N)
+}
+
+# read/write Key A, read/write access bits, read/write Key B
+TRAILER_PERMISSIONS: Dict[int, Tuple[int, int, int, int, int, int]] = {
+    0b000: (_N, _A, _A, _N, _A, _A),
+    0b010: (_N, _N, _A, _N, _A, _N),
+    0b100: (_N, _B, _AB, _N, _N, _B),
+    0b110: (_N, _N, _AB, _N, _N, _N),
+    0b001: (_N, _A, _A, _A, _A, _A),  # transport configuration
+    0b011: (_N, _B, _AB, _B, _N, _B),
+    0b101: (_N, _N, _AB, _B, _N, _N),
+    0b111: (_N, _N, _AB, _N, _N, _N)
+}
+
+TRANSPORT_CONDITIONS = (0b000, 0b000, 0b000, 0b001)
+DEFAULT_GENERAL_PURPOSE_BYTE = 0x69
+
+def _encode(conditions: Sequence[int]) -> bytes:
+    """Encode per-block C1C2C3 values into the 3 access bytes"""
+    c1 = c2 = c3 = 0
+    for block, condition in enumerate(conditions):
+        c1 |= ((condition >> 2) & 1) << block
+        c2 |= ((condition >> 1) & 1) << block
+        c3 |= (condition & 1) << block
+    return bytes([
+        ((~c2 & 0x0F) << 4) | (~c1 & 0x0F),
+        (c1 << 4) | (~c3 & 0x0F),
+        (c3 << 4) | c2
+    ])
+
+def _table_index(conditions: Sequence[int]) -> int:
+    """Pack four 3-bit conditions into a table index"""
+    return (conditions[0] << 9) | (conditions[1] << 6) | (conditions[2] << 3) | conditions[3]
+
+# All 4096 valid encodings; anything not in DECODE_TABLE fails the inverted-bit check
+_ALL_CONDITIONS = [
+    ((index >> 9) & 7, (index >> 6) & 7, (index >> 3) & 7, index & 7)
+    for index in range(4096)
+]
+ENCODE_TABLE: Tuple[bytes, ...] = tuple(_encode(conditions) for conditions in _ALL_CONDITIONS)
+DECODE_TABLE: Dict[bytes, Tuple[int, int, int, int]] = {
+    ENCODE_TABLE[index]: conditions for index, conditions in enumerate(_ALL_CONDITIONS)
+}
+
+class SectorAccess:
+    """Decoded access conditions of one sector"""
+
+    def __init__(self, conditions: Tuple[int, int, int, int]):
+        self.conditions = conditions
+        trailer = TRAILER_PERMISSIONS[conditions[3]]
+        # If Key B is readable it cannot be used for authentication
+        self.key_b_readable = trailer[4] != ACCESS_NEVER
+        key_mask = ACCESS_KEY_A if self.key_b_readable else ACCESS_KEY_AB
+
+        self.block_permissions: List[Dict[str, int]] = [
+            {op: mask & key_mask for op, mask in zip(DATA_OPERATIONS, DATA_BLOCK_PERMISSIONS[condition])}
+            for condition in conditions[:3]
+        ]
+        self.trailer_permissions: Dict[str, int] = {
+            op: mask & key_mask for op, mask in zip(TRAILER_OPERATIONS, trailer)
+        }
+
+    @property
+    def access_bytes(self) -> bytes:
+        """Get encoded access bytes"""
+        return ENCODE_TABLE[_table_index(self.conditions)]
+
+    def get_permission(self, group: int, operation: str) -> int:
+        """Get key mask allowed for operation on a block group (3 = trailer)"""
+        if group == 3:
+            return self.trailer_permissions.get(operation, ACCESS_NEVER)
+        return self.block_permissions[group].get(operation, ACCESS_NEVER)
+
+    def is_allowed(self, group: int, operation: str, key_type: int) -> bool:
+        """Check if operation on a block group is allowed with given key type"""
+        return bool(self.get_permission(group, operation) & KEY_TYPE_MASKS[key_type])
+
+    def allowed_key_types(self, group: int, operation: str) -> List[int]:
+        """Get key types that may perform operation on a block group"""
+        mask = self.get_permission(group, operation)
+        return [key_type for key_type, key_mask in KEY_TYPE_MASKS.items() if mask & key_mask]
+
+    def is_value_block(self, group: int) -> bool:
+        """Check if block group is configured for value block operations"""
+        return group < 3 and self.conditions[group] in (0b110, 0b001)
+
+    def is_permanently_locked(self) -> bool:
+        """Check if keys and access bits can never be changed again"""
+        return (self.trailer_permissions[OP_WRITE_ACCESS] == ACCESS_NEVER and
+                self.trailer_permissions[OP_WRITE_KEY_A] == ACCESS_NEVER and
+                self.trailer_permissions[OP_WRITE_KEY_B] == ACCESS_NEVER)
+
+    def describe(self) -> List[str]:
+        """Get human-readable permission lines"""
+        lines = []
+        for group, permissions in enumerate(self.block_permissions):
+            condition = f"{self.conditions[group]:03b}"
+            ops = ", ".join(f"{op}: {ACCESS_MASK_NAMES[mask]}" for op, mask in permissions.items())
+            lines.append(f"Block {group} [{condition}] {ops}")
+        condition = f"{self.conditions[3]:03b}"
+        ops = ", ".join(f"{op}: {ACCESS_MASK_NAMES[mask]}" for op, mask in self.trailer_permissions.items())
+        lines.append(f"Trailer [{condition}] {ops}")
+        return lines
+
+SECTOR_ACCESS_TABLE: Dict[bytes, SectorAccess] = {
+    access_bytes: SectorAccess(conditions) for access_bytes, conditions in DECODE_TABLE.items()
+}
+
+def encode_access_bits(conditions: Sequence[int]) -> bytes:
+    """Encode C1C2C3 values for blocks 0-2 and the trailer into 3 access bytes"""
+    if len(conditions) != 4 or any(not 0 <= condition <= 7 for condition in conditions):
+        raise ValueError("Access conditions must be four values between 0 and 7")
+    return ENCODE_TABLE[_table_index(conditions)]
+
+def decode_access_bits(access_bytes: bytes) -> Optional[Tuple[int, int, int, int]]:
+    """Decode 3 access bytes into C1C2C3 per block, None if inconsistent"""
+    return DECODE_TABLE.get(bytes(access_bytes[:3])) if len(access_bytes) >= 3 else None
+
+def get_sector_access(access_bytes: bytes) -> Optional[SectorAccess]:
+    """Get decoded sector access for 3 access bytes, None if inconsistent"""
+    return SECTOR_ACCESS_TABLE.get(bytes(access_bytes[:3])) if len(access_bytes) >= 3 else None
+
+def get_trailer_access(trailer_data: bytes) -> Optional[SectorAccess]:
+    """Get decoded sector access from a full 16-byte trailer"""
+    if len(trailer_data) != MIFARE_BLOCK_SIZE:
+        return None
+    return SECTOR_ACCESS_TABLE.get(bytes(trailer_data[6:9]))
+
+def validate_trailer(trailer_data: bytes) -> Tuple[bool, str]:
+    """
+    Validate a sector trailer before writing it
+
+    Returns:
+        tuple: (is_valid, error_message)
+    """
+    if len(trailer_data) != MIFARE_BLOCK_SIZE:
+        return False, f"Trailer must be exactly {MIFARE_BLOCK_SIZE} bytes"
+    if bytes(trailer_data[6:9]) not in SECTOR_ACCESS_TABLE:
+        return False, "Access bits fail the inverted-bit consistency check (sector would be locked)"
+    return True, ""
+
+def build_trailer(key_a: bytes, access_bytes: bytes, key_b: bytes,
+                  gpb: int = DEFAULT_GENERAL_PURPOSE_BYTE) -> bytes:
+    """Assemble a sector trailer, rejecting invalid access bits"""
+    if len(key_a) != 6 or len(key_b) != 6:
+        raise ValueError("Keys must be exactly 6 bytes")
+    if bytes(access_bytes) not in SECTOR_ACCESS_TABLE:
+        raise ValueError("Invalid access bits")
+    return bytes(key_a) + bytes(access_bytes) + bytes([gpb & 0xFF]) + bytes(key_b)
+
+def get_block_group(block_in_sector: int, blocks_in_sector: int) -> int:
+    """Get access condition group (0-2, 3 = trailer) for a block within its sector"""
+    if block_in_sector == blocks_in_sector - 1:
+        return 3
+    if blocks_in_sector == 16:  # 4K large sectors: groups of 5 blocks
+        return block_in_sector // 5
+    return block_in_sector
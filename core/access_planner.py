@@ -0,0 +1,262 @@
+"""
+Access-Condition-Aware Operation Planner
+Chooses Key A or Key B per block operation from decoded sector trailers
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, KEY_TYPE_NAMES
+from .access_conditions import (
+    SectorAccess, get_trailer_access, get_block_group,
+    OP_READ, OP_WRITE, OP_READ_ACCESS, OP_WRITE_ACCESS, OP_WRITE_KEY_A, OP_WRITE_KEY_B,
+    KEY_TYPE_MASKS
+)
+from .authentication import AuthenticationManager
+from .card_operations import CardOperations
+from .data_utils import get_block_sector, get_sector_first_block, get_sector_block_count
+from .key_diversification import KeyMap
+
+logger = logging.getLogger(__name__)
+
+class PlannedOperation:
+    """Single block operation with the key chosen to perform it"""
+
+    def __init__(self, block: int, operation: str, sector: int):
+        self.block = block
+        self.operation = operation
+        self.sector = sector
+        self.key_type: Optional[int] = None
+        self.key: Optional[bytes] = None
+        self.reason = ""
+
+    @property
+    def feasible(self) -> bool:
+        """Check if operation can be performed"""
+        return self.key is not None
+
+    def __repr__(self) -> str:
+        key_name = KEY_TYPE_NAMES.get(self.key_type, "-")
+        return f"PlannedOperation({self.operation} block {self.block}, {key_name}, {self.reason or 'ok'})"
+
+class AccessPlan:
+    """Ordered set of planned operations for one card"""
+
+    def __init__(self, operations: List[PlannedOperation]):
+        self.operations = operations
+
+    def get_feasible(self) -> List[PlannedOperation]:
+        """Get operations that can be performed"""
+        return [op for op in self.operations if op.feasible]
+
+    def get_skipped(self) -> List[PlannedOperation]:
+        """Get operations that were ruled out, with their reasons"""
+        return [op for op in self.operations if not op.feasible]
+
+    def get_auth_groups(self) -> List[Tuple[int, int, bytes, List[PlannedOperation]]]:
+        """Group feasible operations by (sector, key type) in execution order
+
+        Returns:
+            list: (sector, key_type, key, operations)
+        """
+        groups: Dict[Tuple[int, int], Tuple[int, int, bytes, List[PlannedOperation]]] = {}
+        for op in sorted(self.get_feasible(), key=lambda o: (o.sector, o.key_type, o.block)):
+            group = groups.setdefault((op.sector, op.key_type), (op.sector, op.key_type, op.key, []))
+            group[3].append(op)
+        return list(groups.values())
+
+def _trailer_masks(access: SectorAccess) -> Dict[str, int]:
+    """Key masks for whole-block operations on the trailer"""
+    permissions = access.trailer_permissions
+    return {
+        OP_READ: permissions[OP_READ_ACCESS],
+        OP_WRITE: permissions[OP_WRITE_ACCESS] | permissions[OP_WRITE_KEY_A] | permissions[OP_WRITE_KEY_B]
+    }
+
+def _operation_mask(access: SectorAccess, sector: int, block: int, operation: str) -> int:
+    """Key mask permitted to perform operation on block"""
+    group = get_block_group(block - get_sector_first_block(sector), get_sector_block_count(sector))
+    if group == 3:
+        return _trailer_masks(access).get(operation, 0)
+    return access.get_permission(group, operation)
+
+class AccessPlanner:
+    """Plans block reads/writes using each sector's decoded access conditions
+
+    Sector trailers are read and decoded once per card; afterwards every
+    requested operation is assigned the key type its access conditions
+    permit, preferring one key type per sector so each sector needs a
+    single authentication.
+    """
+
+    def __init__(self, card_operations: CardOperations, auth_manager: AuthenticationManager):
+        self.card_operations = card_operations
+        self.auth_manager = auth_manager
+        self._card_uid: Optional[bytes] = None
+        self._sector_access: Dict[int, Optional[SectorAccess]] = {}
+
+    def _reset_if_new_card(self) -> None:
+        """Forget decoded trailers when a different card is presented"""
+        uid = self.card_operations.card_info.uid
+        if uid != self._card_uid:
+            self._card_uid = uid
+            self._sector_access.clear()
+
+    def _merge_key_map(self, key_map: Optional[KeyMap]) -> KeyMap:
+        """Combine explicit keys with keys cached for the current card"""
+        merged: KeyMap = {sector: dict(keys) for sector, keys in self.auth_manager.get_key_map().items()}
+        for sector, keys in (key_map or {}).items():
+            merged.setdefault(sector, {}).update(keys)
+        return merged
+
+    def get_sector_access(self, sector: int) -> Optional[SectorAccess]:
+        """Get access conditions already decoded for sector, without card I/O"""
+        self._reset_if_new_card()
+        return self._sector_access.get(sector)
+
+    def record_trailer(self, sector: int, trailer: bytes) -> Optional[SectorAccess]:
+        """Decode a trailer that was read elsewhere (e.g. by a dump) and remember it"""
+        self._reset_if_new_card()
+        access = get_trailer_access(trailer)
+        if access is None:
+            logger.warning(f"Sector {sector} trailer has inconsistent access bits")
+        self._sector_access[sector] = access
+        return access
+
+    def load_sector_access(self, sector: int, key_map: Optional[KeyMap] = None) -> Optional[SectorAccess]:
+        """Read and decode sector trailer, once per card
+
+        Only a trailer that was actually read is remembered; if no key
+        authenticated, a later call with other keys tries again.
+        """
+        self._reset_if_new_card()
+        if sector in self._sector_access:
+            return self._sector_access[sector]
+
+        keys = self._merge_key_map(key_map).get(sector, {})
+        trailer_block = get_sector_first_block(sector) + get_sector_block_count(sector) - 1
+
+        for key_type in (KEY_TYPE_A, KEY_TYPE_B):
+            key = keys.get(key_type)
+            if key is None or not self.auth_manager.authenticate_sector(sector, key_type, key):
+                continue
+            trailer = self.card_operations.read_block(trailer_block)
+            if trailer is not None:
+                return self.record_trailer(sector, trailer)
+
+        return None
+
+    def choose_key_types(self, sector: int, requests: Iterable[Tuple[int, str]],
+                         key_types: Iterable[int], permitted_only: bool = False) -> List[int]:
+        """Order key_types (e.g. those a key map holds) for (block, operation) requests in sector
+
+        With the sector's access conditions decoded, the key type permitted
+        to perform most of the operations comes first; key types permitted
+        none come last, or are dropped with permitted_only. Without decoded
+        conditions Key A is tried before Key B.
+        """
+        key_types = set(key_types)
+        held = [key_type for key_type in (KEY_TYPE_A, KEY_TYPE_B) if key_type in key_types]
+        access = self.get_sector_access(sector)
+        if access is None:
+            return [] if permitted_only else held
+
+        masks = [_operation_mask(access, sector, block, operation) for block, operation in requests]
+        coverage = {kt: sum(1 for mask in masks if mask & KEY_TYPE_MASKS[kt]) for kt in held}
+        ordered = sorted(held, key=lambda kt: -coverage[kt])
+        return [kt for kt in ordered if coverage[kt]] if permitted_only else ordered
+
+    def authenticate_for(self, sector: int, requests: Iterable[Tuple[int, str]],
+                         keys: Dict[int, bytes]) -> Optional[int]:
+        """Authenticate sector with the key type its access conditions favour for requests
+
+        Returns:
+            int: key type that authenticated, or None
+        """
+        keys = {key_type: key for key_type, key in keys.items() if key is not None}
+        for key_type in self.choose_key_types(sector, list(requests), keys):
+            if self.auth_manager.authenticate_sector(sector, key_type, keys[key_type]):
+                return key_type
+        return None
+
+    def plan(self, requests: Iterable[Tuple[int, str]], key_map: Optional[KeyMap] = None) -> AccessPlan:
+        """Assign a key to each (block, operation) request or explain why it is impossible"""
+        self._reset_if_new_card()
+        keys_by_sector = self._merge_key_map(key_map)
+
+        by_sector: Dict[int, List[PlannedOperation]] = {}
+        operations = []
+        for block, operation in requests:
+            planned = PlannedOperation(block, operation, get_block_sector(block))
+            operations.append(planned)
+            by_sector.setdefault(planned.sector, []).append(planned)
+
+        for sector, sector_ops in by_sector.items():
+            self._plan_sector(sector, sector_ops, keys_by_sector.get(sector, {}), key_map)
+
+        plan = AccessPlan(operations)
+        skipped = plan.get_skipped()
+        if skipped:
+            logger.info(f"Access plan: {len(operations) - len(skipped)} operations, {len(skipped)} skipped")
+        return plan
+
+    def _plan_sector(self, sector: int, sector_ops: List[PlannedOperation],
+                     keys: Dict[int, bytes], key_map: Optional[KeyMap]) -> None:
+        """Choose key types for all operations of one sector"""
+        if not keys:
+            for op in sector_ops:
+                op.reason = f"No key known for sector {sector}"
+            return
+
+        access = self.load_sector_access(sector, key_map)
+        if access is None:
+            for op in sector_ops:
+                op.reason = f"Sector {sector} trailer could not be read or is invalid"
+            return
+
+        # Key types that may perform each operation and that we hold a key for
+        candidates = {}
+        for op in sector_ops:
+            mask = _operation_mask(access, sector, op.block, op.operation)
+            permitted = [kt for kt, kt_mask in KEY_TYPE_MASKS.items() if mask & kt_mask]
+            candidates[id(op)] = [kt for kt in permitted if kt in keys]
+            if not permitted:
+                op.reason = f"{op.operation} of block {op.block} not permitted by access conditions"
+            elif not candidates[id(op)]:
+                names = "/".join(KEY_TYPE_NAMES[kt] for kt in permitted)
+                op.reason = f"{op.operation} of block {op.block} requires {names}, which is not known"
+
+        # Prefer the key type that covers most operations to save authentications
+        coverage = {kt: sum(1 for op in sector_ops if kt in candidates[id(op)]) for kt in keys}
+        preferred = sorted(keys, key=lambda kt: (-coverage[kt], kt))
+
+        for op in sector_ops:
+            for key_type in preferred:
+                if key_type in candidates[id(op)]:
+                    op.key_type = key_type
+                    op.key = keys[key_type]
+                    break
+
+    def execute(self, plan: AccessPlan, write_data: Optional[Dict[int, bytes]] = None) -> Dict[int, object]:
+        """Run feasible operations, authenticating once per (sector, key type)
+
+        Returns:
+            dict: block -> read data (bytes/None) or write result (bool)
+        """
+        write_data = write_data or {}
+        results: Dict[int, object] = {}
+
+        for sector, key_type, key, sector_ops in plan.get_auth_groups():
+            if not self.auth_manager.authenticate_sector(sector, key_type, key):
+                for op in sector_ops:
+                    results[op.block] = None if op.operation == OP_READ else False
+                continue
+
+            for op in sector_ops:
+                if op.operation == OP_READ:
+                    results[op.block] = self.card_operations.read_block(op.block)
+                elif op.operation == OP_WRITE:
+                    data = write_data.get(op.block)
+                    results[op.block] = data is not None and self.card_operations.write_block(op.block, data)
+
+        return results
@@ -4,24 +4,32 @@ Handles key loading and sector authentication
 """
 
 import logging
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from smartcard.Exceptions import CardConnectionException
 
 from config.constants import (
     APDUCommands, ErrorCodes, KEY_TYPE_A, KEY_TYPE_B,
-    DEFAULT_KEY, TRANSPORT_KEY
+    DEFAULT_KEYS
 )
-from .reader_manager import ReaderManager
+from .reader_manager import ApduBatchError, ReaderManager
 from .card_operations import CardOperations
+from .key_cache import KeyCache
+from .key_diversification import KeyDerivationEngine
+from .key_vault import KeyVault
 
 logger = logging.getLogger(__name__)
 
 class AuthenticationManager:
     """Manages MIFARE Classic authentication operations"""
     
-    def __init__(self, reader_manager: ReaderManager, card_operations: CardOperations):
+    def __init__(self, reader_manager: ReaderManager, card_operations: CardOperations,
+                 key_cache: Optional[KeyCache] = None, key_vault: Optional[KeyVault] = None):
         self.reader_manager = reader_manager
         self.card_operations = card_operations
+        self.key_cache = key_cache
+        self.key_vault = key_vault
+        self.auto_reactivate = True
+        self.key_derivation: Optional[KeyDerivationEngine] = None
         self._loaded_keys = {}  # key_slot -> key_data
     
     def load_key(self, key_data: bytes, key_slot: int = 0) -> bool:
@@ -53,6 +61,40 @@ class AuthenticationManager:
             logger.error(f"Error loading key: {e}")
             return False
     
+    def _auth_command(self, sector: int, key_type: int, key_slot: int) -> List[int]:
+        """Build the authentication APDU for sector"""
+        # Get block number for authentication (any block in sector)
+        if self.card_operations.card_info.card_type == 1:  # MIFARE 1K
+            block_number = sector * 4
+        else:  # MIFARE 4K
+            if sector < 32:
+                block_number = sector * 4
+            else:
+                block_number = 32 * 4 + (sector - 32) * 16
+        
+        auth_data = [0x01, 0x00, block_number, key_type, key_slot]
+        return APDUCommands.AUTH_BLOCK + auth_data
+    
+    def _record_auth_result(self, sector: int, key_type: int, key_data: bytes, sw1: int, sw2: int) -> bool:
+        """Update authentication state and key cache from an AUTH response"""
+        uid = self.card_operations.card_info.uid
+        
+        if sw1 == 0x90 and sw2 == 0x00:
+            self.card_operations.set_sector_authenticated(sector, True)
+            if self.key_cache and uid:
+                self.key_cache.record_success(uid, sector, key_type, key_data)
+            logger.info(f"Sector {sector} authenticated with key type {key_type:02X}")
+            return True
+        else:
+            logger.error(f"Authentication failed for sector {sector}: {sw1:02X}{sw2:02X}")
+            live = self._reactivate_card() if self.auto_reactivate else False
+            # Only a rejection from a card that is still there proves the key
+            # wrong; other statuses may be transient reader or RF errors
+            rejected = (sw1 << 8 | sw2) == ErrorCodes.AUTHENTICATION_FAILED
+            if self.key_cache and uid and rejected and live:
+                self.key_cache.record_failure(uid, sector, key_type, key_data)
+            return False
+    
     def authenticate_sector(self, sector: int, key_type: int, key_data: bytes, key_slot: int = 0) -> bool:
         """Authenticate sector with specified key"""
         try:
@@ -63,51 +105,173 @@ class AuthenticationManager:
             if not self.load_key(key_data, key_slot):
                 return False
             
-            # Get block number for authentication (any block in sector)
-            if self.card_operations.card_info.card_type == 1:  # MIFARE 1K
-                block_number = sector * 4
-            else:  # MIFARE 4K
-                if sector < 32:
-                    block_number = sector * 4
-                else:
-                    block_number = 32 * 4 + (sector - 32) * 16
+            command = self._auth_command(sector, key_type, key_slot)
+            response, sw1, sw2 = self.reader_manager.send_apdu(command)
+            return self._record_auth_result(sector, key_type, key_data, sw1, sw2)
+                
+        except Exception as e:
+            logger.error(f"Error authenticating sector {sector}: {e}")
+            return False
+    
+    def authenticate_and_send(self, sector: int, key_type: int, key_data: bytes,
+                              commands: List[List[int]], key_slot: int = 0) -> Optional[List[Tuple[List[int], int, int]]]:
+        """Authenticate sector and run commands in it as one APDU batch
+        
+        Key load, authentication and commands reach the reader together,
+        so a remote reader costs one network round-trip per sector.
+        
+        Returns:
+            list: responses to commands (shorter if the card left part-way),
+            or None if authentication failed
+        """
+        try:
+            if not self.card_operations.card_info.present:
+                raise CardConnectionException("No card present")
+            if len(key_data) != 6:
+                raise ValueError("Key must be exactly 6 bytes")
             
-            # Prepare authentication command
-            auth_data = [0x01, 0x00, block_number, key_type, key_slot]
-            command = APDUCommands.AUTH_BLOCK + auth_data
+            load_command = APDUCommands.LOAD_AUTH_KEY.copy()
+            load_command[3] = key_slot
+            load_command += list(key_data)
+            batch = [load_command, self._auth_command(sector, key_type, key_slot)] + commands
+            try:
+                results = self.reader_manager.send_apdu_batch(batch, required=2)
+            except ApduBatchError as e:
+                # Keep what was read before the card left, if it authenticated
+                results = e.results
+                if len(results) < 2:
+                    raise
             
-            response, sw1, sw2 = self.reader_manager.send_apdu(command)
+            response, sw1, sw2 = results[0]
+            if sw1 != 0x90 or sw2 != 0x00:
+                logger.error(f"Failed to load key into slot {key_slot}: {sw1:02X}{sw2:02X}")
+                return None
+            self._loaded_keys[key_slot] = key_data
             
-            if sw1 == 0x90 and sw2 == 0x00:
-                self.card_operations.set_sector_authenticated(sector, True)
-                logger.info(f"Sector {sector} authenticated with key type {key_type:02X}")
-                return True
-            else:
-                logger.error(f"Authentication failed for sector {sector}: {sw1:02X}{sw2:02X}")
-                return False
+            response, sw1, sw2 = results[1]
+            if not self._record_auth_result(sector, key_type, key_data, sw1, sw2):
+                return None
+            return results[2:]
                 
         except Exception as e:
             logger.error(f"Error authenticating sector {sector}: {e}")
-            return False
+            return None
     
-    def try_default_keys(self, sector: int, key_type: int) -> bool:
-        """Try common default keys for authentication"""
-        default_keys = [
-            DEFAULT_KEY,
-            TRANSPORT_KEY,
-            bytes([0x00, 0x00, 0x00, 0x00, 0x00, 0x00]),  # All zeros
-            bytes([0xA0, 0xB0, 0xC0, 0xD0, 0xE0, 0xF0]),  # Another common key
-        ]
+    def _reactivate_card(self) -> bool:
+        """Reselect the card after a failed authentication left it halted"""
+        card_info = self.card_operations.card_info
+        
+        # Reactivation drops every authenticated sector
+        self.card_operations.clear_authentication()
         
-        for i, key in enumerate(default_keys):
-            logger.debug(f"Trying default key {i+1}/{len(default_keys)} for sector {sector}")
-            if self.authenticate_sector(sector, key_type, key):
-                logger.info(f"Sector {sector} authenticated with default key {i+1}")
+        try:
+            if self.reader_manager.reactivate_card(card_info.uid):
                 return True
+        except Exception as e:
+            logger.debug(f"Card reactivation error: {e}")
         
-        logger.warning(f"No default keys worked for sector {sector}")
+        logger.warning("Card could not be reactivated after failed authentication")
+        card_info.present = False
         return False
     
+    def authenticate_known(self, sector: int, key_type: int) -> bool:
+        """Authenticate with the key cached for this card, if any"""
+        uid = self.card_operations.card_info.uid
+        if not self.key_cache or not uid:
+            return False
+        
+        key = self.key_cache.get_known_key(uid, sector, key_type)
+        if key is None:
+            return False
+        
+        logger.debug(f"Trying cached key for sector {sector}")
+        return self.authenticate_sector(sector, key_type, key)
+    
+    def set_key_derivation(self, engine: Optional[KeyDerivationEngine]) -> None:
+        """Set engine used to derive UID-diversified keys (None to disable)"""
+        self.key_derivation = engine
+    
+    def authenticate_diversified(self, sector: int, key_type: int) -> bool:
+        """Authenticate with the key diversified from the card UID"""
+        card_info = self.card_operations.card_info
+        if not self.key_derivation or not card_info.uid:
+            return False
+        
+        key = self.key_derivation.derive_key(card_info.uid, sector, key_type,
+                                             card_info.get_sector_count() or 16)
+        
+        # Skip the round-trip if this key was already rejected by the card
+        if self.key_cache and self.key_cache.is_known_failed(card_info.uid, sector, key_type, key):
+            return False
+        
+        return self.authenticate_sector(sector, key_type, key)
+    
+    def get_key_set_key(self, sector: int, key_type: int, key_set_name: str) -> Optional[bytes]:
+        """Get the key a named key set or diversification master gives (sector, key_type)"""
+        card_info = self.card_operations.card_info
+        if not self.key_vault or not self.key_vault.is_unlocked():
+            logger.error("Key vault is not unlocked")
+            return None
+        
+        key_set = self.key_vault.get_key_set(key_set_name)
+        if key_set is not None:
+            key = key_set.get_key(sector, key_type)
+        else:
+            engine = self.key_vault.get_derivation_engine(key_set_name)
+            if engine is None or not card_info.uid:
+                logger.error(f"Unknown key set: {key_set_name}")
+                return None
+            key = engine.derive_key(card_info.uid, sector, key_type, card_info.get_sector_count() or 16)
+        
+        if key is None:
+            logger.error(f"Key set {key_set_name} has no key for sector {sector}")
+        return key
+    
+    def authenticate_with_key_set(self, sector: int, key_type: int, key_set_name: str) -> bool:
+        """Authenticate with a named key set or diversification master from the key vault"""
+        key = self.get_key_set_key(sector, key_type, key_set_name)
+        if key is None:
+            return False
+        
+        success = self.authenticate_sector(sector, key_type, key)
+        if self.key_cache:
+            self.key_cache.save()
+        return success
+    
+    def try_default_keys(self, sector: int, key_type: int) -> bool:
+        """Try common default keys for authentication"""
+        try:
+            if self.authenticate_known(sector, key_type):
+                logger.info(f"Sector {sector} authenticated with cached key")
+                return True
+            
+            if self.authenticate_diversified(sector, key_type):
+                logger.info(f"Sector {sector} authenticated with diversified key")
+                return True
+            
+            uid = self.card_operations.card_info.uid
+            for i, key in enumerate(DEFAULT_KEYS):
+                if self.key_cache and uid and self.key_cache.is_known_failed(uid, sector, key_type, key):
+                    logger.debug(f"Skipping default key {i+1}, already rejected for sector {sector}")
+                    continue
+                logger.debug(f"Trying default key {i+1}/{len(DEFAULT_KEYS)} for sector {sector}")
+                if self.authenticate_sector(sector, key_type, key):
+                    logger.info(f"Sector {sector} authenticated with default key {i+1}")
+                    return True
+            
+            logger.warning(f"No default keys worked for sector {sector}")
+            return False
+        finally:
+            if self.key_cache:
+                self.key_cache.save()
+    
+    def get_key_map(self) -> dict:
+        """Get known keys for the current card as {sector: {key_type: key}}"""
+        uid = self.card_operations.card_info.uid
+        if not self.key_cache or not uid:
+            return {}
+        return self.key_cache.get_key_map(uid)
+    
     def authenticate_with_key(self, sector: int, key_type: int, key_hex: str) -> bool:
         """Authenticate with hex key string"""
         try:
@@ -117,14 +281,17 @@ class AuthenticationManager:
                 raise ValueError("Key must be 12 hex characters (6 bytes)")
             
             key_bytes = bytes.fromhex(key_hex)
-            return self.authenticate_sector(sector, key_type, key_bytes)
+            success = self.authenticate_sector(sector, key_type, key_bytes)
+            if self.key_cache:
+                self.key_cache.save()
+            return success
             
         except ValueError as e:
             logger.error(f"Invalid key format: {e}")
             return False
     
     def clear_loaded_keys(self) -> None:
-        """Clear all loaded keys from memory"""
+        """Clear all loaded keys from memory (the per-UID key cache is kept)"""
         self._loaded_keys.clear()
         self.card_operations.clear_authentication()
         logger.debug("Cleared all loaded keys and authentication states")
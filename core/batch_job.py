@@ -0,0 +1,431 @@
+"""
+Batch Jobs
+Encodes cards from a streamed CSV/JSON manifest, resuming from an incremental result log
+"""
+
+import codecs
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+
+from .authentication import AuthenticationManager
+from .card_operations import CardOperations
+from .card_template import CardProgram
+from .dump_library import DumpLibrary
+from .production import ProductionLine, ProductionResult
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_CSV = "csv"
+MANIFEST_JSON = "json"    # JSON array of objects, or one object per line
+MANIFEST_SUFFIXES = {".csv": MANIFEST_CSV, ".json": MANIFEST_JSON, ".jsonl": MANIFEST_JSON, ".ndjson": MANIFEST_JSON}
+
+MATCH_SEQUENCE = "sequence"  # each card takes the next manifest row
+MATCH_UID = "uid"            # each card takes the row with its UID
+
+UID_COLUMN = "uid"
+
+STATUS_ASSIGNED = "assigned"  # row handed to a card, outcome not yet known
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+
+READ_CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = " \t\r\n,"
+
+class ManifestError(Exception):
+    """Raised when a manifest cannot be read"""
+
+class BatchError(Exception):
+    """Raised when a card has no manifest row"""
+
+class ManifestRow:
+    """One order line: optional UID and the template field values"""
+
+    __slots__ = ("index", "offset", "next_offset", "uid", "values")
+
+    def __init__(self, index: int, offset: int, next_offset: int, uid: Optional[bytes], values: Dict[str, object]):
+        self.index = index
+        self.offset = offset            # byte offset of the row in the manifest
+        self.next_offset = next_offset  # byte offset of the following row
+        self.uid = uid
+        self.values = values
+
+    def __repr__(self) -> str:
+        uid = self.uid.hex().upper() if self.uid else "-"
+        return f"ManifestRow({self.index}, uid={uid})"
+
+class _LineSource:
+    """Binary line iterator tracking the byte offset consumed (feeds csv.reader)"""
+
+    def __init__(self, f, offset: int):
+        self.f = f
+        self.offset = offset
+
+    def __iter__(self) -> "_LineSource":
+        return self
+
+    def __next__(self) -> str:
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode("utf-8-sig" if self.offset == len(line) else "utf-8")
+
+class Manifest:
+    """Row-by-row reader of a CSV or JSON order manifest
+
+    Rows are parsed lazily from the file, each with its byte offset, so a
+    run can continue at any row and a large manifest is never held in
+    memory. CSV files need a header row; JSON files hold objects either in
+    a top-level array or one per line. The uid column (hex) is optional;
+    every other column is a template field value.
+    """
+
+    def __init__(self, path: Path, manifest_format: Optional[str] = None):
+        self.path = Path(path)
+        self.format = manifest_format or MANIFEST_SUFFIXES.get(self.path.suffix.lower())
+        if self.format not in (MANIFEST_CSV, MANIFEST_JSON):
+            raise ManifestError(f"Unknown manifest format: {self.path.suffix}")
+        self.fieldnames = None
+        self._data_offset = 0
+        self._json_array = self.format == MANIFEST_JSON and self._is_json_array()
+        if self.format == MANIFEST_CSV:
+            with open(self.path, "rb") as f:
+                source = _LineSource(f, 0)
+                self.fieldnames = next(csv.reader(source), None)
+                self._data_offset = source.offset
+            if not self.fieldnames:
+                raise ManifestError(f"{self.path} has no header row")
+
+    def _make_row(self, index: int, offset: int, next_offset: int, record: dict) -> ManifestRow:
+        """Split a parsed record into UID and field values"""
+        if not isinstance(record, dict):
+            raise ManifestError(f"Row {index} at byte {offset} is not an object")
+        values = {str(name).strip(): value for name, value in record.items() if name is not None}
+        uid_text = values.pop(UID_COLUMN, None)
+        uid = None
+        if uid_text not in (None, ""):
+            try:
+                uid = bytes.fromhex(str(uid_text).replace(":", "").replace(" ", ""))
+            except ValueError:
+                raise ManifestError(f"Row {index}: invalid UID {uid_text!r}")
+        return ManifestRow(index, offset, next_offset, uid, values)
+
+    def rows(self, offset: Optional[int] = None, index: int = 0) -> Iterator[ManifestRow]:
+        """Iterate rows from a byte offset (default first row); index numbers the first row"""
+        if offset is None:
+            offset = self._data_offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            if self.format == MANIFEST_CSV:
+                records = self._csv_records(f, offset)
+            elif self._json_array:
+                records = self._json_array_records(f, offset)
+            else:
+                records = self._json_line_records(f, offset)
+            for start, end, record in records:
+                yield self._make_row(index, start, end, record)
+                index += 1
+
+    def row_at(self, offset: int, index: int) -> ManifestRow:
+        """Read the single row starting at offset"""
+        for row in self.rows(offset, index):
+            return row
+        raise ManifestError(f"No row at byte {offset}")
+
+    def uid_index(self) -> Dict[bytes, Tuple[int, int]]:
+        """Scan the manifest once for UID -> (row index, byte offset)"""
+        index: Dict[bytes, Tuple[int, int]] = {}
+        for row in self.rows():
+            if row.uid is None:
+                raise ManifestError(f"Row {row.index} has no UID")
+            if row.uid in index:
+                raise ManifestError(f"UID {row.uid.hex().upper()} appears in rows {index[row.uid][0]} and {row.index}")
+            index[row.uid] = (row.index, row.offset)
+        return index
+
+    def _csv_records(self, f, offset: int) -> Iterator[Tuple[int, int, dict]]:
+        """Parse CSV records (quoted fields may span lines)"""
+        source = _LineSource(f, offset)
+        reader = csv.reader(source)
+        while True:
+            start = source.offset
+            try:
+                fields = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                raise ManifestError(f"CSV error at byte {start}: {e}")
+            if not any(field.strip() for field in fields):
+                continue
+            if len(fields) > len(self.fieldnames):
+                raise ManifestError(f"Row at byte {start} has more fields than the header")
+            yield start, source.offset, dict(zip(self.fieldnames, fields))
+
+    def _json_line_records(self, f, offset: int) -> Iterator[Tuple[int, int, dict]]:
+        """Parse one JSON object per line"""
+        while True:
+            start = offset
+            line = f.readline()
+            if not line:
+                return
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ManifestError(f"JSON error at byte {start}: {e}")
+            yield start, offset, record
+
+    def _is_json_array(self) -> bool:
+        """Check whether the JSON manifest is a top-level array"""
+        with open(self.path, "rb") as f:
+            head = f.read(READ_CHUNK_SIZE).decode("utf-8", errors="ignore").lstrip("﻿ \t\r\n")
+        return head.startswith("[")
+
+    def _json_array_records(self, f, offset: int) -> Iterator[Tuple[int, int, dict]]:
+        """Parse array elements incrementally, one chunk of the file at a time"""
+        decoder = json.JSONDecoder()
+        text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        buffer = ""
+        position = offset
+        opened = offset > 0
+        eof = False
+        while True:
+            stripped = buffer.lstrip(JSON_SEPARATORS)
+            position += len(buffer[:len(buffer) - len(stripped)].encode("utf-8"))
+            buffer = stripped
+            if buffer and not opened:
+                if not buffer.startswith("["):
+                    raise ManifestError("JSON manifest must be an array or one object per line")
+                position += 1
+                buffer = buffer[1:]
+                opened = True
+                continue
+            if buffer.startswith("]"):
+                return
+            if buffer:
+                try:
+                    record, end = decoder.raw_decode(buffer)
+                except ValueError as e:
+                    if eof:
+                        raise ManifestError(f"JSON error at byte {position}: {e}")
+                else:
+                    size = len(buffer[:end].encode("utf-8"))
+                    yield position, position + size, record
+                    position += size
+                    buffer = buffer[end:]
+                    continue
+            if eof:
+                raise ManifestError("JSON manifest array is not closed")
+            chunk = f.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            if position == 0 and chunk.startswith(codecs.BOM_UTF8):
+                # The decoder drops the BOM, but row offsets are file offsets
+                position += len(codecs.BOM_UTF8)
+            buffer += text_decoder.decode(chunk, final=eof)
+
+class BatchStats:
+    """Progress of a batch job, including rows finished before a restart"""
+
+    def __init__(self):
+        self.encoded = 0
+        self.failed = 0
+        self.resumed = 0      # rows already encoded when the job was opened
+        self.in_doubt = 0     # rows handed to a card whose outcome was never logged
+
+    def to_dict(self) -> dict:
+        """Get statistics as dictionary"""
+        return {
+            "encoded": self.encoded,
+            "failed": self.failed,
+            "resumed": self.resumed,
+            "in_doubt": self.in_doubt
+        }
+
+class BatchJob:
+    """Encodes one manifest row per presented card with a compiled template
+
+    Every assignment and outcome is appended to the output file (JSON
+    lines, flushed and synced) before the next card, and the job reopens
+    that log to resume: finished rows and cards are skipped, a row whose
+    card failed is handed to the next card, and a row handed out right
+    before a crash stays reserved for the card that had it. Encoded cards
+    are also recorded in the dump library when one is given.
+
+    In sequence mode only the current read position is kept; in UID mode
+    a UID -> offset index is built by one pass over the manifest.
+    """
+
+    def __init__(self, manifest: Manifest, program: CardProgram, output_path: Path,
+                 library: Optional[DumpLibrary] = None, match: str = MATCH_SEQUENCE,
+                 station: Optional[str] = None):
+        if match not in (MATCH_SEQUENCE, MATCH_UID):
+            raise ValueError(f"Unknown match mode: {match}")
+        self.manifest = manifest
+        self.program = program
+        self.output_path = Path(output_path)
+        self.library = library
+        self.match = match
+        self.station = station
+        self.stats = BatchStats()
+        self.line: Optional[ProductionLine] = None
+        self.done_uids: Set[bytes] = set()
+        self._done_rows: Set[int] = set()
+        self._reserved: Dict[bytes, ManifestRow] = {}   # uid -> row whose outcome is unknown
+        self._retry: deque = deque()                    # rows to hand to the next card
+        self._assigned: Dict[bytes, ManifestRow] = {}   # uid -> row of the card being encoded
+        self._lock = threading.Lock()
+
+        next_offset, next_index = self._load_output()
+        self._uid_index = manifest.uid_index() if match == MATCH_UID else None
+        self._rows = manifest.rows(next_offset, next_index) if match == MATCH_SEQUENCE else None
+        self._lookahead: Optional[ManifestRow] = None
+        program.value_provider = self.value_provider
+
+    def _load_output(self) -> Tuple[Optional[int], int]:
+        """Replay the result log of an earlier run
+
+        Returns:
+            tuple: (byte offset, index) of the first row never handed out
+        """
+        if not self.output_path.exists():
+            return None, 0
+
+        outcomes: Dict[int, dict] = {}
+        next_offset, next_index = None, 0
+        with open(self.output_path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                    index = entry["row"]
+                except (ValueError, KeyError, TypeError):
+                    # A torn last line is expected after a crash
+                    logger.warning(f"Batch output {self.output_path}:{line_number} skipped")
+                    continue
+                if entry.get("status") == STATUS_OK:
+                    self._done_rows.add(index)
+                    self.done_uids.add(bytes.fromhex(entry["uid"]))
+                    outcomes.pop(index, None)
+                elif index not in self._done_rows:
+                    outcomes[index] = entry
+                if index >= next_index:
+                    next_offset, next_index = entry["next_offset"], index + 1
+
+        self.stats.resumed = len(self._done_rows)
+        for index, entry in sorted(outcomes.items()):
+            row = self.manifest.row_at(entry["offset"], index)
+            if entry["status"] == STATUS_ASSIGNED:
+                self._reserved[bytes.fromhex(entry["uid"])] = row
+                self.stats.in_doubt += 1
+            elif self.match == MATCH_SEQUENCE:
+                self._retry.append(row)
+        if self._done_rows:
+            logger.info(f"Batch resumed: {len(self._done_rows)} rows done, {len(self._retry)} to retry, "
+                        f"{len(self._reserved)} in doubt")
+        return next_offset, next_index
+
+    def _log(self, row: ManifestRow, uid: bytes, status: str, **extra) -> None:
+        """Append one durable result record"""
+        entry = {"time": round(time.time(), 3), "row": row.index, "offset": row.offset,
+                 "next_offset": row.next_offset, "uid": uid.hex().upper(), "status": status}
+        entry.update(extra)
+        with open(self.output_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _peek(self) -> Optional[ManifestRow]:
+        """Get the next unused row in sequence mode without taking it"""
+        while self._lookahead is None:
+            row = next(self._rows, None)
+            if row is None:
+                return None
+            if row.index not in self._done_rows:
+                self._lookahead = row
+        return self._lookahead
+
+    def _take_row(self, uid: bytes) -> ManifestRow:
+        """Get the manifest row for the card with uid"""
+        if uid in self._reserved:
+            return self._reserved.pop(uid)
+        if self.match == MATCH_UID:
+            entry = self._uid_index.get(uid)
+            if entry is None:
+                raise BatchError(f"UID {uid.hex().upper()} is not in the manifest")
+            return self.manifest.row_at(entry[1], entry[0])
+        if self._retry:
+            return self._retry.popleft()
+        row = self._peek()
+        if row is None:
+            raise BatchError("Manifest has no rows left")
+        self._lookahead = None
+        return row
+
+    def remaining(self) -> bool:
+        """Check whether any row is left to encode"""
+        with self._lock:
+            if self.match == MATCH_UID:
+                return len(self._done_rows) < len(self._uid_index)
+            return bool(self._retry or self._reserved or self._peek() is not None)
+
+    def value_provider(self, uid: bytes) -> Dict[str, object]:
+        """Get the field values of the card with uid (CardProgram value provider)"""
+        with self._lock:
+            row = self._take_row(uid)
+            self._assigned[uid] = row
+            self._log(row, uid, STATUS_ASSIGNED)
+        return row.values
+
+    def on_result(self, result: ProductionResult) -> None:
+        """Log the outcome of a card and record it in the library (ProductionLine callback)"""
+        if result.duplicate:
+            return
+        with self._lock:
+            row = self._assigned.pop(result.uid, None)
+            if row is None:
+                # Failed before a row was assigned (e.g. not in the manifest)
+                self.stats.failed += 1
+                return
+            if not result.success:
+                self.stats.failed += 1
+                self._log(row, result.uid, STATUS_FAILED, stage=result.failed_stage)
+                if self.match == MATCH_SEQUENCE:
+                    self._retry.appendleft(row)
+                return
+
+            dump_id = None
+            self._done_rows.add(row.index)
+            self.done_uids.add(result.uid)
+            self.stats.encoded += 1
+            self._log(row, result.uid, STATUS_OK, cycle_ms=round(result.cycle_time * 1000, 3))
+        if self.library is not None:
+            try:
+                dump_id = self.library.add(self.program.written_image(result.uid), self.station,
+                                           label=f"{self.manifest.path.name} row {row.index}")
+            except Exception as e:
+                logger.error(f"Could not record row {row.index} in the dump library: {e}")
+        logger.info(f"Batch row {row.index} encoded on {result.uid.hex().upper()}"
+                    + (f" (dump {dump_id})" if dump_id is not None else ""))
+        if self.line is not None and not self.remaining():
+            logger.info("Batch manifest complete")
+            self.line.stop()
+
+    def create_line(self, card_operations: CardOperations, auth_manager: AuthenticationManager,
+                    on_result: Optional[Callable[[ProductionResult], None]] = None, **kwargs) -> ProductionLine:
+        """Get a production loop running this job, skipping cards already encoded"""
+        def record(result: ProductionResult) -> None:
+            self.on_result(result)
+            if on_result is not None:
+                on_result(result)
+
+        self.line = ProductionLine(card_operations, auth_manager, self.program,
+                                   processed_uids=self.done_uids, on_result=record, **kwargs)
+        return self.line
@@ -0,0 +1,318 @@
+"""
+Card Event Stream
+Continuous headless read mode publishing one NDJSON record per card tap
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import BinaryIO, Iterable, List, Optional
+
+from config.constants import AppSettings, DEFAULT_KEY, KEY_TYPE_A
+from .access_conditions import get_trailer_access
+from .authentication import AuthenticationManager
+from .card_operations import CardOperations
+from .dump import DumpEngine
+from .key_diversification import KeyMap
+from .private_files import claim_socket_path
+
+logger = logging.getLogger(__name__)
+
+class LatencyStats:
+    """Percentiles over the most recent latencies"""
+
+    def __init__(self, window: int = AppSettings.EVENT_LATENCY_WINDOW):
+        self.count = 0
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float) -> None:
+        """Record one latency in seconds"""
+        with self._lock:
+            self.count += 1
+            self._samples.append(elapsed)
+
+    def to_dict(self) -> dict:
+        """Get percentiles as dictionary (times in milliseconds)"""
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self.count
+        if not samples:
+            return {"count": count, "p50_ms": None, "p95_ms": None, "max_ms": None}
+
+        def percentile(fraction: float) -> float:
+            return round(samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000, 3)
+
+        return {
+            "count": count,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(samples[-1] * 1000, 3)
+        }
+
+class StreamSink:
+    """Writes event lines to a binary stream such as stdout"""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+
+    def write(self, data: bytes) -> None:
+        """Write one event line"""
+        self.stream.write(data)
+        self.stream.flush()
+
+    def close(self) -> None:
+        """Flush the stream (it stays open)"""
+        self.stream.flush()
+
+class UnixSocketSink:
+    """Serves event lines to every consumer connected to a Unix socket
+
+    A consumer that cannot take a line within the send timeout is
+    disconnected, so one stalled client never holds up the others. Only a
+    stale socket at path is replaced; anything else raises FileExistsError.
+    """
+
+    def __init__(self, path: Path, send_timeout: float = AppSettings.EVENT_SEND_TIMEOUT / 1000.0):
+        self.path = Path(path)
+        self.send_timeout = send_timeout
+        claim_socket_path(self.path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(str(self.path))
+        self._server.listen()
+        self._clients: List[socket.socket] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._acceptor = threading.Thread(target=self._accept_loop, daemon=True)
+        self._acceptor.start()
+
+    def _accept_loop(self) -> None:
+        """Accept consumers until the sink is closed"""
+        while not self._closed:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            client.settimeout(self.send_timeout)
+            with self._lock:
+                self._clients.append(client)
+            logger.debug("Event consumer connected")
+
+    def client_count(self) -> int:
+        """Get number of connected consumers"""
+        with self._lock:
+            return len(self._clients)
+
+    def write(self, data: bytes) -> None:
+        """Send one event line to every consumer"""
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.sendall(data)
+            except OSError as e:
+                # A partial line cannot be taken back, so the consumer has to go
+                logger.warning(f"Event consumer dropped: {e}")
+                with self._lock:
+                    self._clients.remove(client)
+                client.close()
+
+    def close(self) -> None:
+        """Disconnect consumers and remove the socket file"""
+        self._closed = True
+        self._server.close()
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            client.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+class EventPublisher:
+    """Bounded, non-blocking hand-off from the reader loop to a sink
+
+    publish() only appends to a fixed-size buffer; a writer thread encodes
+    records and writes them to the sink. When the consumer falls behind,
+    the oldest buffered records are dropped, so the reader loop never
+    waits. Tap-to-event latency is measured when a record is written.
+    """
+
+    def __init__(self, sink, buffer_size: int = AppSettings.EVENT_BUFFER_SIZE):
+        self.sink = sink
+        self.published = 0
+        self.dropped = 0
+        self.written = 0
+        self.latency = LatencyStats()
+        self._buffer: deque = deque()
+        self._buffer_size = buffer_size
+        self._condition = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def publish(self, record: dict, detected: Optional[float] = None) -> None:
+        """Queue one record; detected is the monotonic time the card was seen"""
+        with self._condition:
+            if len(self._buffer) >= self._buffer_size:
+                self._buffer.popleft()
+                self.dropped += 1
+            self._buffer.append((record, detected))
+            self.published += 1
+            self._condition.notify()
+
+    def pending_count(self) -> int:
+        """Get number of records waiting for the sink"""
+        with self._condition:
+            return len(self._buffer)
+
+    def _write_loop(self) -> None:
+        """Writer thread: encode and write buffered records"""
+        while True:
+            with self._condition:
+                while not self._buffer and not self._closed:
+                    self._condition.wait()
+                if not self._buffer:
+                    return
+                record, detected = self._buffer.popleft()
+            if detected is not None:
+                elapsed = time.monotonic() - detected
+                record.setdefault("timings", {})["tap_to_event_ms"] = round(elapsed * 1000, 3)
+            try:
+                self.sink.write((json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8"))
+            except Exception as e:
+                logger.error(f"Could not write card event: {e}")
+                continue
+            self.written += 1
+            if detected is not None:
+                self.latency.record(elapsed)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Write what is buffered, then stop the writer and close the sink"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._writer.join(timeout)
+        self.sink.close()
+
+    def to_dict(self) -> dict:
+        """Get delivery statistics"""
+        with self._condition:
+            pending = len(self._buffer)
+        return {
+            "published": self.published,
+            "written": self.written,
+            "dropped": self.dropped,
+            "pending": pending,
+            "tap_to_event": self.latency.to_dict()
+        }
+
+def mask_trailer_keys(trailer: bytes) -> bytes:
+    """Zero Key A, and Key B unless the access bits make it readable data"""
+    access = get_trailer_access(trailer)
+    key_b = trailer[10:16] if access is not None and access.key_b_readable else bytes(6)
+    return bytes(6) + trailer[6:10] + key_b
+
+class ContinuousReader:
+    """Reads the configured sectors of every tapped card and publishes them
+
+    Cards are found with bare GET UID polls. Each sector is read with the
+    keys of the key map (default Key A FFFFFFFFFFFF); sectors that reject
+    them are listed in the record instead of failing it. A card produces
+    one event per tap: the loop waits for it to leave before the next.
+    Trailer keys are masked in the records unless include_keys is set.
+    """
+
+    def __init__(self, card_operations: CardOperations, auth_manager: AuthenticationManager,
+                 publisher: EventPublisher, sectors: Iterable[int], key_map: Optional[KeyMap] = None,
+                 poll_interval: float = AppSettings.PRODUCTION_POLL_INTERVAL / 1000.0,
+                 include_keys: bool = False):
+        self.card_operations = card_operations
+        self.reader_manager = card_operations.reader_manager
+        self.dump_engine = DumpEngine(card_operations, auth_manager)
+        self.publisher = publisher
+        self.sectors = sorted(sectors)
+        self.key_map = key_map or {}
+        self.poll_interval = poll_interval
+        self.include_keys = include_keys
+        self.events = 0
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """Ask the loop to finish"""
+        self._stop.set()
+
+    def read_card(self, uid: bytes) -> dict:
+        """Read the configured sectors of the card in the field into an event record"""
+        start = time.perf_counter()
+        self.card_operations.clear_authentication()
+        self.card_operations.set_detected_card(uid)
+        image = self.dump_engine.new_image()
+        unread = []
+        for sector in self.sectors:
+            keys = self.key_map.get(sector, {KEY_TYPE_A: DEFAULT_KEY})
+            if not self.dump_engine.read_sector(image, sector, keys):
+                unread.append(sector)
+        blocks = {}
+        for sector in self.sectors:
+            trailer_block = image.get_trailer_block(sector)
+            for block in image.get_sector_blocks(sector):
+                if not image.has_block(block):
+                    continue
+                data = image.get_block(block)
+                if block == trailer_block and not self.include_keys:
+                    data = mask_trailer_keys(data)
+                blocks[str(block)] = data.hex().upper()
+        atr = self.reader_manager.get_atr()
+        return {
+            "uid": uid.hex().upper(),
+            "atr": atr.hex().upper() if atr is not None else None,
+            "time": round(time.time(), 3),
+            "blocks": blocks,
+            "unread_sectors": unread,
+            "timings": {"read_ms": round((time.perf_counter() - start) * 1000, 3)}
+        }
+
+    def _wait_for_removal(self, uid: bytes) -> None:
+        """Poll until the card has left the field (debounced like the production loop)"""
+        empty_polls = 0
+        while not self._stop.is_set() and empty_polls < AppSettings.PRODUCTION_REMOVAL_POLLS:
+            current = self.reader_manager.poll_card_uid()
+            if current is not None and current != uid:
+                return
+            empty_polls = empty_polls + 1 if current is None else 0
+            self._stop.wait(self.poll_interval)
+
+    def run(self, max_events: Optional[int] = None) -> dict:
+        """Publish card events until stop() is called or max_events were published
+
+        Returns:
+            dict: delivery statistics (see EventPublisher.to_dict)
+        """
+        self._stop.clear()
+        logger.info(f"Continuous read started for sectors {self.sectors}")
+        while not self._stop.is_set() and (max_events is None or self.events < max_events):
+            uid = self.reader_manager.poll_card_uid()
+            if uid is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            detected = time.monotonic()
+            try:
+                record = self.read_card(uid)
+            except Exception as e:
+                logger.error(f"Continuous read of {uid.hex().upper()} failed: {e}")
+                record = {"uid": uid.hex().upper(), "time": round(time.time(), 3), "error": str(e)}
+            self.publisher.publish(record, detected)
+            self.events += 1
+            self._wait_for_removal(uid)
+
+        stats = self.publisher.to_dict()
+        stats["poll_interval_ms"] = round(self.poll_interval * 1000, 3)
+        logger.info(f"Continuous read stopped after {self.events} events")
+        return stats
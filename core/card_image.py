@@ -0,0 +1,176 @@
+"""
+MIFARE Classic Card Image
+In-memory buffer of card contents with per-block coverage tracking
+"""
+
+from typing import Dict, List, Optional
+
+from config.constants import (
+    KEY_TYPE_A, KEY_TYPE_B, CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K, MIFARE_BLOCK_SIZE,
+    MIFARE_1K_SECTORS, MIFARE_4K_SECTORS, MIFARE_CLASSIC_1K_SIZE, MIFARE_CLASSIC_4K_SIZE
+)
+from .access_conditions import get_trailer_access
+from .data_utils import get_block_sector, get_sector_first_block, get_sector_block_count
+
+CARD_TYPE_SIZES = {
+    CARD_TYPE_MIFARE_1K: MIFARE_CLASSIC_1K_SIZE,
+    CARD_TYPE_MIFARE_4K: MIFARE_CLASSIC_4K_SIZE
+}
+
+CARD_TYPE_SECTORS = {
+    CARD_TYPE_MIFARE_1K: MIFARE_1K_SECTORS,
+    CARD_TYPE_MIFARE_4K: MIFARE_4K_SECTORS
+}
+
+def card_type_from_size(size: int) -> int:
+    """Get card type for an image size in bytes"""
+    for card_type, card_size in CARD_TYPE_SIZES.items():
+        if size == card_size:
+            return card_type
+    raise ValueError(f"Unsupported card image size: {size} bytes")
+
+class CardImage:
+    """Contents of a MIFARE Classic card, possibly only partially captured
+
+    Data lives in one contiguous bytearray; a parallel bytearray flags which
+    blocks were actually captured, so partial reads keep explicit coverage.
+    """
+
+    def __init__(self, card_type: int = CARD_TYPE_MIFARE_1K, uid: Optional[bytes] = None,
+                 data: Optional[bytes] = None):
+        if card_type not in CARD_TYPE_SIZES:
+            raise ValueError(f"Unsupported card type: {card_type}")
+        self.card_type = card_type
+        self.uid = uid
+        self.size = CARD_TYPE_SIZES[card_type]
+        self.block_count = self.size // MIFARE_BLOCK_SIZE
+        self.sector_count = CARD_TYPE_SECTORS[card_type]
+        self.buffer = bytearray(self.size)
+        self.captured = bytearray(self.block_count)
+        self.key_map: Dict[int, Dict[int, bytes]] = {}
+
+        if data is not None:
+            if len(data) != self.size:
+                raise ValueError(f"Image data must be exactly {self.size} bytes")
+            self.buffer[:] = data
+            self.captured[:] = b"\x01" * self.block_count
+            if uid is None:
+                self.uid = self._uid_from_manufacturer_block()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, uid: Optional[bytes] = None) -> "CardImage":
+        """Create a fully captured image from raw card contents"""
+        return cls(card_type_from_size(len(data)), uid, data)
+
+    def _uid_from_manufacturer_block(self) -> Optional[bytes]:
+        """Get 4-byte UID from block 0 if its BCC is consistent"""
+        uid = bytes(self.buffer[0:4])
+        bcc = uid[0] ^ uid[1] ^ uid[2] ^ uid[3]
+        return uid if bcc == self.buffer[4] else None
+
+    def get_block(self, block: int) -> bytes:
+        """Get block contents (zeros if not captured)"""
+        offset = block * MIFARE_BLOCK_SIZE
+        return bytes(self.buffer[offset:offset + MIFARE_BLOCK_SIZE])
+
+    def set_block(self, block: int, data: bytes) -> None:
+        """Store block contents and mark block as captured"""
+        if len(data) != MIFARE_BLOCK_SIZE:
+            raise ValueError(f"Block data must be exactly {MIFARE_BLOCK_SIZE} bytes")
+        offset = block * MIFARE_BLOCK_SIZE
+        self.buffer[offset:offset + MIFARE_BLOCK_SIZE] = data
+        self.captured[block] = 1
+
+    def has_block(self, block: int) -> bool:
+        """Check if block was captured"""
+        return bool(self.captured[block])
+
+    def get_sector_blocks(self, sector: int) -> range:
+        """Get block numbers of sector"""
+        first = get_sector_first_block(sector)
+        return range(first, first + get_sector_block_count(sector))
+
+    def get_sector(self, sector: int) -> bytes:
+        """Get raw contents of all blocks in sector"""
+        blocks = self.get_sector_blocks(sector)
+        return bytes(self.buffer[blocks.start * MIFARE_BLOCK_SIZE:blocks.stop * MIFARE_BLOCK_SIZE])
+
+    def set_sector(self, sector: int, data: bytes) -> None:
+        """Store contents of all blocks in sector"""
+        blocks = self.get_sector_blocks(sector)
+        if len(data) != len(blocks) * MIFARE_BLOCK_SIZE:
+            raise ValueError(f"Sector {sector} data must be {len(blocks) * MIFARE_BLOCK_SIZE} bytes")
+        self.buffer[blocks.start * MIFARE_BLOCK_SIZE:blocks.stop * MIFARE_BLOCK_SIZE] = data
+        self.captured[blocks.start:blocks.stop] = b"\x01" * len(blocks)
+
+    def get_trailer_block(self, sector: int) -> int:
+        """Get trailer block number of sector"""
+        return self.get_sector_blocks(sector)[-1]
+
+    def get_trailer(self, sector: int) -> bytes:
+        """Get sector trailer contents"""
+        return self.get_block(self.get_trailer_block(sector))
+
+    def is_sector_complete(self, sector: int) -> bool:
+        """Check if all blocks of sector were captured"""
+        blocks = self.get_sector_blocks(sector)
+        return all(self.captured[blocks.start:blocks.stop])
+
+    def get_missing_blocks(self) -> List[int]:
+        """Get block numbers not captured yet"""
+        return [block for block in range(self.block_count) if not self.captured[block]]
+
+    def get_missing_sectors(self) -> List[int]:
+        """Get sectors with at least one block not captured"""
+        return [sector for sector in range(self.sector_count) if not self.is_sector_complete(sector)]
+
+    def first_missing_sector(self) -> Optional[int]:
+        """Get first sector that is not completely captured"""
+        for sector in range(self.sector_count):
+            if not self.is_sector_complete(sector):
+                return sector
+        return None
+
+    def captured_block_count(self) -> int:
+        """Get number of captured blocks"""
+        return sum(self.captured)
+
+    def coverage(self) -> float:
+        """Get fraction of blocks captured (0.0 - 1.0)"""
+        return self.captured_block_count() / self.block_count
+
+    def is_complete(self) -> bool:
+        """Check if every block was captured"""
+        return self.captured_block_count() == self.block_count
+
+    def apply_key_map(self, key_map: Dict[int, Dict[int, bytes]]) -> None:
+        """Record verified keys and fill them into captured trailers where the card masked them
+
+        Cards return Key A as zeros, and Key B as zeros unless the access
+        conditions make it readable. Key bytes the card did return are
+        never replaced, so only pass keys that authenticated.
+        """
+        masked = bytes(6)
+        for sector, keys in key_map.items():
+            if sector >= self.sector_count:
+                continue
+            self.key_map.setdefault(sector, {}).update(keys)
+            trailer_block = self.get_trailer_block(sector)
+            if not self.has_block(trailer_block):
+                continue
+            offset = trailer_block * MIFARE_BLOCK_SIZE
+            if KEY_TYPE_A in keys and self.buffer[offset:offset + 6] == masked:
+                self.buffer[offset:offset + 6] = keys[KEY_TYPE_A]
+            if KEY_TYPE_B in keys and self.buffer[offset + 10:offset + 16] == masked:
+                access = get_trailer_access(self.get_block(trailer_block))
+                if access is not None and not access.key_b_readable:
+                    self.buffer[offset + 10:offset + 16] = keys[KEY_TYPE_B]
+
+    def to_bytes(self) -> bytes:
+        """Get raw image contents"""
+        return bytes(self.buffer)
+
+    @staticmethod
+    def get_block_sector(block: int) -> int:
+        """Get sector number containing block"""
+        return get_block_sector(block)
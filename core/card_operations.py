@@ -12,6 +12,8 @@ from config.constants import (
     CARD_TYPE_UNKNOWN, MIFARE_BLOCK_SIZE, MIFARE_1K_SECTORS, MIFARE_4K_SECTORS
 )
 from .reader_manager import ReaderManager
+from .access_conditions import validate_trailer
+from .card_image import CARD_TYPE_SECTORS, CARD_TYPE_SIZES
 
 logger = logging.getLogger(__name__)
 
@@ -89,13 +91,7 @@ class CardOperations:
             response, sw1, sw2 = self.reader_manager.send_apdu(APDUCommands.GET_UID)
             
             if sw1 == 0x90 and sw2 == 0x00 and len(response) > 0:
-                self.card_info.uid = bytes(response)
-                self.card_info.present = True
-                
-                # Determine card type based on UID length and other factors
-                self._determine_card_type()
-                
-                logger.info(f"Card detected: UID={self.card_info.uid.hex()}, Type={self.card_info.get_card_type_name()}")
+                self.set_detected_card(bytes(response))
                 return True
             else:
                 self.card_info.present = False
@@ -108,6 +104,24 @@ class CardOperations:
             self.card_info.present = False
             return False
     
+    def set_detected_card(self, uid: bytes) -> None:
+        """Take a card whose UID was already read (e.g. by polling) as present"""
+        self.card_info.uid = uid
+        self.card_info.present = True
+        
+        # Determine card type based on UID length and other factors
+        self._determine_card_type()
+        
+        logger.info(f"Card detected: UID={self.card_info.uid.hex()}, Type={self.card_info.get_card_type_name()}")
+    
+    def set_card_type(self, card_type: int) -> None:
+        """Take the card in the field as card_type (UID polling cannot tell 4K from 1K)"""
+        if card_type not in CARD_TYPE_SECTORS:
+            raise ValueError(f"Unsupported card type: {card_type}")
+        self.card_info.card_type = card_type
+        self.card_info.size = CARD_TYPE_SIZES[card_type]
+        self.card_info.sectors = CARD_TYPE_SECTORS[card_type]
+
     def _determine_card_type(self) -> None:
         """Determine card type based on available information"""
         # This is a simplified detection - in practice, you might need
@@ -156,6 +170,12 @@ class CardOperations:
             if not self._is_block_accessible(block_number):
                 raise ValueError(f"Block {block_number} not accessible or not authenticated")
             
+            # Never write a trailer whose access bits would lock the sector
+            if self.card_info.is_trailer_block(block_number):
+                trailer_valid, message = validate_trailer(data)
+                if not trailer_valid:
+                    raise ValueError(f"Refusing to write trailer block {block_number}: {message}")
+            
             # Prepare write command
             command = APDUCommands.UPDATE_BINARY + [block_number, MIFARE_BLOCK_SIZE] + list(data)
             
@@ -0,0 +1,616 @@
+"""
+Card Templates
+Declarative card layouts compiled once into preassembled APDU programs
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from config.constants import (
+    APDUCommands, CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K, DEFAULT_KEY,
+    KEY_TYPE_A, KEY_TYPE_B, MIFARE_BLOCK_SIZE
+)
+from .access_conditions import (
+    DEFAULT_GENERAL_PURPOSE_BYTE, KEY_TYPE_MASKS, OP_READ, OP_READ_ACCESS, OP_READ_KEY_B,
+    SectorAccess, build_trailer, encode_access_bits, get_block_group, get_trailer_access
+)
+from .card_image import CardImage, CARD_TYPE_SECTORS
+from .data_utils import get_block_sector, get_sector_first_block, get_sector_block_count
+from .reader_manager import ApduBatchError
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_VERSION = 1
+
+# Volatile key slots of the ACR1252U
+KEY_SLOTS = (0x00, 0x01)
+
+FIELD_SOURCE_UID = "uid"          # UID of the card being encoded
+FIELD_SOURCE_COUNTER = "counter"  # sequence number, advanced per encoded card
+FIELD_SOURCE_VALUE = "value"      # supplied by the caller for each card
+FIELD_SOURCES = (FIELD_SOURCE_UID, FIELD_SOURCE_COUNTER, FIELD_SOURCE_VALUE)
+
+ENCODING_BYTES = "bytes"
+ENCODING_UINT_BE = "uint_be"
+ENCODING_UINT_LE = "uint_le"
+ENCODING_ASCII = "ascii"
+ENCODING_BCD = "bcd"
+ENCODINGS = (ENCODING_BYTES, ENCODING_UINT_BE, ENCODING_UINT_LE, ENCODING_ASCII, ENCODING_BCD)
+
+CARD_TYPE_CODES = {"1k": CARD_TYPE_MIFARE_1K, "4k": CARD_TYPE_MIFARE_4K}
+KEY_TYPE_CODES = {"A": KEY_TYPE_A, "B": KEY_TYPE_B}
+
+STEP_LOAD_KEY = "load_key"
+STEP_AUTH = "auth"
+STEP_WRITE = "write"
+STEP_READ = "read"
+
+class TemplateError(Exception):
+    """Raised when a template is invalid or a field value does not fit"""
+
+def encode_field_value(value: Union[int, str, bytes], encoding: str, length: int) -> bytes:
+    """Encode a field value into exactly length bytes"""
+    try:
+        if encoding == ENCODING_BYTES:
+            data = bytes.fromhex(value) if isinstance(value, str) else bytes(value)
+            if len(data) > length:
+                raise TemplateError(f"{len(data)} bytes do not fit {length}")
+            return data + bytes(length - len(data))
+        if encoding == ENCODING_UINT_BE:
+            return int(value).to_bytes(length, "big")
+        if encoding == ENCODING_UINT_LE:
+            return int(value).to_bytes(length, "little")
+        if encoding == ENCODING_ASCII:
+            data = value if isinstance(value, bytes) else str(value).encode("ascii")
+            if len(data) > length:
+                raise TemplateError(f"Text of {len(data)} characters does not fit {length}")
+            return data + bytes(length - len(data))
+        if encoding == ENCODING_BCD:
+            digits = str(int(value)).rjust(length * 2, "0")
+            if len(digits) > length * 2:
+                raise TemplateError(f"{value} has more than {length * 2} digits")
+            return bytes.fromhex(digits)
+    except (OverflowError, ValueError, TypeError, UnicodeEncodeError) as e:
+        raise TemplateError(f"Cannot encode {value!r} as {encoding}: {e}")
+    raise TemplateError(f"Unknown field encoding: {encoding}")
+
+class TemplateField:
+    """Per-card bytes inside a data block"""
+
+    def __init__(self, name: str, block: int, offset: int, length: int,
+                 source: str = FIELD_SOURCE_VALUE, encoding: str = ENCODING_BYTES,
+                 start: int = 0, step: int = 1):
+        self.name = name
+        self.block = block
+        self.offset = offset
+        self.length = length
+        self.source = source
+        self.encoding = encoding
+        self.start = start
+        self.step = step
+
+    def encode(self, value: Union[int, str, bytes]) -> bytes:
+        """Encode one value of this field"""
+        try:
+            return encode_field_value(value, self.encoding, self.length)
+        except TemplateError as e:
+            raise TemplateError(f"Field {self.name}: {e}")
+
+    def to_dict(self) -> dict:
+        """Get JSON representation"""
+        data = {"name": self.name, "block": self.block, "offset": self.offset, "length": self.length,
+                "source": self.source, "encoding": self.encoding}
+        if self.source == FIELD_SOURCE_COUNTER:
+            data.update(start=self.start, step=self.step)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TemplateField":
+        """Create field from JSON representation"""
+        try:
+            return cls(data["name"], int(data["block"]), int(data.get("offset", 0)), int(data["length"]),
+                       data.get("source", FIELD_SOURCE_VALUE), data.get("encoding", ENCODING_BYTES),
+                       int(data.get("start", 0)), int(data.get("step", 1)))
+        except (KeyError, TypeError, ValueError) as e:
+            raise TemplateError(f"Invalid field definition {data!r}: {e}")
+
+class SectorTemplate:
+    """Contents of one sector: data blocks, optional new trailer and the keys to write it"""
+
+    def __init__(self, sector: int, data: Optional[Dict[int, bytes]] = None,
+                 key_a: Optional[bytes] = None, access: Optional[bytes] = None, key_b: Optional[bytes] = None,
+                 gpb: int = DEFAULT_GENERAL_PURPOSE_BYTE, auth_keys: Optional[Dict[int, bytes]] = None):
+        self.sector = sector
+        self.data = data or {}
+        self.key_a = key_a
+        self.access = access
+        self.key_b = key_b
+        self.gpb = gpb
+        self.auth_keys = auth_keys or {}
+
+    @property
+    def has_trailer(self) -> bool:
+        """Check if the sector trailer is rewritten"""
+        return self.key_a is not None or self.access is not None or self.key_b is not None
+
+    @property
+    def trailer(self) -> Optional[bytes]:
+        """Get the trailer written to the sector, if any"""
+        if not self.has_trailer:
+            return None
+        return build_trailer(self.key_a, self.access, self.key_b, self.gpb)
+
+    def get_write_key(self, default_key: bytes) -> Tuple[int, bytes]:
+        """Get (key type, key) authenticating the sector on a blank card"""
+        for key_type in (KEY_TYPE_A, KEY_TYPE_B):
+            if key_type in self.auth_keys:
+                return key_type, self.auth_keys[key_type]
+        return KEY_TYPE_A, default_key
+
+    def to_dict(self) -> dict:
+        """Get JSON representation"""
+        data: dict = {"data": {str(block): value.hex().upper() for block, value in sorted(self.data.items())}}
+        if self.has_trailer:
+            data.update(key_a=self.key_a.hex().upper(), access=self.access.hex().upper(),
+                        key_b=self.key_b.hex().upper(), gpb=f"{self.gpb:02X}")
+        if self.auth_keys:
+            names = {key_type: name for name, key_type in KEY_TYPE_CODES.items()}
+            data["auth"] = {names[key_type]: key.hex().upper() for key_type, key in self.auth_keys.items()}
+        return data
+
+    @classmethod
+    def from_dict(cls, sector: int, data: dict) -> "SectorTemplate":
+        """Create sector template from JSON representation"""
+        try:
+            blocks = {int(block): bytes.fromhex(value) for block, value in data.get("data", {}).items()}
+            access = data.get("access")
+            if isinstance(access, list):
+                access = encode_access_bits(access)
+            elif access is not None:
+                access = bytes.fromhex(access)
+            auth_keys = {KEY_TYPE_CODES[name.upper()]: bytes.fromhex(key)
+                         for name, key in data.get("auth", {}).items()}
+            return cls(
+                sector, blocks,
+                bytes.fromhex(data["key_a"]) if "key_a" in data else None,
+                access,
+                bytes.fromhex(data["key_b"]) if "key_b" in data else None,
+                int(data.get("gpb", f"{DEFAULT_GENERAL_PURPOSE_BYTE:02X}"), 16),
+                auth_keys
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise TemplateError(f"Invalid definition of sector {sector}: {e}")
+
+class CardTemplate:
+    """Card layout applied to many cards: sectors plus per-card variable fields"""
+
+    def __init__(self, name: str = "", card_type: int = CARD_TYPE_MIFARE_1K,
+                 sectors: Optional[Dict[int, SectorTemplate]] = None,
+                 fields: Optional[List[TemplateField]] = None, default_key: bytes = DEFAULT_KEY):
+        self.name = name
+        self.card_type = card_type
+        self.sectors = sectors or {}
+        self.fields = fields or []
+        self.default_key = default_key
+
+    def validate(self) -> None:
+        """Check the whole layout, raising TemplateError on the first problem"""
+        if self.card_type not in CARD_TYPE_SECTORS:
+            raise TemplateError(f"Unsupported card type: {self.card_type}")
+        if len(self.default_key) != 6:
+            raise TemplateError("Default key must be 6 bytes")
+        if not self.sectors:
+            raise TemplateError("Template has no sectors")
+
+        for sector, sector_template in self.sectors.items():
+            if not 0 <= sector < CARD_TYPE_SECTORS[self.card_type]:
+                raise TemplateError(f"Sector {sector} does not exist on this card type")
+            trailer_block = get_sector_first_block(sector) + get_sector_block_count(sector) - 1
+            for block, data in sector_template.data.items():
+                if block == 0:
+                    raise TemplateError("Block 0 (manufacturer block) cannot be written")
+                if get_block_sector(block) != sector or block == trailer_block:
+                    raise TemplateError(f"Block {block} is not a data block of sector {sector}")
+                if len(data) != MIFARE_BLOCK_SIZE:
+                    raise TemplateError(f"Block {block} data must be {MIFARE_BLOCK_SIZE} bytes")
+            if sector_template.has_trailer:
+                if None in (sector_template.key_a, sector_template.access, sector_template.key_b):
+                    raise TemplateError(f"Sector {sector} trailer needs key_a, access and key_b")
+                if not 0 <= sector_template.gpb <= 0xFF:
+                    raise TemplateError(f"Sector {sector} general purpose byte out of range")
+                try:
+                    sector_template.trailer
+                except ValueError as e:
+                    raise TemplateError(f"Sector {sector} trailer: {e}")
+            elif not sector_template.data:
+                raise TemplateError(f"Sector {sector} has nothing to write")
+            if any(len(key) != 6 for key in sector_template.auth_keys.values()):
+                raise TemplateError(f"Sector {sector} authentication keys must be 6 bytes")
+
+        names = set()
+        covered: Dict[int, bytearray] = {}
+        for field in self.fields:
+            if field.name in names:
+                raise TemplateError(f"Duplicate field name: {field.name}")
+            names.add(field.name)
+            if field.source not in FIELD_SOURCES:
+                raise TemplateError(f"Field {field.name}: unknown source {field.source}")
+            if field.encoding not in ENCODINGS:
+                raise TemplateError(f"Field {field.name}: unknown encoding {field.encoding}")
+            sector_template = self.sectors.get(get_block_sector(field.block))
+            if sector_template is None or field.block not in sector_template.data:
+                raise TemplateError(f"Field {field.name}: block {field.block} is not written by the template")
+            if field.length < 1 or field.offset < 0 or field.offset + field.length > MIFARE_BLOCK_SIZE:
+                raise TemplateError(f"Field {field.name} does not fit in a block")
+            used = covered.setdefault(field.block, bytearray(MIFARE_BLOCK_SIZE))
+            if any(used[field.offset:field.offset + field.length]):
+                raise TemplateError(f"Field {field.name} overlaps another field in block {field.block}")
+            used[field.offset:field.offset + field.length] = b"\x01" * field.length
+
+    def to_dict(self) -> dict:
+        """Get JSON representation"""
+        codes = {card_type: code for code, card_type in CARD_TYPE_CODES.items()}
+        return {
+            "version": TEMPLATE_VERSION,
+            "name": self.name,
+            "card_type": codes[self.card_type],
+            "default_key": self.default_key.hex().upper(),
+            "sectors": {str(sector): template.to_dict() for sector, template in sorted(self.sectors.items())},
+            "fields": [field.to_dict() for field in self.fields]
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CardTemplate":
+        """Create template from JSON representation"""
+        if data.get("version", TEMPLATE_VERSION) != TEMPLATE_VERSION:
+            raise TemplateError(f"Unsupported template version: {data.get('version')}")
+        card_type = CARD_TYPE_CODES.get(str(data.get("card_type", "1k")).lower())
+        if card_type is None:
+            raise TemplateError(f"Unknown card type: {data.get('card_type')}")
+        try:
+            default_key = bytes.fromhex(data.get("default_key", DEFAULT_KEY.hex()))
+            sectors = {int(sector): SectorTemplate.from_dict(int(sector), value)
+                       for sector, value in data.get("sectors", {}).items()}
+        except (TypeError, ValueError) as e:
+            raise TemplateError(f"Invalid template: {e}")
+        fields = [TemplateField.from_dict(field) for field in data.get("fields", [])]
+        return cls(data.get("name", ""), card_type, sectors, fields, default_key)
+
+    @classmethod
+    def from_image(cls, image: CardImage, name: str = "", default_key: bytes = DEFAULT_KEY,
+                   trailers: bool = True) -> "CardTemplate":
+        """Create a template writing the captured blocks of a dump
+
+        Trailer keys come from the image key map when known, since keys
+        read back from a card are masked as zeros. Non-zero trailer keys and
+        a Key B the access bits make readable are taken from the trailer;
+        any other key is unknown and raises TemplateError. With trailers
+        False only data blocks are written and no key is needed.
+        """
+        sectors = {}
+        for sector in range(image.sector_count):
+            trailer_block = image.get_trailer_block(sector)
+            data = {block: image.get_block(block) for block in image.get_sector_blocks(sector)
+                    if block not in (0, trailer_block) and image.has_block(block)}
+            sector_template = SectorTemplate(sector, data)
+            if trailers and image.has_block(trailer_block):
+                trailer = image.get_block(trailer_block)
+                keys = image.key_map.get(sector, {})
+                access = get_trailer_access(trailer)
+                key_a = keys.get(KEY_TYPE_A)
+                if key_a is None and any(trailer[0:6]):
+                    key_a = trailer[0:6]
+                key_b = keys.get(KEY_TYPE_B)
+                if key_b is None and (any(trailer[10:16]) or (access is not None and access.key_b_readable)):
+                    key_b = trailer[10:16]
+                if key_a is None or key_b is None:
+                    missing = "Key A" if key_a is None else "Key B"
+                    raise TemplateError(f"{missing} of sector {sector} is unknown; "
+                                        "give it in the dump's key map")
+                sector_template.key_a = key_a
+                sector_template.access = trailer[6:9]
+                sector_template.gpb = trailer[9]
+                sector_template.key_b = key_b
+            if sector_template.data or sector_template.has_trailer:
+                sectors[sector] = sector_template
+        return cls(name, image.card_type, sectors, default_key=default_key)
+
+def load_template(path: Union[str, Path]) -> CardTemplate:
+    """Load a JSON card template"""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        raise TemplateError(f"Template is not valid JSON: {e}")
+    return CardTemplate.from_dict(data)
+
+def save_template(template: CardTemplate, path: Union[str, Path]) -> None:
+    """Save a card template as JSON"""
+    with open(path, 'w') as f:
+        json.dump(template.to_dict(), f, indent=2)
+
+class ProgramStep:
+    """One preassembled APDU with the response it must produce"""
+
+    __slots__ = ("kind", "sector", "block", "apdu", "expected")
+
+    def __init__(self, kind: str, sector: int, block: int, apdu: List[int],
+                 expected: Optional[List[int]] = None):
+        self.kind = kind
+        self.sector = sector
+        self.block = block
+        self.apdu = apdu
+        self.expected = expected
+
+    def __repr__(self) -> str:
+        return f"ProgramStep({self.kind}, sector {self.sector}, block {self.block})"
+
+class ProgramResult:
+    """Outcome of running a program phase on one card"""
+
+    def __init__(self, success: bool, apdu_count: int, failed_step: Optional[ProgramStep] = None):
+        self.success = success
+        self.apdu_count = apdu_count
+        self.failed_step = failed_step
+
+    def __repr__(self) -> str:
+        state = "ok" if self.success else f"failed at {self.failed_step}"
+        return f"ProgramResult({state}, {self.apdu_count} APDUs)"
+
+class _KeySlotAllocator:
+    """Tracks reader key slot contents at compile time to skip redundant key loads"""
+
+    def __init__(self):
+        self.slots: Dict[int, bytes] = {}
+        self.order: List[int] = []
+
+    def auth_steps(self, sector: int, key_type: int, key: bytes) -> List[ProgramStep]:
+        """Get steps authenticating a sector, loading the key only if no slot holds it"""
+        first_block = get_sector_first_block(sector)
+        steps = []
+        slot = next((slot for slot, loaded in self.slots.items() if loaded == key), None)
+        if slot is None:
+            free = [slot for slot in KEY_SLOTS if slot not in self.slots]
+            slot = free[0] if free else self.order[0]
+            self.slots[slot] = key
+            load = APDUCommands.LOAD_AUTH_KEY.copy()
+            load[3] = slot
+            steps.append(ProgramStep(STEP_LOAD_KEY, sector, first_block, load + list(key)))
+        if slot in self.order:
+            self.order.remove(slot)
+        self.order.append(slot)
+        auth = APDUCommands.AUTH_BLOCK + [0x01, 0x00, first_block, key_type, slot]
+        steps.append(ProgramStep(STEP_AUTH, sector, first_block, auth))
+        return steps
+
+class CardProgram:
+    """Compiled template: write and verify steps with preassembled APDUs
+
+    Per card, only the bytes of variable fields are patched into the
+    prebuilt write commands and expected read responses; everything else
+    is sent as is. The write phase and the verify phase each authenticate
+    sector by sector in ascending order, so verification proves the new
+    keys as well as the data.
+
+    Also usable as a ProductionLine template through write() and verify().
+    """
+
+    def __init__(self, template: CardTemplate, write_steps: List[ProgramStep],
+                 verify_steps: List[ProgramStep], patches: List[Tuple[TemplateField, List[Tuple[List[int], int]]]],
+                 unverified_blocks: List[int]):
+        self.template = template
+        self.write_steps = write_steps
+        self.verify_steps = verify_steps
+        self.patches = patches
+        self.unverified_blocks = unverified_blocks
+        self.counters = {field.name: field.start for field in template.fields
+                         if field.source == FIELD_SOURCE_COUNTER}
+        self.value_provider: Optional[Callable[[bytes], Dict[str, object]]] = None
+        self.last_values: Dict[str, bytes] = {}
+
+    def apdu_count(self) -> int:
+        """Get number of APDUs per card (write and verify)"""
+        return len(self.write_steps) + len(self.verify_steps)
+
+    def prepare(self, uid: bytes, values: Optional[Dict[str, object]] = None) -> Dict[str, bytes]:
+        """Patch the variable fields of one card into the program
+
+        Returns:
+            dict: field name -> encoded bytes
+        """
+        values = values or {}
+        encoded = {}
+        for field, targets in self.patches:
+            if field.source == FIELD_SOURCE_UID:
+                value = uid
+            elif field.source == FIELD_SOURCE_COUNTER:
+                value = self.counters[field.name]
+            elif field.name in values:
+                value = values[field.name]
+            else:
+                raise TemplateError(f"No value for field {field.name}")
+            data = list(field.encode(value))
+            for target, offset in targets:
+                target[offset:offset + field.length] = data
+            encoded[field.name] = bytes(data)
+        self.last_values = encoded
+        return encoded
+
+    def written_image(self, uid: Optional[bytes] = None) -> CardImage:
+        """Get the blocks and keys written to the last prepared card"""
+        image = CardImage(self.template.card_type, uid)
+        for step in self.write_steps:
+            if step.kind == STEP_WRITE:
+                image.set_block(step.block, bytes(step.apdu[5:5 + MIFARE_BLOCK_SIZE]))
+        for sector, sector_template in self.template.sectors.items():
+            if sector_template.has_trailer:
+                image.key_map[sector] = {KEY_TYPE_A: sector_template.key_a, KEY_TYPE_B: sector_template.key_b}
+        return image
+
+    def advance_counters(self) -> None:
+        """Move counter fields to the next card"""
+        for field in self.template.fields:
+            if field.source == FIELD_SOURCE_COUNTER:
+                self.counters[field.name] += field.step
+
+    def execute(self, reader_manager, steps: List[ProgramStep]) -> ProgramResult:
+        """Send steps in order, stopping at the first unexpected response
+
+        The steps go to the reader as one APDU batch, which ends at the
+        first status other than 90 00.
+        """
+        if not steps:
+            return ProgramResult(True, 0)
+        try:
+            results = reader_manager.send_apdu_batch([step.apdu for step in steps])
+            error = None
+        except ApduBatchError as e:
+            results, error = e.results, e
+        except Exception as e:
+            results, error = [], e
+        for index, (step, (response, sw1, sw2)) in enumerate(zip(steps, results)):
+            if sw1 != 0x90 or sw2 != 0x00 or (step.expected is not None and response != step.expected):
+                logger.warning(f"Program {step} failed: {sw1:02X}{sw2:02X}")
+                return ProgramResult(False, index + 1, step)
+        if error is not None:
+            index = min(len(results), len(steps) - 1)
+            logger.warning(f"Program {steps[index]} failed: {error}")
+            return ProgramResult(False, index + 1, steps[index])
+        return ProgramResult(True, len(steps))
+
+    def run(self, reader_manager, uid: bytes, values: Optional[Dict[str, object]] = None) -> ProgramResult:
+        """Prepare, write and verify one card; counters advance on success"""
+        self.prepare(uid, values)
+        result = self.execute(reader_manager, self.write_steps)
+        if not result.success:
+            return result
+        verified = self.execute(reader_manager, self.verify_steps)
+        verified.apdu_count += result.apdu_count
+        if verified.success:
+            self.advance_counters()
+        return verified
+
+    def write(self, card_operations, auth_manager) -> bool:
+        """Production template interface: patch fields and run the write phase"""
+        uid = card_operations.card_info.uid
+        values = self.value_provider(uid) if self.value_provider is not None else None
+        self.prepare(uid, values)
+        # The program owns the key slots and authentication state from here on
+        auth_manager.clear_loaded_keys()
+        return self.execute(card_operations.reader_manager, self.write_steps).success
+
+    def verify(self, card_operations, auth_manager) -> bool:
+        """Production template interface: run the verify phase"""
+        success = self.execute(card_operations.reader_manager, self.verify_steps).success
+        if success:
+            self.advance_counters()
+        return success
+
+def _verify_key(sector_template: SectorTemplate, default_key: bytes, blocks: List[int]) -> Tuple[int, bytes, List[int]]:
+    """Choose the key verifying a sector after it is written
+
+    Returns:
+        tuple: (key type, key, blocks that key cannot read)
+    """
+    if not sector_template.has_trailer:
+        key_type, key = sector_template.get_write_key(default_key)
+        return key_type, key, []
+
+    access = get_trailer_access(sector_template.trailer)
+    first_block = get_sector_first_block(sector_template.sector)
+    block_count = get_sector_block_count(sector_template.sector)
+    keys = {KEY_TYPE_A: sector_template.key_a, KEY_TYPE_B: sector_template.key_b}
+    best = None
+    for key_type in (KEY_TYPE_A, KEY_TYPE_B):
+        unreadable = [block for block in blocks
+                      if not access.is_allowed(get_block_group(block - first_block, block_count), OP_READ, key_type)]
+        if best is None or len(unreadable) < len(best[2]):
+            best = (key_type, keys[key_type], unreadable)
+    return best
+
+def _expected_trailer(sector_template: SectorTemplate, access: SectorAccess, key_type: int) -> Optional[List[int]]:
+    """Get the trailer a card returns to key_type after the write, or None if it may not read it"""
+    permissions = access.trailer_permissions
+    key_mask = KEY_TYPE_MASKS[key_type]
+    if not permissions[OP_READ_ACCESS] & key_mask:
+        return None
+    # Key A always reads back as zeros, Key B too unless it is readable
+    trailer = sector_template.trailer
+    key_b = trailer[10:16] if permissions[OP_READ_KEY_B] & key_mask else bytes(6)
+    return list(bytes(6) + trailer[6:10] + key_b)
+
+def compile_template(template: CardTemplate) -> CardProgram:
+    """Validate a template once and assemble its write/verify program"""
+    template.validate()
+
+    write_steps: List[ProgramStep] = []
+    verify_steps: List[ProgramStep] = []
+    block_steps: Dict[int, Tuple[ProgramStep, Optional[ProgramStep]]] = {}
+    unverified: List[int] = []
+
+    slots = _KeySlotAllocator()
+    for sector in sorted(template.sectors):
+        sector_template = template.sectors[sector]
+        key_type, key = sector_template.get_write_key(template.default_key)
+        write_steps.extend(slots.auth_steps(sector, key_type, key))
+        # Data before the trailer, so a failed write never hides data behind new keys
+        for block in sorted(sector_template.data):
+            apdu = APDUCommands.UPDATE_BINARY + [block, MIFARE_BLOCK_SIZE] + list(sector_template.data[block])
+            step = ProgramStep(STEP_WRITE, sector, block, apdu)
+            write_steps.append(step)
+            block_steps[block] = (step, None)
+        if sector_template.has_trailer:
+            trailer_block = get_sector_first_block(sector) + get_sector_block_count(sector) - 1
+            apdu = APDUCommands.UPDATE_BINARY + [trailer_block, MIFARE_BLOCK_SIZE] + list(sector_template.trailer)
+            write_steps.append(ProgramStep(STEP_WRITE, sector, trailer_block, apdu))
+
+    # Verification may run on its own, so it does not rely on keys loaded by the write phase
+    slots = _KeySlotAllocator()
+    for sector in sorted(template.sectors):
+        sector_template = template.sectors[sector]
+        blocks = sorted(sector_template.data)
+        if not blocks and not sector_template.has_trailer:
+            continue
+        key_type, key, unreadable = _verify_key(sector_template, template.default_key, blocks)
+        unverified.extend(unreadable)
+        readable = [block for block in blocks if block not in unreadable]
+        if not readable and not sector_template.has_trailer:
+            continue
+        verify_steps.extend(slots.auth_steps(sector, key_type, key))
+        for block in readable:
+            apdu = APDUCommands.READ_BINARY + [block, MIFARE_BLOCK_SIZE]
+            step = ProgramStep(STEP_READ, sector, block, apdu, list(sector_template.data[block]))
+            verify_steps.append(step)
+            block_steps[block] = (block_steps[block][0], step)
+        if not sector_template.has_trailer:
+            continue
+
+        # A written trailer is proven by authenticating with both new keys
+        # and reading it back where the access conditions allow
+        access = get_trailer_access(sector_template.trailer)
+        trailer_block = get_sector_first_block(sector) + get_sector_block_count(sector) - 1
+        expected = _expected_trailer(sector_template, access, key_type)
+        if expected is not None:
+            apdu = APDUCommands.READ_BINARY + [trailer_block, MIFARE_BLOCK_SIZE]
+            verify_steps.append(ProgramStep(STEP_READ, sector, trailer_block, apdu, expected))
+        other_type = KEY_TYPE_B if key_type == KEY_TYPE_A else KEY_TYPE_A
+        # A readable Key B is data and cannot authenticate
+        if other_type == KEY_TYPE_A or not access.key_b_readable:
+            other_key = sector_template.key_a if other_type == KEY_TYPE_A else sector_template.key_b
+            verify_steps.extend(slots.auth_steps(sector, other_type, other_key))
+
+    patches = []
+    for field in template.fields:
+        write_step, read_step = block_steps[field.block]
+        targets = [(write_step.apdu, 5 + field.offset)]
+        if read_step is not None:
+            targets.append((read_step.expected, field.offset))
+        patches.append((field, targets))
+
+    if unverified:
+        logger.warning(f"Template blocks {unverified} are not readable with the new keys and are not verified")
+    logger.debug(f"Compiled template '{template.name}': {len(write_steps)} write and "
+                 f"{len(verify_steps)} verify APDUs")
+    return CardProgram(template, write_steps, verify_steps, patches, unverified)
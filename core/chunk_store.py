@@ -0,0 +1,275 @@
+"""
+Content-Addressed Chunk Store
+Dump library backend that stores each distinct sector once in compressed pack files
+"""
+
+import hashlib
+import logging
+import lzma
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from config.constants import MIFARE_BLOCK_SIZE
+from .card_image import CARD_TYPE_SECTORS, card_type_from_size
+from .data_utils import get_sector_first_block, get_sector_block_count
+from .dump_library import DumpStore
+from .private_files import make_private_dir, make_private_file, private_opener
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_ZLIB = "zlib"
+COMPRESSION_LZMA = "lzma"
+
+CHUNK_HASH_SIZE = 16
+DEFAULT_FRAME_SIZE = 64 * 1024          # raw bytes per compressed frame
+DEFAULT_PACK_SIZE = 64 * 1024 * 1024    # bytes per pack file before rolling over
+DEFAULT_FRAME_CACHE_SIZE = 64
+
+_COMPRESSORS = {
+    COMPRESSION_ZLIB: (lambda data: zlib.compress(data, 6), zlib.decompress),
+    COMPRESSION_LZMA: (lambda data: lzma.compress(data, preset=6), lzma.decompress)
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    hash BLOB PRIMARY KEY,
+    pack INTEGER NOT NULL,
+    frame_offset INTEGER NOT NULL,
+    frame_length INTEGER NOT NULL,
+    chunk_offset INTEGER NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS manifests (
+    ref TEXT PRIMARY KEY,
+    chunks BLOB NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def chunk_hash(data: bytes) -> bytes:
+    """Content hash identifying a chunk"""
+    return hashlib.blake2b(data, digest_size=CHUNK_HASH_SIZE).digest()
+
+def split_sectors(data: bytes) -> List[bytes]:
+    """Split raw image bytes into per-sector chunks"""
+    chunks = []
+    for sector in range(CARD_TYPE_SECTORS[card_type_from_size(len(data))]):
+        start = get_sector_first_block(sector) * MIFARE_BLOCK_SIZE
+        chunks.append(data[start:start + get_sector_block_count(sector) * MIFARE_BLOCK_SIZE])
+    return chunks
+
+class ChunkDumpStore(DumpStore):
+    """Stores images as manifests of sector chunks kept once by content hash
+
+    New chunks are collected into frames of about frame_size raw bytes; each
+    frame is compressed on its own and appended to the current pack file, so
+    reading one sector only decompresses the frame holding it. Recently used
+    frames are kept decompressed in an LRU cache for bulk loads.
+    """
+
+    name = "chunks"
+
+    def __init__(self, root: Path, compression: str = COMPRESSION_ZLIB,
+                 frame_size: int = DEFAULT_FRAME_SIZE, pack_size: int = DEFAULT_PACK_SIZE,
+                 frame_cache_size: int = DEFAULT_FRAME_CACHE_SIZE):
+        if compression not in _COMPRESSORS:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.root = Path(root)
+        make_private_dir(self.root)
+        self.frame_size = frame_size
+        self.pack_size = pack_size
+        self.frame_cache_size = frame_cache_size
+        self._lock = threading.RLock()
+
+        self._db = sqlite3.connect(str(make_private_file(self.root / "chunks.sqlite3")), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'compression'").fetchone()
+        if row is None:
+            self._db.execute("INSERT INTO meta (key, value) VALUES ('compression', ?)", (compression,))
+            self._db.commit()
+            row = (compression,)
+        self.compression = row[0]
+        self._compress, self._decompress = _COMPRESSORS[self.compression]
+
+        # Frame being filled: chunk hash -> chunk contents
+        self._pending: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._pending_size = 0
+        self._frame_cache: "OrderedDict[Tuple[int, int], bytes]" = OrderedDict()
+        self._pack = self._last_pack()
+
+    def _pack_path(self, pack: int) -> Path:
+        """Get file path of a pack"""
+        return self.root / f"pack-{pack:06d}.pack"
+
+    def _last_pack(self) -> int:
+        """Get number of the pack new frames are appended to"""
+        packs = sorted(self.root.glob("pack-*.pack"))
+        return int(packs[-1].stem.split("-")[1]) if packs else 0
+
+    # --- Writing ---------------------------------------------------------
+
+    def put(self, data: bytes) -> str:
+        """Store raw image bytes as a manifest of sector chunks"""
+        ref = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM manifests WHERE ref = ?", (ref,)).fetchone():
+                return ref
+            hashes = []
+            for chunk in split_sectors(data):
+                digest = chunk_hash(chunk)
+                hashes.append(digest)
+                if digest in self._pending:
+                    continue
+                if self._db.execute("SELECT 1 FROM chunks WHERE hash = ?", (digest,)).fetchone():
+                    continue
+                self._pending[digest] = chunk
+                self._pending_size += len(chunk)
+                if self._pending_size >= self.frame_size:
+                    self._write_frame()
+            self._db.execute("INSERT INTO manifests (ref, chunks) VALUES (?, ?)", (ref, b"".join(hashes)))
+        return ref
+
+    def _write_frame(self) -> None:
+        """Compress pending chunks into one frame and index them"""
+        if not self._pending:
+            return
+        raw = b"".join(self._pending.values())
+        compressed = self._compress(raw)
+
+        path = self._pack_path(self._pack)
+        if path.exists() and path.stat().st_size + len(compressed) > self.pack_size:
+            self._pack += 1
+            path = self._pack_path(self._pack)
+        with open(path, 'ab', opener=private_opener) as f:
+            frame_offset = f.tell()
+            f.write(compressed)
+
+        rows = []
+        chunk_offset = 0
+        for digest, chunk in self._pending.items():
+            rows.append((digest, self._pack, frame_offset, len(compressed), chunk_offset, len(chunk)))
+            chunk_offset += len(chunk)
+        self._db.executemany(
+            "INSERT OR IGNORE INTO chunks (hash, pack, frame_offset, frame_length, chunk_offset, size) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+        self._pending.clear()
+        self._pending_size = 0
+
+    def flush(self) -> None:
+        """Write the partial frame and commit the chunk index"""
+        with self._lock:
+            self._write_frame()
+            self._db.commit()
+
+    def close(self) -> None:
+        """Flush and close the chunk index"""
+        with self._lock:
+            self.flush()
+            self._db.close()
+
+    # --- Reading ---------------------------------------------------------
+
+    def _read_frame(self, pack: int, frame_offset: int, frame_length: int) -> bytes:
+        """Get decompressed frame, using the LRU frame cache"""
+        key = (pack, frame_offset)
+        frame = self._frame_cache.get(key)
+        if frame is not None:
+            self._frame_cache.move_to_end(key)
+            return frame
+        with open(self._pack_path(pack), 'rb') as f:
+            f.seek(frame_offset)
+            frame = self._decompress(f.read(frame_length))
+        self._frame_cache[key] = frame
+        while len(self._frame_cache) > self.frame_cache_size:
+            self._frame_cache.popitem(last=False)
+        return frame
+
+    def _read_chunk(self, digest: bytes) -> bytes:
+        """Get chunk contents by hash"""
+        pending = self._pending.get(digest)
+        if pending is not None:
+            return pending
+        row = self._db.execute(
+            "SELECT pack, frame_offset, frame_length, chunk_offset, size FROM chunks WHERE hash = ?", (digest,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Missing chunk {digest.hex()}")
+        pack, frame_offset, frame_length, chunk_offset, size = row
+        frame = self._read_frame(pack, frame_offset, frame_length)
+        return frame[chunk_offset:chunk_offset + size]
+
+    def _manifest(self, ref: str) -> List[bytes]:
+        """Get chunk hashes of a stored image"""
+        row = self._db.execute("SELECT chunks FROM manifests WHERE ref = ?", (ref,)).fetchone()
+        if row is None:
+            raise KeyError(f"No stored image {ref}")
+        chunks = row[0]
+        return [chunks[i:i + CHUNK_HASH_SIZE] for i in range(0, len(chunks), CHUNK_HASH_SIZE)]
+
+    def get(self, ref: str) -> bytes:
+        """Reassemble raw image bytes from its manifest"""
+        with self._lock:
+            return b"".join(self._read_chunk(digest) for digest in self._manifest(ref))
+
+    def get_sector(self, ref: str, sector: int) -> bytes:
+        """Get one sector, decompressing only the frame that holds it"""
+        with self._lock:
+            return self._read_chunk(self._manifest(ref)[sector])
+
+    def delete(self, ref: str) -> None:
+        """Remove manifest; unreferenced chunks are dropped by compact()"""
+        with self._lock:
+            self._db.execute("DELETE FROM manifests WHERE ref = ?", (ref,))
+            self._db.commit()
+
+    # --- Maintenance -----------------------------------------------------
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get manifest/chunk counts and on-disk size"""
+        with self._lock:
+            manifests = self._db.execute("SELECT COUNT(*) FROM manifests").fetchone()[0]
+            chunks, raw = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM chunks").fetchone()
+        packed = sum(path.stat().st_size for path in self.root.glob("pack-*.pack"))
+        return {"manifests": manifests, "chunks": chunks, "chunk_bytes": raw, "pack_bytes": packed}
+
+    def compact(self) -> int:
+        """Rewrite packs keeping only chunks still referenced, returns chunks dropped"""
+        with self._lock:
+            self.flush()
+            live = set()
+            for (chunks,) in self._db.execute("SELECT chunks FROM manifests"):
+                live.update(chunks[i:i + CHUNK_HASH_SIZE] for i in range(0, len(chunks), CHUNK_HASH_SIZE))
+            stored = [row[0] for row in self._db.execute("SELECT hash FROM chunks")]
+            dead = len(stored) - len(live & set(stored))
+            if not dead:
+                return 0
+
+            old_packs = sorted(self.root.glob("pack-*.pack"))
+            contents = [(digest, self._read_chunk(digest)) for digest in stored if digest in live]
+            self._db.execute("DELETE FROM chunks")
+            self._frame_cache.clear()
+            self._pack = self._last_pack() + 1
+            for digest, chunk in contents:
+                self._pending[digest] = chunk
+                self._pending_size += len(chunk)
+                if self._pending_size >= self.frame_size:
+                    self._write_frame()
+            self._write_frame()
+            self._db.commit()
+            for path in old_packs:
+                path.unlink()
+        logger.info(f"Chunk store compacted: {dead} chunks dropped")
+        return dead
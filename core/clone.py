@@ -0,0 +1,197 @@
+"""
+Card Cloning
+Two-reader clone that writes each sector while the next one is being read
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config.constants import DEFAULT_KEY, KEY_TYPE_A, KEY_TYPE_B
+from .access_conditions import build_trailer
+from .card_image import CardImage
+from .dump import DumpEngine
+from .key_diversification import KeyMap
+from .production import ImageTemplate
+
+logger = logging.getLogger(__name__)
+
+# Sectors read ahead of the one being written
+CLONE_QUEUE_DEPTH = 1
+
+class CloneError(Exception):
+    """Raised when a sector cannot be cloned"""
+
+class TrailerRewrite:
+    """Replacement keys / access bits for cloned trailers (None keeps the source value)"""
+
+    def __init__(self, key_a: Optional[bytes] = None, access: Optional[bytes] = None,
+                 key_b: Optional[bytes] = None, gpb: Optional[int] = None):
+        self.key_a = key_a
+        self.access = access
+        self.key_b = key_b
+        self.gpb = gpb
+
+class CloneResult:
+    """Outcome and timing of one clone"""
+
+    def __init__(self):
+        self.success = False
+        self.image: Optional[CardImage] = None  # source contents as read
+        self.cloned_sectors: List[int] = []
+        self.failed_sector: Optional[int] = None
+        self.error: Optional[str] = None
+        self.elapsed = 0.0
+        self.source_time = 0.0   # time the source reader was busy
+        self.target_time = 0.0   # time the target reader was busy
+
+    def to_dict(self) -> dict:
+        """Get result as dictionary (times in milliseconds)"""
+        return {
+            "success": self.success,
+            "cloned_sectors": self.cloned_sectors,
+            "failed_sector": self.failed_sector,
+            "error": self.error,
+            "elapsed_ms": round(self.elapsed * 1000, 3),
+            "source_ms": round(self.source_time * 1000, 3),
+            "target_ms": round(self.target_time * 1000, 3)
+        }
+
+class CloneEngine:
+    """Copies a card on a source reader onto a blank card on a target reader
+
+    A reader thread dumps the source sector by sector into a bounded queue
+    while the calling thread writes and verifies the previous sector on the
+    target, so the clone takes about as long as the slower reader. Within a
+    sector, data blocks are written before the trailer and the result is
+    verified with the new keys. Block 0 is never written.
+    """
+
+    def __init__(self, source: DumpEngine, target: DumpEngine):
+        self.source = source
+        self.target = target
+
+    def build_trailer(self, image: CardImage, sector: int, rewrite: Optional[TrailerRewrite]) -> bytes:
+        """Get the trailer written to the target for one sector"""
+        trailer = image.get_trailer(sector)
+        keys = image.key_map.get(sector, {})
+        rewrite = rewrite or TrailerRewrite()
+
+        key_a = rewrite.key_a if rewrite.key_a is not None else keys.get(KEY_TYPE_A)
+        key_b = rewrite.key_b if rewrite.key_b is not None else keys.get(KEY_TYPE_B)
+        if key_b is None and any(trailer[10:16]):
+            # Readable Key B is plain data and is returned unmasked
+            key_b = trailer[10:16]
+        if key_a is None or key_b is None:
+            missing = "Key A" if key_a is None else "Key B"
+            raise CloneError(f"{missing} of sector {sector} is unknown; give a rewrite for it")
+        access = rewrite.access if rewrite.access is not None else trailer[6:9]
+        gpb = rewrite.gpb if rewrite.gpb is not None else trailer[9]
+        try:
+            return build_trailer(key_a, access, key_b, gpb)
+        except ValueError as e:
+            raise CloneError(f"Sector {sector} trailer: {e}")
+
+    def _read_sectors(self, image: CardImage, sectors: List[int], key_map: KeyMap,
+                      ready: queue.Queue, stop: threading.Event, result: CloneResult) -> None:
+        """Source thread: read sectors in order and hand them to the writer"""
+        keys_by_sector = {sector: dict(keys) for sector, keys in self.source.auth_manager.get_key_map().items()}
+        for sector, keys in (key_map or {}).items():
+            keys_by_sector.setdefault(sector, {}).update(keys)
+
+        def hand_over(item) -> None:
+            while not stop.is_set():
+                try:
+                    ready.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        for sector in sectors:
+            if stop.is_set():
+                return
+            start = time.perf_counter()
+            keys = keys_by_sector.get(sector, {})
+            complete = self.source.read_sector(image, sector, keys)
+            if complete:
+                # The trailer is rebuilt from both keys, so prove the one not read with
+                self.source.verify_keys(image, sector, keys)
+            result.source_time += time.perf_counter() - start
+            if not complete:
+                hand_over(CloneError(f"Could not read source sector {sector}"))
+                return
+            hand_over(sector)
+        hand_over(None)
+
+    def _write_sector(self, image: CardImage, sector: int, target_keys: KeyMap,
+                      rewrite: Optional[TrailerRewrite]) -> None:
+        """Write and verify one sector on the target card"""
+        trailer = self.build_trailer(image, sector, rewrite)
+        sector_image = CardImage(image.card_type)
+        for block in image.get_sector_blocks(sector):
+            sector_image.set_block(block, image.get_block(block))
+        sector_image.set_block(image.get_trailer_block(sector), trailer)
+        sector_image.key_map[sector] = {KEY_TYPE_A: trailer[0:6], KEY_TYPE_B: trailer[10:16]}
+
+        template = ImageTemplate(sector_image, [sector], target_keys)
+        target = self.target
+        if not template.write(target.card_operations, target.auth_manager):
+            raise CloneError(f"Could not write target sector {sector}")
+        if not template.verify(target.card_operations, target.auth_manager):
+            raise CloneError(f"Target sector {sector} failed verification")
+
+    def clone(self, key_map: Optional[KeyMap] = None, target_keys: Optional[KeyMap] = None,
+              rewrites: Optional[Dict[int, TrailerRewrite]] = None,
+              default_rewrite: Optional[TrailerRewrite] = None,
+              sectors: Optional[List[int]] = None) -> CloneResult:
+        """Clone the source card onto the target card
+
+        Args:
+            key_map: keys of the source card (cached keys are used as well)
+            target_keys: keys of the blank target per sector (default Key A FFFFFFFFFFFF)
+            rewrites: per-sector trailer changes applied while cloning
+            default_rewrite: trailer change for sectors without an entry in rewrites
+            sectors: sectors to clone (default all)
+        """
+        result = CloneResult()
+        image = result.image = self.source.new_image()
+        if sectors is None:
+            sectors = list(range(image.sector_count))
+        target_keys = target_keys or {sector: {KEY_TYPE_A: DEFAULT_KEY} for sector in sectors}
+        rewrites = rewrites or {}
+
+        ready: queue.Queue = queue.Queue(maxsize=CLONE_QUEUE_DEPTH)
+        stop = threading.Event()
+        reader = threading.Thread(target=self._read_sectors,
+                                  args=(image, sectors, key_map, ready, stop, result), daemon=True)
+        start = time.perf_counter()
+        reader.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is None:
+                    result.success = True
+                    break
+                if isinstance(item, CloneError):
+                    raise item
+                sector_start = time.perf_counter()
+                try:
+                    self._write_sector(image, item, target_keys, rewrites.get(item, default_rewrite))
+                finally:
+                    result.target_time += time.perf_counter() - sector_start
+                result.cloned_sectors.append(item)
+        except CloneError as e:
+            result.error = str(e)
+            result.failed_sector = next((sector for sector in sectors if sector not in result.cloned_sectors), None)
+            logger.error(f"Clone failed: {e}")
+        finally:
+            stop.set()
+            reader.join()
+            result.elapsed = time.perf_counter() - start
+
+        if result.success:
+            logger.info(f"Cloned {len(result.cloned_sectors)} sectors in {result.elapsed * 1000:.0f} ms "
+                        f"(source {result.source_time * 1000:.0f} ms, target {result.target_time * 1000:.0f} ms)")
+        return result
@@ -87,19 +87,55 @@ def validate_sector_number(sector: int, card_type: int) -> bool:
     
     return False
 
+def get_sector_first_block(sector: int) -> int:
+    """Get first block number of sector (4K layout is a superset of 1K)"""
+    if sector < 32:
+        return sector * 4
+    return 32 * 4 + (sector - 32) * 16
+
+def get_sector_block_count(sector: int) -> int:
+    """Get number of blocks in sector"""
+    return 4 if sector < 32 else 16
+
+def get_block_sector(block_number: int) -> int:
+    """Get sector number containing block"""
+    if block_number < 32 * 4:
+        return block_number // 4
+    return 32 + (block_number - 32 * 4) // 16
+
 def parse_access_bits(trailer_data: bytes) -> dict:
     """Parse access bits from trailer block"""
+    from core.access_conditions import get_trailer_access
+    
     if len(trailer_data) != 16:
         return {}
     
     # Access bits are at bytes 6, 7, 8
     access_bytes = trailer_data[6:9]
+    sector_access = get_trailer_access(trailer_data)
     
-    # This is a simplified parser - full implementation would
-    # decode the complex access bit structure
-    return {
+    result = {
         "raw": bytes_to_hex_string(access_bytes),
-        "c1": access_bytes[0],
-        "c2": access_bytes[1], 
-        "c3": access_bytes[2]
+        "c1": access_bytes[1] >> 4,
+        "c2": access_bytes[2] & 0x0F,
+        "c3": access_bytes[2] >> 4,
+        "gpb": trailer_data[9],
+        "valid": sector_access is not None
     }
+    
+    if sector_access is not None:
+        result["conditions"] = list(sector_access.conditions)
+        result["blocks"] = [dict(permissions) for permissions in sector_access.block_permissions]
+        result["trailer"] = dict(sector_access.trailer_permissions)
+        result["key_b_readable"] = sector_access.key_b_readable
+    
+    return result
+
+def is_value_block_format(data: bytes) -> bool:
+    """Check if block data has the value block layout (value, ~value, value, addr, ~addr, addr, ~addr)"""
+    if len(data) != 16:
+        return False
+    value, inverted, copy = data[0:4], data[4:8], data[8:12]
+    if value != copy or any(a ^ b != 0xFF for a, b in zip(value, inverted)):
+        return False
+    return data[12] == data[14] and data[13] == data[15] and data[12] ^ data[13] == 0xFF
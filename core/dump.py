@@ -0,0 +1,293 @@
+"""
+MIFARE Classic Dump Engine
+Reads whole cards or prioritized parts of them into a CardImage
+"""
+
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config.constants import (
+    AppSettings, APDUCommands, KEY_TYPE_A, KEY_TYPE_B, CARD_TYPE_MIFARE_4K, CARD_TYPE_MIFARE_1K,
+    MIFARE_BLOCK_SIZE
+)
+from .access_conditions import OP_READ
+from .access_planner import AccessPlanner
+from .authentication import AuthenticationManager
+from .card_image import CardImage
+from .card_operations import CardOperations
+from .data_utils import get_block_sector
+from .dump_resume import PartialDumpStore
+from .key_diversification import KeyMap
+
+logger = logging.getLogger(__name__)
+
+INS_LOAD_KEY = 0x82
+INS_AUTHENTICATE = 0x86
+INS_READ_BINARY = 0xB0
+
+class DumpEngine:
+    """Reads card contents sector by sector using known keys
+
+    The access planner picks the key type each sector's access conditions
+    permit for reading, and learns the conditions from trailers as they
+    are read.
+    """
+
+    def __init__(self, card_operations: CardOperations, auth_manager: AuthenticationManager,
+                 planner: Optional[AccessPlanner] = None):
+        self.card_operations = card_operations
+        self.auth_manager = auth_manager
+        self.planner = planner if planner is not None else AccessPlanner(card_operations, auth_manager)
+        self.last_report: dict = {}
+
+    def new_image(self) -> CardImage:
+        """Create an empty image for the card in the field"""
+        card_info = self.card_operations.card_info
+        card_type = CARD_TYPE_MIFARE_4K if card_info.card_type == CARD_TYPE_MIFARE_4K else CARD_TYPE_MIFARE_1K
+        return CardImage(card_type, card_info.uid)
+
+    def _merge_key_map(self, key_map: Optional[KeyMap], image: Optional[CardImage] = None) -> KeyMap:
+        """Combine explicit keys with keys cached for the current card or image"""
+        merged: KeyMap = {sector: dict(keys) for sector, keys in self.auth_manager.get_key_map().items()}
+        for source in ((image.key_map if image is not None else None), key_map):
+            for sector, keys in (source or {}).items():
+                merged.setdefault(sector, {}).update(keys)
+        return merged
+
+    def _start_image(self, image: Optional[CardImage],
+                     resume_store: Optional[PartialDumpStore]) -> CardImage:
+        """Get image to fill: given, resumed from a partial dump, or new"""
+        if image is not None:
+            return image
+        uid = self.card_operations.card_info.uid
+        if resume_store is not None and uid:
+            image = resume_store.get(uid)
+            if image is not None:
+                logger.info(f"Resuming dump of {uid.hex()} at sector {image.first_missing_sector()} "
+                            f"({image.captured_block_count()} blocks already captured)")
+                return image
+        return self.new_image()
+
+    def _finish_image(self, image: CardImage, resume_store: Optional[PartialDumpStore]) -> None:
+        """Keep incomplete images for the next tap, drop complete ones"""
+        if resume_store is None or image.uid is None:
+            return
+        if image.is_complete():
+            resume_store.discard(image.uid)
+        else:
+            resume_store.put(image)
+
+    def _card_gone(self) -> bool:
+        """Check whether the card left the field"""
+        return not self.card_operations.card_info.present or not self.card_operations.detect_card()
+
+    def authenticate_sector(self, sector: int, keys: Dict[int, bytes]) -> Optional[int]:
+        """Authenticate sector with Key A or Key B from keys
+
+        Returns:
+            int: key type that worked, or None
+        """
+        for key_type in (KEY_TYPE_A, KEY_TYPE_B):
+            key = keys.get(key_type)
+            if key is not None and self.auth_manager.authenticate_sector(sector, key_type, key):
+                return key_type
+        return None
+
+    def read_sector(self, image: CardImage, sector: int, keys: Dict[int, bytes],
+                    blocks: Optional[Iterable[int]] = None) -> bool:
+        """Read blocks of one sector into image
+
+        Returns:
+            bool: True if every requested block was captured
+        """
+        if blocks is None:
+            blocks = image.get_sector_blocks(sector)
+        blocks = [block for block in blocks if not image.has_block(block)]
+        if not blocks:
+            return True
+
+        used_key_types: List[int] = []
+        verified: Dict[int, bytes] = {}
+        while True:
+            # Authentication and reads go out as one batch per key; after the
+            # first batch only key types the access conditions permit are tried
+            requests = [(block, OP_READ) for block in blocks]
+            key_types = [kt for kt in self.planner.choose_key_types(sector, requests, keys,
+                                                                    permitted_only=bool(used_key_types))
+                         if kt not in used_key_types]
+            results = None
+            read_commands = [APDUCommands.READ_BINARY + [block, MIFARE_BLOCK_SIZE] for block in blocks]
+            for key_type in key_types:
+                used_key_types.append(key_type)
+                results = self.auth_manager.authenticate_and_send(sector, key_type, keys[key_type], read_commands)
+                if results is not None:
+                    break
+            if results is None:
+                if key_types:
+                    logger.debug(f"No working key for sector {sector}")
+                break
+            verified[key_type] = keys[key_type]
+
+            for block, (response, sw1, sw2) in zip(blocks, results):
+                if sw1 != 0x90 or sw2 != 0x00:
+                    logger.error(f"Read block {block} failed: {sw1:02X}{sw2:02X}")
+                    continue
+                image.set_block(block, bytes(response))
+
+            trailer_block = image.get_trailer_block(sector)
+            if trailer_block in blocks and image.has_block(trailer_block):
+                self.planner.record_trailer(sector, image.get_block(trailer_block))
+
+            card_left = len(results) < len(blocks)
+            blocks = [block for block in blocks if not image.has_block(block)]
+            if not blocks or card_left:
+                break
+
+        if verified:
+            # Only keys the card accepted go into the image and its trailer
+            image.apply_key_map({sector: verified})
+        return not blocks
+
+    def verify_keys(self, image: CardImage, sector: int, keys: Dict[int, bytes]) -> Dict[int, bytes]:
+        """Authenticate with supplied keys the dump did not need, recording those that work
+
+        A dump proves only the key type it read with; callers that rebuild
+        trailers (e.g. cloning) verify the other key before trusting it.
+
+        Returns:
+            dict: key type -> key for every verified key of the sector
+        """
+        verified = dict(image.key_map.get(sector, {}))
+        for key_type, key in keys.items():
+            if verified.get(key_type) == key:
+                continue
+            if self.auth_manager.authenticate_sector(sector, key_type, key):
+                image.apply_key_map({sector: {key_type: key}})
+                verified[key_type] = key
+        return verified
+
+    def dump(self, key_map: Optional[KeyMap] = None, sectors: Optional[Iterable[int]] = None,
+             image: Optional[CardImage] = None,
+             resume_store: Optional[PartialDumpStore] = None) -> CardImage:
+        """Read all (or the given) sectors of the card in the field
+
+        With a resume_store, a partial image left by an earlier interrupted
+        dump of the same UID is continued, and an incomplete result is
+        stored for the next tap.
+        """
+        start = time.perf_counter()
+        image = self._start_image(image, resume_store)
+        keys_by_sector = self._merge_key_map(key_map, image)
+        failed_sectors = []
+        card_removed = False
+
+        for sector in (range(image.sector_count) if sectors is None else sectors):
+            if image.is_sector_complete(sector):
+                continue
+            if not self.read_sector(image, sector, keys_by_sector.get(sector, {})):
+                failed_sectors.append(sector)
+                if self._card_gone():
+                    card_removed = True
+                    break
+
+        self.last_report = {
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+            "captured_blocks": image.captured_block_count(),
+            "coverage": image.coverage(),
+            "failed_sectors": failed_sectors,
+            "card_removed": card_removed
+        }
+        self._finish_image(image, resume_store)
+        logger.info(f"Dump finished: {image.captured_block_count()}/{image.block_count} blocks")
+        return image
+
+    def estimate_cost(self, block_count: int) -> float:
+        """Estimate seconds needed to authenticate a sector and read block_count blocks"""
+        latency = self.card_operations.reader_manager.apdu_latency
+        load_key = latency.estimate(INS_LOAD_KEY, AppSettings.ESTIMATED_LOAD_KEY_TIME / 1000.0)
+        auth = latency.estimate(INS_AUTHENTICATE, AppSettings.ESTIMATED_AUTH_TIME / 1000.0)
+        read = latency.estimate(INS_READ_BINARY, AppSettings.ESTIMATED_READ_TIME / 1000.0)
+        return load_key + auth + block_count * read
+
+    def _build_read_units(self, image: CardImage, priority_sectors: Sequence[int],
+                          priority_blocks: Sequence[int], include_rest: bool) -> List[Tuple[int, List[int]]]:
+        """Order (sector, blocks) units by priority, merging adjacent units of one sector"""
+        units: List[Tuple[int, List[int]]] = []
+        scheduled = set()
+
+        def add(sector: int, blocks: Iterable[int]) -> None:
+            blocks = [b for b in blocks if b not in scheduled and not image.has_block(b)]
+            if not blocks:
+                return
+            scheduled.update(blocks)
+            if units and units[-1][0] == sector:
+                units[-1][1].extend(blocks)
+            else:
+                units.append((sector, blocks))
+
+        for block in priority_blocks:
+            add(get_block_sector(block), [block])
+        for sector in priority_sectors:
+            add(sector, image.get_sector_blocks(sector))
+        if include_rest:
+            for sector in range(image.sector_count):
+                add(sector, image.get_sector_blocks(sector))
+        return units
+
+    def dump_with_deadline(self, budget: float, priority_sectors: Sequence[int] = (),
+                           priority_blocks: Sequence[int] = (), key_map: Optional[KeyMap] = None,
+                           include_rest: bool = True, image: Optional[CardImage] = None,
+                           resume_store: Optional[PartialDumpStore] = None) -> CardImage:
+        """Read the most important data first within a time budget (seconds)
+
+        Priority blocks are read first, then priority sectors, then (if
+        include_rest) everything else. Measured APDU latencies decide which
+        units still fit; the returned image records exactly what was captured.
+        """
+        start = time.perf_counter()
+        deadline = start + budget
+        image = self._start_image(image, resume_store)
+        keys_by_sector = self._merge_key_map(key_map, image)
+        units = self._build_read_units(image, priority_sectors, priority_blocks, include_rest)
+        skipped_sectors = []
+        failed_sectors = []
+        card_removed = False
+
+        for index, (sector, blocks) in enumerate(units):
+            remaining = deadline - time.perf_counter()
+            fits = len(blocks)
+            while fits > 0 and self.estimate_cost(fits) > remaining:
+                fits -= 1
+            if fits == 0:
+                skipped_sectors.extend(s for s, _ in units[index:] if s not in skipped_sectors)
+                break
+
+            keys = keys_by_sector.get(sector, {})
+            if not keys:
+                skipped_sectors.append(sector)
+                continue
+
+            if not self.read_sector(image, sector, keys, blocks[:fits]):
+                if sector not in failed_sectors:
+                    failed_sectors.append(sector)
+                if self._card_gone():
+                    card_removed = True
+                    break
+            if fits < len(blocks):
+                skipped_sectors.append(sector)
+
+        elapsed = time.perf_counter() - start
+        self.last_report = {
+            "budget_ms": round(budget * 1000, 3),
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "captured_blocks": image.captured_block_count(),
+            "coverage": image.coverage(),
+            "skipped_sectors": skipped_sectors,
+            "failed_sectors": failed_sectors,
+            "card_removed": card_removed
+        }
+        self._finish_image(image, resume_store)
+        logger.info(f"Deadline dump: {image.captured_block_count()} blocks in {elapsed * 1000:.1f} ms "
+                    f"(budget {budget * 1000:.0f} ms)")
+        return image
@@ -0,0 +1,265 @@
+"""
+Dump Diff Engine
+Vectorized block-by-block comparison of card images
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.constants import MIFARE_BLOCK_SIZE
+from .access_conditions import get_trailer_access, get_block_group
+from .card_image import CardImage
+from .data_utils import get_block_sector, get_sector_first_block, get_sector_block_count, is_value_block_format
+from .key_diversification import KeyMap
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_MANUFACTURER = "manufacturer"
+CATEGORY_TRAILER = "trailer"
+CATEGORY_VALUE = "value"
+CATEGORY_DATA = "data"
+
+CATEGORIES = (CATEGORY_MANUFACTURER, CATEGORY_TRAILER, CATEGORY_VALUE, CATEGORY_DATA)
+
+# Trailer fields: (name, start, end)
+TRAILER_FIELDS = (("key_a", 0, 6), ("access_bits", 6, 9), ("gpb", 9, 10), ("key_b", 10, 16))
+
+_TRAILER_MASKS: Dict[int, np.ndarray] = {}
+
+def _trailer_mask(block_count: int) -> np.ndarray:
+    """Boolean mask of trailer blocks for an image with block_count blocks"""
+    mask = _TRAILER_MASKS.get(block_count)
+    if mask is None:
+        mask = np.zeros(block_count, dtype=bool)
+        sector = 0
+        while get_sector_first_block(sector) < block_count:
+            mask[get_sector_first_block(sector) + get_sector_block_count(sector) - 1] = True
+            sector += 1
+        _TRAILER_MASKS[block_count] = mask
+    return mask
+
+def _key_byte_mask(block_count: int) -> np.ndarray:
+    """(blocks, 16) mask that hides key bytes of trailers"""
+    mask = np.ones((block_count, MIFARE_BLOCK_SIZE), dtype=bool)
+    mask[_trailer_mask(block_count), 0:6] = False
+    mask[_trailer_mask(block_count), 10:16] = False
+    return mask
+
+def _blocks_view(data) -> np.ndarray:
+    """View raw image bytes (or a stack of them) as (..., blocks, 16) uint8"""
+    array = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray)) else np.asarray(data)
+    return array.reshape(array.shape[:-1] + (-1, MIFARE_BLOCK_SIZE))
+
+class BlockDiff:
+    """Difference in one block between two images"""
+
+    def __init__(self, block: int, category: str, old: bytes, new: bytes):
+        self.block = block
+        self.sector = get_block_sector(block)
+        self.category = category
+        self.old = old
+        self.new = new
+        self.offsets = [i for i in range(MIFARE_BLOCK_SIZE) if old[i] != new[i]]
+
+    @property
+    def fields(self) -> List[str]:
+        """Get changed trailer fields (empty for other categories)"""
+        if self.category != CATEGORY_TRAILER:
+            return []
+        return [name for name, start, end in TRAILER_FIELDS if self.old[start:end] != self.new[start:end]]
+
+    def format(self) -> str:
+        """Get one-line description"""
+        if self.fields:
+            detail = ", ".join(self.fields)
+        else:
+            ranges = _format_ranges(self.offsets)
+            detail = f"bytes {ranges}"
+        return f"Block {self.block:3d} [{self.category}] {detail}: {self.old.hex().upper()} -> {self.new.hex().upper()}"
+
+    def __repr__(self) -> str:
+        return f"BlockDiff({self.block}, {self.category}, {len(self.offsets)} bytes)"
+
+def _format_ranges(offsets: Sequence[int]) -> str:
+    """Format byte offsets as compact ranges, e.g. '0-3,8'"""
+    ranges = []
+    start = prev = None
+    for offset in offsets:
+        if start is None:
+            start = prev = offset
+        elif offset == prev + 1:
+            prev = offset
+        else:
+            ranges.append(f"{start}-{prev}" if prev != start else str(start))
+            start = prev = offset
+    if start is not None:
+        ranges.append(f"{start}-{prev}" if prev != start else str(start))
+    return ",".join(ranges)
+
+class DumpDiff:
+    """Result of comparing two card images"""
+
+    def __init__(self, left: CardImage, right: CardImage, blocks: List[BlockDiff],
+                 left_only: List[int], right_only: List[int]):
+        self.left_uid = left.uid
+        self.right_uid = right.uid
+        self.blocks = blocks
+        self.left_only = left_only
+        self.right_only = right_only
+
+    @property
+    def is_identical(self) -> bool:
+        """Check if all blocks captured on both sides are equal"""
+        return not self.blocks
+
+    def by_category(self) -> Dict[str, List[BlockDiff]]:
+        """Group block differences by category"""
+        groups: Dict[str, List[BlockDiff]] = {category: [] for category in CATEGORIES}
+        for block_diff in self.blocks:
+            groups[block_diff.category].append(block_diff)
+        return groups
+
+    def changed_sectors(self) -> List[int]:
+        """Get sectors with at least one differing block"""
+        return sorted({block_diff.sector for block_diff in self.blocks})
+
+    def summary(self) -> Dict[str, int]:
+        """Get number of differing blocks per category"""
+        summary = {category: len(diffs) for category, diffs in self.by_category().items()}
+        summary["left_only"] = len(self.left_only)
+        summary["right_only"] = len(self.right_only)
+        return summary
+
+    def format_report(self) -> str:
+        """Render a compact text report"""
+        left = self.left_uid.hex().upper() if self.left_uid else "?"
+        right = self.right_uid.hex().upper() if self.right_uid else "?"
+        lines = [f"Diff {left} -> {right}: " +
+                 (", ".join(f"{count} {name}" for name, count in self.summary().items() if count) or "identical")]
+        for sector in self.changed_sectors():
+            lines.append(f"Sector {sector}:")
+            lines.extend("  " + block_diff.format() for block_diff in self.blocks if block_diff.sector == sector)
+        if self.left_only:
+            lines.append(f"Only in left: blocks {_format_ranges(self.left_only)}")
+        if self.right_only:
+            lines.append(f"Only in right: blocks {_format_ranges(self.right_only)}")
+        return "\n".join(lines)
+
+def _categorize(block: int, left: CardImage, right: CardImage) -> str:
+    """Classify a differing block"""
+    if block == 0:
+        return CATEGORY_MANUFACTURER
+    sector = get_block_sector(block)
+    first_block = get_sector_first_block(sector)
+    block_count = get_sector_block_count(sector)
+    group = get_block_group(block - first_block, block_count)
+    if group == 3:
+        return CATEGORY_TRAILER
+
+    for image in (left, right):
+        trailer_block = first_block + block_count - 1
+        if image.has_block(trailer_block):
+            access = get_trailer_access(image.get_block(trailer_block))
+            if access is not None and access.is_value_block(group):
+                return CATEGORY_VALUE
+    if is_value_block_format(left.get_block(block)) or is_value_block_format(right.get_block(block)):
+        return CATEGORY_VALUE
+    return CATEGORY_DATA
+
+def diff_images(left: CardImage, right: CardImage, ignore_keys: bool = False) -> DumpDiff:
+    """Compare two images block by block
+
+    Blocks captured on only one side are listed separately instead of being
+    compared. With ignore_keys, trailer key bytes are left out (cards
+    return Key A, and usually Key B, masked).
+    """
+    if left.card_type != right.card_type:
+        raise ValueError("Cannot diff images of different card types")
+
+    left_blocks = _blocks_view(left.buffer)
+    right_blocks = _blocks_view(right.buffer)
+    differs = left_blocks != right_blocks
+    if ignore_keys:
+        differs &= _key_byte_mask(left.block_count)
+
+    left_captured = np.frombuffer(bytes(left.captured), dtype=bool)
+    right_captured = np.frombuffer(bytes(right.captured), dtype=bool)
+    both = left_captured & right_captured
+
+    changed = np.flatnonzero(differs.any(axis=1) & both)
+    blocks = []
+    for block in changed.tolist():
+        old, new = left.get_block(block), right.get_block(block)
+        if ignore_keys and _trailer_mask(left.block_count)[block]:
+            old = bytes(6) + old[6:10] + bytes(6)
+            new = bytes(6) + new[6:10] + bytes(6)
+        blocks.append(BlockDiff(block, _categorize(block, left, right), old, new))
+
+    return DumpDiff(left, right, blocks,
+                    np.flatnonzero(left_captured & ~right_captured).tolist(),
+                    np.flatnonzero(right_captured & ~left_captured).tolist())
+
+def diff_against_card(dump_engine, reference: CardImage, key_map: Optional[KeyMap] = None,
+                      ignore_keys: bool = True) -> DumpDiff:
+    """Dump the card in the field and compare it against a reference image"""
+    live = dump_engine.dump(key_map or reference.key_map or None)
+    return diff_images(reference, live, ignore_keys=ignore_keys)
+
+def stack_images(images: Iterable[CardImage]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack same-type images into (N, size) data and (N, blocks) captured arrays"""
+    images = list(images)
+    if not images:
+        return np.zeros((0, 0), dtype=np.uint8), np.zeros((0, 0), dtype=bool)
+    if len({image.card_type for image in images}) > 1:
+        raise ValueError("Cannot stack images of different card types")
+    data = np.frombuffer(b"".join(bytes(image.buffer) for image in images), dtype=np.uint8)
+    captured = np.frombuffer(b"".join(bytes(image.captured) for image in images), dtype=bool)
+    return data.reshape(len(images), -1), captured.reshape(len(images), -1)
+
+def diff_block_matrix(reference: CardImage, data: np.ndarray, captured: Optional[np.ndarray] = None,
+                      ignore_keys: bool = False) -> np.ndarray:
+    """Compare one image against N stacked images
+
+    Returns:
+        ndarray: (N, blocks) bool, True where a block captured on both sides differs
+    """
+    reference_blocks = _blocks_view(reference.buffer)
+    candidate_blocks = _blocks_view(data)
+    differs = candidate_blocks != reference_blocks
+    if ignore_keys:
+        differs &= _key_byte_mask(reference.block_count)
+    changed = differs.any(axis=2)
+
+    changed &= np.frombuffer(bytes(reference.captured), dtype=bool)
+    if captured is not None:
+        changed &= captured
+    return changed
+
+def rank_by_similarity(reference: CardImage, data: np.ndarray, captured: Optional[np.ndarray] = None,
+                       ignore_keys: bool = False) -> List[Tuple[int, int]]:
+    """Order stacked images by number of differing blocks
+
+    Returns:
+        list: (index, differing block count), closest first
+    """
+    counts = diff_block_matrix(reference, data, captured, ignore_keys).sum(axis=1)
+    order = np.argsort(counts, kind="stable")
+    return [(int(index), int(counts[index])) for index in order]
+
+def diff_against_library(library, reference: CardImage, records=None,
+                         ignore_keys: bool = False) -> List[Tuple[object, int]]:
+    """Rank library dumps (all of the reference's card type by default) by similarity
+
+    Returns:
+        list: (DumpRecord, differing block count), closest first
+    """
+    if records is None:
+        records = library.query(card_type=reference.card_type)
+    records = [record for record in records if record.card_type == reference.card_type]
+    if not records:
+        return []
+    data, captured = stack_images(library.load(record) for record in records)
+    return [(records[index], count)
+            for index, count in rank_by_similarity(reference, data, captured, ignore_keys)]
@@ -0,0 +1,308 @@
+"""
+Dump File Formats
+Streaming readers and writers for common MIFARE Classic dump formats
+
+Supported formats:
+- "mfd":  raw binary (.mfd, .bin), memory-mapped on import
+- "mct":  MIFARE Classic Tool text dump (.dump, .mct) with unknown-block markers
+- "eml":  Proxmark emulator file (.eml), one hex line per block
+- "json": Proxmark-style JSON (.json)
+"""
+
+import json
+import logging
+import mmap
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+from config.constants import (
+    KEY_TYPE_A, KEY_TYPE_B, CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K, MIFARE_BLOCK_SIZE
+)
+from .card_image import CardImage, card_type_from_size
+from .data_utils import get_block_sector, get_sector_first_block, get_sector_block_count
+from .key_diversification import KeyMap
+
+logger = logging.getLogger(__name__)
+
+FORMAT_BINARY = "mfd"
+FORMAT_MCT = "mct"
+FORMAT_EML = "eml"
+FORMAT_JSON = "json"
+
+FORMAT_EXTENSIONS = {
+    ".mfd": FORMAT_BINARY,
+    ".bin": FORMAT_BINARY,
+    ".dump": FORMAT_MCT,
+    ".mct": FORMAT_MCT,
+    ".eml": FORMAT_EML,
+    ".json": FORMAT_JSON
+}
+
+DEFAULT_EXTENSIONS = {
+    FORMAT_BINARY: ".mfd",
+    FORMAT_MCT: ".dump",
+    FORMAT_EML: ".eml",
+    FORMAT_JSON: ".json"
+}
+
+MCT_SECTOR_PREFIX = "+Sector:"
+MCT_UNKNOWN_BLOCK = "-" * (MIFARE_BLOCK_SIZE * 2)
+MCT_UNKNOWN_KEY = "-" * 12
+
+# (block number, data or None if unknown)
+BlockStream = Iterator[Tuple[int, Optional[bytes]]]
+
+class DumpFormatError(Exception):
+    """Raised when a dump file cannot be parsed"""
+
+def detect_format(path: Path) -> str:
+    """Get dump format from file extension"""
+    fmt = FORMAT_EXTENSIONS.get(Path(path).suffix.lower())
+    if fmt is None:
+        raise DumpFormatError(f"Unknown dump file extension: {path}")
+    return fmt
+
+# --- Readers -------------------------------------------------------------
+
+def _iter_binary(path: Path, key_map: KeyMap) -> BlockStream:
+    """Stream blocks of a raw binary dump through a memory map"""
+    with open(path, 'rb') as f:
+        size = Path(path).stat().st_size
+        card_type_from_size(size)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for block in range(size // MIFARE_BLOCK_SIZE):
+                offset = block * MIFARE_BLOCK_SIZE
+                yield block, mapped[offset:offset + MIFARE_BLOCK_SIZE]
+
+def _parse_mct_block(line: str, block: int, key_map: KeyMap) -> Optional[bytes]:
+    """Parse one MCT block line, collecting trailer keys"""
+    if line == MCT_UNKNOWN_BLOCK:
+        return None
+    if len(line) != MIFARE_BLOCK_SIZE * 2:
+        raise DumpFormatError(f"Invalid MCT block line for block {block}: {line!r}")
+
+    sector = get_block_sector(block)
+    is_trailer = block == get_sector_first_block(sector) + get_sector_block_count(sector) - 1
+    if is_trailer:
+        for key_type, start in ((KEY_TYPE_A, 0), (KEY_TYPE_B, 20)):
+            key_hex = line[start:start + 12]
+            if key_hex != MCT_UNKNOWN_KEY:
+                key_map.setdefault(sector, {})[key_type] = bytes.fromhex(key_hex)
+
+    # Unknown bytes inside a block (e.g. unread keys) become zeros
+    return bytes.fromhex(line.replace("-", "0"))
+
+def _iter_mct(path: Path, key_map: KeyMap) -> BlockStream:
+    """Stream blocks of an MCT text dump"""
+    block = None
+    end_block = None
+    with open(path, 'r') as f:
+        for raw_line in f:
+            line = raw_line.strip()
+            if not line:
+                continue
+            if line.startswith(MCT_SECTOR_PREFIX):
+                sector = int(line[len(MCT_SECTOR_PREFIX):].strip())
+                block = get_sector_first_block(sector)
+                end_block = block + get_sector_block_count(sector)
+                continue
+            if block is None or block >= end_block:
+                raise DumpFormatError(f"Unexpected line in MCT dump: {line!r}")
+            yield block, _parse_mct_block(line.upper(), block, key_map)
+            block += 1
+
+def _iter_eml(path: Path, key_map: KeyMap) -> BlockStream:
+    """Stream blocks of a Proxmark .eml file"""
+    with open(path, 'r') as f:
+        block = 0
+        for raw_line in f:
+            line = raw_line.strip()
+            if not line:
+                continue
+            if len(line) != MIFARE_BLOCK_SIZE * 2:
+                raise DumpFormatError(f"Invalid EML line for block {block}: {line!r}")
+            yield block, bytes.fromhex(line)
+            block += 1
+
+def _iter_json(path: Path, key_map: KeyMap) -> BlockStream:
+    """Stream blocks of a Proxmark-style JSON dump"""
+    with open(path, 'r') as f:
+        document = json.load(f)
+
+    for sector, keys in document.get("SectorKeys", {}).items():
+        for key_type, name in ((KEY_TYPE_A, "KeyA"), (KEY_TYPE_B, "KeyB")):
+            if keys.get(name):
+                key_map.setdefault(int(sector), {})[key_type] = bytes.fromhex(keys[name])
+
+    for block, data_hex in sorted(document.get("blocks", {}).items(), key=lambda item: int(item[0])):
+        yield int(block), None if data_hex is None else bytes.fromhex(data_hex)
+
+READERS = {
+    FORMAT_BINARY: _iter_binary,
+    FORMAT_MCT: _iter_mct,
+    FORMAT_EML: _iter_eml,
+    FORMAT_JSON: _iter_json
+}
+
+def iter_blocks(path: Path, fmt: Optional[str] = None,
+                key_map: Optional[KeyMap] = None) -> BlockStream:
+    """Stream (block, data) pairs from a dump file
+
+    Unknown blocks are yielded with data None. Keys found in the file are
+    added to key_map if one is given.
+    """
+    fmt = fmt or detect_format(path)
+    if fmt not in READERS:
+        raise DumpFormatError(f"Unsupported dump format: {fmt}")
+    return READERS[fmt](Path(path), key_map if key_map is not None else {})
+
+def read_into_image(blocks: Iterable[Tuple[int, Optional[bytes]]], image: CardImage) -> CardImage:
+    """Fill an image from a block stream"""
+    for block, data in blocks:
+        if block >= image.block_count:
+            raise DumpFormatError(f"Block {block} outside a {image.size}-byte card")
+        if data is not None:
+            image.set_block(block, data)
+    return image
+
+def load_image(path: Path, fmt: Optional[str] = None) -> CardImage:
+    """Load a dump file into a CardImage"""
+    path = Path(path)
+    fmt = fmt or detect_format(path)
+    key_map: KeyMap = {}
+
+    if fmt == FORMAT_BINARY:
+        image = CardImage(card_type_from_size(path.stat().st_size))
+        read_into_image(iter_blocks(path, fmt, key_map), image)
+        image.uid = image._uid_from_manufacturer_block()
+        return image
+
+    # Text formats: block numbers decide 1K vs 4K, so fill a 4K image first
+    image = CardImage(CARD_TYPE_MIFARE_4K)
+    read_into_image(iter_blocks(path, fmt, key_map), image)
+
+    small = CardImage(CARD_TYPE_MIFARE_1K)
+    if not any(image.captured[small.block_count:]):
+        small.buffer[:] = image.buffer[:small.size]
+        small.captured[:] = image.captured[:small.block_count]
+        image = small
+
+    if fmt == FORMAT_JSON:
+        with open(path, 'r') as f:
+            uid_hex = json.load(f).get("Card", {}).get("UID")
+        image.uid = bytes.fromhex(uid_hex) if uid_hex else None
+    if image.uid is None and image.has_block(0):
+        image.uid = image._uid_from_manufacturer_block()
+
+    image.key_map = key_map
+    return image
+
+# --- Writers -------------------------------------------------------------
+
+def _image_blocks(image: CardImage) -> BlockStream:
+    """Stream (block, data) pairs of an image, None for uncaptured blocks"""
+    for block in range(image.block_count):
+        yield block, image.get_block(block) if image.has_block(block) else None
+
+def _write_binary(f, blocks: Iterable[Tuple[int, Optional[bytes]]], key_map: KeyMap, uid) -> None:
+    """Write raw binary dump (unknown blocks as zeros)"""
+    for block, data in blocks:
+        f.write(data if data is not None else bytes(MIFARE_BLOCK_SIZE))
+
+def _write_mct(f, blocks: Iterable[Tuple[int, Optional[bytes]]], key_map: KeyMap, uid) -> None:
+    """Write MCT text dump with unknown-block and unknown-key markers"""
+    for block, data in blocks:
+        sector = get_block_sector(block)
+        first_block = get_sector_first_block(sector)
+        if block == first_block:
+            f.write(f"{MCT_SECTOR_PREFIX} {sector}\n")
+        if data is None:
+            f.write(MCT_UNKNOWN_BLOCK + "\n")
+            continue
+
+        if block == first_block + get_sector_block_count(sector) - 1:
+            keys = key_map.get(sector, {})
+            data = bytearray(data)
+            for key_type, start in ((KEY_TYPE_A, 0), (KEY_TYPE_B, 10)):
+                if key_type in keys:
+                    data[start:start + 6] = keys[key_type]
+            line = data.hex().upper()
+            # Cards return unreadable keys as zeros; mark them unknown unless the key is known
+            for key_type, start in ((KEY_TYPE_A, 0), (KEY_TYPE_B, 10)):
+                if key_type not in keys and not any(data[start:start + 6]):
+                    line = line[:start * 2] + MCT_UNKNOWN_KEY + line[start * 2 + 12:]
+        else:
+            line = data.hex().upper()
+        f.write(line + "\n")
+
+def _write_eml(f, blocks: Iterable[Tuple[int, Optional[bytes]]], key_map: KeyMap, uid) -> None:
+    """Write Proxmark .eml file (unknown blocks as zeros)"""
+    for block, data in blocks:
+        f.write((data if data is not None else bytes(MIFARE_BLOCK_SIZE)).hex().upper() + "\n")
+
+def _write_json(f, blocks: Iterable[Tuple[int, Optional[bytes]]], key_map: KeyMap, uid) -> None:
+    """Write Proxmark-style JSON, streaming the blocks object"""
+    f.write('{\n  "Created": "mifare-classic-tool",\n  "FileType": "mfcard",\n')
+    f.write(f'  "Card": {{"UID": {json.dumps(uid.hex().upper() if uid else None)}}},\n')
+    f.write('  "blocks": {')
+    first = True
+    for block, data in blocks:
+        if data is None:
+            continue
+        f.write(("\n" if first else ",\n") + f'    "{block}": "{data.hex().upper()}"')
+        first = False
+    f.write('\n  },\n  "SectorKeys": ')
+    json.dump({
+        str(sector): {name: keys[key_type].hex().upper()
+                      for key_type, name in ((KEY_TYPE_A, "KeyA"), (KEY_TYPE_B, "KeyB")) if key_type in keys}
+        for sector, keys in sorted(key_map.items())
+    }, f)
+    f.write("\n}\n")
+
+WRITERS = {
+    FORMAT_BINARY: _write_binary,
+    FORMAT_MCT: _write_mct,
+    FORMAT_EML: _write_eml,
+    FORMAT_JSON: _write_json
+}
+
+def write_blocks(path: Path, blocks: Iterable[Tuple[int, Optional[bytes]]], fmt: Optional[str] = None,
+                 key_map: Optional[KeyMap] = None, uid: Optional[bytes] = None) -> None:
+    """Write a block stream to a dump file"""
+    fmt = fmt or detect_format(path)
+    if fmt not in WRITERS:
+        raise DumpFormatError(f"Unsupported dump format: {fmt}")
+    mode = 'wb' if fmt == FORMAT_BINARY else 'w'
+    with open(path, mode) as f:
+        WRITERS[fmt](f, blocks, key_map or {}, uid)
+
+def save_image(image: CardImage, path: Path, fmt: Optional[str] = None) -> None:
+    """Save a CardImage to a dump file"""
+    write_blocks(path, _image_blocks(image), fmt, image.key_map, image.uid)
+
+def convert(source: Path, destination: Path, source_fmt: Optional[str] = None,
+            destination_fmt: Optional[str] = None) -> None:
+    """Convert a dump file between formats"""
+    image = load_image(source, source_fmt)
+    save_image(image, destination, destination_fmt)
+
+def iter_images(directory: Path, pattern: str = "*") -> Iterator[Tuple[Path, CardImage]]:
+    """Load dump files of a directory one at a time"""
+    for path in sorted(Path(directory).glob(pattern)):
+        if path.suffix.lower() not in FORMAT_EXTENSIONS:
+            continue
+        try:
+            yield path, load_image(path)
+        except (DumpFormatError, ValueError) as e:
+            logger.warning(f"Skipping {path}: {e}")
+
+def convert_directory(source_dir: Path, destination_dir: Path, destination_fmt: str,
+                      pattern: str = "*") -> int:
+    """Convert every dump in a directory, returns number of files written"""
+    destination_dir = Path(destination_dir)
+    destination_dir.mkdir(parents=True, exist_ok=True)
+    count = 0
+    for path, image in iter_images(source_dir, pattern):
+        save_image(image, destination_dir / (path.stem + DEFAULT_EXTENSIONS[destination_fmt]), destination_fmt)
+        count += 1
+    return count
@@ -0,0 +1,499 @@
+"""
+Dump Library
+Stores card images on disk with a SQLite index for fast lookups
+"""
+
+import hashlib
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.constants import MIFARE_BLOCK_SIZE
+from .card_image import CardImage, CARD_TYPE_SIZES
+from .data_utils import get_sector_first_block, get_sector_block_count
+from .key_cache import KEY_TYPE_TAGS, TAG_KEY_TYPES
+from .key_diversification import KeyMap
+from .private_files import make_private_dir, make_private_file, write_private_file
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_SCHEMA_VERSION = 1
+DEFAULT_BATCH_SIZE = 500
+SECTOR_HASH_SIZE = 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dumps (
+    id INTEGER PRIMARY KEY,
+    uid TEXT,
+    card_type INTEGER NOT NULL,
+    created REAL NOT NULL,
+    station TEXT,
+    label TEXT,
+    captured BLOB NOT NULL,
+    key_map_id INTEGER REFERENCES key_maps(id),
+    storage_ref TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dumps_uid ON dumps(uid, created);
+CREATE INDEX IF NOT EXISTS dumps_created ON dumps(created);
+CREATE INDEX IF NOT EXISTS dumps_station ON dumps(station, created);
+CREATE INDEX IF NOT EXISTS dumps_storage_ref ON dumps(storage_ref);
+
+CREATE TABLE IF NOT EXISTS sector_hashes (
+    dump_id INTEGER NOT NULL REFERENCES dumps(id) ON DELETE CASCADE,
+    sector INTEGER NOT NULL,
+    hash BLOB NOT NULL,
+    PRIMARY KEY (dump_id, sector)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sector_hashes_lookup ON sector_hashes(sector, hash);
+
+CREATE TABLE IF NOT EXISTS key_maps (
+    id INTEGER PRIMARY KEY,
+    hash BLOB NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def sector_hash(data: bytes) -> bytes:
+    """Content hash of one sector's raw bytes"""
+    return hashlib.blake2b(data, digest_size=SECTOR_HASH_SIZE).digest()
+
+def _uid_key(uid: Optional[bytes]) -> Optional[str]:
+    """Normalize UID into index key"""
+    return uid.hex().upper() if uid else None
+
+def _encode_key_map(key_map: KeyMap) -> str:
+    """Serialize key map as canonical JSON with 'sector:A' slots"""
+    return json.dumps({
+        f"{sector}:{KEY_TYPE_TAGS[key_type]}": key.hex().upper()
+        for sector, keys in key_map.items() for key_type, key in keys.items()
+    }, sort_keys=True)
+
+def _decode_key_map(data: str) -> KeyMap:
+    """Parse key map stored by _encode_key_map"""
+    key_map: KeyMap = {}
+    for slot, key_hex in json.loads(data).items():
+        sector, tag = slot.split(":")
+        key_map.setdefault(int(sector), {})[TAG_KEY_TYPES[tag]] = bytes.fromhex(key_hex)
+    return key_map
+
+class DumpStore:
+    """Base class for dump library storage backends
+
+    Backends store raw image bytes under a reference string chosen by the
+    backend; identical images may share one reference.
+    """
+
+    name = ""
+
+    def put(self, data: bytes) -> str:
+        """Store raw image bytes, returns storage reference"""
+        raise NotImplementedError
+
+    def get(self, ref: str) -> bytes:
+        """Get raw image bytes for storage reference"""
+        raise NotImplementedError
+
+    def get_sector(self, ref: str, sector: int) -> bytes:
+        """Get raw bytes of one sector"""
+        data = self.get(ref)
+        first_block = get_sector_first_block(sector)
+        end_block = first_block + get_sector_block_count(sector)
+        return data[first_block * MIFARE_BLOCK_SIZE:end_block * MIFARE_BLOCK_SIZE]
+
+    def delete(self, ref: str) -> None:
+        """Remove stored image (called once no dump references it)"""
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Make stored data durable"""
+
+    def close(self) -> None:
+        """Flush and release resources"""
+        self.flush()
+
+class FileDumpStore(DumpStore):
+    """Stores each distinct image as a raw .mfd file named by content hash"""
+
+    name = "files"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path_for(self, ref: str) -> Path:
+        """Get file path for storage reference"""
+        return self.root / ref[:2] / f"{ref}.mfd"
+
+    def put(self, data: bytes) -> str:
+        """Store raw image bytes, returns storage reference"""
+        ref = hashlib.sha256(data).hexdigest()
+        path = self._path_for(ref)
+        if not path.exists():
+            make_private_dir(path.parent)
+            write_private_file(path, data)
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        """Get raw image bytes for storage reference"""
+        with open(self._path_for(ref), 'rb') as f:
+            return f.read()
+
+    def get_sector(self, ref: str, sector: int) -> bytes:
+        """Get raw bytes of one sector without reading the whole file"""
+        first_block = get_sector_first_block(sector)
+        with open(self._path_for(ref), 'rb') as f:
+            f.seek(first_block * MIFARE_BLOCK_SIZE)
+            return f.read(get_sector_block_count(sector) * MIFARE_BLOCK_SIZE)
+
+    def delete(self, ref: str) -> None:
+        """Remove stored image file"""
+        try:
+            self._path_for(ref).unlink()
+        except FileNotFoundError:
+            pass
+
+class DumpRecord:
+    """Index entry of one stored dump"""
+
+    def __init__(self, dump_id: int, uid: Optional[str], card_type: int, created: float,
+                 station: Optional[str], label: Optional[str], captured: bytes,
+                 key_map_id: Optional[int], storage_ref: str):
+        self.dump_id = dump_id
+        self.uid = bytes.fromhex(uid) if uid else None
+        self.card_type = card_type
+        self.created = created
+        self.station = station
+        self.label = label
+        self.captured = captured
+        self.key_map_id = key_map_id
+        self.storage_ref = storage_ref
+
+    @property
+    def coverage(self) -> float:
+        """Get fraction of blocks captured (0.0 - 1.0)"""
+        return sum(self.captured) / len(self.captured) if self.captured else 0.0
+
+    def __repr__(self) -> str:
+        uid = self.uid.hex().upper() if self.uid else "-"
+        return f"DumpRecord({self.dump_id}, UID {uid}, {self.station or '-'}, {self.created:.0f})"
+
+_RECORD_COLUMNS = "id, uid, card_type, created, station, label, captured, key_map_id, storage_ref"
+
+class DumpLibrary:
+    """Dump archive with a SQLite index of UID, card type, time, station,
+    per-sector content hashes and key maps
+
+    Image bytes go to a pluggable DumpStore backend (one file per distinct
+    image by default). Only complete sectors are hashed, so sector queries
+    never match partially captured data. Dumps and the key_maps table hold
+    card contents and keys in plaintext, so the library directory is made
+    0700 and the index and stored dumps are written 0600.
+    """
+
+    def __init__(self, library_dir: Optional[Path] = None, store: Optional[DumpStore] = None,
+                 station: Optional[str] = None, ngram_index: Optional[bool] = None):
+        if library_dir is None:
+            library_dir = Path.home() / ".mifare_classic_tool" / "library"
+        self.library_dir = Path(library_dir)
+        make_private_dir(self.library_dir)
+        self.store = store if store is not None else FileDumpStore(self.library_dir / "dumps")
+        self.station = station or socket.gethostname()
+        self._lock = threading.RLock()
+
+        index_path = make_private_file(self.library_dir / "index.sqlite3")
+        self._db = sqlite3.connect(str(index_path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+        self._db.execute(f"PRAGMA user_version={LIBRARY_SCHEMA_VERSION}")
+        self._check_store()
+        self.ngram_index = None
+        self._configure_ngram_index(ngram_index)
+
+    def _check_store(self) -> None:
+        """Record the storage backend, refusing to open a library with a different one"""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'store'").fetchone()
+        if row is None:
+            self._db.execute("INSERT INTO meta (key, value) VALUES ('store', ?)", (self.store.name,))
+            self._db.commit()
+        elif row[0] != self.store.name:
+            self._db.close()
+            raise ValueError(f"Library uses the '{row[0]}' store, not '{self.store.name}'")
+
+    def _configure_ngram_index(self, enabled: Optional[bool]) -> None:
+        """Enable or disable the n-gram index (None keeps the stored choice)"""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'ngram_index'").fetchone()
+        stored = row is not None and row[0] == "1"
+        if enabled is None:
+            enabled = stored
+
+        if enabled:
+            from .ngram_index import NgramIndex
+            self.ngram_index = NgramIndex(self._db)
+            if not stored:
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('ngram_index', '1')")
+                self.rebuild_ngram_index()
+        elif stored:
+            self._db.execute("DROP TABLE IF EXISTS ngrams")
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('ngram_index', '0')")
+            self._db.commit()
+
+    def rebuild_ngram_index(self) -> None:
+        """Re-index every stored dump"""
+        with self._lock:
+            cursor = self._db.cursor()
+            self.ngram_index.clear()
+            for record in self._records():
+                self.ngram_index.add(cursor, record.dump_id, self.load(record))
+            self._db.commit()
+
+    def close(self) -> None:
+        """Flush storage and close the index"""
+        with self._lock:
+            self.store.close()
+            self._db.close()
+
+    def __enter__(self) -> "DumpLibrary":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    # --- Inserts ---------------------------------------------------------
+
+    def _key_map_id(self, cursor: sqlite3.Cursor, key_map: KeyMap) -> Optional[int]:
+        """Get id of a stored key map, inserting it once"""
+        if not key_map:
+            return None
+        data = _encode_key_map(key_map)
+        digest = hashlib.sha256(data.encode()).digest()
+        row = cursor.execute("SELECT id FROM key_maps WHERE hash = ?", (digest,)).fetchone()
+        if row:
+            return row[0]
+        cursor.execute("INSERT INTO key_maps (hash, data) VALUES (?, ?)", (digest, data))
+        return cursor.lastrowid
+
+    def _insert(self, cursor: sqlite3.Cursor, image: CardImage, station: Optional[str],
+                label: Optional[str], created: Optional[float]) -> int:
+        """Store one image and index it within the current transaction"""
+        storage_ref = self.store.put(image.to_bytes())
+        cursor.execute(
+            "INSERT INTO dumps (uid, card_type, created, station, label, captured, key_map_id, storage_ref) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (_uid_key(image.uid), image.card_type, created if created is not None else time.time(),
+             station or self.station, label, bytes(image.captured),
+             self._key_map_id(cursor, image.key_map), storage_ref)
+        )
+        dump_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO sector_hashes (dump_id, sector, hash) VALUES (?, ?, ?)",
+            [(dump_id, sector, sector_hash(image.get_sector(sector)))
+             for sector in range(image.sector_count) if image.is_sector_complete(sector)]
+        )
+        if self.ngram_index is not None:
+            self.ngram_index.add(cursor, dump_id, image)
+        return dump_id
+
+    def add(self, image: CardImage, station: Optional[str] = None, label: Optional[str] = None,
+            created: Optional[float] = None) -> int:
+        """Store one image, returns its dump id"""
+        return self.add_many([image], station, label, created)[0]
+
+    def add_many(self, images: Iterable[CardImage], station: Optional[str] = None,
+                 label: Optional[str] = None, created: Optional[float] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> List[int]:
+        """Store many images, committing once per batch"""
+        dump_ids: List[int] = []
+        with self._lock:
+            cursor = self._db.cursor()
+            pending = 0
+            try:
+                for image in images:
+                    dump_ids.append(self._insert(cursor, image, station, label, created))
+                    pending += 1
+                    if pending >= batch_size:
+                        self.store.flush()
+                        self._db.commit()
+                        pending = 0
+                self.store.flush()
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+        logger.debug(f"Stored {len(dump_ids)} dumps in library")
+        return dump_ids
+
+    def delete(self, dump_id: int) -> bool:
+        """Remove a dump from the library"""
+        with self._lock:
+            cursor = self._db.cursor()
+            row = cursor.execute("SELECT storage_ref FROM dumps WHERE id = ?", (dump_id,)).fetchone()
+            if row is None:
+                return False
+            if self.ngram_index is not None:
+                self.ngram_index.remove(cursor, dump_id, self.load(dump_id))
+            cursor.execute("DELETE FROM dumps WHERE id = ?", (dump_id,))
+            still_used = cursor.execute("SELECT 1 FROM dumps WHERE storage_ref = ? LIMIT 1", row).fetchone()
+            self._db.commit()
+            # Still under the lock: an add of the same content could otherwise
+            # reference storage_ref between the commit and the delete
+            if not still_used:
+                self.store.delete(row[0])
+        return True
+
+    # --- Queries ---------------------------------------------------------
+
+    def _records(self, where: str = "", params: Tuple = (), limit: Optional[int] = None) -> List[DumpRecord]:
+        """Run a dumps query, newest first"""
+        sql = f"SELECT {_RECORD_COLUMNS} FROM dumps {where} ORDER BY created DESC, id DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [DumpRecord(*row) for row in rows]
+
+    def get_record(self, dump_id: int) -> Optional[DumpRecord]:
+        """Get index entry of one dump"""
+        records = self._records("WHERE id = ?", (dump_id,))
+        return records[0] if records else None
+
+    def find_by_uid(self, uid: bytes, limit: Optional[int] = None) -> List[DumpRecord]:
+        """Get all dumps of one card, newest first"""
+        return self._records("WHERE uid = ?", (_uid_key(uid),), limit)
+
+    def latest(self, uid: bytes) -> Optional[DumpRecord]:
+        """Get most recent dump of one card"""
+        records = self.find_by_uid(uid, limit=1)
+        return records[0] if records else None
+
+    def query(self, uid: Optional[bytes] = None, card_type: Optional[int] = None,
+              station: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, label: Optional[str] = None,
+              limit: Optional[int] = None) -> List[DumpRecord]:
+        """Find dumps matching all given criteria, newest first"""
+        clauses, params = [], []
+        for column, op, value in (("uid", "=", _uid_key(uid) if uid else None),
+                                  ("card_type", "=", card_type), ("station", "=", station),
+                                  ("created", ">=", since), ("created", "<", until), ("label", "=", label)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        return self._records(where, tuple(params), limit)
+
+    def find_by_sector(self, sector: int, data: bytes, limit: Optional[int] = None) -> List[DumpRecord]:
+        """Get dumps whose sector contents equal data exactly"""
+        return self.find_by_sector_hash(sector, sector_hash(data), limit)
+
+    def find_by_sector_hash(self, sector: int, digest: bytes, limit: Optional[int] = None) -> List[DumpRecord]:
+        """Get dumps whose sector has the given content hash"""
+        return self._records("WHERE id IN (SELECT dump_id FROM sector_hashes WHERE sector = ? AND hash = ?)",
+                             (sector, digest), limit)
+
+    def find_matching_template(self, template: CardImage, sectors: Optional[Iterable[int]] = None,
+                               limit: Optional[int] = None) -> List[DumpRecord]:
+        """Get dumps matching all complete sectors of a template image"""
+        if sectors is None:
+            sectors = range(template.sector_count)
+        conditions = [(sector, sector_hash(template.get_sector(sector)))
+                      for sector in sectors if template.is_sector_complete(sector)]
+        if not conditions:
+            return []
+        subqueries = " INTERSECT ".join(["SELECT dump_id FROM sector_hashes WHERE sector = ? AND hash = ?"]
+                                        * len(conditions))
+        params = tuple(value for condition in conditions for value in condition)
+        return self._records(f"WHERE id IN ({subqueries})", params, limit)
+
+    def search_bytes(self, pattern: bytes, limit: Optional[int] = None) -> list:
+        """Find every occurrence of a byte pattern using the n-gram index
+
+        Returns:
+            list: SearchHit per match, newest dumps first
+        """
+        if self.ngram_index is None:
+            raise ValueError("N-gram index is not enabled for this library")
+        from .ngram_index import SearchHit
+
+        pattern = bytes(pattern)
+        hits = []
+        matched_dumps = 0
+        with self._lock:
+            candidates = self.ngram_index.candidates(pattern)
+        for dump_id, blocks in candidates.items():
+            if limit is not None and matched_dumps >= limit:
+                break
+            image = self.load(dump_id)
+            found = False
+            for block in blocks:
+                for offset in range(MIFARE_BLOCK_SIZE):
+                    start = block * MIFARE_BLOCK_SIZE + offset
+                    end = start + len(pattern)
+                    if image.buffer[start:end] != pattern:
+                        continue
+                    last_block = (end - 1) // MIFARE_BLOCK_SIZE
+                    if all(image.captured[block:last_block + 1]):
+                        hits.append(SearchHit(dump_id, image.uid, block, offset))
+                        found = True
+            matched_dumps += found
+        return hits
+
+    def search_uids(self, pattern: bytes) -> List[bytes]:
+        """Get UIDs of cards whose dumps contain a byte pattern"""
+        return sorted({hit.uid for hit in self.search_bytes(pattern) if hit.uid})
+
+    def get_sector_hashes(self, dump_id: int) -> Dict[int, bytes]:
+        """Get content hashes of the complete sectors of one dump"""
+        with self._lock:
+            rows = self._db.execute("SELECT sector, hash FROM sector_hashes WHERE dump_id = ?",
+                                    (dump_id,)).fetchall()
+        return dict(rows)
+
+    def get_key_map(self, key_map_id: int) -> KeyMap:
+        """Get stored key map by id"""
+        with self._lock:
+            row = self._db.execute("SELECT data FROM key_maps WHERE id = ?", (key_map_id,)).fetchone()
+        return _decode_key_map(row[0]) if row else {}
+
+    def count(self) -> int:
+        """Get number of stored dumps"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM dumps").fetchone()[0]
+
+    def uids(self) -> List[bytes]:
+        """Get distinct UIDs in the library"""
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT uid FROM dumps WHERE uid IS NOT NULL").fetchall()
+        return [bytes.fromhex(row[0]) for row in rows]
+
+    # --- Loading ---------------------------------------------------------
+
+    def load(self, record) -> CardImage:
+        """Rebuild a CardImage from a record or dump id"""
+        if not isinstance(record, DumpRecord):
+            dump_id = record
+            record = self.get_record(dump_id)
+            if record is None:
+                raise KeyError(f"No dump with id {dump_id}")
+        image = CardImage(record.card_type, record.uid)
+        data = self.store.get(record.storage_ref)
+        if len(data) != CARD_TYPE_SIZES[record.card_type]:
+            raise ValueError(f"Stored image {record.storage_ref} has wrong size")
+        image.buffer[:] = data
+        image.captured[:] = record.captured
+        if record.key_map_id is not None:
+            image.key_map = self.get_key_map(record.key_map_id)
+        return image
+
+    def load_sector(self, record: DumpRecord, sector: int) -> bytes:
+        """Get raw bytes of one sector of a stored dump"""
+        return self.store.get_sector(record.storage_ref, sector)
@@ -0,0 +1,139 @@
+"""
+Resumable Partial Dumps
+Keeps partially read card images per UID so interrupted dumps can continue
+"""
+
+import base64
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .card_image import CardImage
+from .key_cache import KEY_TYPE_TAGS, TAG_KEY_TYPES
+from .private_files import make_private_dir, write_private_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTIAL_DUMP_TTL = 600  # seconds
+
+class PartialDumpStore:
+    """Per-UID store of incomplete card images with expiry
+
+    Images are held in memory; if persist_dir is given they are also
+    written there so a restarted station can continue where it stopped.
+    Persisted files hold card contents and the keys found so far in
+    plaintext, so persist_dir is made 0700 and each file is written 0600;
+    files are removed once the dump completes or expires.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_PARTIAL_DUMP_TTL, persist_dir: Optional[Path] = None):
+        self.ttl = ttl
+        self.persist_dir = Path(persist_dir) if persist_dir is not None else None
+        self._images: Dict[str, Tuple[float, CardImage]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _uid_key(uid: bytes) -> str:
+        """Normalize UID into store key"""
+        return uid.hex().upper()
+
+    def _file_for(self, uid_key: str) -> Path:
+        """Get persistence file for UID"""
+        return self.persist_dir / f"{uid_key}.partial.json"
+
+    def get(self, uid: bytes) -> Optional[CardImage]:
+        """Get partial image for UID if present and not expired"""
+        uid_key = self._uid_key(uid)
+        with self._lock:
+            entry = self._images.get(uid_key)
+        if entry is None and self.persist_dir is not None:
+            entry = self._load(uid_key)
+        if entry is None:
+            return None
+
+        updated, image = entry
+        if time.time() - updated > self.ttl:
+            self.discard(uid)
+            return None
+
+        with self._lock:
+            self._images[uid_key] = entry
+        return image
+
+    def put(self, image: CardImage) -> None:
+        """Store (or refresh) partial image of a card"""
+        if image.uid is None:
+            raise ValueError("Partial dumps need a card UID")
+        uid_key = self._uid_key(image.uid)
+        updated = time.time()
+        with self._lock:
+            self._images[uid_key] = (updated, image)
+        if self.persist_dir is not None:
+            self._save(uid_key, updated, image)
+
+    def discard(self, uid: bytes) -> None:
+        """Forget partial image of a card"""
+        uid_key = self._uid_key(uid)
+        with self._lock:
+            self._images.pop(uid_key, None)
+        if self.persist_dir is not None:
+            try:
+                self._file_for(uid_key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def purge_expired(self) -> int:
+        """Remove expired entries, returns number removed"""
+        now = time.time()
+        with self._lock:
+            expired = [uid_key for uid_key, (updated, _) in self._images.items() if now - updated > self.ttl]
+        if self.persist_dir is not None and self.persist_dir.exists():
+            for path in self.persist_dir.glob("*.partial.json"):
+                if now - path.stat().st_mtime > self.ttl:
+                    expired.append(path.name.split(".")[0])
+        for uid_key in set(expired):
+            self.discard(bytes.fromhex(uid_key))
+        return len(set(expired))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._images)
+
+    def _save(self, uid_key: str, updated: float, image: CardImage) -> None:
+        """Write partial image to disk"""
+        try:
+            make_private_dir(self.persist_dir)
+            record = {
+                "uid": uid_key,
+                "card_type": image.card_type,
+                "updated": updated,
+                "data": base64.b64encode(bytes(image.buffer)).decode("ascii"),
+                "captured": base64.b64encode(bytes(image.captured)).decode("ascii"),
+                "keys": {f"{sector}:{KEY_TYPE_TAGS[kt]}": key.hex()
+                         for sector, keys in image.key_map.items() for kt, key in keys.items()}
+            }
+            write_private_file(self._file_for(uid_key), json.dumps(record))
+        except Exception as e:
+            logger.warning(f"Could not persist partial dump for {uid_key}: {e}")
+
+    def _load(self, uid_key: str) -> Optional[Tuple[float, CardImage]]:
+        """Read partial image from disk"""
+        path = self._file_for(uid_key)
+        try:
+            with open(path, 'r') as f:
+                record = json.load(f)
+            image = CardImage(record["card_type"], bytes.fromhex(record["uid"]))
+            image.buffer[:] = base64.b64decode(record["data"])
+            image.captured[:] = base64.b64decode(record["captured"])
+            for slot, key_hex in record.get("keys", {}).items():
+                sector, tag = slot.split(":")
+                image.key_map.setdefault(int(sector), {})[TAG_KEY_TYPES[tag]] = bytes.fromhex(key_hex)
+            return record["updated"], image
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not load partial dump {path}: {e}")
+            return None
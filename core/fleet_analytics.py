@@ -0,0 +1,347 @@
+"""
+Fleet Analytics
+Packs many card dumps into NumPy arrays for vectorized fleet-wide statistics
+"""
+
+import csv
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.constants import DEFAULT_KEYS, KEY_TYPE_A, KEY_TYPE_B, MIFARE_BLOCK_SIZE
+from .access_conditions import SECTOR_ACCESS_TABLE
+from .card_image import CardImage, CARD_TYPE_SIZES, CARD_TYPE_SECTORS
+from .data_utils import get_block_sector, get_sector_first_block, get_sector_block_count
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_CHUNK_ROWS = 1024
+DATA_FILE = "data.npy"
+CAPTURED_FILE = "captured.npy"
+UIDS_FILE = "uids.npy"
+KEY_MAP_FILE = "key_map.npy"
+
+# Access bytes (packed big-endian) under which Key B reads back as stored
+_KEY_B_READABLE_PROFILES = np.array(sorted(int.from_bytes(access_bytes, "big")
+                                           for access_bytes, access in SECTOR_ACCESS_TABLE.items()
+                                           if access.key_b_readable), dtype=np.int32)
+
+def trailer_block_numbers(card_type: int) -> np.ndarray:
+    """Get trailer block numbers of all sectors of a card type"""
+    return np.array([get_sector_first_block(sector) + get_sector_block_count(sector) - 1
+                     for sector in range(CARD_TYPE_SECTORS[card_type])])
+
+def _pack_keys(keys: np.ndarray) -> np.ndarray:
+    """Pack (..., 6) key bytes into uint64 values for fast comparison"""
+    packed = np.zeros(keys.shape[:-1], dtype=np.uint64)
+    for i in range(6):
+        packed = (packed << np.uint64(8)) | keys[..., i].astype(np.uint64)
+    return packed
+
+class FleetArray:
+    """N card images of one type as an (N, size) uint8 array
+
+    captured is an (N, blocks) bool array; statistics only count blocks
+    that were actually captured. key_map is an (N, sectors, 2) bool array
+    flagging Key A / Key B taken from the dump's key map. The arrays may
+    be memory-mapped .npy files so fleets larger than RAM can be analysed.
+    """
+
+    def __init__(self, card_type: int, data: np.ndarray, captured: np.ndarray, uids: Sequence[str],
+                 key_map: Optional[np.ndarray] = None):
+        self.card_type = card_type
+        self.data = data
+        self.captured = captured
+        self.uids = list(uids)
+        self.size = CARD_TYPE_SIZES[card_type]
+        self.block_count = self.size // MIFARE_BLOCK_SIZE
+        self.sector_count = CARD_TYPE_SECTORS[card_type]
+        if key_map is None:
+            key_map = np.zeros((data.shape[0], self.sector_count, 2), dtype=bool)
+        self.key_map = key_map
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    # --- Loading ---------------------------------------------------------
+
+    @classmethod
+    def allocate(cls, card_type: int, count: int, memmap_dir: Optional[Path] = None) -> "FleetArray":
+        """Create an empty fleet array, memory-mapped to .npy files if memmap_dir is given"""
+        size = CARD_TYPE_SIZES[card_type]
+        blocks = size // MIFARE_BLOCK_SIZE
+        sectors = CARD_TYPE_SECTORS[card_type]
+        if memmap_dir is None:
+            data = np.zeros((count, size), dtype=np.uint8)
+            captured = np.zeros((count, blocks), dtype=bool)
+            key_map = np.zeros((count, sectors, 2), dtype=bool)
+        else:
+            memmap_dir = Path(memmap_dir)
+            memmap_dir.mkdir(parents=True, exist_ok=True)
+            data = np.lib.format.open_memmap(memmap_dir / DATA_FILE, mode="w+", dtype=np.uint8, shape=(count, size))
+            captured = np.lib.format.open_memmap(memmap_dir / CAPTURED_FILE, mode="w+", dtype=bool,
+                                                 shape=(count, blocks))
+            key_map = np.lib.format.open_memmap(memmap_dir / KEY_MAP_FILE, mode="w+", dtype=bool,
+                                                shape=(count, sectors, 2))
+        return cls(card_type, data, captured, [""] * count, key_map)
+
+    @classmethod
+    def from_images(cls, images: Iterable[CardImage], card_type: int, count: Optional[int] = None,
+                    memmap_dir: Optional[Path] = None) -> "FleetArray":
+        """Pack images of one card type (others are skipped)
+
+        With count given, images are streamed straight into the arrays
+        instead of being collected first.
+        """
+        if count is None:
+            images = [image for image in images if image.card_type == card_type]
+            count = len(images)
+        fleet = cls.allocate(card_type, count, memmap_dir)
+
+        row = 0
+        for image in images:
+            if image.card_type != card_type:
+                continue
+            if row >= count:
+                break
+            fleet.data[row] = np.frombuffer(bytes(image.buffer), dtype=np.uint8)
+            fleet.captured[row] = np.frombuffer(bytes(image.captured), dtype=bool)
+            fleet.uids[row] = image.uid.hex().upper() if image.uid else ""
+            for sector, keys in image.key_map.items():
+                if sector < fleet.sector_count:
+                    fleet.key_map[row, sector] = (KEY_TYPE_A in keys, KEY_TYPE_B in keys)
+            row += 1
+
+        if row < count:
+            fleet = fleet.subset(np.arange(row))
+        logger.debug(f"Packed {row} cards into fleet array")
+        return fleet
+
+    @classmethod
+    def from_library(cls, library, card_type: int, records=None,
+                     memmap_dir: Optional[Path] = None) -> "FleetArray":
+        """Pack dumps of a dump library (all of card_type by default)"""
+        if records is None:
+            records = library.query(card_type=card_type)
+        records = [record for record in records if record.card_type == card_type]
+        return cls.from_images((library.load(record) for record in records), card_type,
+                               len(records), memmap_dir)
+
+    @classmethod
+    def from_files(cls, paths: Sequence[Path], card_type: int,
+                   memmap_dir: Optional[Path] = None) -> "FleetArray":
+        """Pack dump files in any supported format"""
+        from .dump_formats import load_image
+        return cls.from_images((load_image(path) for path in paths), card_type, len(paths), memmap_dir)
+
+    @classmethod
+    def open(cls, directory: Path, card_type: Optional[int] = None, mmap: bool = True) -> "FleetArray":
+        """Open a fleet array saved with save()"""
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        data = np.load(directory / DATA_FILE, mmap_mode=mode)
+        captured = np.load(directory / CAPTURED_FILE, mmap_mode=mode)
+        uids_path = directory / UIDS_FILE
+        uids = np.load(uids_path).tolist() if uids_path.exists() else [""] * data.shape[0]
+        key_map_path = directory / KEY_MAP_FILE
+        key_map = np.load(key_map_path, mmap_mode=mode) if key_map_path.exists() else None
+        if card_type is None:
+            card_type = next(ct for ct, size in CARD_TYPE_SIZES.items() if size == data.shape[1])
+        return cls(card_type, data, captured, uids, key_map)
+
+    def save(self, directory: Path) -> None:
+        """Write data, captured flags, key map flags and UIDs as .npy files"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, array in ((DATA_FILE, self.data), (CAPTURED_FILE, self.captured), (KEY_MAP_FILE, self.key_map)):
+            if isinstance(array, np.memmap) and Path(array.filename) == (directory / name).resolve():
+                array.flush()
+            else:
+                np.save(directory / name, array)
+        np.save(directory / UIDS_FILE, np.array(self.uids, dtype=str))
+
+    def subset(self, rows) -> "FleetArray":
+        """Get fleet array of selected rows (index array or bool mask)"""
+        rows = np.asarray(rows)
+        indices = np.flatnonzero(rows) if rows.dtype == bool else rows
+        return FleetArray(self.card_type, np.asarray(self.data[indices]), np.asarray(self.captured[indices]),
+                          [self.uids[i] for i in indices], np.asarray(self.key_map[indices]))
+
+    # --- Views -----------------------------------------------------------
+
+    def blocks(self) -> np.ndarray:
+        """View data as (N, blocks, 16)"""
+        return self.data.reshape(len(self), self.block_count, MIFARE_BLOCK_SIZE)
+
+    def trailers(self) -> np.ndarray:
+        """Get sector trailers as (N, sectors, 16)"""
+        return self.blocks()[:, trailer_block_numbers(self.card_type)]
+
+    def trailer_captured(self) -> np.ndarray:
+        """Get (N, sectors) flags of captured trailers"""
+        return self.captured[:, trailer_block_numbers(self.card_type)]
+
+    def key_a(self) -> np.ndarray:
+        """Get Key A bytes as (N, sectors, 6)"""
+        return self.trailers()[:, :, 0:6]
+
+    def key_b(self) -> np.ndarray:
+        """Get Key B bytes as (N, sectors, 6)"""
+        return self.trailers()[:, :, 10:16]
+
+    def access_bytes(self) -> np.ndarray:
+        """Get access bytes as (N, sectors, 3)"""
+        return self.trailers()[:, :, 6:9]
+
+    # --- Statistics ------------------------------------------------------
+
+    def keys_known(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Flag sectors whose trailer holds the real Key A / Key B
+
+        Cards read masked keys back as zeros, so zero key bytes are only
+        a key when the dump's key map has it, or for Key B when the access
+        bits make it readable.
+
+        Returns:
+            tuple: (key_a_known, key_b_known), each (N, sectors) bool
+        """
+        trailers = self.trailers()
+        key_map = np.asarray(self.key_map)
+        readable = np.isin(self.access_profiles(), _KEY_B_READABLE_PROFILES)
+        return (key_map[:, :, 0] | trailers[:, :, 0:6].any(axis=2),
+                key_map[:, :, 1] | trailers[:, :, 10:16].any(axis=2) | readable)
+
+    def factory_key_mask(self, keys: Optional[Iterable[bytes]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Flag captured sectors whose Key A / Key B is known to be a factory key
+
+        Returns:
+            tuple: (key_a_mask, key_b_mask), each (N, sectors) bool
+        """
+        keys = np.array([int.from_bytes(key, "big") for key in (keys if keys is not None else DEFAULT_KEYS)],
+                        dtype=np.uint64)
+        trailers = self.trailers()
+        captured = self.trailer_captured()
+        key_a_known, key_b_known = self.keys_known()
+        return (np.isin(_pack_keys(trailers[:, :, 0:6]), keys) & captured & key_a_known,
+                np.isin(_pack_keys(trailers[:, :, 10:16]), keys) & captured & key_b_known)
+
+    def factory_key_counts(self, keys: Optional[Iterable[bytes]] = None) -> Dict[str, np.ndarray]:
+        """Count cards per sector still using a factory key, and cards whose key is unknown"""
+        key_a_mask, key_b_mask = self.factory_key_mask(keys)
+        captured = self.trailer_captured()
+        key_a_known, key_b_known = self.keys_known()
+        return {
+            "key_a": key_a_mask.sum(axis=0),
+            "key_b": key_b_mask.sum(axis=0),
+            "either": (key_a_mask | key_b_mask).sum(axis=0),
+            "key_a_unknown": (captured & ~key_a_known).sum(axis=0),
+            "key_b_unknown": (captured & ~key_b_known).sum(axis=0),
+            "captured": captured.sum(axis=0)
+        }
+
+    def access_profiles(self) -> np.ndarray:
+        """Get access bytes packed as (N, sectors) int32, -1 where not captured"""
+        access = self.access_bytes().astype(np.int32)
+        packed = (access[:, :, 0] << 16) | (access[:, :, 1] << 8) | access[:, :, 2]
+        return np.where(self.trailer_captured(), packed, -1)
+
+    def access_profile_histogram(self, sector: Optional[int] = None) -> Dict[str, int]:
+        """Count cards per access-bytes profile (one sector or all sectors)
+
+        Keys are access bytes as hex; invalid encodings are suffixed with '!'.
+        """
+        profiles = self.access_profiles()
+        if sector is not None:
+            profiles = profiles[:, sector]
+        values, counts = np.unique(profiles[profiles >= 0], return_counts=True)
+        histogram = {}
+        for value, count in sorted(zip(values.tolist(), counts.tolist()), key=lambda item: -item[1]):
+            access = value.to_bytes(3, "big")
+            histogram[access.hex().upper() + ("" if access in SECTOR_ACCESS_TABLE else "!")] = count
+        return histogram
+
+    def byte_histogram(self) -> np.ndarray:
+        """Count values per byte position over captured blocks
+
+        Returns:
+            ndarray: (size, 256) int64 counts
+        """
+        counts = np.zeros(self.size * 256, dtype=np.int64)
+        offsets = np.arange(self.size, dtype=np.int32) * 256
+        for start in range(0, len(self), HISTOGRAM_CHUNK_ROWS):
+            # Bin index = byte position * 256 + value
+            bins = np.asarray(self.data[start:start + HISTOGRAM_CHUNK_ROWS]).astype(np.int32)
+            bins += offsets
+            captured = np.asarray(self.captured[start:start + HISTOGRAM_CHUNK_ROWS])
+            if not captured.all():
+                bins = bins[np.repeat(captured, MIFARE_BLOCK_SIZE, axis=1)]
+            counts += np.bincount(bins.ravel(), minlength=self.size * 256)
+        return counts.reshape(self.size, 256)
+
+    def byte_entropy(self, histogram: Optional[np.ndarray] = None) -> np.ndarray:
+        """Shannon entropy (bits) per byte position"""
+        if histogram is None:
+            histogram = self.byte_histogram()
+        totals = histogram.sum(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p = np.where(totals > 0, histogram / np.maximum(totals, 1), 0.0)
+            terms = np.where(p > 0, -p * np.log2(np.where(p > 0, p, 1.0)), 0.0)
+        return terms.sum(axis=1)
+
+    def block_entropy(self, histogram: Optional[np.ndarray] = None) -> np.ndarray:
+        """Mean byte entropy (bits per byte) of each block"""
+        return self.byte_entropy(histogram).reshape(self.block_count, MIFARE_BLOCK_SIZE).mean(axis=1)
+
+    def block_variability(self, histogram: Optional[np.ndarray] = None) -> np.ndarray:
+        """Fraction of captured cards per block that differ from the most common byte values
+
+        0.0 means every card has the same contents; bytes are compared
+        independently against their per-position mode.
+        """
+        if histogram is None:
+            histogram = self.byte_histogram()
+        mode = histogram.argmax(axis=1).astype(np.uint8).reshape(self.block_count, MIFARE_BLOCK_SIZE)
+        differing = np.zeros(self.block_count, dtype=np.int64)
+        for start in range(0, len(self), HISTOGRAM_CHUNK_ROWS):
+            chunk = np.asarray(self.data[start:start + HISTOGRAM_CHUNK_ROWS])
+            chunk = chunk.reshape(-1, self.block_count, MIFARE_BLOCK_SIZE)
+            captured = np.asarray(self.captured[start:start + HISTOGRAM_CHUNK_ROWS])
+            differing += ((chunk != mode).any(axis=2) & captured).sum(axis=0)
+        captured_counts = self.block_captured_counts()
+        return np.where(captured_counts > 0, differing / np.maximum(captured_counts, 1), 0.0)
+
+    def block_captured_counts(self) -> np.ndarray:
+        """Number of cards that captured each block"""
+        return np.asarray(self.captured).sum(axis=0)
+
+    # --- Export ----------------------------------------------------------
+
+    def export_block_stats_csv(self, path: Path) -> None:
+        """Write per-block captured count, variability and entropy as CSV"""
+        histogram = self.byte_histogram()
+        entropy = self.block_entropy(histogram)
+        variability = self.block_variability(histogram)
+        captured = self.block_captured_counts()
+        trailers = set(trailer_block_numbers(self.card_type).tolist())
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["block", "sector", "trailer", "captured", "variability", "entropy_bits"])
+            for block in range(self.block_count):
+                writer.writerow([block, get_block_sector(block), int(block in trailers), int(captured[block]),
+                                 f"{variability[block]:.4f}", f"{entropy[block]:.4f}"])
+
+    def export_sector_stats_csv(self, path: Path, keys: Optional[Iterable[bytes]] = None) -> None:
+        """Write per-sector factory key counts and most common access profile as CSV"""
+        counts = self.factory_key_counts(keys)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["sector", "captured", "factory_key_a", "factory_key_b",
+                             "unknown_key_a", "unknown_key_b", "profiles", "top_profile", "top_profile_count"])
+            for sector in range(self.sector_count):
+                histogram = self.access_profile_histogram(sector)
+                top = next(iter(histogram.items()), ("", 0))
+                writer.writerow([sector, int(counts["captured"][sector]), int(counts["key_a"][sector]),
+                                 int(counts["key_b"][sector]), int(counts["key_a_unknown"][sector]),
+                                 int(counts["key_b_unknown"][sector]), len(histogram), top[0], top[1]])
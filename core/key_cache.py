@@ -0,0 +1,219 @@
+"""
+Per-UID Key Cache
+Remembers which keys worked (and which were recently rejected) for each card
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, AppSettings
+from .private_files import write_private_file
+
+logger = logging.getLogger(__name__)
+
+KEY_TYPE_TAGS = {KEY_TYPE_A: "A", KEY_TYPE_B: "B"}
+TAG_KEY_TYPES = {tag: key_type for key_type, tag in KEY_TYPE_TAGS.items()}
+
+CACHE_FORMAT_VERSION = 3
+
+# Refresh a card's last-use time on disk at most this often (seconds)
+USE_REFRESH_INTERVAL = 3600
+
+class KeyCache:
+    """Persistent cache of known-good and recently rejected keys per card UID
+
+    Known keys are stored per (sector, key type) in plaintext, so the cache
+    file is written owner-only (0600); cards not used for max_age seconds
+    are dropped, and at most max_cards cards are kept. Turn the cache off
+    (operations.remember_card_keys, cli --no-cache) where that exposure is
+    not acceptable and keep keys in the encrypted KeyVault instead.
+
+    Rejected keys are never stored in plaintext: each is recorded as a
+    salted digest with the time it was rejected, and is ignored once older
+    than failure_ttl seconds so a card that was reset or rekeyed gets its
+    keys tried again.
+    """
+
+    def __init__(self, cache_file: Optional[Path] = None,
+                 failure_ttl: float = AppSettings.KEY_CACHE_FAILURE_TTL,
+                 max_age: float = AppSettings.KEY_CACHE_MAX_AGE,
+                 max_cards: int = AppSettings.KEY_CACHE_MAX_CARDS):
+        if cache_file is None:
+            cache_file = Path.home() / ".mifare_classic_tool" / "key_cache.json"
+        self.cache_file = Path(cache_file)
+        self.failure_ttl = failure_ttl
+        self.max_age = max_age
+        self.max_cards = max_cards
+        self._known: Dict[str, Dict[Tuple[int, int], bytes]] = {}
+        self._used: Dict[str, float] = {}  # uid -> last time one of its keys authenticated
+        # {uid: {(sector, key_type): {key digest: rejection time}}}
+        self._failed: Dict[str, Dict[Tuple[int, int], Dict[str, float]]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        """Load cache contents from disk"""
+        try:
+            if not self.cache_file.exists():
+                return
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+
+            # Version 1 stored rejected keys in plaintext; those are dropped
+            version = data.get("version", 1)
+            with_failures = version >= 2
+            if version < CACHE_FORMAT_VERSION:
+                self._dirty = True
+            loaded = time.time()
+            for uid, entry in data.get("cards", {}).items():
+                used = float(entry.get("used", loaded))
+                if loaded - used > self.max_age:
+                    self._dirty = True
+                    continue
+                self._used[uid] = used
+                for slot, key_hex in entry.get("known", {}).items():
+                    self._known.setdefault(uid, {})[self._parse_slot(slot)] = bytes.fromhex(key_hex)
+                if not with_failures:
+                    self._dirty = True
+                    continue
+                for slot, digests in entry.get("failed", {}).items():
+                    live = {digest: float(rejected) for digest, rejected in digests.items()
+                            if not self._expired(rejected)}
+                    if live:
+                        self._failed.setdefault(uid, {})[self._parse_slot(slot)] = live
+
+            self._evict()
+            logger.debug(f"Loaded key cache for {len(self._known)} cards")
+        except Exception as e:
+            logger.warning(f"Could not load key cache: {e}")
+
+    def _evict(self) -> None:
+        """Drop the least recently used cards beyond max_cards (caller holds the lock or is loading)"""
+        uids = set(self._known) | set(self._failed)
+        if len(uids) <= self.max_cards:
+            return
+        for uid in sorted(uids, key=lambda uid: self._used.get(uid, 0.0))[:len(uids) - self.max_cards]:
+            self._known.pop(uid, None)
+            self._failed.pop(uid, None)
+            self._used.pop(uid, None)
+        self._dirty = True
+
+    def save(self) -> None:
+        """Write cache to disk if it changed since the last save"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._evict()
+            cards = {}
+            for uid in set(self._known) | set(self._failed):
+                cards[uid] = {
+                    "used": self._used.get(uid, time.time()),
+                    "known": {self._format_slot(slot): key.hex().upper()
+                              for slot, key in self._known.get(uid, {}).items()},
+                    "failed": {self._format_slot(slot): dict(digests)
+                               for slot, digests in self._failed.get(uid, {}).items() if digests}
+                }
+            data = json.dumps({"version": CACHE_FORMAT_VERSION, "cards": cards})
+            try:
+                write_private_file(self.cache_file, data)
+            except Exception as e:
+                # Still dirty, so the next save tries again
+                logger.warning(f"Could not save key cache: {e}")
+                return
+            self._dirty = False
+
+    @staticmethod
+    def _format_slot(slot: Tuple[int, int]) -> str:
+        """Format (sector, key_type) as 'sector:A' / 'sector:B'"""
+        sector, key_type = slot
+        return f"{sector}:{KEY_TYPE_TAGS[key_type]}"
+
+    @staticmethod
+    def _parse_slot(slot: str) -> Tuple[int, int]:
+        """Parse 'sector:A' / 'sector:B' into (sector, key_type)"""
+        sector, tag = slot.split(":")
+        return int(sector), TAG_KEY_TYPES[tag]
+
+    @staticmethod
+    def _uid_key(uid: bytes) -> str:
+        """Normalize UID into cache key"""
+        return uid.hex().upper()
+
+    @staticmethod
+    def _key_digest(uid: bytes, slot: Tuple[int, int], key: bytes) -> str:
+        """Digest standing in for a rejected key on disk, salted with UID and slot"""
+        sector, key_type = slot
+        return hashlib.sha256(bytes(uid) + bytes([sector, key_type]) + bytes(key)).hexdigest()[:16]
+
+    def _expired(self, rejected: float) -> bool:
+        """Check whether a rejection is older than the failure TTL"""
+        return time.time() - float(rejected) > self.failure_ttl
+
+    def get_known_key(self, uid: bytes, sector: int, key_type: int) -> Optional[bytes]:
+        """Get key that previously authenticated (sector, key_type) on this card"""
+        return self._known.get(self._uid_key(uid), {}).get((sector, key_type))
+
+    def get_key_map(self, uid: bytes) -> Dict[int, Dict[int, bytes]]:
+        """Get all known keys for a card as {sector: {key_type: key}}"""
+        key_map: Dict[int, Dict[int, bytes]] = {}
+        for (sector, key_type), key in self._known.get(self._uid_key(uid), {}).items():
+            key_map.setdefault(sector, {})[key_type] = key
+        return key_map
+
+    def is_known_failed(self, uid: bytes, sector: int, key_type: int, key: bytes) -> bool:
+        """Check whether key was rejected for (sector, key_type) within the failure TTL"""
+        slot = (sector, key_type)
+        rejected = self._failed.get(self._uid_key(uid), {}).get(slot, {}).get(self._key_digest(uid, slot, key))
+        return rejected is not None and not self._expired(rejected)
+
+    def record_success(self, uid: bytes, sector: int, key_type: int, key: bytes) -> None:
+        """Remember a key that authenticated successfully"""
+        uid_key = self._uid_key(uid)
+        slot = (sector, key_type)
+        with self._lock:
+            now = time.time()
+            if now - self._used.get(uid_key, 0.0) > USE_REFRESH_INTERVAL:
+                self._dirty = True
+            self._used[uid_key] = now
+            known = self._known.setdefault(uid_key, {})
+            if known.get(slot) != key:
+                known[slot] = bytes(key)
+                self._dirty = True
+            failed = self._failed.get(uid_key, {}).get(slot)
+            if failed and failed.pop(self._key_digest(uid, slot, key), None) is not None:
+                self._dirty = True
+
+    def record_failure(self, uid: bytes, sector: int, key_type: int, key: bytes) -> None:
+        """Remember a key that a live card rejected"""
+        uid_key = self._uid_key(uid)
+        slot = (sector, key_type)
+        with self._lock:
+            # A known key that now fails means the sector was rekeyed
+            known = self._known.get(uid_key, {})
+            if known.get(slot) == key:
+                del known[slot]
+                self._dirty = True
+            failed = self._failed.setdefault(uid_key, {}).setdefault(slot, {})
+            failed[self._key_digest(uid, slot, key)] = time.time()
+            self._used.setdefault(uid_key, time.time())
+            self._dirty = True
+
+    def forget_card(self, uid: bytes) -> None:
+        """Remove all cached information about a card"""
+        uid_key = self._uid_key(uid)
+        with self._lock:
+            if self._known.pop(uid_key, None) is not None:
+                self._dirty = True
+            if self._failed.pop(uid_key, None) is not None:
+                self._dirty = True
+            self._used.pop(uid_key, None)
+
+    def card_count(self) -> int:
+        """Get number of cards with cached information"""
+        return len(set(self._known) | set(self._failed))
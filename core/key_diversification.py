@@ -0,0 +1,181 @@
+"""
+MIFARE Classic Key Diversification
+Derives per-card sector keys from the card UID and a master secret
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Type
+
+from cryptography.hazmat.primitives.ciphers import algorithms
+from cryptography.hazmat.primitives.cmac import CMAC
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, MIFARE_1K_SECTORS
+
+logger = logging.getLogger(__name__)
+
+# {sector: {key_type: key}}
+KeyMap = Dict[int, Dict[int, bytes]]
+
+DIVERSIFICATION_CONSTANT = 0x01
+DEFAULT_CACHE_SIZE = 4096
+BATCH_CHUNK_SIZE = 512
+
+class KeyDiversifier:
+    """Base class for UID-based key diversification algorithms"""
+
+    name = ""
+
+    def __init__(self, master_key: bytes, system_identifier: bytes = b""):
+        self.master_key = bytes(master_key)
+        self.system_identifier = bytes(system_identifier)
+
+    def derive_key(self, uid: bytes, sector: int, key_type: int) -> bytes:
+        """Derive the 6-byte key for one sector and key type"""
+        raise NotImplementedError
+
+    def derive_card_keys(self, uid: bytes, sectors: Iterable[int]) -> KeyMap:
+        """Derive Key A and Key B for all given sectors of one card"""
+        return {
+            sector: {key_type: self.derive_key(uid, sector, key_type)
+                     for key_type in (KEY_TYPE_A, KEY_TYPE_B)}
+            for sector in sectors
+        }
+
+    def get_options(self) -> dict:
+        """Get constructor arguments needed to recreate this diversifier"""
+        return {"master_key": self.master_key, "system_identifier": self.system_identifier}
+
+class AesCmacDiversifier(KeyDiversifier):
+    """AES-128/192/256 CMAC diversification (NXP AN10922 style)
+
+    Diversification input is 0x01 || UID || sector || key type || system
+    identifier; the first 6 bytes of the CMAC are used as the sector key.
+    """
+
+    name = "aes-cmac"
+
+    def __init__(self, master_key: bytes, system_identifier: bytes = b""):
+        if len(master_key) not in (16, 24, 32):
+            raise ValueError("AES master key must be 16, 24 or 32 bytes")
+        super().__init__(master_key, system_identifier)
+        # Keyed CMAC template; copies skip the AES key schedule
+        self._cmac = CMAC(algorithms.AES(self.master_key))
+
+    def derive_key(self, uid: bytes, sector: int, key_type: int) -> bytes:
+        """Derive the 6-byte key for one sector and key type"""
+        cmac = self._cmac.copy()
+        cmac.update(bytes([DIVERSIFICATION_CONSTANT]) + uid + bytes([sector, key_type]) + self.system_identifier)
+        return cmac.finalize()[:6]
+
+DIVERSIFIERS: Dict[str, Type[KeyDiversifier]] = {
+    AesCmacDiversifier.name: AesCmacDiversifier
+}
+
+def register_diversifier(diversifier_class: Type[KeyDiversifier]) -> None:
+    """Register an additional diversification algorithm by name"""
+    DIVERSIFIERS[diversifier_class.name] = diversifier_class
+
+def create_diversifier(name: str, master_key: bytes, **options) -> KeyDiversifier:
+    """Create a diversifier by algorithm name"""
+    if name not in DIVERSIFIERS:
+        raise ValueError(f"Unknown diversification algorithm: {name}")
+    return DIVERSIFIERS[name](master_key, **options)
+
+def _derive_chunk(name: str, options: dict, uids: List[bytes], sectors: List[int]) -> List[KeyMap]:
+    """Process pool worker: derive key maps for a chunk of UIDs"""
+    diversifier = create_diversifier(name, **options)
+    return [diversifier.derive_card_keys(uid, sectors) for uid in uids]
+
+class KeyDerivationEngine:
+    """Derives card key maps with an LRU cache and process-pool batching"""
+
+    def __init__(self, diversifier: KeyDiversifier, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.diversifier = diversifier
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, KeyMap]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_get(self, cache_key: tuple) -> Optional[KeyMap]:
+        """Get cached key map and mark it as recently used"""
+        with self._lock:
+            key_map = self._cache.get(cache_key)
+            if key_map is not None:
+                self._cache.move_to_end(cache_key)
+            return key_map
+
+    def _cache_put(self, cache_key: tuple, key_map: KeyMap) -> None:
+        """Store key map, evicting the least recently used entries"""
+        with self._lock:
+            self._cache[cache_key] = key_map
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def derive_card_keys(self, uid: bytes, sector_count: int = MIFARE_1K_SECTORS) -> KeyMap:
+        """Derive all sector keys for one card"""
+        cache_key = (bytes(uid), sector_count)
+        key_map = self._cache_get(cache_key)
+        if key_map is None:
+            key_map = self.diversifier.derive_card_keys(uid, range(sector_count))
+            self._cache_put(cache_key, key_map)
+        return key_map
+
+    def derive_key(self, uid: bytes, sector: int, key_type: int,
+                   sector_count: int = MIFARE_1K_SECTORS) -> bytes:
+        """Derive a single key, using the cached card key map"""
+        if sector >= sector_count:
+            return self.diversifier.derive_key(uid, sector, key_type)
+        return self.derive_card_keys(uid, sector_count)[sector][key_type]
+
+    def derive_batch(self, uids: Iterable[bytes], sector_count: int = MIFARE_1K_SECTORS,
+                     processes: Optional[int] = None) -> Dict[bytes, KeyMap]:
+        """Derive key maps for many cards, spreading work over a process pool"""
+        results: Dict[bytes, KeyMap] = {}
+        pending: List[bytes] = []
+        seen: Set[bytes] = set()
+
+        for uid in uids:
+            uid = bytes(uid)
+            if uid in seen:
+                continue
+            seen.add(uid)
+            key_map = self._cache_get((uid, sector_count))
+            if key_map is not None:
+                results[uid] = key_map
+            else:
+                pending.append(uid)
+
+        if not pending:
+            return results
+
+        sectors = list(range(sector_count))
+        workers = processes or os.cpu_count() or 1
+
+        if workers <= 1 or len(pending) <= BATCH_CHUNK_SIZE:
+            derived = [self.diversifier.derive_card_keys(uid, sectors) for uid in pending]
+        else:
+            chunks = [pending[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(pending), BATCH_CHUNK_SIZE)]
+            options = self.diversifier.get_options()
+            derived = []
+            # Imported here to keep startup fast for callers that never batch
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+                futures = [executor.submit(_derive_chunk, self.diversifier.name, options, chunk, sectors)
+                           for chunk in chunks]
+                for future in futures:
+                    derived.extend(future.result())
+
+        for uid, key_map in zip(pending, derived):
+            results[uid] = key_map
+            self._cache_put((uid, sector_count), key_map)
+
+        logger.debug(f"Derived keys for {len(pending)} cards ({len(results) - len(pending)} cached)")
+        return results
+
+    def clear_cache(self) -> None:
+        """Drop all cached key maps"""
+        with self._lock:
+            self._cache.clear()
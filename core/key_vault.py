@@ -0,0 +1,312 @@
+"""
+Encrypted Key Vault
+Stores named key sets and diversification masters on disk
+"""
+
+import base64
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+from .key_cache import KEY_TYPE_TAGS, TAG_KEY_TYPES
+from .key_diversification import KeyDerivationEngine, KeyMap, create_diversifier
+
+logger = logging.getLogger(__name__)
+
+VAULT_FORMAT_VERSION = 1
+DEFAULT_KDF_COST = 2 ** 15
+DEFAULT_VAULT_CACHE_SIZE = 32
+
+class VaultLockedError(Exception):
+    """Raised when vault contents are accessed before unlocking"""
+
+class KeySet:
+    """Named set of sector keys with optional default keys"""
+
+    def __init__(self, name: str, key_map: Optional[KeyMap] = None,
+                 default_keys: Optional[Dict[int, bytes]] = None):
+        self.name = name
+        self.key_map: KeyMap = key_map or {}
+        self.default_keys: Dict[int, bytes] = default_keys or {}
+
+    def get_key(self, sector: int, key_type: int) -> Optional[bytes]:
+        """Get key for sector, falling back to the set's default key"""
+        key = self.key_map.get(sector, {}).get(key_type)
+        if key is None:
+            key = self.default_keys.get(key_type)
+        return key
+
+    def to_dict(self) -> dict:
+        """Serialize key set with hex-encoded keys"""
+        return {
+            "default": {KEY_TYPE_TAGS[kt]: key.hex().upper() for kt, key in self.default_keys.items()},
+            "sectors": {str(sector): {KEY_TYPE_TAGS[kt]: key.hex().upper() for kt, key in keys.items()}
+                        for sector, keys in self.key_map.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict) -> "KeySet":
+        """Deserialize key set from hex-encoded keys"""
+        default_keys = {TAG_KEY_TYPES[tag]: bytes.fromhex(key) for tag, key in data.get("default", {}).items()}
+        key_map = {
+            int(sector): {TAG_KEY_TYPES[tag]: bytes.fromhex(key) for tag, key in keys.items()}
+            for sector, keys in data.get("sectors", {}).items()
+        }
+        return cls(name, key_map, default_keys)
+
+    @classmethod
+    def from_file(cls, name: str, path: Path) -> "KeySet":
+        """Load a key set from a key set or key map JSON file, or from a dump file
+
+        Raises:
+            ValueError: if the file holds no keys
+        """
+        path = Path(path)
+        try:
+            with open(path, 'r', encoding="utf-8") as f:
+                data = json.load(f)
+        except (UnicodeDecodeError, ValueError):
+            data = None
+
+        try:
+            if isinstance(data, dict) and ("sectors" in data or "default" in data):
+                key_set = cls.from_dict(name, data)
+            elif isinstance(data, dict) and data and all(str(sector).isdigit() for sector in data):
+                key_set = cls.from_dict(name, {"sectors": data})
+            else:
+                from .dump_formats import DumpFormatError, load_image
+                try:
+                    key_set = cls(name, load_image(path).key_map)
+                except DumpFormatError as e:
+                    raise ValueError(str(e))
+        except (KeyError, AttributeError) as e:
+            raise ValueError(f"Invalid key entry in {path}: {e}")
+
+        if not key_set.key_map and not key_set.default_keys:
+            raise ValueError(f"No keys in {path}")
+        return key_set
+
+class KeyVault:
+    """Passphrase-protected store of key sets and diversification masters
+
+    The vault file is encrypted with AES-GCM under a key derived from the
+    passphrase with scrypt. The KDF runs once per unlock; decoded key sets
+    and derivation engines are kept in a bounded LRU cache afterwards.
+    """
+
+    def __init__(self, vault_file: Optional[Path] = None, kdf_cost: int = DEFAULT_KDF_COST,
+                 cache_size: int = DEFAULT_VAULT_CACHE_SIZE):
+        if vault_file is None:
+            vault_file = Path.home() / ".mifare_classic_tool" / "keys.vault"
+        self.vault_file = Path(vault_file)
+        self.kdf_cost = kdf_cost
+        self.cache_size = cache_size
+        self._key: Optional[bytes] = None
+        self._salt: Optional[bytes] = None
+        self._payload: Optional[dict] = None
+        self._cache: "OrderedDict[tuple, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _derive_key(passphrase: str, salt: bytes, cost: int) -> bytes:
+        """Derive the vault encryption key from a passphrase"""
+        kdf = Scrypt(salt=salt, length=32, n=cost, r=8, p=1)
+        return kdf.derive(passphrase.encode("utf-8"))
+
+    def exists(self) -> bool:
+        """Check if vault file exists"""
+        return self.vault_file.exists()
+
+    def is_unlocked(self) -> bool:
+        """Check if vault is unlocked for this session"""
+        return self._payload is not None
+
+    def create(self, passphrase: str) -> bool:
+        """Create an empty vault file under passphrase and unlock it
+
+        Refuses to replace an existing vault.
+        """
+        if self.exists():
+            logger.error(f"Key vault already exists: {self.vault_file}")
+            return False
+        try:
+            self._salt = os.urandom(16)
+            self._key = self._derive_key(passphrase, self._salt, self.kdf_cost)
+            self._payload = {"key_sets": {}, "masters": {}}
+            self._cache.clear()
+            self.save()
+            logger.info(f"Created new key vault: {self.vault_file}")
+            return True
+        except Exception as e:
+            self.lock()
+            logger.error(f"Failed to create key vault: {e}")
+            return False
+
+    def unlock(self, passphrase: str) -> bool:
+        """Unlock an existing vault (see create() for a new one)"""
+        try:
+            if not self.exists():
+                logger.error(f"No key vault at {self.vault_file}")
+                return False
+
+            with open(self.vault_file, 'r') as f:
+                header = json.load(f)
+
+            salt = bytes.fromhex(header["salt"])
+            key = self._derive_key(passphrase, salt, header.get("kdf_cost", DEFAULT_KDF_COST))
+            plaintext = AESGCM(key).decrypt(bytes.fromhex(header["nonce"]),
+                                            base64.b64decode(header["ciphertext"]), None)
+
+            self._salt = salt
+            self.kdf_cost = header.get("kdf_cost", DEFAULT_KDF_COST)
+            self._key = key
+            self._payload = json.loads(plaintext.decode("utf-8"))
+            self._cache.clear()
+            logger.info(f"Key vault unlocked ({len(self._payload['key_sets'])} key sets)")
+            return True
+
+        except InvalidTag:
+            logger.error("Failed to unlock key vault: wrong passphrase")
+            return False
+        except Exception as e:
+            logger.error(f"Failed to unlock key vault: {e}")
+            return False
+
+    def lock(self) -> None:
+        """Forget decryption key and all decrypted key material"""
+        with self._lock:
+            self._key = None
+            self._payload = None
+            self._cache.clear()
+        logger.info("Key vault locked")
+
+    def save(self) -> None:
+        """Encrypt and write vault contents to disk"""
+        self._require_unlocked()
+        nonce = os.urandom(12)
+        plaintext = json.dumps(self._payload).encode("utf-8")
+        ciphertext = AESGCM(self._key).encrypt(nonce, plaintext, None)
+
+        self.vault_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.vault_file.with_suffix(".tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump({
+                "version": VAULT_FORMAT_VERSION,
+                "kdf": "scrypt",
+                "kdf_cost": self.kdf_cost,
+                "salt": self._salt.hex(),
+                "nonce": nonce.hex(),
+                "ciphertext": base64.b64encode(ciphertext).decode("ascii")
+            }, f)
+        os.replace(tmp_file, self.vault_file)
+
+    def change_passphrase(self, passphrase: str) -> None:
+        """Re-encrypt the vault under a new passphrase"""
+        self._require_unlocked()
+        self._salt = os.urandom(16)
+        self._key = self._derive_key(passphrase, self._salt, self.kdf_cost)
+        self.save()
+
+    def _require_unlocked(self) -> None:
+        """Raise if the vault is locked"""
+        if self._payload is None:
+            raise VaultLockedError("Key vault is locked")
+
+    def _cache_get(self, cache_key: tuple):
+        """Get decoded vault entry from cache"""
+        with self._lock:
+            value = self._cache.get(cache_key)
+            if value is not None:
+                self._cache.move_to_end(cache_key)
+            return value
+
+    def _cache_put(self, cache_key: tuple, value) -> None:
+        """Store decoded vault entry, evicting least recently used ones"""
+        with self._lock:
+            self._cache[cache_key] = value
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def list_key_sets(self) -> List[str]:
+        """Get names of stored key sets"""
+        self._require_unlocked()
+        return sorted(self._payload["key_sets"])
+
+    def get_key_set(self, name: str) -> Optional[KeySet]:
+        """Get key set by name"""
+        self._require_unlocked()
+        key_set = self._cache_get(("key_set", name))
+        if key_set is None:
+            data = self._payload["key_sets"].get(name)
+            if data is None:
+                return None
+            key_set = KeySet.from_dict(name, data)
+            self._cache_put(("key_set", name), key_set)
+        return key_set
+
+    def put_key_set(self, key_set: KeySet) -> None:
+        """Add or replace a key set"""
+        self._require_unlocked()
+        self._payload["key_sets"][key_set.name] = key_set.to_dict()
+        self._cache_put(("key_set", key_set.name), key_set)
+
+    def remove_key_set(self, name: str) -> bool:
+        """Remove key set by name"""
+        self._require_unlocked()
+        with self._lock:
+            self._cache.pop(("key_set", name), None)
+        return self._payload["key_sets"].pop(name, None) is not None
+
+    def list_masters(self) -> List[str]:
+        """Get names of stored diversification masters"""
+        self._require_unlocked()
+        return sorted(self._payload["masters"])
+
+    def put_master(self, name: str, algorithm: str, master_key: bytes,
+                   system_identifier: bytes = b"") -> None:
+        """Add or replace a diversification master"""
+        self._require_unlocked()
+        # Validate before storing
+        create_diversifier(algorithm, master_key, system_identifier=system_identifier)
+        self._payload["masters"][name] = {
+            "algorithm": algorithm,
+            "master_key": master_key.hex(),
+            "system_identifier": system_identifier.hex()
+        }
+        with self._lock:
+            self._cache.pop(("master", name), None)
+
+    def remove_master(self, name: str) -> bool:
+        """Remove diversification master by name"""
+        self._require_unlocked()
+        with self._lock:
+            self._cache.pop(("master", name), None)
+        return self._payload["masters"].pop(name, None) is not None
+
+    def get_derivation_engine(self, name: str) -> Optional[KeyDerivationEngine]:
+        """Get key derivation engine for a stored master
+
+        The engine is cached, so keys it already derived are reused.
+        """
+        self._require_unlocked()
+        engine = self._cache_get(("master", name))
+        if engine is None:
+            data = self._payload["masters"].get(name)
+            if data is None:
+                return None
+            diversifier = create_diversifier(
+                data["algorithm"], bytes.fromhex(data["master_key"]),
+                system_identifier=bytes.fromhex(data.get("system_identifier", ""))
+            )
+            engine = KeyDerivationEngine(diversifier)
+            self._cache_put(("master", name), engine)
+        return engine
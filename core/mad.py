@@ -0,0 +1,202 @@
+"""
+MIFARE Application Directory (MAD)
+MAD v1/v2 parsing/building and a reader that fetches only one application's sectors
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+from config.constants import (
+    KEY_TYPE_A, TRANSPORT_KEY, CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K, MIFARE_BLOCK_SIZE
+)
+from .card_image import CardImage, CARD_TYPE_SECTORS
+from .data_utils import get_sector_block_count
+from .key_diversification import KeyMap
+
+logger = logging.getLogger(__name__)
+
+MAD_KEY_A = TRANSPORT_KEY
+MAD_ACCESS_BITS = bytes.fromhex("787788")  # Key A read, Key B read/write
+
+MAD2_SECTOR = 16
+MAD1_BLOCKS = (1, 2)
+MAD2_BLOCKS = (64, 65, 66)
+
+# General purpose byte of the MAD sector trailer
+GPB_DA = 0x80            # MAD available
+GPB_MA = 0x40            # multi-application card
+GPB_ADV_MASK = 0x03      # MAD version
+
+MAD_CRC_PRESET = 0xC7
+MAD_CRC_POLYNOMIAL = 0x1D
+
+AID_FREE = 0x0000
+AID_DEFECT = 0x0001
+AID_RESERVED = 0x0002
+AID_ADDITIONAL_INFO = 0x0003
+AID_CARD_HOLDER = 0x0004
+AID_NOT_APPLICABLE = 0x0005
+AID_NDEF = 0x03E1
+
+class MadError(Exception):
+    """Raised when a MAD is missing or corrupt"""
+
+def mad_crc(data: bytes) -> int:
+    """CRC-8 used by the MAD (polynomial 0x1D, preset 0xC7)"""
+    crc = MAD_CRC_PRESET
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ MAD_CRC_POLYNOMIAL) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+class Mad:
+    """Parsed application directory: application ID per sector"""
+
+    def __init__(self, version: int, aids: Dict[int, int], publisher_sector: int = 0,
+                 publisher_sector_v2: int = 0):
+        self.version = version
+        self.aids = aids
+        self.publisher_sector = publisher_sector
+        self.publisher_sector_v2 = publisher_sector_v2
+
+    def get_sectors(self, aid: int) -> List[int]:
+        """Get sectors of an application in order"""
+        return sorted(sector for sector, sector_aid in self.aids.items() if sector_aid == aid)
+
+    def get_applications(self) -> Dict[int, List[int]]:
+        """Get sectors of every application (free/administrative AIDs excluded)"""
+        applications: Dict[int, List[int]] = {}
+        for sector, aid in sorted(self.aids.items()):
+            if aid > AID_NOT_APPLICABLE:
+                applications.setdefault(aid, []).append(sector)
+        return applications
+
+    def get_free_sectors(self) -> List[int]:
+        """Get sectors not assigned to any application"""
+        return sorted(sector for sector, aid in self.aids.items() if aid == AID_FREE)
+
+    def encode_v1(self) -> bytes:
+        """Encode sectors 1-15 into the 32 bytes of blocks 1 and 2"""
+        body = bytes([self.publisher_sector & 0x3F])
+        for sector in range(1, 16):
+            body += self.aids.get(sector, AID_FREE).to_bytes(2, "little")
+        return bytes([mad_crc(body)]) + body
+
+    def encode_v2(self) -> bytes:
+        """Encode sectors 17-39 into the 48 bytes of blocks 64-66"""
+        body = bytes([self.publisher_sector_v2 & 0x3F])
+        for sector in range(17, 40):
+            body += self.aids.get(sector, AID_FREE).to_bytes(2, "little")
+        return bytes([mad_crc(body)]) + body
+
+    def __repr__(self) -> str:
+        applications = ", ".join(f"{aid:04X}: {sectors}" for aid, sectors in self.get_applications().items())
+        return f"Mad(v{self.version}, {applications or 'empty'})"
+
+def _parse_entries(data: bytes, first_sector: int, count: int, aids: Dict[int, int]) -> int:
+    """Check CRC of a MAD area and collect its AIDs, returns publisher sector"""
+    if mad_crc(data[1:]) != data[0]:
+        raise MadError(f"MAD CRC mismatch (stored {data[0]:02X}, computed {mad_crc(data[1:]):02X})")
+    for index in range(count):
+        aids[first_sector + index] = int.from_bytes(data[2 + index * 2:4 + index * 2], "little")
+    return data[1] & 0x3F
+
+def parse_mad(mad1: bytes, gpb: int, mad2: Optional[bytes] = None) -> Mad:
+    """Parse MAD from blocks 1-2 (and 64-66 for v2) and the sector 0 general purpose byte"""
+    if not gpb & GPB_DA:
+        raise MadError("Card has no MAD (DA bit not set)")
+    version = gpb & GPB_ADV_MASK
+    if version not in (1, 2):
+        raise MadError(f"Unsupported MAD version {version}")
+
+    aids: Dict[int, int] = {}
+    publisher = _parse_entries(mad1, 1, 15, aids)
+    publisher_v2 = 0
+    if version == 2:
+        if mad2 is None:
+            raise MadError("MAD v2 requires sector 16")
+        publisher_v2 = _parse_entries(mad2, 17, 23, aids)
+    return Mad(version, aids, publisher, publisher_v2)
+
+def parse_mad_image(image: CardImage) -> Mad:
+    """Parse the MAD of a card image"""
+    if not all(image.has_block(block) for block in MAD1_BLOCKS + (3,)):
+        raise MadError("Sector 0 not captured")
+    mad1 = b"".join(image.get_block(block) for block in MAD1_BLOCKS)
+    gpb = image.get_block(3)[9]
+    mad2 = None
+    if gpb & GPB_ADV_MASK == 2 and image.card_type == CARD_TYPE_MIFARE_4K:
+        if not all(image.has_block(block) for block in MAD2_BLOCKS):
+            raise MadError("Sector 16 not captured")
+        mad2 = b"".join(image.get_block(block) for block in MAD2_BLOCKS)
+    return parse_mad(mad1, gpb, mad2)
+
+def build_mad(aids: Dict[int, int], card_type: int = CARD_TYPE_MIFARE_1K, publisher_sector: int = 0) -> Mad:
+    """Create a MAD for a card type (v2 for 4K), marking MAD sectors as not applicable"""
+    version = 2 if card_type == CARD_TYPE_MIFARE_4K else 1
+    entries = {sector: AID_FREE for sector in range(1, CARD_TYPE_SECTORS[card_type])}
+    entries.update(aids)
+    if version == 2:
+        entries[MAD2_SECTOR] = AID_NOT_APPLICABLE
+    entries.pop(0, None)
+    return Mad(version, entries, publisher_sector)
+
+def mad_gpb(mad: Mad, multi_application: bool = True) -> int:
+    """Get general purpose byte announcing a MAD"""
+    return GPB_DA | (GPB_MA if multi_application else 0) | mad.version
+
+class MadReader:
+    """Reads the MAD first, then only the sectors of the requested application"""
+
+    def __init__(self, dump_engine, mad_key: bytes = MAD_KEY_A):
+        self.dump_engine = dump_engine
+        self.mad_key = mad_key
+
+    def read_mad(self, image: Optional[CardImage] = None) -> Mad:
+        """Read sector 0 (and 16 for MAD v2) of the card in the field into image"""
+        if image is None:
+            image = self.dump_engine.new_image()
+        keys = {KEY_TYPE_A: self.mad_key}
+        if not self.dump_engine.read_sector(image, 0, keys, (1, 2, 3)):
+            raise MadError("Could not read MAD sector 0")
+        if image.get_block(3)[9] & GPB_ADV_MASK == 2 and image.card_type == CARD_TYPE_MIFARE_4K:
+            if not self.dump_engine.read_sector(image, MAD2_SECTOR, keys, MAD2_BLOCKS):
+                raise MadError("Could not read MAD sector 16")
+        return parse_mad_image(image)
+
+    def read_application(self, aid: int, key: Optional[bytes] = None, key_type: int = KEY_TYPE_A,
+                         key_map: Optional[KeyMap] = None, image: Optional[CardImage] = None) -> bytes:
+        """Read the data blocks of every sector of one application
+
+        Keys come from key_map, then the given key for all application
+        sectors, then keys already known for the card.
+
+        Returns:
+            bytes: concatenated data blocks (trailers excluded) in sector order
+        """
+        if image is None:
+            image = self.dump_engine.new_image()
+        mad = self.read_mad(image)
+        sectors = mad.get_sectors(aid)
+        if not sectors:
+            raise MadError(f"Application {aid:04X} not found in MAD")
+
+        cached = self.dump_engine.auth_manager.get_key_map()
+        data = b""
+        for sector in sectors:
+            keys = dict(cached.get(sector, {}))
+            if key is not None:
+                keys[key_type] = key
+            keys.update((key_map or {}).get(sector, {}))
+            blocks = list(image.get_sector_blocks(sector))[:-1]
+            if not self.dump_engine.read_sector(image, sector, keys, blocks):
+                raise MadError(f"Could not read sector {sector} of application {aid:04X}")
+            data += b"".join(image.get_block(block) for block in blocks)
+
+        logger.debug(f"Read application {aid:04X} from sectors {sectors} ({len(data)} bytes)")
+        return data
+
+def application_sector_capacity(sector: int) -> int:
+    """Data bytes available in a sector (trailer excluded)"""
+    return (get_sector_block_count(sector) - 1) * MIFARE_BLOCK_SIZE
@@ -0,0 +1,289 @@
+"""
+NDEF on MIFARE Classic
+TLV/record decoding and an encoder that precompiles NDEF card images
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from config.constants import KEY_TYPE_A, DEFAULT_KEY, CARD_TYPE_MIFARE_1K, MIFARE_BLOCK_SIZE
+from .access_conditions import build_trailer
+from .card_image import CardImage, CARD_TYPE_SECTORS
+from .data_utils import get_sector_first_block, get_sector_block_count
+from .mad import (
+    AID_NDEF, MAD_KEY_A, MAD_ACCESS_BITS, MAD1_BLOCKS, MAD2_BLOCKS, MAD2_SECTOR, MadReader,
+    build_mad, mad_gpb
+)
+
+logger = logging.getLogger(__name__)
+
+NDEF_KEY_A = bytes.fromhex("D3F7D3F7D3F7")
+NDEF_ACCESS_BITS = bytes.fromhex("7F0788")  # Key A read/write data, Key B manages trailer
+NDEF_GPB = 0x40                              # mapping version 1.0, read/write
+
+# TLV types
+TLV_NULL = 0x00
+TLV_NDEF_MESSAGE = 0x03
+TLV_PROPRIETARY = 0xFD
+TLV_TERMINATOR = 0xFE
+
+# Record header flags
+FLAG_MB = 0x80
+FLAG_ME = 0x40
+FLAG_CF = 0x20
+FLAG_SR = 0x10
+FLAG_IL = 0x08
+TNF_MASK = 0x07
+
+TNF_EMPTY = 0x00
+TNF_WELL_KNOWN = 0x01
+TNF_MIME = 0x02
+TNF_URI = 0x03
+TNF_EXTERNAL = 0x04
+
+URI_PREFIXES = (
+    "", "http://www.", "https://www.", "http://", "https://", "tel:", "mailto:",
+    "ftp://anonymous:anonymous@", "ftp://ftp.", "ftps://", "sftp://", "smb://", "nfs://",
+    "ftp://", "dav://", "news:", "telnet://", "imap:", "rtsp://", "urn:", "pop:", "sip:",
+    "sips:", "tftp:", "btspp://", "btl2cap://", "btgoep://", "tcpobex://", "irdaobex://",
+    "file://", "urn:epc:id:", "urn:epc:tag:", "urn:epc:pat:", "urn:epc:raw:", "urn:epc:",
+    "urn:nfc:"
+)
+
+class NdefError(Exception):
+    """Raised when NDEF data cannot be decoded or does not fit"""
+
+class NdefRecord:
+    """Single NDEF record"""
+
+    def __init__(self, tnf: int, record_type: bytes, payload: bytes, record_id: bytes = b""):
+        self.tnf = tnf
+        self.type = record_type
+        self.payload = payload
+        self.id = record_id
+
+    @classmethod
+    def text(cls, text: str, language: str = "en") -> "NdefRecord":
+        """Create a well-known Text record (UTF-8)"""
+        lang = language.encode("ascii")
+        return cls(TNF_WELL_KNOWN, b"T", bytes([len(lang)]) + lang + text.encode("utf-8"))
+
+    @classmethod
+    def uri(cls, uri: str) -> "NdefRecord":
+        """Create a well-known URI record using the longest matching prefix code"""
+        code = max((i for i, prefix in enumerate(URI_PREFIXES) if prefix and uri.startswith(prefix)),
+                   key=lambda i: len(URI_PREFIXES[i]), default=0)
+        return cls(TNF_WELL_KNOWN, b"U", bytes([code]) + uri[len(URI_PREFIXES[code]):].encode("utf-8"))
+
+    @classmethod
+    def mime(cls, mime_type: str, payload: bytes) -> "NdefRecord":
+        """Create a MIME media record"""
+        return cls(TNF_MIME, mime_type.encode("ascii"), payload)
+
+    def get_text(self) -> Optional[str]:
+        """Get text of a Text record"""
+        if self.tnf != TNF_WELL_KNOWN or self.type != b"T" or not self.payload:
+            return None
+        status = self.payload[0]
+        encoding = "utf-16" if status & 0x80 else "utf-8"
+        return self.payload[1 + (status & 0x3F):].decode(encoding, errors="replace")
+
+    def get_uri(self) -> Optional[str]:
+        """Get full URI of a URI record"""
+        if self.tnf != TNF_WELL_KNOWN or self.type != b"U" or not self.payload:
+            return None
+        prefix = URI_PREFIXES[self.payload[0]] if self.payload[0] < len(URI_PREFIXES) else ""
+        return prefix + self.payload[1:].decode("utf-8", errors="replace")
+
+    def encode(self, first: bool, last: bool) -> bytes:
+        """Encode record with message begin/end flags"""
+        short = len(self.payload) < 256
+        header = (self.tnf & TNF_MASK) | (FLAG_MB if first else 0) | (FLAG_ME if last else 0)
+        header |= (FLAG_SR if short else 0) | (FLAG_IL if self.id else 0)
+        out = bytes([header, len(self.type)])
+        out += bytes([len(self.payload)]) if short else len(self.payload).to_bytes(4, "big")
+        if self.id:
+            out += bytes([len(self.id)])
+        return out + self.type + self.id + self.payload
+
+    def __repr__(self) -> str:
+        summary = self.get_text() or self.get_uri() or f"{len(self.payload)} bytes"
+        return f"NdefRecord(tnf={self.tnf}, type={self.type!r}, {summary!r})"
+
+def encode_message(records: List[NdefRecord]) -> bytes:
+    """Encode records as one NDEF message"""
+    if not records:
+        return NdefRecord(TNF_EMPTY, b"", b"").encode(True, True)
+    return b"".join(record.encode(i == 0, i == len(records) - 1) for i, record in enumerate(records))
+
+def decode_message(data: bytes) -> List[NdefRecord]:
+    """Decode an NDEF message into records (chunked records are joined)"""
+    records: List[NdefRecord] = []
+    offset = 0
+    chunk: Optional[NdefRecord] = None
+    while offset < len(data):
+        try:
+            header = data[offset]
+            type_length = data[offset + 1]
+            offset += 2
+            if header & FLAG_SR:
+                payload_length = data[offset]
+                offset += 1
+            else:
+                payload_length = int.from_bytes(data[offset:offset + 4], "big")
+                offset += 4
+            id_length = 0
+            if header & FLAG_IL:
+                id_length = data[offset]
+                offset += 1
+        except IndexError:
+            raise NdefError("Truncated NDEF record header")
+
+        record_type = data[offset:offset + type_length]
+        record_id = data[offset + type_length:offset + type_length + id_length]
+        start = offset + type_length + id_length
+        payload = data[start:start + payload_length]
+        if len(payload) != payload_length:
+            raise NdefError("Truncated NDEF record payload")
+        offset = start + payload_length
+
+        if chunk is not None:
+            chunk.payload += payload
+            if not header & FLAG_CF:
+                records.append(chunk)
+                chunk = None
+        elif header & FLAG_CF:
+            chunk = NdefRecord(header & TNF_MASK, record_type, payload, record_id)
+        else:
+            records.append(NdefRecord(header & TNF_MASK, record_type, payload, record_id))
+
+        if header & FLAG_ME:
+            break
+    return records
+
+def iter_tlvs(data: bytes):
+    """Yield (type, value) of the TLV blocks in an application area"""
+    offset = 0
+    while offset < len(data):
+        tlv_type = data[offset]
+        offset += 1
+        if tlv_type == TLV_NULL:
+            continue
+        if tlv_type == TLV_TERMINATOR:
+            return
+        if offset >= len(data):
+            raise NdefError("Truncated TLV")
+        length = data[offset]
+        offset += 1
+        if length == 0xFF:
+            length = int.from_bytes(data[offset:offset + 2], "big")
+            offset += 2
+        value = data[offset:offset + length]
+        if len(value) != length:
+            raise NdefError("Truncated TLV value")
+        offset += length
+        yield tlv_type, value
+
+def encode_tlv(tlv_type: int, value: bytes) -> bytes:
+    """Encode one TLV with 1- or 3-byte length"""
+    if len(value) < 0xFF:
+        return bytes([tlv_type, len(value)]) + value
+    return bytes([tlv_type, 0xFF]) + len(value).to_bytes(2, "big") + value
+
+def decode_ndef_area(data: bytes) -> List[NdefRecord]:
+    """Decode the first NDEF message TLV of an application area"""
+    for tlv_type, value in iter_tlvs(data):
+        if tlv_type == TLV_NDEF_MESSAGE:
+            return decode_message(value)
+    return []
+
+def read_ndef(dump_engine, key: bytes = NDEF_KEY_A) -> List[NdefRecord]:
+    """Read NDEF records from the card in the field, touching only MAD and NDEF sectors"""
+    return decode_ndef_area(MadReader(dump_engine).read_application(AID_NDEF, key))
+
+class CompiledNdefImage:
+    """NDEF card layout assembled once and written unchanged to many cards
+
+    Holds the image plus the write sequence: per sector, data blocks first
+    and the trailer last so a failed write never locks out the data.
+    """
+
+    def __init__(self, image: CardImage, sectors: List[int]):
+        self.image = image
+        self.sectors = sectors
+        self.write_sequence: List[Tuple[int, List[Tuple[int, bytes]]]] = []
+        for sector in sectors:
+            blocks = [block for block in image.get_sector_blocks(sector) if block != 0]
+            self.write_sequence.append((sector, [(block, image.get_block(block)) for block in blocks]))
+
+    def block_count(self) -> int:
+        """Get number of block writes per card"""
+        return sum(len(blocks) for _, blocks in self.write_sequence)
+
+    def write(self, card_operations, auth_manager, current_keys: Optional[Dict[int, Dict[int, bytes]]] = None,
+              default_key: bytes = DEFAULT_KEY) -> bool:
+        """Write the compiled layout to the card in the field
+
+        current_keys gives the keys the blank card uses per sector; sectors
+        not listed are authenticated with Key A = default_key.
+        """
+        for sector, blocks in self.write_sequence:
+            keys = (current_keys or {}).get(sector, {KEY_TYPE_A: default_key})
+            if not any(auth_manager.authenticate_sector(sector, key_type, key) for key_type, key in keys.items()):
+                logger.warning(f"NDEF write: cannot authenticate sector {sector}")
+                return False
+            for block, data in blocks:
+                if not card_operations.write_block(block, data):
+                    logger.warning(f"NDEF write: block {block} failed")
+                    return False
+        return True
+
+def compile_ndef_image(records: List[NdefRecord], card_type: int = CARD_TYPE_MIFARE_1K,
+                       key_b: bytes = DEFAULT_KEY, mad_key_b: Optional[bytes] = None) -> CompiledNdefImage:
+    """Build a MAD + NDEF image for a message once, for reuse across a batch"""
+    area = encode_tlv(TLV_NDEF_MESSAGE, encode_message(records)) + bytes([TLV_TERMINATOR])
+    mad_key_b = mad_key_b if mad_key_b is not None else key_b
+
+    sector_count = CARD_TYPE_SECTORS[card_type]
+    mad_sectors = {0, MAD2_SECTOR} if sector_count > MAD2_SECTOR else {0}
+    ndef_sectors = []
+    capacity = 0
+    for sector in range(1, sector_count):
+        if capacity >= len(area):
+            break
+        if sector in mad_sectors:
+            continue
+        ndef_sectors.append(sector)
+        capacity += (get_sector_block_count(sector) - 1) * MIFARE_BLOCK_SIZE
+    if capacity < len(area):
+        raise NdefError(f"NDEF message of {len(area)} bytes does not fit the card")
+
+    image = CardImage(card_type)
+    mad = build_mad({sector: AID_NDEF for sector in ndef_sectors}, card_type)
+
+    mad_trailer = build_trailer(MAD_KEY_A, MAD_ACCESS_BITS, mad_key_b, mad_gpb(mad))
+    mad1 = mad.encode_v1()
+    for index, block in enumerate(MAD1_BLOCKS):
+        image.set_block(block, mad1[index * MIFARE_BLOCK_SIZE:(index + 1) * MIFARE_BLOCK_SIZE])
+    image.set_block(image.get_trailer_block(0), mad_trailer)
+    if mad.version == 2:
+        mad2 = mad.encode_v2()
+        for index, block in enumerate(MAD2_BLOCKS):
+            image.set_block(block, mad2[index * MIFARE_BLOCK_SIZE:(index + 1) * MIFARE_BLOCK_SIZE])
+        image.set_block(image.get_trailer_block(MAD2_SECTOR), mad_trailer)
+
+    padded = area + bytes(capacity - len(area))
+    offset = 0
+    ndef_trailer = build_trailer(NDEF_KEY_A, NDEF_ACCESS_BITS, key_b, NDEF_GPB)
+    for sector in ndef_sectors:
+        first_block = get_sector_first_block(sector)
+        for block in range(first_block, first_block + get_sector_block_count(sector) - 1):
+            image.set_block(block, padded[offset:offset + MIFARE_BLOCK_SIZE])
+            offset += MIFARE_BLOCK_SIZE
+        image.set_block(image.get_trailer_block(sector), ndef_trailer)
+
+    sectors = sorted(mad_sectors | set(ndef_sectors))
+    image.key_map = {sector: {KEY_TYPE_A: NDEF_KEY_A} for sector in ndef_sectors}
+    image.key_map.update({sector: {KEY_TYPE_A: MAD_KEY_A} for sector in mad_sectors})
+    logger.debug(f"Compiled NDEF image: {len(area)} bytes in sectors {ndef_sectors}")
+    return CompiledNdefImage(image, sectors)
@@ -0,0 +1,135 @@
+"""
+N-gram Inverted Index
+Byte-pattern search over dumps stored in the dump library
+"""
+
+import logging
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.constants import MIFARE_BLOCK_SIZE
+from .card_image import CardImage
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZE = 4
+MAX_QUERY_NGRAMS = 8
+INDEX_CACHE_KIB = 65536
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ngrams (
+    gram INTEGER NOT NULL,
+    dump_id INTEGER NOT NULL,
+    block INTEGER NOT NULL,
+    PRIMARY KEY (gram, dump_id, block)
+) WITHOUT ROWID;
+"""
+
+def image_ngrams(image: CardImage) -> np.ndarray:
+    """Get distinct (gram, start block) pairs of the captured parts of an image
+
+    Returns:
+        ndarray: uint64 values gram << 8 | block
+    """
+    data = np.frombuffer(bytes(image.buffer), dtype=np.uint8).astype(np.uint64)
+    grams = (data[:-3] << 24) | (data[1:-2] << 16) | (data[2:-1] << 8) | data[3:]
+    offsets = np.arange(len(grams))
+    start_blocks = offsets // MIFARE_BLOCK_SIZE
+    end_blocks = (offsets + NGRAM_SIZE - 1) // MIFARE_BLOCK_SIZE
+
+    captured = np.frombuffer(bytes(image.captured), dtype=bool)
+    keep = captured[start_blocks] & captured[end_blocks]
+    return np.unique((grams[keep] << 8) | start_blocks[keep].astype(np.uint64))
+
+def pattern_ngrams(pattern: bytes) -> List[Tuple[int, int]]:
+    """Get (offset, gram) pairs of a search pattern"""
+    return [(offset, int.from_bytes(pattern[offset:offset + NGRAM_SIZE], "big"))
+            for offset in range(len(pattern) - NGRAM_SIZE + 1)]
+
+class SearchHit:
+    """Occurrence of a byte pattern in a stored dump"""
+
+    def __init__(self, dump_id: int, uid: Optional[bytes], block: int, offset: int):
+        self.dump_id = dump_id
+        self.uid = uid
+        self.block = block
+        self.offset = offset
+
+    def __repr__(self) -> str:
+        uid = self.uid.hex().upper() if self.uid else "-"
+        return f"SearchHit(dump {self.dump_id}, UID {uid}, block {self.block}, offset {self.offset})"
+
+class NgramIndex:
+    """Inverted index of byte 4-grams and the blocks they start in
+
+    Lives in the dump library database and is updated in the same
+    transaction as each insert or delete. Searches intersect the posting
+    lists of the pattern's n-grams to find candidate blocks, which the
+    library then verifies against the stored image.
+    """
+
+    def __init__(self, db: sqlite3.Connection):
+        self._db = db
+        self._db.executescript(_SCHEMA)
+        # Postings land all over the B-tree; a larger page cache cuts bulk insert time
+        self._db.execute(f"PRAGMA cache_size=-{INDEX_CACHE_KIB}")
+
+    def add(self, cursor: sqlite3.Cursor, dump_id: int, image: CardImage) -> None:
+        """Index the captured blocks of one dump"""
+        entries = image_ngrams(image)
+        cursor.executemany(
+            "INSERT OR IGNORE INTO ngrams (gram, dump_id, block) VALUES (?, ?, ?)",
+            ((int(entry >> 8), dump_id, int(entry & 0xFF)) for entry in entries)
+        )
+
+    def remove(self, cursor: sqlite3.Cursor, dump_id: int, image: CardImage) -> None:
+        """Drop index entries of one dump"""
+        entries = image_ngrams(image)
+        cursor.executemany(
+            "DELETE FROM ngrams WHERE gram = ? AND dump_id = ? AND block = ?",
+            ((int(entry >> 8), dump_id, int(entry & 0xFF)) for entry in entries)
+        )
+
+    def clear(self) -> None:
+        """Remove all index entries"""
+        self._db.execute("DELETE FROM ngrams")
+
+    def drop(self) -> None:
+        """Remove the index table"""
+        self._db.execute("DROP TABLE IF EXISTS ngrams")
+
+    def candidates(self, pattern: bytes, limit: Optional[int] = None) -> Dict[int, List[int]]:
+        """Find blocks where pattern may start
+
+        Returns:
+            dict: dump_id -> candidate start blocks
+        """
+        if len(pattern) < NGRAM_SIZE:
+            raise ValueError(f"Search pattern must be at least {NGRAM_SIZE} bytes")
+
+        grams = pattern_ngrams(pattern)
+        first_gram = grams[0][1]
+        # Spread the filtering n-grams over the whole pattern
+        step = max(1, len(grams) // MAX_QUERY_NGRAMS)
+        others = sorted({gram for _, gram in grams[step::step]} - {first_gram})
+
+        sql = "SELECT dump_id, block FROM ngrams WHERE gram = ?"
+        params = [first_gram]
+        if others:
+            sql += " AND dump_id IN (" + " INTERSECT ".join(
+                ["SELECT dump_id FROM ngrams WHERE gram = ?"] * len(others)) + ")"
+            params.extend(others)
+        sql += " ORDER BY dump_id DESC, block"
+
+        results: Dict[int, List[int]] = {}
+        for dump_id, block in self._db.execute(sql, params):
+            if limit is not None and dump_id not in results and len(results) >= limit:
+                break
+            results.setdefault(dump_id, []).append(block)
+        return results
+
+    def entry_count(self) -> int:
+        """Get number of (gram, dump, block) entries"""
+        return self._db.execute("SELECT COUNT(*) FROM ngrams").fetchone()[0]
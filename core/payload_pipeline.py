@@ -0,0 +1,193 @@
+"""
+Payload Pipeline
+Generates per-card payloads ahead of the encode loop in a worker pool
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_THREAD = "thread"
+EXECUTOR_PROCESS = "process"
+
+DEFAULT_DEPTH = 8
+
+class PipelineError(Exception):
+    """Raised when no payload can be delivered"""
+
+def _timed_call(generator: Callable[[Any], Any], key: Any) -> Tuple[Any, float]:
+    """Pool worker: generate one payload and measure how long it took"""
+    start = time.perf_counter()
+    payload = generator(key)
+    return payload, time.perf_counter() - start
+
+class PipelineStats:
+    """Counters showing how well generation overlaps with card I/O"""
+
+    def __init__(self):
+        self.delivered = 0
+        self.on_demand = 0       # keys not generated ahead (cards outside the lookahead)
+        self.requeued = 0
+        self.generate_time = 0.0
+        self.wait_time = 0.0     # time the encode loop spent waiting for payloads
+
+    def to_dict(self) -> dict:
+        """Get statistics as dictionary (times in milliseconds)"""
+        return {
+            "delivered": self.delivered,
+            "on_demand": self.on_demand,
+            "requeued": self.requeued,
+            "generate_ms": round(self.generate_time * 1000, 3),
+            "wait_ms": round(self.wait_time * 1000, 3)
+        }
+
+class PayloadPipeline:
+    """Runs payload generation for upcoming cards while the current card is encoded
+
+    Keys (sequence numbers, or UIDs expected from a manifest) are drawn
+    from the source iterable and handed to generator(key) in a thread or
+    process pool (the process pool needs a module-level generator). At most depth payloads are in flight or waiting, so a
+    slow encode loop holds the producer back instead of piling up results.
+    Payloads may complete in any order; take() delivers the next one in
+    source order, or the one of a given key, so cards presented out of
+    order still get their own payload. A key that was never generated
+    ahead is generated on demand.
+
+    For the production loop, use value_provider as the compiled program's
+    value provider and on_result as the line's result callback; the
+    payload of a card that failed is then handed to the next card.
+    """
+
+    def __init__(self, generator: Callable[[Any], Any], keys: Iterable[Hashable], depth: int = DEFAULT_DEPTH,
+                 workers: Optional[int] = None, executor: str = EXECUTOR_THREAD, key_by_uid: bool = False):
+        if depth < 1:
+            raise ValueError("Pipeline depth must be at least 1")
+        if executor not in (EXECUTOR_THREAD, EXECUTOR_PROCESS):
+            raise ValueError(f"Unknown executor: {executor}")
+        self.generator = generator
+        self.depth = depth
+        self.key_by_uid = key_by_uid
+        self.stats = PipelineStats()
+        pool_class = ProcessPoolExecutor if executor == EXECUTOR_PROCESS else ThreadPoolExecutor
+        self._executor = pool_class(max_workers=workers or depth)
+        self._source = iter(keys)
+        self._exhausted = False
+        self._pending: "OrderedDict[Hashable, Future]" = OrderedDict()
+        self._requeued: deque = deque()
+        self._taken: set = set()
+        self._current: Optional[Tuple[Hashable, Any]] = None
+        self._lock = threading.Lock()
+        with self._lock:
+            self._fill()
+
+    def __enter__(self) -> "PayloadPipeline":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Cancel payloads not yet started and shut the pool down"""
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+        self._executor.shutdown(wait=True)
+
+    def _submit(self, key: Hashable) -> Future:
+        """Start generating the payload of one key"""
+        return self._executor.submit(_timed_call, self.generator, key)
+
+    def _fill(self) -> None:
+        """Keep depth payloads in flight (caller holds the lock)"""
+        while not self._exhausted and len(self._pending) + len(self._requeued) < self.depth:
+            try:
+                key = next(self._source)
+            except StopIteration:
+                self._exhausted = True
+                break
+            if key in self._taken or key in self._pending:
+                continue
+            self._pending[key] = self._submit(key)
+
+    def pending_count(self) -> int:
+        """Get number of payloads generated ahead or in progress"""
+        with self._lock:
+            return len(self._pending) + len(self._requeued)
+
+    def take(self, key: Optional[Hashable] = None, timeout: Optional[float] = None) -> Tuple[Hashable, Any]:
+        """Get the next payload in source order, or the payload of key
+
+        Returns:
+            tuple: (key, payload)
+        """
+        with self._lock:
+            if key is None and self._requeued:
+                self.stats.delivered += 1
+                return self._requeued.popleft()
+            if key is None:
+                if not self._pending:
+                    raise PipelineError("No more payloads")
+                key, future = self._pending.popitem(last=False)
+            else:
+                requeued = next((item for item in self._requeued if item[0] == key), None)
+                if requeued is not None:
+                    self._requeued.remove(requeued)
+                    self.stats.delivered += 1
+                    return requeued
+                future = self._pending.pop(key, None)
+                if future is None:
+                    self.stats.on_demand += 1
+                    future = self._submit(key)
+            if self.key_by_uid:
+                # Cards may arrive before their UID comes up in the source
+                self._taken.add(key)
+            # Refill before waiting so the next payloads overlap with this card
+            self._fill()
+
+        start = time.perf_counter()
+        try:
+            payload, elapsed = future.result(timeout)
+        except BaseException:
+            self._restore(key, future)
+            raise
+        with self._lock:
+            self.stats.wait_time += time.perf_counter() - start
+            self.stats.generate_time += elapsed
+            self.stats.delivered += 1
+        return key, payload
+
+    def _restore(self, key: Hashable, future: Future) -> None:
+        """Put a payload that could not be delivered back at the head of the queue
+
+        A wait that timed out keeps its future; a generator that raised is
+        started again, so the next take() retries the same key.
+        """
+        if future.done() and not future.cancelled() and future.exception() is not None:
+            future = self._submit(key)
+        with self._lock:
+            self._taken.discard(key)
+            self._pending[key] = future
+            self._pending.move_to_end(key, last=False)
+
+    def requeue(self, key: Hashable, payload: Any) -> None:
+        """Give an unused payload back; the next take() in source order returns it"""
+        with self._lock:
+            self._requeued.appendleft((key, payload))
+            self.stats.requeued += 1
+
+    def value_provider(self, uid: bytes) -> Any:
+        """Get the payload for the card with uid (CardProgram value provider)"""
+        self._current = self.take(uid if self.key_by_uid else None)
+        return self._current[1]
+
+    def on_result(self, result) -> None:
+        """Hand the payload of a failed card to the next one (ProductionLine callback)"""
+        current, self._current = self._current, None
+        if current is not None and not result.success and not result.duplicate:
+            self.requeue(*current)
@@ -0,0 +1,100 @@
+"""
+Private Files
+Owner-only storage for files holding keys or card contents
+"""
+
+import os
+import socket
+import stat
+from pathlib import Path
+from typing import Union
+
+PRIVATE_FILE_MODE = 0o600
+PRIVATE_DIR_MODE = 0o700
+
+def make_private_dir(path: Path) -> Path:
+    """Create a directory and any missing parents readable by the owner only
+    (an existing directory is restricted too)"""
+    path = Path(path)
+    if not path.parent.exists():
+        make_private_dir(path.parent)
+    path.mkdir(mode=PRIVATE_DIR_MODE, exist_ok=True)
+    os.chmod(path, PRIVATE_DIR_MODE)
+    return path
+
+def make_private_file(path: Path) -> Path:
+    """Create path readable by the owner only if missing (an existing file is restricted too)
+
+    Used before handing a path to code that creates it with default
+    permissions, such as SQLite; its -wal and -shm files copy the mode.
+    """
+    path = Path(path)
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT, PRIVATE_FILE_MODE))
+    os.chmod(path, PRIVATE_FILE_MODE)
+    return path
+
+def private_opener(path: str, flags: int) -> int:
+    """open() opener creating new files readable by the owner only"""
+    return os.open(path, flags, PRIVATE_FILE_MODE)
+
+def write_private_file(path: Path, data: Union[bytes, str]) -> None:
+    """Atomically replace path with data, readable by the owner only
+
+    The temporary file is created 0600 rather than chmod-ed afterwards,
+    so the contents are never visible to other users.
+    """
+    path = Path(path)
+    if not path.parent.exists():
+        make_private_dir(path.parent)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    fd = os.open(tmp_path, flags, PRIVATE_FILE_MODE)
+    try:
+        if hasattr(os, "fchmod"):
+            # O_CREAT leaves the mode of a stale temporary file alone
+            os.fchmod(fd, PRIVATE_FILE_MODE)
+        with os.fdopen(fd, "wb") as f:
+            fd = None
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if fd is not None:
+            os.close(fd)
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def claim_socket_path(path: Path) -> Path:
+    """Prepare path for binding a Unix socket
+
+    A missing parent directory is created owner-only. A socket left behind
+    by a server that did not stop cleanly is removed; anything else at the
+    path is left alone.
+
+    Raises:
+        FileExistsError: path is not a socket, or a server still listens on it
+    """
+    path = Path(path)
+    if not path.parent.exists():
+        make_private_dir(path.parent)
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return path
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(path))
+    except OSError:
+        os.unlink(path)
+        return path
+    finally:
+        probe.close()
+    raise FileExistsError(f"A server is already listening on {path}")
@@ -0,0 +1,367 @@
+"""
+Production Line Encoding
+Unattended encode loop: card arrival, template write, verify, signal, removal
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+from config.constants import AppSettings, DEFAULT_KEY, KEY_TYPE_A, KEY_TYPE_B
+from .access_conditions import OP_READ, get_trailer_access
+from .authentication import AuthenticationManager
+from .card_image import CardImage
+from .card_operations import CardOperations
+from .key_diversification import KeyMap
+
+logger = logging.getLogger(__name__)
+
+STAGE_ARRIVAL = "arrival"    # waiting for the next card (operator time)
+STAGE_DETECT = "detect"      # UID check against cards already processed
+STAGE_WRITE = "write"        # authenticate and write the template
+STAGE_VERIFY = "verify"      # authenticate with the new keys and read back
+STAGE_SIGNAL = "signal"      # LED/buzzer feedback
+STAGE_REMOVAL = "removal"    # waiting for the card to leave (operator time)
+
+STAGES = (STAGE_ARRIVAL, STAGE_DETECT, STAGE_WRITE, STAGE_VERIFY, STAGE_SIGNAL, STAGE_REMOVAL)
+# Stages spent talking to the card; their sum is the machine cycle time
+CARD_STAGES = (STAGE_DETECT, STAGE_WRITE, STAGE_VERIFY, STAGE_SIGNAL)
+
+class ImageTemplate:
+    """Card image written unchanged to every card of a run
+
+    Captured blocks are written sector by sector, data blocks before the
+    trailer so a failed write never leaves data behind new keys. Block 0 is
+    never written. Verification authenticates with the keys of the written
+    trailer, which also proves the new keys took effect.
+    """
+
+    def __init__(self, image: CardImage, sectors: Optional[Iterable[int]] = None,
+                 current_keys: Optional[KeyMap] = None, default_key: bytes = DEFAULT_KEY):
+        self.image = image
+        self.current_keys = current_keys or {}
+        self.default_key = default_key
+        if sectors is None:
+            sectors = [sector for sector in range(image.sector_count)
+                       if any(image.has_block(block) for block in image.get_sector_blocks(sector))]
+        self.write_sequence: List = []
+        self.verify_keys: KeyMap = {}
+        for sector in sectors:
+            blocks = [(block, image.get_block(block)) for block in image.get_sector_blocks(sector)
+                      if block != 0 and image.has_block(block)]
+            self.write_sequence.append((sector, blocks))
+            self.verify_keys[sector] = self._sector_verify_keys(sector)
+
+    def _sector_verify_keys(self, sector: int) -> Dict[int, bytes]:
+        """Get keys that can read the sector data once the template is written"""
+        trailer_block = self.image.get_trailer_block(sector)
+        if not self.image.has_block(trailer_block):
+            return self.current_keys.get(sector, {KEY_TYPE_A: self.default_key})
+        trailer = self.image.get_block(trailer_block)
+        keys = {KEY_TYPE_A: trailer[0:6], KEY_TYPE_B: trailer[10:16]}
+        keys.update(self.image.key_map.get(sector, {}))
+        access = get_trailer_access(trailer)
+        if access is None:
+            return keys
+        readers = set(access.allowed_key_types(0, OP_READ))
+        return {key_type: key for key_type, key in keys.items() if key_type in readers} or keys
+
+    def _authenticate(self, auth_manager: AuthenticationManager, sector: int, keys: Dict[int, bytes]) -> bool:
+        """Authenticate sector with the first key that works"""
+        for key_type in (KEY_TYPE_A, KEY_TYPE_B):
+            key = keys.get(key_type)
+            if key is not None and auth_manager.authenticate_sector(sector, key_type, key):
+                return True
+        return False
+
+    def block_count(self) -> int:
+        """Get number of block writes per card"""
+        return sum(len(blocks) for _, blocks in self.write_sequence)
+
+    def write(self, card_operations: CardOperations, auth_manager: AuthenticationManager) -> bool:
+        """Write the template to the card in the field"""
+        for sector, blocks in self.write_sequence:
+            keys = self.current_keys.get(sector, {KEY_TYPE_A: self.default_key})
+            if not self._authenticate(auth_manager, sector, keys):
+                logger.warning(f"Template write: cannot authenticate sector {sector}")
+                return False
+            for block, data in blocks:
+                if not card_operations.write_block(block, data):
+                    logger.warning(f"Template write: block {block} failed")
+                    return False
+        return True
+
+    def verify(self, card_operations: CardOperations, auth_manager: AuthenticationManager) -> bool:
+        """Read back data blocks with the new keys and compare"""
+        for sector, blocks in self.write_sequence:
+            data_blocks = [(block, data) for block, data in blocks
+                           if block != self.image.get_trailer_block(sector)]
+            if not self._authenticate(auth_manager, sector, self.verify_keys[sector]):
+                logger.warning(f"Template verify: new keys rejected in sector {sector}")
+                return False
+            for block, data in data_blocks:
+                if card_operations.read_block(block) != data:
+                    logger.warning(f"Template verify: block {block} differs")
+                    return False
+        return True
+
+class StageTiming:
+    """Accumulated duration of one production stage"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min_time: Optional[float] = None
+        self.max_time: Optional[float] = None
+
+    def record(self, elapsed: float) -> None:
+        """Record one stage duration in seconds"""
+        self.count += 1
+        self.total += elapsed
+        self.min_time = elapsed if self.min_time is None else min(self.min_time, elapsed)
+        self.max_time = elapsed if self.max_time is None else max(self.max_time, elapsed)
+
+    def to_dict(self) -> dict:
+        """Get timing as dictionary (times in milliseconds)"""
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+
+        return {
+            "count": self.count,
+            "average_ms": ms(self.total / self.count) if self.count else None,
+            "min_ms": ms(self.min_time),
+            "max_ms": ms(self.max_time)
+        }
+
+class ProductionResult:
+    """Outcome of one card"""
+
+    def __init__(self, uid: bytes):
+        self.uid = uid
+        self.success = False
+        self.duplicate = False
+        self.failed_stage: Optional[str] = None
+        self.stage_times: Dict[str, float] = {}
+
+    @property
+    def cycle_time(self) -> float:
+        """Seconds spent on the card itself (operator waits excluded)"""
+        return sum(self.stage_times.get(stage, 0.0) for stage in CARD_STAGES)
+
+    def __repr__(self) -> str:
+        state = "duplicate" if self.duplicate else "ok" if self.success else f"failed at {self.failed_stage}"
+        return f"ProductionResult({self.uid.hex().upper()}, {state}, {self.cycle_time * 1000:.1f} ms)"
+
+class ProductionStats:
+    """Thread-safe counters, per-stage timing and cards/minute rate of a run"""
+
+    def __init__(self, rate_window: float = AppSettings.PRODUCTION_RATE_WINDOW):
+        self.rate_window = rate_window
+        self.encoded = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.stages = {stage: StageTiming() for stage in STAGES}
+        self.cycle = StageTiming()
+        self.failures_by_stage: Dict[str, int] = {}
+        self.started = time.monotonic()
+        self._completions: deque = deque()
+        self._lock = threading.Lock()
+
+    def record(self, result: ProductionResult, now: Optional[float] = None) -> None:
+        """Record the outcome of one card"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for stage, elapsed in result.stage_times.items():
+                self.stages[stage].record(elapsed)
+            if result.duplicate:
+                self.duplicates += 1
+                return
+            self.cycle.record(result.cycle_time)
+            if result.success:
+                self.encoded += 1
+                self._completions.append(now)
+            else:
+                self.failed += 1
+                self.failures_by_stage[result.failed_stage] = self.failures_by_stage.get(result.failed_stage, 0) + 1
+
+    def record_stage(self, stage: str, elapsed: float) -> None:
+        """Record a stage not tied to a card result (e.g. waiting for removal)"""
+        with self._lock:
+            self.stages[stage].record(elapsed)
+
+    def cards_per_minute(self, now: Optional[float] = None) -> float:
+        """Get successful cards per minute over the rate window"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            while self._completions and self._completions[0] < now - self.rate_window:
+                self._completions.popleft()
+            span = min(self.rate_window, now - self.started)
+            return len(self._completions) * 60.0 / span if span > 0 else 0.0
+
+    def failure_rate(self) -> float:
+        """Get fraction of attempted cards that failed (duplicates excluded)"""
+        with self._lock:
+            attempted = self.encoded + self.failed
+            return self.failed / attempted if attempted else 0.0
+
+    def to_dict(self) -> dict:
+        """Get a snapshot of the run statistics"""
+        cards_per_minute = self.cards_per_minute()
+        failure_rate = self.failure_rate()
+        with self._lock:
+            return {
+                "encoded": self.encoded,
+                "failed": self.failed,
+                "duplicates": self.duplicates,
+                "cards_per_minute": round(cards_per_minute, 2),
+                "failure_rate": round(failure_rate, 4),
+                "failures_by_stage": dict(self.failures_by_stage),
+                "cycle": self.cycle.to_dict(),
+                "stages": {stage: timing.to_dict() for stage, timing in self.stages.items()}
+            }
+
+class ProductionLine:
+    """Encodes cards presented one after another, without operator prompts
+
+    The loop polls for a card, skips UIDs already encoded in this run,
+    writes and verifies the template, signals the result on the reader and
+    waits for the card to leave. Polling uses bare GET UID commands at a
+    short interval, so the machine part of each cycle is the APDUs of the
+    template itself.
+
+    The template is any object with write() and verify() methods taking
+    (card_operations, auth_manager) and returning bool, e.g. ImageTemplate.
+    """
+
+    def __init__(self, card_operations: CardOperations, auth_manager: AuthenticationManager, template,
+                 processed_uids: Optional[Iterable[bytes]] = None, signal: bool = True,
+                 poll_interval: float = AppSettings.PRODUCTION_POLL_INTERVAL / 1000.0,
+                 on_result: Optional[Callable[[ProductionResult], None]] = None):
+        self.card_operations = card_operations
+        self.auth_manager = auth_manager
+        self.reader_manager = card_operations.reader_manager
+        self.template = template
+        self.processed_uids = set(processed_uids or ())
+        self.signal = signal
+        self.poll_interval = poll_interval
+        self.on_result = on_result
+        self.stats = ProductionStats()
+        self.last_result: Optional[ProductionResult] = None
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """Ask the loop to finish after the current card"""
+        self._stop.set()
+
+    def is_stopping(self) -> bool:
+        """Check whether stop() was called"""
+        return self._stop.is_set()
+
+    def wait_for_card(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Poll until a card is in the field, returns its UID"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set():
+            uid = self.reader_manager.poll_card_uid()
+            if uid is not None:
+                return uid
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            self._stop.wait(self.poll_interval)
+        return None
+
+    def wait_for_removal(self, uid: bytes) -> None:
+        """Poll until the card with uid has left the field
+
+        A few consecutive empty polls are required so a card briefly
+        detuned by the operator's hand is not counted twice.
+        """
+        empty_polls = 0
+        while not self._stop.is_set() and empty_polls < AppSettings.PRODUCTION_REMOVAL_POLLS:
+            current = self.reader_manager.poll_card_uid()
+            if current is not None and current != uid:
+                return
+            empty_polls = empty_polls + 1 if current is None else 0
+            self._stop.wait(self.poll_interval)
+
+    def _run_stage(self, result: ProductionResult, stage: str, action: Callable[[], bool]) -> bool:
+        """Time one stage, marking the result failed if it returns False"""
+        start = time.perf_counter()
+        try:
+            success = action()
+        except Exception as e:
+            logger.error(f"Production stage {stage} failed: {e}")
+            success = False
+        result.stage_times[stage] = time.perf_counter() - start
+        if not success and result.failed_stage is None:
+            result.failed_stage = stage
+        return success
+
+    def process_card(self, uid: bytes) -> ProductionResult:
+        """Encode the card with uid that is already in the field"""
+        result = ProductionResult(uid)
+
+        def detect() -> bool:
+            if uid in self.processed_uids:
+                result.duplicate = True
+                return False
+            self.card_operations.clear_authentication()
+            self.card_operations.set_detected_card(uid)
+            return True
+
+        if self._run_stage(result, STAGE_DETECT, detect):
+            result.success = (
+                self._run_stage(result, STAGE_WRITE,
+                                lambda: self.template.write(self.card_operations, self.auth_manager)) and
+                self._run_stage(result, STAGE_VERIFY,
+                                lambda: self.template.verify(self.card_operations, self.auth_manager))
+            )
+        if result.duplicate:
+            result.failed_stage = None
+        if result.success:
+            self.processed_uids.add(uid)
+
+        if self.signal:
+            start = time.perf_counter()
+            self.reader_manager.signal_result(result.success)
+            result.stage_times[STAGE_SIGNAL] = time.perf_counter() - start
+
+        self.stats.record(result)
+        self.last_result = result
+        logger.info(f"Production: {result}")
+        if self.on_result is not None:
+            try:
+                self.on_result(result)
+            except Exception as e:
+                logger.error(f"Error in production result callback: {e}")
+        return result
+
+    def run(self, max_cards: Optional[int] = None) -> dict:
+        """Encode cards until stop() is called or max_cards were attempted
+
+        Returns:
+            dict: final statistics (see ProductionStats.to_dict)
+        """
+        self._stop.clear()
+        attempted = 0
+        logger.info("Production run started")
+        while not self._stop.is_set() and (max_cards is None or attempted < max_cards):
+            start = time.perf_counter()
+            uid = self.wait_for_card()
+            if uid is None:
+                break
+            self.stats.record_stage(STAGE_ARRIVAL, time.perf_counter() - start)
+
+            result = self.process_card(uid)
+            if not result.duplicate:
+                attempted += 1
+
+            start = time.perf_counter()
+            self.wait_for_removal(uid)
+            self.stats.record_stage(STAGE_REMOVAL, time.perf_counter() - start)
+
+        stats = self.stats.to_dict()
+        logger.info(f"Production run finished: {stats['encoded']} encoded, {stats['failed']} failed, "
+                    f"{stats['duplicates']} duplicates")
+        return stats
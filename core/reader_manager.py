@@ -15,7 +15,11 @@ from smartcard.CardType import AnyCardType
 from smartcard.Exceptions import NoCardException, CardConnectionException
 from smartcard.pcsc.PCSCExceptions import EstablishContextException
 
-from config.constants import ACR1252U_READER_NAME, ESCAPE_COMMAND, APDUCommands, ErrorCodes
+from config.constants import (
+    ACR1252U_READER_NAME, ESCAPE_COMMAND, APDUCommands, ErrorCodes, AppSettings,
+    ANTENNA_FIELD_OFF, ANTENNA_FIELD_ON, REACTIVATION_FIELD_RESET, REACTIVATION_RECONNECT,
+    LED_RED_ON, LED_GREEN_ON
+)
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +30,79 @@ class ReaderStatus:
     CONNECTED = "connected"
     ERROR = "error"
 
+class ApduBatchError(CardConnectionException):
+    """Transport failure part-way through an APDU batch
+
+    results holds the responses of the APDUs that completed before it.
+    """
+
+    def __init__(self, message: str, results: List[Tuple[List[int], int, int]]):
+        super().__init__(message)
+        self.results = results
+
+class ReactivationStats:
+    """Timing statistics for card reactivation"""
+    
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total_time = 0.0
+        self.min_time: Optional[float] = None
+        self.max_time: Optional[float] = None
+        self.last_time: Optional[float] = None
+    
+    def record(self, elapsed: float, success: bool) -> None:
+        """Record one reactivation attempt"""
+        self.count += 1
+        if not success:
+            self.failures += 1
+        self.total_time += elapsed
+        self.last_time = elapsed
+        self.min_time = elapsed if self.min_time is None else min(self.min_time, elapsed)
+        self.max_time = elapsed if self.max_time is None else max(self.max_time, elapsed)
+    
+    def to_dict(self) -> dict:
+        """Get statistics as dictionary (times in milliseconds)"""
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+        
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "average_ms": ms(self.total_time / self.count) if self.count else None,
+            "min_ms": ms(self.min_time),
+            "max_ms": ms(self.max_time),
+            "last_ms": ms(self.last_time)
+        }
+
+class ApduLatencyTracker:
+    """Measured APDU latencies per instruction byte (exponential moving average)"""
+    
+    def __init__(self, smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self._averages: dict = {}
+        self._counts: dict = {}
+    
+    def record(self, ins: int, elapsed: float) -> None:
+        """Record latency of one APDU in seconds"""
+        average = self._averages.get(ins)
+        if average is None:
+            self._averages[ins] = elapsed
+        else:
+            self._averages[ins] = average + self.smoothing * (elapsed - average)
+        self._counts[ins] = self._counts.get(ins, 0) + 1
+    
+    def estimate(self, ins: int, default: float) -> float:
+        """Get expected latency in seconds, or default if never measured"""
+        return self._averages.get(ins, default)
+    
+    def to_dict(self) -> dict:
+        """Get latencies as {INS hex: {count, average_ms}}"""
+        return {
+            f"{ins:02X}": {"count": self._counts[ins], "average_ms": round(average * 1000, 3)}
+            for ins, average in sorted(self._averages.items())
+        }
+
 class ReaderManager:
     """Manages ACR1252U reader connection and basic operations"""
     
@@ -37,6 +114,9 @@ class ReaderManager:
         self.status_callbacks: List[Callable] = []
         self._monitoring = False
         self._monitor_thread = None
+        self.reactivation_stats = ReactivationStats()
+        self._reactivation_method: Optional[str] = None
+        self.apdu_latency = ApduLatencyTracker()
     
     def add_status_callback(self, callback: Callable[[str], None]) -> None:
         """Add callback for status changes"""
@@ -77,8 +157,8 @@ class ReaderManager:
         logger.warning("ACR1252U reader not found")
         return None
     
-    def connect(self, reader_name: Optional[str] = None) -> bool:
-        """Connect to ACR1252U reader"""
+    def connect(self, reader_name: Optional[str] = None, monitor: bool = True) -> bool:
+        """Connect to ACR1252U reader (monitor=False skips the background health check)"""
         try:
             self._notify_status_change(ReaderStatus.CONNECTING)
             
@@ -116,7 +196,8 @@ class ReaderManager:
             self._get_firmware_version()
 
             # Start monitoring thread
-            self._start_monitoring()
+            if monitor:
+                self._start_monitoring()
 
             return True
             
@@ -125,6 +206,28 @@ class ReaderManager:
             self._notify_status_change(ReaderStatus.ERROR)
             return False
     
+    def connect_remote(self, host: str, port: int = AppSettings.BRIDGE_PORT, monitor: bool = True,
+                       token: Optional[bytes] = None) -> bool:
+        """Connect to a reader exposed by a bridge agent on another machine"""
+        from .remote_reader import RemoteConnection
+        try:
+            self._notify_status_change(ReaderStatus.CONNECTING)
+            self.connection = RemoteConnection(host, port, token=token)
+            self.reader = self.connection.name
+            self._notify_status_change(ReaderStatus.CONNECTED)
+
+            logger.info(f"Connected to remote reader: {self.reader}")
+            self._get_firmware_version()
+            if monitor:
+                self._start_monitoring()
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to connect to remote reader {host}:{port}: {e}")
+            self.connection = None
+            self._notify_status_change(ReaderStatus.ERROR)
+            return False
+    
     def disconnect(self) -> None:
         """Disconnect from reader"""
         try:
@@ -169,13 +272,191 @@ class ReaderManager:
             raise CardConnectionException("Reader not connected")
         
         try:
+            start = time.perf_counter()
             response, sw1, sw2 = self.connection.transmit(command)
-            logger.debug(f"APDU: {toHexString(command)} -> {toHexString(response)} {sw1:02X}{sw2:02X}")
+            self.apdu_latency.record(command[1], time.perf_counter() - start)
+            # Formatting every APDU costs more than some APDUs on the emulator
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"APDU: {toHexString(command)} -> {toHexString(response)} {sw1:02X}{sw2:02X}")
             return response, sw1, sw2
         except Exception as e:
             logger.error(f"APDU command failed: {e}")
             raise
     
+    def send_apdu_batch(self, commands: List[List[int]],
+                        required: Optional[int] = None) -> List[Tuple[List[int], int, int]]:
+        """Send several APDUs, in one round-trip when the transport pipelines them
+        
+        The batch stops after the first of its leading `required` APDUs (all
+        of them by default) that does not answer 90 00, so later commands
+        never run on a sector that failed to authenticate. Returns the
+        responses of the APDUs that ran; a transport failure raises
+        ApduBatchError carrying the responses received before it.
+        """
+        if not self.is_connected():
+            raise CardConnectionException("Reader not connected")
+        if required is None:
+            required = len(commands)
+        
+        transmit_batch = getattr(self.connection, "transmit_batch", None)
+        if transmit_batch is None:
+            results = []
+            for index, command in enumerate(commands):
+                try:
+                    result = self.send_apdu(command)
+                except Exception as e:
+                    raise ApduBatchError(str(e), results) from e
+                results.append(result)
+                if index < required and (result[1], result[2]) != (0x90, 0x00):
+                    break
+            return results
+        
+        start = time.perf_counter()
+        results = transmit_batch(commands, required)
+        if results:
+            # One round-trip: charge each APDU an equal share
+            share = (time.perf_counter() - start) / len(results)
+            for command in commands[:len(results)]:
+                self.apdu_latency.record(command[1], share)
+        if logger.isEnabledFor(logging.DEBUG):
+            for command, (response, sw1, sw2) in zip(commands, results):
+                logger.debug(f"APDU: {toHexString(command)} -> {toHexString(response)} {sw1:02X}{sw2:02X}")
+        return results
+    
+    def poll_card_uid(self) -> Optional[bytes]:
+        """Get UID of the card in the field, or None if there is none
+        
+        An empty field is the normal case here, so it is not logged as an
+        error and the call is cheap enough for tight polling loops.
+        """
+        if not self.is_connected():
+            raise CardConnectionException("Reader not connected")
+        
+        try:
+            response, sw1, sw2 = self.connection.transmit(APDUCommands.GET_UID)
+        except (NoCardException, CardConnectionException):
+            return None
+        
+        if sw1 == 0x90 and sw2 == 0x00 and response:
+            return bytes(response)
+        return None
+    
+    def get_atr(self) -> Optional[bytes]:
+        """Get ATR of the card in the field, or None if there is none"""
+        if not self.is_connected():
+            return None
+
+        try:
+            return bytes(self.connection.getATR())
+        except Exception as e:
+            logger.debug(f"ATR unavailable: {e}")
+            return None
+
+    def signal_result(self, success: bool) -> bool:
+        """Show an operation result on the reader LEDs and buzzer
+        
+        Green with a short beep for success, red with a long beep for
+        failure. The reader times the beep itself, so this does not block.
+        """
+        led = LED_GREEN_ON if success else LED_RED_ON
+        duration = AppSettings.SIGNAL_BEEP_SUCCESS if success else AppSettings.SIGNAL_BEEP_FAILURE
+        try:
+            response, sw1, sw2 = self.send_escape_command(APDUCommands.LED_CONTROL + [led])
+            if sw1 != 0xE1:
+                return False
+            response, sw1, sw2 = self.send_escape_command(APDUCommands.BUZZER_CONTROL + [duration])
+            return sw1 == 0xE1
+        except Exception as e:
+            logger.debug(f"Result signal failed: {e}")
+            return False
+    
+    def set_antenna_field(self, enabled: bool) -> bool:
+        """Switch the reader RF field on or off"""
+        value = ANTENNA_FIELD_ON if enabled else ANTENNA_FIELD_OFF
+        response, sw1, sw2 = self.send_escape_command(APDUCommands.ANTENNA_FIELD_CONTROL + [value])
+        return sw1 == 0xE1
+    
+    def _reactivate_by_field_reset(self) -> bool:
+        """Reactivate card by cycling the RF field"""
+        if not self.set_antenna_field(False):
+            return False
+        time.sleep(AppSettings.RF_RESET_TIME / 1000.0)
+        return self.set_antenna_field(True)
+    
+    def _reactivate_by_reconnect(self) -> bool:
+        """Reactivate card by reconnecting with a card reset disposition"""
+        from smartcard.scard import SCARD_RESET_CARD
+        self.connection.reconnect(disposition=SCARD_RESET_CARD)
+        return True
+    
+    def reactivate_card(self, expected_uid: Optional[bytes] = None) -> bool:
+        """Bring a halted card back to the active state
+        
+        Used after a failed authentication, which leaves the card in HALT.
+        Tries RF field cycling first and falls back to a PC/SC reconnect;
+        the method that works is remembered for later calls. If expected_uid
+        is given, the reactivated card must report the same UID.
+        """
+        if not self.is_connected():
+            raise CardConnectionException("Reader not connected")
+        
+        methods = [
+            (REACTIVATION_FIELD_RESET, self._reactivate_by_field_reset),
+            (REACTIVATION_RECONNECT, self._reactivate_by_reconnect)
+        ]
+        if self._reactivation_method == REACTIVATION_RECONNECT:
+            methods.reverse()
+        
+        start = time.perf_counter()
+        success = False
+        
+        for name, method in methods:
+            try:
+                if not method():
+                    continue
+            except Exception as e:
+                logger.debug(f"Card reactivation via {name} failed: {e}")
+                continue
+            
+            try:
+                response, sw1, sw2 = self.send_apdu(APDUCommands.GET_UID)
+            except Exception as e:
+                logger.debug(f"No card after reactivation via {name}: {e}")
+                continue
+            
+            if not (sw1 == 0x90 and sw2 == 0x00 and response):
+                logger.debug(f"No card after reactivation via {name}: {sw1:02X} {sw2:02X}")
+                continue
+            
+            success = expected_uid is None or bytes(response) == expected_uid
+            if success:
+                # Only a method that brought the card back is remembered
+                self._reactivation_method = name
+            else:
+                # Another method would find the same other card
+                logger.warning(f"Different card after reactivation: {bytes(response).hex()}")
+            break
+        
+        self.reactivation_stats.record(time.perf_counter() - start, success)
+        return success
+    
+    def get_reactivation_stats(self) -> dict:
+        """Get card reactivation timing statistics"""
+        stats = self.reactivation_stats.to_dict()
+        stats["method"] = self._reactivation_method
+        return stats
+    
+    def measure_reactivation(self, samples: int = 10) -> dict:
+        """Measure card reactivation cost over several cycles"""
+        response, sw1, sw2 = self.send_apdu(APDUCommands.GET_UID)
+        expected_uid = bytes(response) if sw1 == 0x90 and sw2 == 0x00 else None
+        
+        self.reactivation_stats = ReactivationStats()
+        for _ in range(samples):
+            self.reactivate_card(expected_uid)
+        
+        return self.get_reactivation_stats()
+    
     def _get_firmware_version(self) -> None:
         """Get reader firmware version"""
         try:
@@ -0,0 +1,546 @@
+"""
+Reader Service
+Local daemon sharing one reader between processes over a Unix socket
+"""
+
+import json
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from config.constants import AppSettings
+from .authentication import AuthenticationManager
+from .card_operations import CardOperations
+from .dump import DumpEngine
+from .key_cache import KEY_TYPE_TAGS, TAG_KEY_TYPES
+from .key_diversification import KeyMap
+from .private_files import claim_socket_path
+
+logger = logging.getLogger(__name__)
+
+# Frame: 4-byte big-endian length followed by a UTF-8 JSON object
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 1024 * 1024
+
+EVENT_CARD_ARRIVAL = "card_arrival"
+EVENT_CARD_REMOVAL = "card_removal"
+EVENTS = (EVENT_CARD_ARRIVAL, EVENT_CARD_REMOVAL)
+
+class ReaderServiceError(Exception):
+    """Raised for protocol errors and failed service requests"""
+
+def send_frame(sock: socket.socket, message: dict) -> None:
+    """Send one length-prefixed JSON message"""
+    payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ReaderServiceError(f"Message of {len(payload)} bytes exceeds the frame limit")
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    """Receive size bytes, None if the peer closed first"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+def recv_frame(sock: socket.socket) -> Optional[dict]:
+    """Receive one length-prefixed JSON message, None on a clean disconnect"""
+    header = _recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ReaderServiceError(f"Frame of {size} bytes exceeds the limit")
+    payload = _recv_exactly(sock, size)
+    if payload is None:
+        raise ReaderServiceError("Connection closed inside a frame")
+    message = json.loads(payload.decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ReaderServiceError("Frame is not a JSON object")
+    return message
+
+def key_map_to_dict(key_map: KeyMap) -> Dict[str, Dict[str, str]]:
+    """Encode {sector: {key_type: key}} for the wire"""
+    return {str(sector): {KEY_TYPE_TAGS[key_type]: key.hex().upper() for key_type, key in keys.items()}
+            for sector, keys in sorted(key_map.items())}
+
+def key_map_from_dict(data: Dict[str, Dict[str, str]]) -> KeyMap:
+    """Decode a key map sent by a client"""
+    return {int(sector): {TAG_KEY_TYPES[tag.upper()]: bytes.fromhex(key) for tag, key in keys.items()}
+            for sector, keys in data.items()}
+
+class _Client:
+    """One connected client: socket, pending requests and subscriptions
+
+    Sends time out after send_timeout so a client that stops reading
+    cannot hold up the executor; it is disconnected instead. Receives
+    stay blocking, since clients may sit idle between requests.
+    """
+
+    def __init__(self, client_id: int, sock: socket.socket,
+                 send_timeout: float = AppSettings.SERVICE_SEND_TIMEOUT / 1000.0):
+        self.client_id = client_id
+        self.sock = sock
+        seconds, fraction = divmod(send_timeout, 1.0)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO,
+                        struct.pack("ll", int(seconds), int(fraction * 1000000)))
+        self.requests: deque = deque()
+        self.subscriptions: set = set()
+        self.served = 0
+        self.connected = True
+        self._send_lock = threading.Lock()
+
+    def send(self, message: dict) -> bool:
+        """Send a message, False if the client is gone"""
+        with self._send_lock:
+            if not self.connected:
+                return False
+            try:
+                send_frame(self.sock, message)
+                return True
+            except (OSError, ReaderServiceError) as e:
+                logger.warning(f"Service client {self.client_id} dropped: send failed: {e}")
+                self.connected = False
+                try:
+                    # A frame may be half sent; ends the receiver of this client too
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                return False
+
+class ReaderService:
+    """Owns the reader and serves card operations to local clients
+
+    Each client's requests are queued separately and a single executor
+    thread takes one request per client in turn, so a client sending a
+    long batch cannot starve the others and the reader never sees two
+    commands at once. While no request is pending the executor polls for
+    card presence and notifies subscribed clients of arrivals and
+    removals.
+
+    Authentication state belongs to the card, not to a client: read and
+    write requests may carry a key so that authentication and the
+    operation run back to back without another client's request between
+    them.
+    """
+
+    def __init__(self, card_operations: CardOperations, auth_manager: AuthenticationManager,
+                 path: Path = AppSettings.SERVICE_SOCKET_PATH,
+                 poll_interval: float = AppSettings.SERVICE_POLL_INTERVAL / 1000.0,
+                 client_queue: int = AppSettings.SERVICE_CLIENT_QUEUE,
+                 send_timeout: float = AppSettings.SERVICE_SEND_TIMEOUT / 1000.0):
+        self.card_operations = card_operations
+        self.auth_manager = auth_manager
+        self.reader_manager = card_operations.reader_manager
+        self.dump_engine = DumpEngine(card_operations, auth_manager)
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.client_queue = client_queue
+        self.send_timeout = send_timeout
+        self.requests_served = 0
+        self.started = time.monotonic()
+        self._clients: Dict[int, _Client] = {}
+        self._ready: deque = deque()  # clients with pending requests, in turn order
+        self._condition = threading.Condition()
+        self._next_client_id = 1
+        self._card_uid: Optional[bytes] = None
+        self._running = False
+        self._server: Optional[socket.socket] = None
+        self._threads: List[threading.Thread] = []
+        self._operations: Dict[str, Callable[[dict], Any]] = {
+            "detect": self._op_detect,
+            "auth": self._op_auth,
+            "read": self._op_read,
+            "write": self._op_write,
+            "dump": self._op_dump,
+            "keymap": self._op_keymap,
+            "metrics": self._op_metrics
+        }
+
+    def start(self) -> None:
+        """Bind the socket and start serving
+
+        Raises:
+            ReaderServiceError: another service is listening on the socket
+                path, or something other than a socket is there
+        """
+        try:
+            claim_socket_path(self.path)
+        except FileExistsError as e:
+            raise ReaderServiceError(str(e))
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(str(self.path))
+        os.chmod(self.path, 0o600)
+        self._server.listen()
+        self._running = True
+        for target in (self._accept_loop, self._execute_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Reader service listening on {self.path}")
+
+    def stop(self) -> None:
+        """Stop serving and disconnect clients"""
+        self._running = False
+        if self._server is not None:
+            try:
+                # Wakes the accept loop; close() alone leaves it blocked
+                self._server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._server.close()
+        with self._condition:
+            clients = list(self._clients.values())
+            self._condition.notify_all()
+        for client in clients:
+            client.connected = False
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.sock.close()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        logger.info("Reader service stopped")
+
+    def __enter__(self) -> "ReaderService":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    # Connections
+
+    def _accept_loop(self) -> None:
+        """Accept clients and start a receiver per client"""
+        while self._running:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            with self._condition:
+                client = _Client(self._next_client_id, sock, self.send_timeout)
+                self._next_client_id += 1
+                self._clients[client.client_id] = client
+            thread = threading.Thread(target=self._receive_loop, args=(client,), daemon=True)
+            thread.start()
+            logger.debug(f"Service client {client.client_id} connected")
+
+    def _receive_loop(self, client: _Client) -> None:
+        """Queue requests of one client"""
+        try:
+            while self._running:
+                message = recv_frame(client.sock)
+                if message is None:
+                    break
+                self._enqueue(client, message)
+        except (OSError, ValueError, ReaderServiceError) as e:
+            logger.debug(f"Service client {client.client_id} dropped: {e}")
+        finally:
+            with self._condition:
+                self._clients.pop(client.client_id, None)
+                client.connected = False
+            client.sock.close()
+            logger.debug(f"Service client {client.client_id} disconnected")
+
+    def _enqueue(self, client: _Client, message: dict) -> None:
+        """Add a request to the client's queue, or answer subscriptions directly"""
+        op = message.get("op")
+        if op in ("subscribe", "unsubscribe"):
+            events = set(message.get("events", EVENTS)) & set(EVENTS)
+            with self._condition:
+                if op == "subscribe":
+                    client.subscriptions |= events
+                else:
+                    client.subscriptions -= events
+            client.send({"id": message.get("id"), "ok": True, "result": sorted(client.subscriptions)})
+            return
+
+        with self._condition:
+            if len(client.requests) >= self.client_queue:
+                busy = True
+            else:
+                busy = False
+                if not client.requests:
+                    self._ready.append(client)
+                client.requests.append(message)
+                self._condition.notify()
+        if busy:
+            client.send({"id": message.get("id"), "ok": False, "error": "Too many pending requests"})
+
+    # Execution
+
+    def _next_request(self, timeout: float):
+        """Take one request from the client whose turn it is"""
+        with self._condition:
+            if not self._ready:
+                self._condition.wait(timeout)
+            while self._ready:
+                client = self._ready.popleft()
+                if not client.connected or not client.requests:
+                    continue
+                message = client.requests.popleft()
+                if client.requests:
+                    self._ready.append(client)
+                return client, message
+            return None
+
+    def _execute_loop(self) -> None:
+        """Executor thread: the only thread talking to the reader"""
+        last_poll = 0.0
+        while self._running:
+            if time.monotonic() - last_poll >= self.poll_interval:
+                self._poll_presence()
+                last_poll = time.monotonic()
+            request = self._next_request(self.poll_interval)
+            if request is None:
+                continue
+            client, message = request
+            client.send(self.execute(message))
+            client.served += 1
+            self.requests_served += 1
+
+    def execute(self, message: dict) -> dict:
+        """Run one request and build its response"""
+        request_id = message.get("id")
+        operation = self._operations.get(message.get("op"))
+        if operation is None:
+            return {"id": request_id, "ok": False, "error": f"Unknown operation: {message.get('op')}"}
+        try:
+            return {"id": request_id, "ok": True, "result": operation(message)}
+        except (KeyError, TypeError, ValueError, ReaderServiceError) as e:
+            return {"id": request_id, "ok": False, "error": str(e) or type(e).__name__}
+        except Exception as e:
+            logger.error(f"Service operation {message.get('op')} failed: {e}")
+            return {"id": request_id, "ok": False, "error": str(e)}
+
+    def _has_subscribers(self) -> bool:
+        """Check whether any client wants card events"""
+        with self._condition:
+            return any(client.subscriptions for client in self._clients.values())
+
+    def _publish(self, event: str, uid: bytes) -> None:
+        """Send a card event to subscribed clients"""
+        message = {"event": event, "uid": uid.hex().upper(), "time": round(time.time(), 3)}
+        with self._condition:
+            clients = [client for client in self._clients.values() if event in client.subscriptions]
+        for client in clients:
+            client.send(message)
+
+    def _poll_presence(self) -> None:
+        """Track the card in the field and announce changes"""
+        if not self._has_subscribers() or not self.reader_manager.is_connected():
+            return
+        uid = self.reader_manager.poll_card_uid()
+        if uid == self._card_uid:
+            return
+        if self._card_uid is not None:
+            self._publish(EVENT_CARD_REMOVAL, self._card_uid)
+            self.card_operations.card_info.present = False
+            self.card_operations.clear_authentication()
+        self._card_uid = uid
+        if uid is not None:
+            self.card_operations.clear_authentication()
+            self.card_operations.set_detected_card(uid)
+            self._publish(EVENT_CARD_ARRIVAL, uid)
+
+    # Operations
+
+    def _require_card(self) -> None:
+        """Fail the request if no card was detected"""
+        if not self.card_operations.card_info.present:
+            raise ReaderServiceError("No card present")
+
+    def _authenticate(self, message: dict) -> None:
+        """Authenticate the sector of a request that carries a key"""
+        key = message.get("key")
+        if key is None:
+            return
+        sector = message.get("sector")
+        if sector is None:
+            sector = self._sector_of(int(message["block"]))
+        key_type = TAG_KEY_TYPES[str(message.get("key_type", "A")).upper()]
+        if not self.auth_manager.authenticate_sector(int(sector), key_type, bytes.fromhex(key)):
+            raise ReaderServiceError(f"Authentication failed for sector {sector}")
+
+    def _sector_of(self, block: int) -> int:
+        """Get the sector of a block on the card in the field"""
+        card_info = self.card_operations.card_info
+        for sector in range(card_info.get_sector_count()):
+            if block <= card_info.get_trailer_block(sector):
+                return sector
+        raise ReaderServiceError(f"Block {block} is outside the card")
+
+    def _op_detect(self, message: dict) -> dict:
+        """detect: look for a card and describe it"""
+        present = self.card_operations.detect_card()
+        card_info = self.card_operations.card_info
+        if present:
+            self._card_uid = card_info.uid
+        return {
+            "present": present,
+            "uid": card_info.uid.hex().upper() if present else None,
+            "card_type": card_info.get_card_type_name() if present else None,
+            "sectors": card_info.get_sector_count() if present else 0
+        }
+
+    def _op_auth(self, message: dict) -> bool:
+        """auth: authenticate {sector, key_type, key}"""
+        self._require_card()
+        self._authenticate(message)
+        return True
+
+    def _op_read(self, message: dict) -> str:
+        """read: read {block}, authenticating first if a key is given"""
+        self._require_card()
+        self._authenticate(message)
+        data = self.card_operations.read_block(int(message["block"]))
+        if data is None:
+            raise ReaderServiceError(f"Could not read block {message['block']}")
+        return data.hex().upper()
+
+    def _op_write(self, message: dict) -> bool:
+        """write: write {block, data}, authenticating first if a key is given"""
+        self._require_card()
+        self._authenticate(message)
+        if not self.card_operations.write_block(int(message["block"]), bytes.fromhex(message["data"])):
+            raise ReaderServiceError(f"Could not write block {message['block']}")
+        return True
+
+    def _op_dump(self, message: dict) -> dict:
+        """dump: read {sectors} with {key_map} (known keys are used as well)"""
+        self._require_card()
+        key_map = key_map_from_dict(message.get("key_map", {}))
+        image = self.dump_engine.dump(key_map, message.get("sectors"))
+        return {
+            "uid": image.uid.hex().upper() if image.uid else None,
+            "blocks": {str(block): image.get_block(block).hex().upper()
+                       for block in range(image.block_count) if image.has_block(block)},
+            "key_map": key_map_to_dict(image.key_map),
+            "failed_sectors": self.dump_engine.last_report["failed_sectors"]
+        }
+
+    def _op_keymap(self, message: dict) -> dict:
+        """keymap: keys known for the card in the field"""
+        return key_map_to_dict(self.auth_manager.get_key_map())
+
+    def _op_metrics(self, message: dict) -> dict:
+        """metrics: reader latencies and service counters"""
+        with self._condition:
+            clients = {str(client.client_id): {"served": client.served, "pending": len(client.requests),
+                                               "subscriptions": sorted(client.subscriptions)}
+                       for client in self._clients.values()}
+        return {
+            "reader": self.reader_manager.get_reader_info(),
+            "apdu_latency": self.reader_manager.apdu_latency.to_dict(),
+            "reactivation": self.reader_manager.get_reactivation_stats(),
+            "requests_served": self.requests_served,
+            "uptime_s": round(time.monotonic() - self.started, 3),
+            "clients": clients
+        }
+
+class ReaderServiceClient:
+    """Client of a running reader service
+
+    Responses are matched to requests by id, so several threads may share
+    one client; card events go to a separate queue read with next_event().
+    """
+
+    def __init__(self, path: Path = AppSettings.SERVICE_SOCKET_PATH, timeout: Optional[float] = 10.0):
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(str(path))
+        self._pending: Dict[int, queue.Queue] = {}
+        self._events: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._next_id = 1
+        self._closed = False
+        self._receiver = threading.Thread(target=self._receive_loop, daemon=True)
+        self._receiver.start()
+
+    def _receive_loop(self) -> None:
+        """Route responses to waiting calls and events to the event queue"""
+        try:
+            while True:
+                message = recv_frame(self.sock)
+                if message is None:
+                    break
+                if "event" in message:
+                    self._events.put(message)
+                    continue
+                with self._lock:
+                    waiter = self._pending.pop(message.get("id"), None)
+                if waiter is not None:
+                    waiter.put(message)
+        except (OSError, ValueError, ReaderServiceError):
+            pass
+        finally:
+            self._closed = True
+            with self._lock:
+                waiters, self._pending = list(self._pending.values()), {}
+            for waiter in waiters:
+                waiter.put({"ok": False, "error": "Service connection closed"})
+
+    def call(self, op: str, **params) -> Any:
+        """Run one operation on the service and return its result"""
+        if self._closed:
+            raise ReaderServiceError("Service connection closed")
+        waiter: queue.Queue = queue.Queue(maxsize=1)
+        with self._lock:
+            request_id = self._next_id
+            self._next_id += 1
+            self._pending[request_id] = waiter
+        message = dict(params, id=request_id, op=op)
+        with self._send_lock:
+            send_frame(self.sock, message)
+        try:
+            response = waiter.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise ReaderServiceError(f"No response to {op} within {self.timeout} s")
+        if not response.get("ok"):
+            raise ReaderServiceError(response.get("error", "Request failed"))
+        return response.get("result")
+
+    def subscribe(self, events=EVENTS) -> List[str]:
+        """Receive card arrival/removal events"""
+        return self.call("subscribe", events=list(events))
+
+    def next_event(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Get the next card event, None if none arrived within timeout"""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        """Disconnect from the service"""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self._receiver.join(timeout=1.0)
+
+    def __enter__(self) -> "ReaderServiceClient":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
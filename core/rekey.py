@@ -0,0 +1,346 @@
+"""
+Fleet Rekeying
+Rotates sector keys and access bits on cards presented back-to-back, with a per-UID journal
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Union
+
+from config.constants import CARD_TYPE_MIFARE_1K, CARD_TYPE_NAMES, DEFAULT_KEY, KEY_TYPE_A, KEY_TYPE_B
+from .access_conditions import (
+    DEFAULT_GENERAL_PURPOSE_BYTE, TRANSPORT_CONDITIONS, OP_READ_ACCESS, OP_READ_KEY_B,
+    build_trailer, encode_access_bits, get_sector_access
+)
+from .authentication import AuthenticationManager
+from .card_image import CARD_TYPE_SECTORS
+from .card_operations import CardOperations
+from .key_diversification import KeyDerivationEngine, KeyMap
+from .production import ProductionLine, ProductionResult
+
+logger = logging.getLogger(__name__)
+
+# Static key map, or per-UID diversification rule
+KeySource = Union[KeyMap, KeyDerivationEngine]
+
+EVENT_START = "start"        # card accepted, no sector touched yet
+EVENT_WRITTEN = "written"    # sector trailer written with the new keys
+EVENT_ALREADY = "already"    # sector already carried the new keys (earlier interrupted run)
+EVENT_VERIFIED = "verified"  # sector authenticated with the new keys and trailer read back
+EVENT_DONE = "done"          # every sector verified
+EVENT_FAILED = "failed"      # card left in an unknown mix of old and new keys
+
+class RekeyError(Exception):
+    """Raised when a rekey job is misconfigured"""
+
+class AccessProfile:
+    """Access bits and general purpose byte written together with the new keys"""
+
+    def __init__(self, access: Optional[bytes] = None, gpb: int = DEFAULT_GENERAL_PURPOSE_BYTE,
+                 sector_access: Optional[Dict[int, bytes]] = None):
+        self.access = bytes(access) if access is not None else encode_access_bits(TRANSPORT_CONDITIONS)
+        self.gpb = gpb
+        self.sector_access = {sector: bytes(value) for sector, value in (sector_access or {}).items()}
+        for sector, value in [(None, self.access)] + list(self.sector_access.items()):
+            if len(value) != 3 or get_sector_access(value) is None:
+                where = "default" if sector is None else f"sector {sector}"
+                raise RekeyError(f"Invalid access bits for {where}: {value.hex().upper()}")
+
+    def for_sector(self, sector: int) -> bytes:
+        """Get access bytes written to a sector"""
+        return self.sector_access.get(sector, self.access)
+
+    def warnings(self, sectors: Optional[Iterable[int]] = None) -> List[str]:
+        """Get warnings about sectors this profile makes impossible to change again"""
+        if sectors is None:
+            checks = [("All sectors", self.access)] + [
+                (f"Sector {sector}", access) for sector, access in sorted(self.sector_access.items())]
+        else:
+            checks = [(f"Sector {sector}", self.for_sector(sector)) for sector in sectors]
+        return [f"{where}: keys and access bits become PERMANENTLY unchangeable"
+                for where, access in checks if get_sector_access(access).is_permanently_locked()]
+
+class RekeyJournal:
+    """Append-only per-UID progress log of a rekey run
+
+    Every sector step is one JSON line, flushed to disk before the next
+    APDU, so a power cut or crash leaves a record of exactly which sectors
+    of which card already carry the new keys. Without a path the journal
+    is kept in memory only.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path is not None else None
+        self._cards: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    @staticmethod
+    def _uid_key(uid: bytes) -> str:
+        """Normalize UID into journal key"""
+        return uid.hex().upper()
+
+    def _load(self) -> None:
+        """Replay an existing journal file"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    # A torn last line is expected after a crash
+                    logger.warning(f"Rekey journal {self.path}:{line_number} skipped: {e}")
+
+    def _apply(self, entry: dict) -> None:
+        """Fold one journal entry into the per-card state"""
+        card = self._cards.setdefault(entry["uid"], {"status": EVENT_START, "sectors": {}, "error": None})
+        event = entry["event"]
+        if event in (EVENT_WRITTEN, EVENT_ALREADY, EVENT_VERIFIED):
+            card["sectors"][int(entry["sector"])] = event
+        else:
+            card["status"] = event
+            card["error"] = entry.get("error")
+            if event == EVENT_START:
+                card["sectors"] = {}
+
+    def record(self, uid: bytes, event: str, sector: Optional[int] = None, error: Optional[str] = None) -> None:
+        """Append one event for a card"""
+        entry = {"time": round(time.time(), 3), "uid": self._uid_key(uid), "event": event}
+        if sector is not None:
+            entry["sector"] = sector
+        if error is not None:
+            entry["error"] = error
+        with self._lock:
+            self._apply(entry)
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def get(self, uid: bytes) -> Optional[dict]:
+        """Get journal state of a card ({"status", "sectors", "error"}), None if never seen"""
+        with self._lock:
+            card = self._cards.get(self._uid_key(uid))
+            return None if card is None else {"status": card["status"], "sectors": dict(card["sectors"]),
+                                              "error": card["error"]}
+
+    def completed_uids(self) -> Set[bytes]:
+        """Get UIDs of cards fully rekeyed and verified"""
+        with self._lock:
+            return {bytes.fromhex(uid) for uid, card in self._cards.items() if card["status"] == EVENT_DONE}
+
+    def incomplete_uids(self) -> Set[bytes]:
+        """Get UIDs of cards started but not verified (possibly half-rekeyed)"""
+        with self._lock:
+            return {bytes.fromhex(uid) for uid, card in self._cards.items() if card["status"] != EVENT_DONE}
+
+    def to_dict(self) -> dict:
+        """Get journal totals"""
+        with self._lock:
+            statuses = [card["status"] for card in self._cards.values()]
+        return {
+            "cards": len(statuses),
+            "done": statuses.count(EVENT_DONE),
+            "incomplete": len(statuses) - statuses.count(EVENT_DONE)
+        }
+
+class RekeyJob:
+    """Rekey template for the production loop
+
+    write() authenticates every sector with its old key and writes the new
+    trailer; verify() authenticates with each new key and reads the access
+    bits back. A sector whose old keys are rejected but whose new Key A
+    works is taken as already rekeyed, so a card interrupted half-way is
+    finished when it is presented again. Keys come from static key maps or
+    from diversification engines deriving them from the UID.
+
+    Run it with create_line(); describe() gives the summary shown in the
+    single confirmation before a run.
+
+    The reader cannot tell a 4K card from a 1K card, so card_type says
+    which layout the cards have; a 4K job addresses sectors 32-39 by
+    their 16-block layout.
+    """
+
+    def __init__(self, old_keys: Optional[KeySource], new_keys: KeySource, profile: Optional[AccessProfile] = None,
+                 sectors: Optional[Iterable[int]] = None, journal: Optional[RekeyJournal] = None,
+                 default_key: bytes = DEFAULT_KEY, card_type: int = CARD_TYPE_MIFARE_1K):
+        if card_type not in CARD_TYPE_SECTORS:
+            raise RekeyError(f"Unsupported card type: {card_type}")
+        self.old_keys = old_keys if old_keys is not None else {}
+        self.new_keys = new_keys
+        self.profile = profile or AccessProfile()
+        self.sectors = sorted(sectors) if sectors is not None else None
+        self.journal = journal or RekeyJournal()
+        self.default_key = default_key
+        self.card_type = card_type
+        self._card_keys: Optional[tuple] = None  # (uid, old key map, new key map) of the card in the field
+        if isinstance(new_keys, KeyDerivationEngine):
+            if self.sectors is None:
+                # The reader reports every card as 1K, so "all sectors" would leave 4K sectors 16-39 untouched
+                raise RekeyError("Diversified new keys need an explicit sector list")
+        else:
+            for sector in self.sectors if self.sectors is not None else new_keys:
+                self._new_sector_keys(new_keys, sector)
+        sectors = self.sectors if self.sectors is not None else sorted(new_keys)
+        outside = [sector for sector in sectors if not 0 <= sector < CARD_TYPE_SECTORS[card_type]]
+        if outside:
+            raise RekeyError(f"Sectors {outside} do not exist on a {CARD_TYPE_NAMES[card_type]} card")
+
+    def _new_sector_keys(self, key_map: KeyMap, sector: int) -> Dict[int, bytes]:
+        """Get new Key A and Key B of a sector"""
+        keys = key_map.get(sector, {})
+        if KEY_TYPE_A not in keys or KEY_TYPE_B not in keys:
+            raise RekeyError(f"New Key A and Key B are needed for sector {sector}")
+        return keys
+
+    def _use_layout(self, card_operations: CardOperations) -> None:
+        """Address the card in the field with the block layout of the job's card type"""
+        if card_operations.card_info.card_type != self.card_type:
+            card_operations.set_card_type(self.card_type)
+
+    def _card_sectors(self, card_operations: CardOperations) -> List[int]:
+        """Get sectors rekeyed on the card in the field"""
+        if self.sectors is not None:
+            return self.sectors
+        return sorted(self.new_keys)
+
+    @staticmethod
+    def _resolve(source: KeySource, uid: bytes, sector_count: int) -> KeyMap:
+        """Get the key map of one card"""
+        if isinstance(source, KeyDerivationEngine):
+            return source.derive_card_keys(uid, sector_count)
+        return source
+
+    def _keys_for(self, card_operations: CardOperations) -> tuple:
+        """Get (uid, old key map, new key map) of the card in the field"""
+        uid = card_operations.card_info.uid
+        if self._card_keys is None or self._card_keys[0] != uid:
+            sector_count = CARD_TYPE_SECTORS[self.card_type]
+            self._card_keys = (uid, self._resolve(self.old_keys, uid, sector_count),
+                               self._resolve(self.new_keys, uid, sector_count))
+        return self._card_keys
+
+    def build_trailer(self, new_keys: KeyMap, sector: int) -> bytes:
+        """Get the trailer written to a sector"""
+        keys = self._new_sector_keys(new_keys, sector)
+        return build_trailer(keys[KEY_TYPE_A], self.profile.for_sector(sector), keys[KEY_TYPE_B], self.profile.gpb)
+
+    def describe(self) -> List[str]:
+        """Get a summary of the run for the up-front confirmation"""
+        sectors = self.sectors if self.sectors is not None else sorted(self.new_keys)
+
+        def source_text(source: KeySource) -> str:
+            return "diversified from UID" if isinstance(source, KeyDerivationEngine) else "key map"
+
+        lines = [
+            "Sectors: " + ", ".join(str(sector) for sector in sectors),
+            f"Card type: {CARD_TYPE_NAMES[self.card_type]}",
+            f"Old keys: {source_text(self.old_keys)}",
+            f"New keys: {source_text(self.new_keys)}",
+            f"Access bits: {self.profile.access.hex().upper()}, GPB {self.profile.gpb:02X}"
+        ]
+        for sector, access in sorted(self.profile.sector_access.items()):
+            lines.append(f"Sector {sector} access bits: {access.hex().upper()}")
+        lines.extend(self.profile.warnings(sectors))
+        completed = len(self.journal.completed_uids())
+        if completed:
+            lines.append(f"{completed} cards already rekeyed in the journal are skipped")
+        return lines
+
+    def _old_candidates(self, old_keys: KeyMap, sector: int) -> List[tuple]:
+        """Get (key_type, key) pairs to try with the old trailer"""
+        keys = old_keys.get(sector) or {KEY_TYPE_A: self.default_key}
+        return [(key_type, keys[key_type]) for key_type in (KEY_TYPE_A, KEY_TYPE_B) if key_type in keys]
+
+    def _write_sector(self, card_operations: CardOperations, auth_manager: AuthenticationManager,
+                      uid: bytes, sector: int, old_keys: KeyMap, trailer: bytes) -> bool:
+        """Write the new trailer of one sector"""
+        trailer_block = card_operations.card_info.get_trailer_block(sector)
+        for key_type, key in self._old_candidates(old_keys, sector):
+            if not auth_manager.authenticate_sector(sector, key_type, key):
+                continue
+            if card_operations.write_block(trailer_block, trailer):
+                self.journal.record(uid, EVENT_WRITTEN, sector)
+                return True
+
+        # Old keys rejected: an interrupted run may have rekeyed this sector already
+        # (verify() still checks its access bits and Key B)
+        if auth_manager.authenticate_sector(sector, KEY_TYPE_A, trailer[0:6]):
+            self.journal.record(uid, EVENT_ALREADY, sector)
+            return True
+        logger.warning(f"Rekey: sector {sector} of {uid.hex().upper()} rejects old and new keys")
+        return False
+
+    def _verify_sector(self, card_operations: CardOperations, auth_manager: AuthenticationManager,
+                       sector: int, trailer: bytes) -> bool:
+        """Authenticate with the new keys and compare the trailer read back"""
+        access = get_sector_access(trailer[6:9])
+        if not auth_manager.authenticate_sector(sector, KEY_TYPE_A, trailer[0:6]):
+            return False
+        key_b_checked = False
+        if access.is_allowed(3, OP_READ_ACCESS, KEY_TYPE_A):
+            data = card_operations.read_block(card_operations.card_info.get_trailer_block(sector))
+            if data is None or data[6:10] != trailer[6:10]:
+                logger.warning(f"Rekey verify: sector {sector} access bits differ")
+                return False
+            if access.is_allowed(3, OP_READ_KEY_B, KEY_TYPE_A):
+                if data[10:16] != trailer[10:16]:
+                    logger.warning(f"Rekey verify: sector {sector} Key B differs")
+                    return False
+                key_b_checked = True
+        # Key B is unreadable here, so prove it by authenticating with it
+        return key_b_checked or auth_manager.authenticate_sector(sector, KEY_TYPE_B, trailer[10:16])
+
+    def write(self, card_operations: CardOperations, auth_manager: AuthenticationManager) -> bool:
+        """Write the new trailers of the card in the field"""
+        self._use_layout(card_operations)
+        uid, old_keys, new_keys = self._keys_for(card_operations)
+        self.journal.record(uid, EVENT_START)
+        for sector in self._card_sectors(card_operations):
+            trailer = self.build_trailer(new_keys, sector)
+            if not self._write_sector(card_operations, auth_manager, uid, sector, old_keys, trailer):
+                return False
+        return True
+
+    def verify(self, card_operations: CardOperations, auth_manager: AuthenticationManager) -> bool:
+        """Check every new key and access byte took effect"""
+        self._use_layout(card_operations)
+        uid, _, new_keys = self._keys_for(card_operations)
+        for sector in self._card_sectors(card_operations):
+            if not self._verify_sector(card_operations, auth_manager, sector, self.build_trailer(new_keys, sector)):
+                logger.warning(f"Rekey verify: sector {sector} of {uid.hex().upper()} failed")
+                return False
+            self.journal.record(uid, EVENT_VERIFIED, sector)
+        return True
+
+    def on_result(self, result: ProductionResult) -> None:
+        """Close the journal entry of a card (ProductionLine callback)"""
+        if result.duplicate:
+            return
+        if result.success:
+            self.journal.record(result.uid, EVENT_DONE)
+        else:
+            state = self.journal.get(result.uid)
+            touched = sorted(state["sectors"]) if state else []
+            self.journal.record(result.uid, EVENT_FAILED, error=f"{result.failed_stage} failed")
+            logger.error(f"Rekey of {result.uid.hex().upper()} failed at {result.failed_stage}; "
+                         f"sectors already changed: {touched or 'none'}")
+
+    def create_line(self, card_operations: CardOperations, auth_manager: AuthenticationManager,
+                    on_result: Optional[Callable[[ProductionResult], None]] = None, **kwargs) -> ProductionLine:
+        """Get a production loop running this job, skipping cards the journal lists as done"""
+        def record(result: ProductionResult) -> None:
+            self.on_result(result)
+            if on_result is not None:
+                on_result(result)
+
+        return ProductionLine(card_operations, auth_manager, self,
+                              processed_uids=self.journal.completed_uids(), on_result=record, **kwargs)
@@ -0,0 +1,458 @@
+"""
+Remote Reader Bridge
+TCP agent exposing a local reader and the matching connection for ReaderManager
+"""
+
+import hmac
+import ipaddress
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from smartcard.Exceptions import CardConnectionException, NoCardException
+
+from config.constants import AppSettings, ESCAPE_COMMAND
+from .reader_manager import ApduBatchError, ReaderManager
+
+logger = logging.getLogger(__name__)
+
+# Frame: type byte and payload length, then the payload; all integers big-endian
+FRAME_HEADER = struct.Struct(">BI")
+MAX_FRAME_SIZE = 1024 * 1024
+
+REQUEST_TRANSMIT = 0x01  # u16 count, u16 required, then count x (u16 length, APDU)
+REQUEST_CONTROL = 0x02  # u32 control code, escape command
+REQUEST_ATR = 0x03
+REQUEST_RECONNECT = 0x04  # u32 disposition
+REQUEST_HELLO = 0x05  # shared token; first request on a connection to an agent with a token
+RESPONSE_OK = 0x80  # results
+RESPONSE_ERROR = 0x81  # u8 error kind, results completed before the error, UTF-8 message
+
+ERROR_CONNECTION = 0
+ERROR_NO_CARD = 1
+
+_U16 = struct.Struct(">H")
+_U32 = struct.Struct(">I")
+
+# Reader escape commands clients may send (ACR1252U escape IOCTL only)
+ALLOWED_CONTROL_CODES = frozenset({ESCAPE_COMMAND})
+
+Result = Tuple[List[int], int, int]
+
+class BridgeProtocolError(Exception):
+    """Raised for malformed bridge frames"""
+
+def encode_commands(commands: List[List[int]], required: int) -> bytes:
+    """Encode an APDU batch"""
+    parts = [_U16.pack(len(commands)), _U16.pack(required)]
+    for command in commands:
+        parts.append(_U16.pack(len(command)))
+        parts.append(bytes(command))
+    return b"".join(parts)
+
+def decode_commands(payload: bytes) -> Tuple[List[List[int]], int]:
+    """Decode an APDU batch"""
+    (count,) = _U16.unpack_from(payload, 0)
+    (required,) = _U16.unpack_from(payload, 2)
+    offset = 4
+    commands = []
+    for _ in range(count):
+        (length,) = _U16.unpack_from(payload, offset)
+        offset += 2
+        commands.append(list(payload[offset:offset + length]))
+        offset += length
+    if offset != len(payload):
+        raise BridgeProtocolError("Trailing bytes after APDU batch")
+    return commands, required
+
+def encode_results(results: List[Result]) -> bytes:
+    """Encode responses, each as data followed by SW1 SW2"""
+    parts = [_U16.pack(len(results))]
+    for response, sw1, sw2 in results:
+        parts.append(_U16.pack(len(response) + 2))
+        parts.append(bytes(response) + bytes([sw1, sw2]))
+    return b"".join(parts)
+
+def decode_results(payload: bytes, offset: int = 0) -> Tuple[List[Result], int]:
+    """Decode responses
+
+    Returns:
+        tuple: (results, offset after them)
+    """
+    (count,) = _U16.unpack_from(payload, offset)
+    offset += 2
+    results = []
+    for _ in range(count):
+        (length,) = _U16.unpack_from(payload, offset)
+        offset += 2
+        data = payload[offset:offset + length]
+        if len(data) != length or length < 2:
+            raise BridgeProtocolError("Truncated response")
+        results.append((list(data[:-2]), data[-2], data[-1]))
+        offset += length
+    return results, offset
+
+def send_frame(sock: socket.socket, frame_type: int, payload: bytes = b"") -> None:
+    """Send one frame"""
+    sock.sendall(FRAME_HEADER.pack(frame_type, len(payload)) + payload)
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    """Receive size bytes, None if the peer closed first"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+def recv_frame(sock: socket.socket) -> Optional[Tuple[int, bytes]]:
+    """Receive one frame, None on a clean disconnect"""
+    header = _recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    frame_type, size = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise BridgeProtocolError(f"Frame of {size} bytes exceeds the limit")
+    payload = _recv_exactly(sock, size)
+    if payload is None:
+        raise BridgeProtocolError("Connection closed inside a frame")
+    return frame_type, payload
+
+def _is_loopback(host: str) -> bool:
+    """Check whether host only accepts connections from this machine"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class ReaderBridgeAgent:
+    """Serves a local reader to remote ReaderManagers over TCP
+
+    Runs on the machine the reader is attached to. Requests from all
+    clients are executed one at a time; an APDU batch runs to its end
+    here, so the network is crossed once per batch instead of once per
+    APDU.
+
+    The agent listens on loopback by default. With a token, a client's
+    first request must present it; listening on other interfaces without
+    one needs allow_unauthenticated. Only the reader escape command is
+    accepted as a control request.
+    """
+
+    def __init__(self, reader_manager: ReaderManager, host: str = AppSettings.BRIDGE_HOST,
+                 port: int = AppSettings.BRIDGE_PORT, token: Optional[bytes] = None,
+                 allow_unauthenticated: bool = False):
+        if token is None and not allow_unauthenticated and not _is_loopback(host):
+            raise ValueError(f"Listening on {host} needs a token or allow_unauthenticated")
+        self.reader_manager = reader_manager
+        self.host = host
+        self.port = port
+        self.token = token
+        self.batches = 0
+        self.apdus = 0
+        self._lock = threading.Lock()
+        self._server: Optional[socket.socket] = None
+        self._clients: List[socket.socket] = []
+        self._running = False
+        self._acceptor: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """Get bound (host, port); port 0 is resolved after start()"""
+        return self._server.getsockname()[:2] if self._server else (self.host, self.port)
+
+    def start(self) -> None:
+        """Listen and start accepting clients"""
+        self._server = socket.create_server((self.host, self.port))
+        self._running = True
+        self._acceptor = threading.Thread(target=self._accept_loop, daemon=True)
+        self._acceptor.start()
+        logger.info(f"Reader bridge listening on {self.address[0]}:{self.address[1]}")
+
+    def stop(self) -> None:
+        """Stop listening and disconnect clients"""
+        self._running = False
+        if self._server is not None:
+            try:
+                self._server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._server.close()
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            self._close_client(client)
+        if self._acceptor is not None:
+            self._acceptor.join(timeout=2.0)
+        logger.info("Reader bridge stopped")
+
+    def disconnect_clients(self) -> None:
+        """Drop every client connection (they reconnect on their next request)"""
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            self._close_client(client)
+
+    def __enter__(self) -> "ReaderBridgeAgent":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    @staticmethod
+    def _close_client(client: socket.socket) -> None:
+        """Shut a client socket down so its serving thread wakes up"""
+        try:
+            client.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        client.close()
+
+    def _accept_loop(self) -> None:
+        """Accept clients and serve each in its own thread"""
+        while self._running:
+            try:
+                client, address = self._server.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._clients.append(client)
+            threading.Thread(target=self._serve, args=(client, address), daemon=True).start()
+            logger.info(f"Bridge client connected from {address[0]}:{address[1]}")
+
+    def _serve(self, client: socket.socket, address) -> None:
+        """Answer the requests of one client"""
+        authorized = self.token is None
+        try:
+            while self._running:
+                frame = recv_frame(client)
+                if frame is None:
+                    break
+                request_type, payload = frame
+                if request_type == REQUEST_HELLO:
+                    authorized = self.token is None or hmac.compare_digest(payload, self.token)
+                    if not authorized:
+                        logger.warning(f"Bridge client {address[0]}:{address[1]} presented a wrong token")
+                        send_frame(client, *self._error(PermissionError("Wrong bridge token")))
+                        break
+                    send_frame(client, RESPONSE_OK)
+                    continue
+                if not authorized:
+                    logger.warning(f"Bridge client {address[0]}:{address[1]} sent a request without a token")
+                    send_frame(client, *self._error(PermissionError("Bridge token required")))
+                    break
+                with self._lock:
+                    response_type, payload = self.handle(request_type, payload)
+                send_frame(client, response_type, payload)
+        except (OSError, BridgeProtocolError, struct.error) as e:
+            logger.debug(f"Bridge client {address[0]}:{address[1]} dropped: {e}")
+        finally:
+            with self._lock:
+                if client in self._clients:
+                    self._clients.remove(client)
+            client.close()
+            logger.info(f"Bridge client {address[0]}:{address[1]} disconnected")
+
+    @staticmethod
+    def _error(error: Exception, results: Optional[List[Result]] = None) -> Tuple[int, bytes]:
+        """Build an error response"""
+        cause = error.__cause__ if isinstance(error, ApduBatchError) and error.__cause__ else error
+        kind = ERROR_NO_CARD if isinstance(cause, NoCardException) else ERROR_CONNECTION
+        return RESPONSE_ERROR, bytes([kind]) + encode_results(results or []) + str(error).encode("utf-8")
+
+    def handle(self, request_type: int, payload: bytes) -> Tuple[int, bytes]:
+        """Execute one request on the local reader"""
+        connection = self.reader_manager.connection
+        try:
+            if request_type == REQUEST_TRANSMIT:
+                commands, required = decode_commands(payload)
+                self.batches += 1
+                try:
+                    results = self.reader_manager.send_apdu_batch(commands, required)
+                except ApduBatchError as e:
+                    self.apdus += len(e.results)
+                    return self._error(e, e.results)
+                self.apdus += len(results)
+                return RESPONSE_OK, encode_results(results)
+            if connection is None:
+                raise CardConnectionException("Reader not connected")
+            if request_type == REQUEST_CONTROL:
+                (code,) = _U32.unpack_from(payload, 0)
+                if code not in ALLOWED_CONTROL_CODES:
+                    raise PermissionError(f"Control code {code:#x} is not allowed")
+                response, sw1, sw2 = connection.control(code, list(payload[4:]))
+                return RESPONSE_OK, encode_results([(response, sw1, sw2)])
+            if request_type == REQUEST_ATR:
+                return RESPONSE_OK, bytes(connection.getATR())
+            if request_type == REQUEST_RECONNECT:
+                (disposition,) = _U32.unpack_from(payload, 0)
+                connection.reconnect(disposition=disposition)
+                return RESPONSE_OK, b""
+            raise BridgeProtocolError(f"Unknown request type {request_type:#04x}")
+        except (BridgeProtocolError, struct.error):
+            raise
+        except Exception as e:
+            return self._error(e)
+
+class RemoteConnection:
+    """PC/SC-style connection to a reader behind a ReaderBridgeAgent
+
+    Used by ReaderManager in place of a local card connection. A dropped
+    TCP connection is re-established transparently, but a request is only
+    sent again if it never reached the agent: once it was sent, a lost
+    response fails the request, since the agent may already have run it
+    (a write batch must not run twice). transmit_batch() sends many APDUs
+    in one round-trip.
+    """
+
+    def __init__(self, host: str, port: int = AppSettings.BRIDGE_PORT,
+                 connect_timeout: float = AppSettings.BRIDGE_CONNECT_TIMEOUT / 1000.0,
+                 response_timeout: float = AppSettings.BRIDGE_RESPONSE_TIMEOUT / 1000.0,
+                 reconnect_attempts: int = AppSettings.BRIDGE_RECONNECT_ATTEMPTS,
+                 reconnect_delay: float = AppSettings.BRIDGE_RECONNECT_DELAY / 1000.0,
+                 token: Optional[bytes] = None):
+        self.host = host
+        self.port = port
+        self.name = f"tcp://{host}:{port}"
+        self.connect_timeout = connect_timeout
+        self.response_timeout = response_timeout
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.token = token
+        self.round_trips = 0
+        self.apdus = 0
+        self.reconnects = 0
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._open()
+
+    def _open(self) -> None:
+        """Open the TCP connection to the agent"""
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.response_timeout)
+        if self.token is not None:
+            try:
+                send_frame(sock, REQUEST_HELLO, self.token)
+                frame = recv_frame(sock)
+            except (OSError, BridgeProtocolError):
+                sock.close()
+                raise
+            if frame is None or frame[0] != RESPONSE_OK:
+                sock.close()
+                raise CardConnectionException(f"Remote reader {self.name} rejected the token")
+        self._sock = sock
+
+    def _close_socket(self) -> None:
+        """Close the current TCP connection"""
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _connection_dropped(self) -> bool:
+        """Check whether the agent closed the idle connection (it is readable only then)"""
+        try:
+            return bool(select.select([self._sock], [], [], 0)[0])
+        except (OSError, ValueError):
+            return True
+
+    def _request(self, request_type: int, payload: bytes = b"") -> Tuple[int, bytes]:
+        """Send one request and wait for its response, reconnecting as needed"""
+        with self._lock:
+            delay = self.reconnect_delay
+            for attempt in range(self.reconnect_attempts + 1):
+                sent = False
+                try:
+                    if self._sock is not None and self._connection_dropped():
+                        self._close_socket()
+                    if self._sock is None:
+                        self._open()
+                        self.reconnects += 1
+                        logger.info(f"Reconnected to {self.name}")
+                    send_frame(self._sock, request_type, payload)
+                    sent = True
+                    frame = recv_frame(self._sock)
+                    if frame is None:
+                        raise ConnectionError("Agent closed the connection")
+                    self.round_trips += 1
+                    return frame
+                except (OSError, BridgeProtocolError) as e:
+                    self._close_socket()
+                    if sent:
+                        # The agent may have run the request; only the caller can tell if it is safe to repeat
+                        raise CardConnectionException(f"No response from remote reader {self.name}: {e}")
+                    if attempt == self.reconnect_attempts:
+                        raise CardConnectionException(f"Remote reader {self.name} unreachable: {e}")
+                    logger.warning(f"Connection to {self.name} lost ({e}), reconnecting")
+                    time.sleep(delay)
+                    delay *= 2
+
+    @staticmethod
+    def _raise_error(payload: bytes) -> None:
+        """Raise the exception described by an error response"""
+        results, offset = decode_results(payload, 1)
+        message = payload[offset:].decode("utf-8", errors="replace")
+        if payload[0] == ERROR_NO_CARD and not results:
+            raise NoCardException(message)
+        raise ApduBatchError(message, results)
+
+    def transmit_batch(self, commands: List[List[int]], required: Optional[int] = None) -> List[Result]:
+        """Run APDUs on the remote reader in one round-trip (see ReaderManager.send_apdu_batch)"""
+        if required is None:
+            required = len(commands)
+        response_type, payload = self._request(REQUEST_TRANSMIT, encode_commands(commands, required))
+        if response_type == RESPONSE_ERROR:
+            self._raise_error(payload)
+        results, _ = decode_results(payload)
+        self.apdus += len(results)
+        return results
+
+    def transmit(self, command: List[int]) -> Result:
+        """Send one APDU"""
+        return self.transmit_batch([command])[0]
+
+    def control(self, code: int, command: List[int]) -> Result:
+        """Send a reader escape command"""
+        response_type, payload = self._request(REQUEST_CONTROL, _U32.pack(code) + bytes(command))
+        if response_type == RESPONSE_ERROR:
+            self._raise_error(payload)
+        return decode_results(payload)[0][0]
+
+    def getATR(self) -> List[int]:
+        """Get ATR of the card in the remote field"""
+        response_type, payload = self._request(REQUEST_ATR)
+        if response_type == RESPONSE_ERROR:
+            self._raise_error(payload)
+        return list(payload)
+
+    def reconnect(self, disposition: int = 0) -> None:
+        """Reconnect the agent's card connection (card reset)"""
+        response_type, payload = self._request(REQUEST_RECONNECT, _U32.pack(disposition))
+        if response_type == RESPONSE_ERROR:
+            self._raise_error(payload)
+
+    def disconnect(self) -> None:
+        """Close the connection to the agent"""
+        with self._lock:
+            self._close_socket()
+
+    def to_dict(self) -> dict:
+        """Get transport statistics"""
+        return {
+            "agent": self.name,
+            "round_trips": self.round_trips,
+            "apdus": self.apdus,
+            "reconnects": self.reconnects
+        }
@@ -15,11 +15,16 @@ from config.settings import settings
 from core.reader_manager import ReaderManager, ReaderStatus
 from core.card_operations import CardOperations
 from core.authentication import AuthenticationManager
+from core.access_planner import AccessPlanner
+from core.key_cache import KeyCache
+from core.key_vault import KeyVault
 from gui.widgets.reader_panel import ReaderPanel
 from gui.widgets.card_panel import CardPanel
 from gui.widgets.auth_panel import AuthPanel
 from gui.widgets.block_panel import BlockPanel
 from gui.widgets.security_panel import SecurityPanel
+from gui.widgets.production_panel import ProductionPanel
+from gui.widgets.rekey_panel import RekeyPanel
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +37,13 @@ class MainWindow(QMainWindow):
         # Initialize core components
         self.reader_manager = ReaderManager()
         self.card_operations = CardOperations(self.reader_manager)
-        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations)
+        key_cache = KeyCache() if settings.get('operations.remember_card_keys', True) else None
+        self.key_vault = KeyVault()
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations,
+                                                  key_cache, self.key_vault)
+        self.access_planner = AccessPlanner(self.card_operations, self.auth_manager)
+        
+        self.reader_runs = set()  # background runs that own the reader
         
         # Setup UI
         self.setup_ui()
@@ -78,7 +89,7 @@ class MainWindow(QMainWindow):
         left_layout.addWidget(self.card_panel)
         
         # Authentication panel
-        self.auth_panel = AuthPanel(self.auth_manager, self.card_operations)
+        self.auth_panel = AuthPanel(self.auth_manager, self.card_operations, self.access_planner)
         left_layout.addWidget(self.auth_panel)
         
         left_layout.addStretch()
@@ -96,6 +107,14 @@ class MainWindow(QMainWindow):
         self.security_panel = SecurityPanel(self.card_operations, self.auth_manager)
         right_layout.addWidget(self.security_panel)
         
+        # Production encoding panel
+        self.production_panel = ProductionPanel(self.card_operations, self.auth_manager)
+        right_layout.addWidget(self.production_panel)
+        
+        # Fleet rekey panel
+        self.rekey_panel = RekeyPanel(self.card_operations, self.auth_manager)
+        right_layout.addWidget(self.rekey_panel)
+        
         right_layout.addStretch()
         splitter.addWidget(right_panel)
         
@@ -156,6 +175,10 @@ class MainWindow(QMainWindow):
         
         # Block operations updates
         self.block_panel.operation_completed.connect(self.on_operation_completed)
+        
+        # Production runs own the reader
+        self.production_panel.production_running.connect(self.on_production_running)
+        self.rekey_panel.rekey_running.connect(self.on_rekey_running)
     
     def auto_connect_reader(self):
         """Auto-connect to reader if available"""
@@ -189,6 +212,8 @@ class MainWindow(QMainWindow):
         self.card_panel.update_card_info()
         self.auth_panel.update_ui_state()
         self.block_panel.update_ui_state()
+        self.production_panel.update_ui_state()
+        self.rekey_panel.update_ui_state()
     
     def on_authentication_success(self, sector: int):
         """Handle successful authentication"""
@@ -202,6 +227,35 @@ class MainWindow(QMainWindow):
         else:
             self.status_bar.showMessage(f"{operation} failed")
     
+    def on_production_running(self, running: bool):
+        """Production encoding owns the reader while it runs"""
+        self.set_reader_run("production", running)
+        self.status_bar.showMessage("Production encoding running" if running else "Production encoding stopped")
+    
+    def on_rekey_running(self, running: bool):
+        """Fleet rekey owns the reader while it runs"""
+        self.set_reader_run("rekey", running)
+        self.status_bar.showMessage("Fleet rekey running" if running else "Fleet rekey stopped")
+    
+    def set_reader_run(self, name: str, running: bool):
+        """Track background runs; while any runs, the other run and manual operations are blocked"""
+        if running:
+            self.reader_runs.add(name)
+        else:
+            self.reader_runs.discard(name)
+        busy = bool(self.reader_runs)
+        
+        self.production_panel.set_reader_busy("rekey" in self.reader_runs)
+        self.rekey_panel.set_reader_busy("production" in self.reader_runs)
+        for panel in (self.auth_panel, self.block_panel, self.security_panel):
+            panel.setEnabled(not busy)
+        
+        # Card monitoring resumes only when no run owns the reader
+        if busy:
+            self.card_monitor_timer.stop()
+        elif not self.card_monitor_timer.isActive():
+            self.card_monitor_timer.start(1000)
+    
     def refresh_card(self):
         """Refresh card information"""
         if self.reader_manager.is_connected():
@@ -239,13 +293,18 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         """Handle application close"""
         try:
-            # Stop timers
+            # Stop timers and the production loop
             self.card_monitor_timer.stop()
+            self.production_panel.stop_production()
+            self.rekey_panel.stop_rekey()
             
             # Disconnect reader
             if self.reader_manager.is_connected():
                 self.reader_manager.disconnect()
             
+            # Drop decrypted key material
+            self.key_vault.lock()
+            
             # Save settings
             settings.save_settings()
             
@@ -6,15 +6,18 @@ import logging
 from PyQt5.QtWidgets import (
     QGroupBox, QVBoxLayout, QHBoxLayout, QLabel, 
     QPushButton, QComboBox, QLineEdit, QCheckBox,
-    QSpinBox, QMessageBox
+    QSpinBox, QMessageBox, QInputDialog, QFileDialog
 )
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QFont
 
 from config.constants import KEY_TYPE_A, KEY_TYPE_B, KEY_TYPE_NAMES
+from core.access_conditions import OP_READ, OP_WRITE
+from core.access_planner import AccessPlanner
 from core.authentication import AuthenticationManager
 from core.card_operations import CardOperations
-from core.data_utils import is_valid_hex_string
+from core.data_utils import is_valid_hex_string, get_sector_first_block, get_sector_block_count
+from core.key_vault import KeySet
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +27,12 @@ class AuthPanel(QGroupBox):
     authentication_success = pyqtSignal(int)  # sector
     authentication_failed = pyqtSignal(int)   # sector
     
-    def __init__(self, auth_manager: AuthenticationManager, card_operations: CardOperations):
+    def __init__(self, auth_manager: AuthenticationManager, card_operations: CardOperations,
+                 planner: AccessPlanner = None):
         super().__init__("Authentication")
         self.auth_manager = auth_manager
         self.card_operations = card_operations
+        self.planner = planner if planner is not None else AccessPlanner(card_operations, auth_manager)
         self.setup_ui()
         self.update_ui_state()
     
@@ -54,11 +59,34 @@ class AuthPanel(QGroupBox):
         self.key_type_combo = QComboBox()
         self.key_type_combo.addItem("Key A", KEY_TYPE_A)
         self.key_type_combo.addItem("Key B", KEY_TYPE_B)
+        # Key type chosen from the sector's access conditions
+        self.key_type_combo.addItem("Auto (access bits)", None)
         key_type_layout.addWidget(self.key_type_combo)
         
         key_type_layout.addStretch()
         layout.addLayout(key_type_layout)
         
+        # Key set selection from the key vault
+        key_set_layout = QHBoxLayout()
+        key_set_layout.addWidget(QLabel("Key Set:"))
+        
+        self.key_set_combo = QComboBox()
+        self.key_set_combo.addItem("(manual key)", None)
+        self.key_set_combo.currentIndexChanged.connect(self.on_key_set_changed)
+        key_set_layout.addWidget(self.key_set_combo)
+        
+        self.unlock_vault_button = QPushButton("Unlock Vault")
+        self.unlock_vault_button.clicked.connect(self.unlock_vault)
+        self.unlock_vault_button.setEnabled(self.auth_manager.key_vault is not None)
+        key_set_layout.addWidget(self.unlock_vault_button)
+        
+        self.import_key_set_button = QPushButton("Import Key Set...")
+        self.import_key_set_button.clicked.connect(self.import_key_set)
+        self.import_key_set_button.setEnabled(False)
+        key_set_layout.addWidget(self.import_key_set_button)
+        
+        layout.addLayout(key_set_layout)
+        
         # Key input
         key_layout = QVBoxLayout()
         key_layout.addWidget(QLabel("Authentication Key:"))
@@ -113,8 +141,9 @@ class AuthPanel(QGroupBox):
         controls_enabled = reader_connected and card_info.present
         self.sector_spinbox.setEnabled(controls_enabled)
         self.key_type_combo.setEnabled(controls_enabled)
-        self.key_input.setEnabled(controls_enabled and not self.default_key_checkbox.isChecked())
-        self.default_key_checkbox.setEnabled(controls_enabled)
+        self.key_input.setEnabled(controls_enabled and not self.default_key_checkbox.isChecked()
+                                  and not self.selected_key_set())
+        self.default_key_checkbox.setEnabled(controls_enabled and not self.selected_key_set())
         self.try_defaults_button.setEnabled(controls_enabled)
         
         # Update authenticate button
@@ -155,7 +184,7 @@ class AuthPanel(QGroupBox):
             self.auth_button.setEnabled(False)
             return
         
-        if self.default_key_checkbox.isChecked():
+        if self.default_key_checkbox.isChecked() or self.selected_key_set():
             self.auth_button.setEnabled(True)
         else:
             key_valid = is_valid_hex_string(self.key_input.text(), 6)
@@ -171,22 +200,164 @@ class AuthPanel(QGroupBox):
         
         self.update_auth_button_state()
     
+    def selected_key_set(self):
+        """Get name of selected key set, or None for manual key entry"""
+        return self.key_set_combo.currentData()
+    
+    def on_key_set_changed(self, index):
+        """Handle key set selection change"""
+        self.update_ui_state()
+    
+    def unlock_vault(self):
+        """Ask for the vault passphrase and load key set names"""
+        key_vault = self.auth_manager.key_vault
+        if key_vault is None:
+            return
+        
+        if not key_vault.is_unlocked():
+            if not key_vault.exists():
+                if not self.create_vault():
+                    return
+            else:
+                passphrase, ok = QInputDialog.getText(
+                    self, "Unlock Key Vault", "Vault passphrase:", QLineEdit.Password
+                )
+                if not ok:
+                    return
+                if not key_vault.unlock(passphrase):
+                    QMessageBox.warning(self, "Key Vault", "Wrong passphrase or damaged vault file.")
+                    return
+        
+        self.reload_key_sets()
+        self.unlock_vault_button.setText("Reload Vault")
+        self.import_key_set_button.setEnabled(True)
+        self.update_ui_state()
+    
+    def create_vault(self) -> bool:
+        """Create a new vault after confirming and entering the passphrase twice"""
+        key_vault = self.auth_manager.key_vault
+        reply = QMessageBox.question(
+            self, "Create Key Vault",
+            f"No key vault found at {key_vault.vault_file}.\n\nCreate a new empty vault?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return False
+        
+        passphrase, ok = QInputDialog.getText(
+            self, "Create Key Vault", "New vault passphrase:", QLineEdit.Password
+        )
+        if not ok or not passphrase:
+            return False
+        confirmation, ok = QInputDialog.getText(
+            self, "Create Key Vault", "Repeat passphrase:", QLineEdit.Password
+        )
+        if not ok:
+            return False
+        if confirmation != passphrase:
+            QMessageBox.warning(self, "Key Vault", "Passphrases do not match.")
+            return False
+        
+        if not key_vault.create(passphrase):
+            QMessageBox.warning(self, "Key Vault", "Could not create the key vault.")
+            return False
+        return True
+    
+    def reload_key_sets(self):
+        """Fill the key set picker from the unlocked vault"""
+        key_vault = self.auth_manager.key_vault
+        self.key_set_combo.blockSignals(True)
+        self.key_set_combo.clear()
+        self.key_set_combo.addItem("(manual key)", None)
+        for name in key_vault.list_key_sets() + key_vault.list_masters():
+            self.key_set_combo.addItem(name, name)
+        self.key_set_combo.blockSignals(False)
+    
+    def import_key_set(self):
+        """Add a key set to the vault from a key map or dump file"""
+        key_vault = self.auth_manager.key_vault
+        if key_vault is None or not key_vault.is_unlocked():
+            return
+        
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Import Key Set", "",
+            "Key files (*.json *.mfd *.bin *.mct *.dump *.eml);;All Files (*)"
+        )
+        if not file_path:
+            return
+        name, ok = QInputDialog.getText(self, "Import Key Set", "Key set name:")
+        name = name.strip()
+        if not ok or not name:
+            return
+        if name in key_vault.list_key_sets() + key_vault.list_masters():
+            reply = QMessageBox.question(
+                self, "Import Key Set", f"Replace existing key set '{name}'?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+        
+        try:
+            key_vault.put_key_set(KeySet.from_file(name, file_path))
+            key_vault.save()
+        except (OSError, ValueError) as e:
+            logger.error(f"Key set import failed: {e}")
+            QMessageBox.warning(self, "Import Key Set", f"Could not import key set: {e}")
+            return
+        
+        self.reload_key_sets()
+        self.key_set_combo.setCurrentIndex(self.key_set_combo.findData(name))
+    
+    def data_block_requests(self, sector):
+        """Read and write requests for the data blocks of sector"""
+        first_block = get_sector_first_block(sector)
+        blocks = range(first_block, first_block + get_sector_block_count(sector) - 1)
+        return [(block, operation) for block in blocks for operation in (OP_READ, OP_WRITE)]
+    
+    def authenticate_auto(self, sector, keys):
+        """Authenticate with the key type the sector's access conditions favour
+        
+        Returns:
+            int: key type that authenticated, or None
+        """
+        keys = {key_type: key for key_type, key in keys.items() if key is not None}
+        self.planner.load_sector_access(sector, {sector: keys})
+        return self.planner.authenticate_for(sector, self.data_block_requests(sector), keys)
+    
     def authenticate(self):
         """Perform authentication"""
         try:
             sector = self.sector_spinbox.value()
             key_type = self.key_type_combo.currentData()
+            key_set_name = self.selected_key_set()
             
-            if self.default_key_checkbox.isChecked():
-                key_hex = "FFFFFFFFFFFF"
+            if key_set_name:
+                if key_type is None:
+                    keys = {kt: self.auth_manager.get_key_set_key(sector, kt, key_set_name)
+                            for kt in (KEY_TYPE_A, KEY_TYPE_B)}
+                    key_type = self.authenticate_auto(sector, keys)
+                    success = key_type is not None
+                else:
+                    success = self.auth_manager.authenticate_with_key_set(sector, key_type, key_set_name)
             else:
-                key_hex = self.key_input.text().replace(" ", "")
+                if self.default_key_checkbox.isChecked():
+                    key_hex = "FFFFFFFFFFFF"
+                else:
+                    key_hex = self.key_input.text().replace(" ", "")
+                
+                if key_type is None:
+                    key = bytes.fromhex(key_hex)
+                    key_type = self.authenticate_auto(sector, {KEY_TYPE_A: key, KEY_TYPE_B: key})
+                    success = key_type is not None
+                else:
+                    success = self.auth_manager.authenticate_with_key(sector, key_type, key_hex)
             
-            success = self.auth_manager.authenticate_with_key(sector, key_type, key_hex)
+            if self.auth_manager.key_cache:
+                self.auth_manager.key_cache.save()
             
             if success:
                 self.authentication_success.emit(sector)
-                self.status_label.setText(f"Sector {sector} authenticated")
+                self.status_label.setText(f"Sector {sector} authenticated ({KEY_TYPE_NAMES[key_type]})")
                 self.status_label.setStyleSheet("color: green;")
             else:
                 self.authentication_failed.emit(sector)
@@ -205,7 +376,13 @@ class AuthPanel(QGroupBox):
             sector = self.sector_spinbox.value()
             key_type = self.key_type_combo.currentData()
             
-            success = self.auth_manager.try_default_keys(sector, key_type)
+            if key_type is None:
+                # Key types ordered by the access conditions, if already decoded
+                key_types = self.planner.choose_key_types(sector, self.data_block_requests(sector),
+                                                          (KEY_TYPE_A, KEY_TYPE_B))
+                success = any(self.auth_manager.try_default_keys(sector, kt) for kt in key_types)
+            else:
+                success = self.auth_manager.try_default_keys(sector, key_type)
             
             if success:
                 self.authentication_success.emit(sector)
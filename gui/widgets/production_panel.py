@@ -0,0 +1,275 @@
+"""
+Production encoding panel for unattended batch card encoding
+"""
+
+import logging
+import sqlite3
+import threading
+from typing import Optional
+from PyQt5.QtWidgets import (
+    QGroupBox, QVBoxLayout, QHBoxLayout, QGridLayout, QLabel,
+    QPushButton, QLineEdit, QCheckBox, QFileDialog, QMessageBox
+)
+from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtGui import QFont
+
+from core.card_operations import CardOperations
+from core.authentication import AuthenticationManager
+from core.data_utils import hex_string_to_bytes, is_valid_hex_string
+from core.batch_job import BatchJob, Manifest, ManifestError, MATCH_SEQUENCE, MATCH_UID
+from core.card_template import CardTemplate, TemplateError, compile_template, load_template
+from core.dump_formats import DumpFormatError, load_image
+from core.dump_library import DumpLibrary
+from core.production import (
+    ProductionLine, STAGE_DETECT, STAGE_WRITE, STAGE_VERIFY, STAGE_SIGNAL
+)
+
+logger = logging.getLogger(__name__)
+
+class ProductionPanel(QGroupBox):
+    """Production encoding panel widget
+
+    The encode loop runs in a worker thread; the readout is refreshed from
+    a statistics snapshot on a timer so the UI never sits in the card cycle.
+    """
+
+    production_running = pyqtSignal(bool)
+
+    def __init__(self, card_operations: CardOperations, auth_manager: AuthenticationManager,
+                 library: Optional[DumpLibrary] = None):
+        super().__init__("Production Encoding")
+        self.card_operations = card_operations
+        self.auth_manager = auth_manager
+        self.library = library  # opened on the first manifest run when not given
+        self.card_template = None
+        self.manifest_path = None
+        self.line = None
+        self.worker = None
+        self.reader_busy = False  # another run owns the reader
+        self.setup_ui()
+
+        self.refresh_timer = QTimer()
+        self.refresh_timer.timeout.connect(self.refresh_readout)
+        self.update_ui_state()
+
+    def setup_ui(self):
+        """Setup the user interface"""
+        layout = QVBoxLayout(self)
+
+        # Template selection
+        template_layout = QHBoxLayout()
+        self.template_label = QLabel("Template: -")
+        template_layout.addWidget(self.template_label)
+        template_layout.addStretch()
+
+        self.load_template_button = QPushButton("Load Template...")
+        self.load_template_button.clicked.connect(self.load_template)
+        template_layout.addWidget(self.load_template_button)
+        layout.addLayout(template_layout)
+
+        # Optional order manifest supplying per-card field values
+        manifest_layout = QHBoxLayout()
+        self.manifest_label = QLabel("Manifest: -")
+        manifest_layout.addWidget(self.manifest_label)
+        manifest_layout.addStretch()
+
+        self.match_uid_checkbox = QCheckBox("Match by UID")
+        manifest_layout.addWidget(self.match_uid_checkbox)
+
+        self.library_checkbox = QCheckBox("Record in dump library")
+        self.library_checkbox.setChecked(True)
+        manifest_layout.addWidget(self.library_checkbox)
+
+        self.load_manifest_button = QPushButton("Load Manifest...")
+        self.load_manifest_button.clicked.connect(self.load_manifest)
+        manifest_layout.addWidget(self.load_manifest_button)
+        layout.addLayout(manifest_layout)
+
+        # Blank card key
+        key_layout = QHBoxLayout()
+        key_layout.addWidget(QLabel("Blank card Key A:"))
+        self.blank_key_input = QLineEdit("FFFFFFFFFFFF")
+        self.blank_key_input.setFont(QFont("Courier", 9))
+        self.blank_key_input.setMaxLength(12)
+        self.blank_key_input.textChanged.connect(self.update_ui_state)
+        key_layout.addWidget(self.blank_key_input)
+
+        self.signal_checkbox = QCheckBox("Signal on reader")
+        self.signal_checkbox.setChecked(True)
+        key_layout.addWidget(self.signal_checkbox)
+        layout.addLayout(key_layout)
+
+        # Start / stop
+        button_layout = QHBoxLayout()
+        self.start_button = QPushButton("Start")
+        self.start_button.clicked.connect(self.start_production)
+        button_layout.addWidget(self.start_button)
+
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.clicked.connect(self.stop_production)
+        button_layout.addWidget(self.stop_button)
+        button_layout.addStretch()
+        layout.addLayout(button_layout)
+
+        # Readout
+        readout_layout = QGridLayout()
+        self.readout_labels = {}
+        fields = [
+            ("cards_per_minute", "Cards/min:"), ("encoded", "Encoded:"),
+            ("failed", "Failed:"), ("failure_rate", "Failure rate:"),
+            ("duplicates", "Duplicates:"), ("cycle", "Cycle:"),
+            (STAGE_DETECT, "Detect:"), (STAGE_WRITE, "Write:"),
+            (STAGE_VERIFY, "Verify:"), (STAGE_SIGNAL, "Signal:")
+        ]
+        for index, (name, title) in enumerate(fields):
+            row, column = divmod(index, 2)
+            readout_layout.addWidget(QLabel(title), row, column * 2)
+            label = QLabel("-")
+            label.setStyleSheet("font-weight: bold;")
+            readout_layout.addWidget(label, row, column * 2 + 1)
+            self.readout_labels[name] = label
+        layout.addLayout(readout_layout)
+
+        self.last_result_label = QLabel("Last card: -")
+        self.last_result_label.setFont(QFont("Courier", 9))
+        layout.addWidget(self.last_result_label)
+
+    def is_running(self) -> bool:
+        """Check if the encode loop is running"""
+        return self.worker is not None and self.worker.is_alive()
+
+    def set_reader_busy(self, busy: bool):
+        """Block starting a run while another run owns the reader"""
+        self.reader_busy = busy
+        self.update_ui_state()
+
+    def update_ui_state(self):
+        """Update UI state based on template, reader and run state"""
+        running = self.is_running()
+        ready = (self.card_template is not None and
+                 self.card_operations.reader_manager.is_connected() and
+                 is_valid_hex_string(self.blank_key_input.text(), 12))
+
+        self.start_button.setEnabled(ready and not running and not self.reader_busy)
+        self.stop_button.setEnabled(running)
+        self.load_template_button.setEnabled(not running)
+        self.load_manifest_button.setEnabled(not running)
+        self.match_uid_checkbox.setEnabled(not running)
+        self.library_checkbox.setEnabled(not running)
+        self.blank_key_input.setEnabled(not running)
+        self.signal_checkbox.setEnabled(not running)
+
+    def load_template(self):
+        """Load a card template, or a dump whose captured blocks are written to every card"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Load Template", "",
+            "Templates and dumps (*.json *.mfd *.bin *.mct *.dump *.eml);;All files (*)"
+        )
+        if not path:
+            return
+
+        try:
+            try:
+                card_template = load_template(path)
+            except (TemplateError, UnicodeDecodeError):
+                card_template = None
+            # JSON dumps parse as templates without sectors
+            if card_template is None or not card_template.sectors:
+                card_template = CardTemplate.from_image(load_image(path), name=path)
+            card_template.validate()
+        except (OSError, DumpFormatError, TemplateError) as e:
+            QMessageBox.warning(self, "Load Template", f"Could not load template:\n{e}")
+            return
+
+        self.card_template = card_template
+
+        self.template_label.setText(f"Template: {path}")
+        self.update_ui_state()
+
+    def load_manifest(self):
+        """Choose a CSV/JSON manifest; results are logged next to it and a rerun resumes"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Load Manifest", "", "Manifests (*.csv *.json *.jsonl *.ndjson);;All files (*)"
+        )
+        if not path:
+            return
+
+        self.manifest_path = path
+        self.manifest_label.setText(f"Manifest: {path}")
+        self.update_ui_state()
+
+    def start_production(self):
+        """Start the encode loop in a worker thread"""
+        if self.reader_busy or self.is_running():
+            return
+        self.card_template.default_key = hex_string_to_bytes(self.blank_key_input.text())
+        try:
+            program = compile_template(self.card_template)
+        except TemplateError as e:
+            QMessageBox.warning(self, "Production Encoding", f"Invalid template:\n{e}")
+            return
+
+        signal = self.signal_checkbox.isChecked()
+        if self.manifest_path is not None:
+            match = MATCH_UID if self.match_uid_checkbox.isChecked() else MATCH_SEQUENCE
+            library = None
+            if self.library_checkbox.isChecked():
+                try:
+                    library = self.open_library()
+                except (OSError, ValueError, sqlite3.Error) as e:
+                    QMessageBox.warning(self, "Production Encoding", f"Cannot open the dump library:\n{e}")
+                    return
+            try:
+                job = BatchJob(Manifest(self.manifest_path), program, f"{self.manifest_path}.results.jsonl",
+                               library=library, match=match)
+            except (OSError, ManifestError) as e:
+                QMessageBox.warning(self, "Production Encoding", f"Invalid manifest:\n{e}")
+                return
+            self.line = job.create_line(self.card_operations, self.auth_manager, signal=signal)
+        else:
+            self.line = ProductionLine(self.card_operations, self.auth_manager, program, signal=signal)
+        self.worker = threading.Thread(target=self.line.run, daemon=True)
+        self.worker.start()
+
+        self.production_running.emit(True)
+        self.refresh_timer.start(500)
+        self.update_ui_state()
+        logger.info(f"Production started ({program.apdu_count()} APDUs per card)")
+
+    def open_library(self) -> DumpLibrary:
+        """Get the dump library encoded cards are recorded in"""
+        if self.library is None:
+            self.library = DumpLibrary()
+        return self.library
+
+    def stop_production(self):
+        """Ask the encode loop to stop after the current card"""
+        if self.line is not None:
+            self.line.stop()
+        self.stop_button.setEnabled(False)
+
+    def refresh_readout(self):
+        """Refresh statistics from the running line"""
+        if self.line is None:
+            return
+
+        stats = self.line.stats.to_dict()
+        self.readout_labels["cards_per_minute"].setText(f"{stats['cards_per_minute']:.1f}")
+        self.readout_labels["encoded"].setText(str(stats["encoded"]))
+        self.readout_labels["failed"].setText(str(stats["failed"]))
+        self.readout_labels["failure_rate"].setText(f"{stats['failure_rate'] * 100:.1f}%")
+        self.readout_labels["duplicates"].setText(str(stats["duplicates"]))
+
+        timings = dict(stats["stages"], cycle=stats["cycle"])
+        for name in ("cycle", STAGE_DETECT, STAGE_WRITE, STAGE_VERIFY, STAGE_SIGNAL):
+            average = timings[name]["average_ms"]
+            self.readout_labels[name].setText("-" if average is None else f"{average:.1f} ms")
+
+        if stats["encoded"] or stats["failed"] or stats["duplicates"]:
+            self.last_result_label.setText(f"Last card: {self.line.last_result}")
+
+        if not self.is_running():
+            self.refresh_timer.stop()
+            self.production_running.emit(False)
+            self.update_ui_state()
+            logger.info("Production stopped")
@@ -0,0 +1,250 @@
+"""
+Fleet rekey panel for rotating keys on many cards in one run
+"""
+
+import logging
+import threading
+from PyQt5.QtWidgets import (
+    QGroupBox, QVBoxLayout, QHBoxLayout, QGridLayout, QLabel,
+    QPushButton, QLineEdit, QSpinBox, QFileDialog, QMessageBox
+)
+from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtGui import QFont
+
+from config.constants import (
+    CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K, KEY_TYPE_A, KEY_TYPE_B, MIFARE_1K_SECTORS
+)
+from core.card_operations import CardOperations
+from core.authentication import AuthenticationManager
+from core.data_utils import hex_string_to_bytes, is_valid_hex_string
+from core.rekey import AccessProfile, RekeyError, RekeyJob, RekeyJournal
+
+logger = logging.getLogger(__name__)
+
+class RekeyPanel(QGroupBox):
+    """Fleet rekey panel widget
+
+    The whole run is confirmed once up front; cards are then rekeyed
+    back-to-back in a worker thread and progress is journaled per UID.
+    """
+
+    rekey_running = pyqtSignal(bool)
+
+    def __init__(self, card_operations: CardOperations, auth_manager: AuthenticationManager):
+        super().__init__("Fleet Rekey")
+        self.card_operations = card_operations
+        self.auth_manager = auth_manager
+        self.journal_path = None
+        self.job = None
+        self.line = None
+        self.worker = None
+        self.reader_busy = False  # another run owns the reader
+        self.setup_ui()
+
+        self.refresh_timer = QTimer()
+        self.refresh_timer.timeout.connect(self.refresh_readout)
+        self.update_ui_state()
+
+    def _key_input(self, text: str = "") -> QLineEdit:
+        """Create a 12 hex character key input"""
+        key_input = QLineEdit(text)
+        key_input.setFont(QFont("Courier", 9))
+        key_input.setMaxLength(12)
+        key_input.textChanged.connect(self.update_ui_state)
+        return key_input
+
+    def setup_ui(self):
+        """Setup the user interface"""
+        layout = QVBoxLayout(self)
+
+        keys_layout = QGridLayout()
+        keys_layout.addWidget(QLabel("Old Key A:"), 0, 0)
+        self.old_key_a_input = self._key_input("FFFFFFFFFFFF")
+        keys_layout.addWidget(self.old_key_a_input, 0, 1)
+        keys_layout.addWidget(QLabel("Old Key B:"), 0, 2)
+        self.old_key_b_input = self._key_input()
+        self.old_key_b_input.setPlaceholderText("optional")
+        keys_layout.addWidget(self.old_key_b_input, 0, 3)
+
+        keys_layout.addWidget(QLabel("New Key A:"), 1, 0)
+        self.new_key_a_input = self._key_input()
+        keys_layout.addWidget(self.new_key_a_input, 1, 1)
+        keys_layout.addWidget(QLabel("New Key B:"), 1, 2)
+        self.new_key_b_input = self._key_input()
+        keys_layout.addWidget(self.new_key_b_input, 1, 3)
+
+        keys_layout.addWidget(QLabel("Access:"), 2, 0)
+        self.access_input = QLineEdit("FF0780")
+        self.access_input.setFont(QFont("Courier", 9))
+        self.access_input.setMaxLength(8)
+        self.access_input.setPlaceholderText("FF0780 or FF078069")
+        self.access_input.textChanged.connect(self.update_ui_state)
+        keys_layout.addWidget(self.access_input, 2, 1)
+        layout.addLayout(keys_layout)
+
+        # Sector range
+        sector_layout = QHBoxLayout()
+        sector_layout.addWidget(QLabel("Sectors:"))
+        self.first_sector_spinbox = QSpinBox()
+        self.first_sector_spinbox.setRange(0, 39)
+        sector_layout.addWidget(self.first_sector_spinbox)
+        sector_layout.addWidget(QLabel("to"))
+        self.last_sector_spinbox = QSpinBox()
+        self.last_sector_spinbox.setRange(0, 39)
+        self.last_sector_spinbox.setValue(15)
+        sector_layout.addWidget(self.last_sector_spinbox)
+        sector_layout.addStretch()
+        layout.addLayout(sector_layout)
+
+        # Journal
+        journal_layout = QHBoxLayout()
+        self.journal_label = QLabel("Journal: -")
+        journal_layout.addWidget(self.journal_label)
+        journal_layout.addStretch()
+        self.journal_button = QPushButton("Journal File...")
+        self.journal_button.clicked.connect(self.choose_journal)
+        journal_layout.addWidget(self.journal_button)
+        layout.addLayout(journal_layout)
+
+        # Start / stop
+        button_layout = QHBoxLayout()
+        self.start_button = QPushButton("Start Rekey")
+        self.start_button.clicked.connect(self.start_rekey)
+        button_layout.addWidget(self.start_button)
+
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.clicked.connect(self.stop_rekey)
+        button_layout.addWidget(self.stop_button)
+        button_layout.addStretch()
+        layout.addLayout(button_layout)
+
+        self.status_label = QLabel("Rekeyed: - | Failed: - | Skipped: - | Cards/min: -")
+        self.status_label.setStyleSheet("font-weight: bold;")
+        layout.addWidget(self.status_label)
+
+        self.last_result_label = QLabel("Last card: -")
+        self.last_result_label.setFont(QFont("Courier", 9))
+        layout.addWidget(self.last_result_label)
+
+    def is_running(self) -> bool:
+        """Check if the rekey loop is running"""
+        return self.worker is not None and self.worker.is_alive()
+
+    def set_reader_busy(self, busy: bool):
+        """Block starting a run while another run owns the reader"""
+        self.reader_busy = busy
+        self.update_ui_state()
+
+    def update_ui_state(self):
+        """Update UI state based on inputs, reader and run state"""
+        running = self.is_running()
+        old_key_b = self.old_key_b_input.text()
+        ready = (self.card_operations.reader_manager.is_connected() and
+                 self.journal_path is not None and
+                 is_valid_hex_string(self.old_key_a_input.text(), 12) and
+                 (not old_key_b or is_valid_hex_string(old_key_b, 12)) and
+                 is_valid_hex_string(self.new_key_a_input.text(), 12) and
+                 is_valid_hex_string(self.new_key_b_input.text(), 12) and
+                 len(self.access_input.text()) in (6, 8) and
+                 is_valid_hex_string(self.access_input.text()))
+
+        self.start_button.setEnabled(ready and not running and not self.reader_busy)
+        self.stop_button.setEnabled(running)
+        self.journal_button.setEnabled(not running)
+
+    def choose_journal(self):
+        """Choose the journal file (an existing journal continues its run)"""
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Rekey Journal", "rekey_journal.jsonl",
+            "Rekey journals (*.jsonl);;All files (*)",
+            options=QFileDialog.DontConfirmOverwrite
+        )
+        if not path:
+            return
+        self.journal_path = path
+        self.journal_label.setText(f"Journal: {path}")
+        self.update_ui_state()
+
+    def build_job(self) -> RekeyJob:
+        """Build the rekey job from the inputs"""
+        sectors = list(range(self.first_sector_spinbox.value(), self.last_sector_spinbox.value() + 1))
+        if not sectors:
+            raise RekeyError("Sector range is empty")
+
+        old_keys = {KEY_TYPE_A: hex_string_to_bytes(self.old_key_a_input.text())}
+        if self.old_key_b_input.text():
+            old_keys[KEY_TYPE_B] = hex_string_to_bytes(self.old_key_b_input.text())
+        new_keys = {KEY_TYPE_A: hex_string_to_bytes(self.new_key_a_input.text()),
+                    KEY_TYPE_B: hex_string_to_bytes(self.new_key_b_input.text())}
+        access = hex_string_to_bytes(self.access_input.text())
+        profile = AccessProfile(access[:3], access[3]) if len(access) == 4 else AccessProfile(access)
+
+        # Sectors past 15 only exist on 4K cards, whose sectors 32-39 have 16 blocks
+        card_type = CARD_TYPE_MIFARE_4K if sectors[-1] >= MIFARE_1K_SECTORS else CARD_TYPE_MIFARE_1K
+        journal = RekeyJournal(self.journal_path)
+        return RekeyJob({sector: dict(old_keys) for sector in sectors},
+                        {sector: dict(new_keys) for sector in sectors},
+                        profile, sectors, journal, card_type=card_type)
+
+    def start_rekey(self):
+        """Confirm the run once, then rekey cards in a worker thread"""
+        if self.reader_busy or self.is_running():
+            return
+        try:
+            job = self.build_job()
+        except (RekeyError, OSError) as e:
+            QMessageBox.warning(self, "Fleet Rekey", f"Invalid rekey settings:\n{e}")
+            return
+
+        incomplete = job.journal.incomplete_uids()
+        summary = "\n".join(job.describe())
+        if incomplete:
+            summary += f"\n{len(incomplete)} cards in the journal were left unfinished; present them again"
+        reply = QMessageBox.question(
+            self, "Confirm Fleet Rekey",
+            f"Every card presented will get new keys and access conditions:\n\n{summary}\n\n"
+            "Cards are processed without further confirmation. Continue?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+
+        self.job = job
+        self.line = job.create_line(self.card_operations, self.auth_manager)
+        self.worker = threading.Thread(target=self.line.run, daemon=True)
+        self.worker.start()
+
+        self.rekey_running.emit(True)
+        self.refresh_timer.start(500)
+        self.update_ui_state()
+        logger.info("Fleet rekey started")
+
+    def stop_rekey(self):
+        """Ask the rekey loop to stop after the current card"""
+        if self.line is not None:
+            self.line.stop()
+        self.stop_button.setEnabled(False)
+
+    def refresh_readout(self):
+        """Refresh progress from the running line"""
+        if self.line is None:
+            return
+
+        stats = self.line.stats.to_dict()
+        self.status_label.setText(
+            f"Rekeyed: {stats['encoded']} | Failed: {stats['failed']} | "
+            f"Skipped: {stats['duplicates']} | Cards/min: {stats['cards_per_minute']:.1f}"
+        )
+        if self.line.last_result is not None:
+            self.last_result_label.setText(f"Last card: {self.line.last_result}")
+
+        if not self.is_running():
+            self.refresh_timer.stop()
+            self.rekey_running.emit(False)
+            self.update_ui_state()
+            incomplete = len(self.job.journal.incomplete_uids())
+            if incomplete:
+                QMessageBox.warning(self, "Fleet Rekey",
+                                    f"{incomplete} cards are not fully rekeyed; see the journal for their UIDs.")
+            logger.info("Fleet rekey stopped")
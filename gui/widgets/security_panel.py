@@ -14,6 +14,12 @@ from PyQt5.QtGui import QFont
 from core.card_operations import CardOperations
 from core.authentication import AuthenticationManager
 from core.data_utils import bytes_to_hex_string, hex_string_to_bytes, is_valid_hex_string
+from core.access_conditions import (
+    get_sector_access, get_trailer_access, build_trailer,
+    DATA_BLOCK_PERMISSIONS, TRAILER_PERMISSIONS, ACCESS_MASK_NAMES,
+    DEFAULT_GENERAL_PURPOSE_BYTE
+)
+from utils.validators import validate_access_conditions
 
 logger = logging.getLogger(__name__)
 
@@ -115,9 +121,9 @@ class SecurityPanel(QGroupBox):
         layout.addWidget(self.new_key_b_input)
         
         # Access conditions input
-        layout.addWidget(QLabel("Access Conditions (6 hex characters):"))
+        layout.addWidget(QLabel("Access Conditions (6 hex characters, optional GPB):"))
         self.access_conditions_input = QLineEdit()
-        self.access_conditions_input.setPlaceholderText("Enter access conditions (e.g., FF0780)")
+        self.access_conditions_input.setPlaceholderText("Enter access conditions (e.g., FF0780 or FF078069)")
         self.access_conditions_input.setFont(QFont("Courier", 9))
         self.access_conditions_input.textChanged.connect(self.validate_key_inputs)
         layout.addWidget(self.access_conditions_input)
@@ -143,30 +149,8 @@ class SecurityPanel(QGroupBox):
         
         layout.addWidget(QLabel("Access Conditions Reference"))
         
-        # Access conditions reference text
-        reference_text = """
-Common Access Conditions:
-
-FF 07 80 69 - Transport Configuration (Key A: read/write, Key B: read/write)
-78 77 88 C1 - Key A: read only, Key B: read/write  
-FF 07 80 00 - Key A: read/write, Key B: read only
-00 00 00 00 - Both keys: no access (lock sector permanently!)
-
-Data Block Access:
-- C1 C2 C3 combinations control read/write permissions
-- 000: read/write with Key A or B
-- 001: read with Key A or B, write with Key B
-- 010: read with Key A or B, write never
-- 011: read/write with Key B
-- 100: read with Key A or B, write never  
-- 101: read/write never
-- 110: read with Key A or B, write with Key B
-- 111: read/write never
-
-Trailer Block Access:
-- Controls key A/B read/write permissions
-- Controls access condition bits modification
-"""
+        # Access conditions reference text, generated from the codec tables
+        reference_text = self.build_access_reference()
         
         reference_display = QTextEdit()
         reference_display.setFont(QFont("Courier", 8))
@@ -176,6 +160,36 @@ Trailer Block Access:
         
         self.tabs.addTab(access_widget, "Access Reference")
     
+    def build_access_reference(self) -> str:
+        """Build access conditions reference text from the permission tables"""
+        lines = [
+            "Common Access Conditions:",
+            "",
+            "FF 07 80 69 - Transport Configuration (Key A: read/write, Key B: read/write)",
+            "78 77 88 69 - Key A: read only, Key B: read/write",
+            "7F 07 88 69 - Data: Key A|B read/write, keys and access bits changed with Key B",
+            "",
+            "Data Block Access (C1 C2 C3: read / write / increment / decrement):"
+        ]
+        for condition in sorted(DATA_BLOCK_PERMISSIONS):
+            masks = DATA_BLOCK_PERMISSIONS[condition]
+            lines.append(f"- {condition:03b}: " + " / ".join(ACCESS_MASK_NAMES[mask] for mask in masks))
+        
+        lines += [
+            "",
+            "Trailer Block Access (C1 C2 C3: Key A r/w, access bits r/w, Key B r/w):"
+        ]
+        for condition in sorted(TRAILER_PERMISSIONS):
+            masks = TRAILER_PERMISSIONS[condition]
+            lines.append(f"- {condition:03b}: " + " / ".join(ACCESS_MASK_NAMES[mask] for mask in masks))
+        
+        lines += [
+            "",
+            "If Key B is readable it cannot be used for authentication.",
+            "Inconsistent access bits are rejected before writing."
+        ]
+        return "\n".join(lines)
+    
     def update_ui_state(self):
         """Update UI state based on card and authentication status"""
         card_info = self.card_operations.get_card_info()
@@ -244,6 +258,12 @@ Trailer Block Access:
                     display_text += f"Access:    {hex_data[18:24]}\\n"  # bytes 6-8
                     display_text += f"Key B:     [MASKED]\\n"
                     
+                    sector_access = get_trailer_access(data)
+                    if sector_access is None:
+                        display_text += "\\nAccess bits INVALID (inverted-bit check failed)\\n"
+                    else:
+                        display_text += "\\n" + "\\n".join(sector_access.describe()) + "\\n"
+                    
                     self.trailer_display.setText(display_text)
                 else:
                     self.trailer_display.setText("Failed to read trailer block")
@@ -256,7 +276,7 @@ Trailer Block Access:
         """Validate key management inputs"""
         key_a_valid = is_valid_hex_string(self.new_key_a_input.text(), 6)
         key_b_valid = is_valid_hex_string(self.new_key_b_input.text(), 6)
-        access_valid = is_valid_hex_string(self.access_conditions_input.text(), 3)
+        access_valid, _ = validate_access_conditions(self.access_conditions_input.text())
         
         # Update input styling
         self.new_key_a_input.setStyleSheet("" if key_a_valid or not self.new_key_a_input.text() else "background-color: #ffcccc;")
@@ -269,7 +289,7 @@ Trailer Block Access:
         """Check if all key inputs are valid"""
         key_a_valid = is_valid_hex_string(self.new_key_a_input.text(), 6)
         key_b_valid = is_valid_hex_string(self.new_key_b_input.text(), 6)
-        access_valid = is_valid_hex_string(self.access_conditions_input.text(), 3)
+        access_valid, _ = validate_access_conditions(self.access_conditions_input.text())
         
         return (key_a_valid and key_b_valid and access_valid and 
                 self.new_key_a_input.text() and 
@@ -281,6 +301,17 @@ Trailer Block Access:
         try:
             sector = self.key_sector_spinbox.value()
             
+            access_valid, message = validate_access_conditions(self.access_conditions_input.text())
+            if not access_valid:
+                QMessageBox.critical(self, "Error", message)
+                return
+            
+            access_input = hex_string_to_bytes(self.access_conditions_input.text())
+            sector_access = get_sector_access(access_input[:3])
+            lock_warning = ""
+            if sector_access.is_permanently_locked():
+                lock_warning = "These access bits make keys and access conditions PERMANENTLY unchangeable!\\n\\n"
+            
             # Multiple confirmation dialogs for safety
             reply1 = QMessageBox.question(
                 self, "Confirm Key Change", 
@@ -301,6 +332,7 @@ Trailer Block Access:
                 f"New Key A: {self.new_key_a_input.text()}\\n"
                 f"New Key B: {self.new_key_b_input.text()}\\n"
                 f"Access: {self.access_conditions_input.text()}\\n\\n"
+                f"{lock_warning}"
                 "Proceed with key change?",
                 QMessageBox.Yes | QMessageBox.No,
                 QMessageBox.No
@@ -320,14 +352,14 @@ Trailer Block Access:
             # Construct new trailer data
             key_a = hex_string_to_bytes(self.new_key_a_input.text())
             key_b = hex_string_to_bytes(self.new_key_b_input.text())
-            access_conditions = hex_string_to_bytes(self.access_conditions_input.text())
             
-            if not all([key_a, key_b, access_conditions]):
+            if not all([key_a, key_b]):
                 QMessageBox.critical(self, "Error", "Invalid key or access condition format")
                 return
             
             # Build trailer data: Key A (6) + Access (3) + GPB (1) + Key B (6)
-            trailer_data = key_a + access_conditions + bytes([0x69]) + key_b
+            gpb = access_input[3] if len(access_input) == 4 else DEFAULT_GENERAL_PURPOSE_BYTE
+            trailer_data = build_trailer(key_a, access_input[:3], key_b, gpb)
             
             # Write trailer block
             success = self.card_operations.write_block(trailer_block, trailer_data)
@@ -0,0 +1,198 @@
+"""
+ACR1252U + MIFARE Classic emulator for tests
+
+Implements the PC/SC connection interface used by ReaderManager
+(transmit/control/getATR) on top of an in-memory card image.
+"""
+
+import time
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from smartcard.Exceptions import CardConnectionException
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, DEFAULT_KEY, MIFARE_BLOCK_SIZE
+from core.access_conditions import (
+    get_trailer_access, get_block_group, build_trailer,
+    OP_READ, OP_WRITE, OP_READ_KEY_B, OP_READ_ACCESS,
+    OP_WRITE_KEY_A, OP_WRITE_ACCESS, OP_WRITE_KEY_B, KEY_TYPE_MASKS
+)
+from core.data_utils import get_block_sector, get_sector_first_block, get_sector_block_count
+from core.reader_manager import ReaderManager, ReaderStatus
+
+TRANSPORT_ACCESS = bytes([0xFF, 0x07, 0x80])
+ATR_1K = [0x3B, 0x8F, 0x80, 0x01, 0x80, 0x4F, 0x0C, 0xA0, 0x00, 0x00, 0x03, 0x06,
+          0x03, 0x00, 0x01, 0x00, 0x00, 0x00, 0x00, 0x6A]
+
+class EmulatedCard:
+    """In-memory MIFARE Classic card"""
+
+    def __init__(self, uid: bytes = bytes([0x04, 0xA1, 0xB2, 0xC3]), sectors: int = 16):
+        self.uid = bytes(uid)
+        self.sectors = sectors
+        size = get_sector_first_block(sectors - 1) + get_sector_block_count(sectors - 1)
+        self.memory = bytearray(size * MIFARE_BLOCK_SIZE)
+        bcc = 0
+        for b in self.uid:
+            bcc ^= b
+        self.memory[0:len(self.uid) + 1] = self.uid + bytes([bcc])
+        for sector in range(sectors):
+            self.set_trailer(sector, DEFAULT_KEY, TRANSPORT_ACCESS, DEFAULT_KEY)
+
+    def trailer_block(self, sector: int) -> int:
+        """Get trailer block number of sector"""
+        return get_sector_first_block(sector) + get_sector_block_count(sector) - 1
+
+    def set_trailer(self, sector: int, key_a: bytes, access: bytes, key_b: bytes) -> None:
+        """Set keys and access bits of sector"""
+        self.set_block(self.trailer_block(sector), build_trailer(key_a, access, key_b))
+
+    def get_block(self, block: int) -> bytes:
+        """Get raw block contents"""
+        return bytes(self.memory[block * 16:(block + 1) * 16])
+
+    def set_block(self, block: int, data: bytes) -> None:
+        """Set raw block contents"""
+        self.memory[block * 16:(block + 1) * 16] = data
+
+class EmulatedConnection:
+    """PC/SC connection to an emulated ACR1252U with an optional card in the field"""
+
+    def __init__(self, card: EmulatedCard = None, apdu_delay: float = 0.0):
+        self.card = card
+        self.apdu_delay = apdu_delay
+        self.key_slots = {}
+        self.halted = False
+        self.authenticated = None  # (sector, key_type)
+        self.apdu_count = 0
+        self.auth_count = 0
+        self.remove_after = None  # remove card after this many APDUs
+
+    def attach(self, reader_manager: ReaderManager) -> ReaderManager:
+        """Make reader_manager use this connection"""
+        reader_manager.connection = self
+        reader_manager.status = ReaderStatus.CONNECTED
+        return reader_manager
+
+    def present(self, card: EmulatedCard) -> None:
+        """Place a card in the field"""
+        self.card = card
+        self.halted = False
+        self.authenticated = None
+
+    def remove(self) -> None:
+        """Take the card out of the field"""
+        self.card = None
+        self.authenticated = None
+
+    def getATR(self):
+        """Get ATR of the card in the field"""
+        if self.card is None:
+            raise CardConnectionException("No card")
+        return list(ATR_1K)
+
+    def control(self, code, command):
+        """Handle ACR1252U escape commands"""
+        if command[:4] == [0xE0, 0x00, 0x00, 0x25]:
+            self.halted = False
+            self.authenticated = None
+            return [0xE1, 0x00, 0x00, 0x00, 0x01, command[5]], 0xE1, 0x00
+        if command[:4] == [0xE0, 0x00, 0x00, 0x18]:
+            version = list(b"ACR1252U_EMU")
+            return [0xE1, 0x00, 0x00, 0x00, len(version)] + version, 0xE1, 0x00
+        return [], 0x6A, 0x81
+
+    def transmit(self, command):
+        """Handle PC/SC pseudo-APDUs"""
+        self.apdu_count += 1
+        if self.apdu_delay:
+            time.sleep(self.apdu_delay)
+        if self.remove_after is not None and self.apdu_count > self.remove_after:
+            self.remove()
+        if self.card is None:
+            raise CardConnectionException("Card removed")
+
+        ins = command[1]
+        if ins == 0xCA:
+            if self.halted:
+                return [], 0x63, 0x00
+            return list(self.card.uid), 0x90, 0x00
+        if ins == 0x82:
+            self.key_slots[command[3]] = bytes(command[5:11])
+            return [], 0x90, 0x00
+        if self.halted:
+            return [], 0x63, 0x00
+        if ins == 0x86:
+            return self._authenticate(command[7], command[8], command[9])
+        if ins == 0xB0:
+            return self._read(command[3])
+        if ins == 0xD6:
+            return self._write(command[3], bytes(command[5:5 + MIFARE_BLOCK_SIZE]))
+        return [], 0x6A, 0x81
+
+    def _authenticate(self, block, key_type, slot):
+        """Authenticate sector of block with key from slot"""
+        self.auth_count += 1
+        sector = get_block_sector(block)
+        trailer = self.card.get_block(self.card.trailer_block(sector))
+        expected = trailer[0:6] if key_type == KEY_TYPE_A else trailer[10:16]
+        if self.key_slots.get(slot) != expected:
+            self.halted = True
+            self.authenticated = None
+            return [], 0x63, 0x00
+        self.authenticated = (sector, key_type)
+        return [], 0x90, 0x00
+
+    def _check(self, block, operation):
+        """Check access permission of operation on block"""
+        sector = get_block_sector(block)
+        if self.authenticated is None or self.authenticated[0] != sector:
+            return None
+        access = get_trailer_access(self.card.get_block(self.card.trailer_block(sector)))
+        group = get_block_group(block - get_sector_first_block(sector), get_sector_block_count(sector))
+        return access, group, KEY_TYPE_MASKS[self.authenticated[1]]
+
+    def _read(self, block):
+        """Read block, masking keys in trailers"""
+        checked = self._check(block, OP_READ)
+        if checked is None:
+            return [], 0x69, 0x82
+        access, group, key_mask = checked
+        data = bytearray(self.card.get_block(block))
+        if group == 3:
+            data[0:6] = bytes(6)
+            if not access.trailer_permissions[OP_READ_KEY_B] & key_mask:
+                data[10:16] = bytes(6)
+            if not access.trailer_permissions[OP_READ_ACCESS] & key_mask:
+                return [], 0x69, 0x82
+        elif not access.get_permission(group, OP_READ) & key_mask:
+            return [], 0x69, 0x82
+        return list(data), 0x90, 0x00
+
+    def _write(self, block, data):
+        """Write block"""
+        checked = self._check(block, OP_WRITE)
+        if checked is None or block == 0:
+            return [], 0x69, 0x82
+        access, group, key_mask = checked
+        if group == 3:
+            permissions = access.trailer_permissions
+            if not (permissions[OP_WRITE_ACCESS] | permissions[OP_WRITE_KEY_A] |
+                    permissions[OP_WRITE_KEY_B]) & key_mask:
+                return [], 0x69, 0x82
+        elif not access.get_permission(group, OP_WRITE) & key_mask:
+            return [], 0x69, 0x82
+        self.card.set_block(block, data)
+        return [], 0x90, 0x00
+
+def create_emulated_reader(card: EmulatedCard = None, apdu_delay: float = 0.0):
+    """Create a connected ReaderManager backed by an emulated reader
+
+    Returns:
+        tuple: (reader_manager, connection)
+    """
+    connection = EmulatedConnection(card if card is not None else EmulatedCard(), apdu_delay)
+    reader_manager = connection.attach(ReaderManager())
+    return reader_manager, connection
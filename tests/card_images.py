@@ -0,0 +1,68 @@
+"""
+Card image builders for tests
+
+Captured CardImage instances for tests that work on dumps rather than on
+an emulated reader.
+"""
+
+import sys
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import CARD_TYPE_MIFARE_1K, KEY_TYPE_A, KEY_TYPE_B, MIFARE_BLOCK_SIZE
+from core.access_conditions import get_trailer_access
+from core.card_image import CardImage
+
+DEFAULT_UID = bytes.fromhex("11223344")
+MASKED_KEY = bytes(6)
+
+def block_pattern(block: int) -> bytes:
+    """Default block contents: the block number repeated"""
+    return bytes([block & 0xFF] * MIFARE_BLOCK_SIZE)
+
+def make_image(uid: Union[int, bytes] = DEFAULT_UID, card_type: int = CARD_TYPE_MIFARE_1K,
+               fill: Callable[[int], bytes] = block_pattern, trailer: Optional[bytes] = None) -> CardImage:
+    """Build a fully captured image with a valid manufacturer block
+
+    An int uid is a serial number: it becomes the 4-byte UID and the
+    contents of block 4, so images of a fleet differ in one data block.
+    Trailers hold trailer when given and the fill pattern otherwise.
+    """
+    serial = uid if isinstance(uid, int) else None
+    if serial is not None:
+        uid = serial.to_bytes(4, "big")
+    image = CardImage(card_type, bytes(uid))
+    image.set_block(0, uid + bytes([uid[0] ^ uid[1] ^ uid[2] ^ uid[3]]) + bytes(11))
+    for block in range(1, image.block_count):
+        image.set_block(block, fill(block))
+    if trailer is not None:
+        for sector in range(image.sector_count):
+            image.set_block(image.get_trailer_block(sector), trailer)
+    if serial is not None:
+        image.set_block(4, serial.to_bytes(MIFARE_BLOCK_SIZE, "big"))
+    return image
+
+def mask_keys(image: CardImage, known: bool = True) -> CardImage:
+    """Zero the trailer keys a card does not return on read
+
+    Key A always reads back as zeros, Key B unless the access bits make it
+    readable. With known the real keys go to the key map, as in a dump
+    taken with known keys; otherwise they are lost and stay unknown.
+    """
+    for sector in range(image.sector_count):
+        trailer_block = image.get_trailer_block(sector)
+        if not image.has_block(trailer_block):
+            continue
+        trailer = image.get_block(trailer_block)
+        access = get_trailer_access(trailer)
+        key_b_readable = access is not None and access.key_b_readable
+        if known:
+            keys = image.key_map.setdefault(sector, {})
+            keys[KEY_TYPE_A] = trailer[0:6]
+            if not key_b_readable:
+                keys[KEY_TYPE_B] = trailer[10:16]
+        key_b = trailer[10:16] if key_b_readable else MASKED_KEY
+        image.set_block(trailer_block, MASKED_KEY + trailer[6:10] + key_b)
+    return image
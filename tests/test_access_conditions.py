@@ -0,0 +1,89 @@
+"""
+Tests for the access conditions codec
+"""
+
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, DEFAULT_KEY
+from core.access_conditions import (
+    encode_access_bits, decode_access_bits, get_sector_access, get_trailer_access,
+    validate_trailer, build_trailer, get_block_group, DECODE_TABLE,
+    TRANSPORT_CONDITIONS, OP_READ, OP_WRITE, OP_DECREMENT, OP_WRITE_KEY_A, OP_WRITE_ACCESS
+)
+from core.data_utils import parse_access_bits
+
+class TestAccessConditions(unittest.TestCase):
+    """Test cases for access bits encoding and decoding"""
+
+    def test_transport_configuration(self):
+        """Test well-known transport access bits"""
+        self.assertEqual(encode_access_bits(TRANSPORT_CONDITIONS), bytes([0xFF, 0x07, 0x80]))
+        self.assertEqual(decode_access_bits(bytes([0xFF, 0x07, 0x80])), TRANSPORT_CONDITIONS)
+
+        access = get_sector_access(bytes([0xFF, 0x07, 0x80]))
+        self.assertTrue(access.key_b_readable)
+        # Readable Key B cannot authenticate, so only Key A is allowed
+        self.assertEqual(access.allowed_key_types(0, OP_WRITE), [KEY_TYPE_A])
+        self.assertTrue(access.is_allowed(3, OP_WRITE_ACCESS, KEY_TYPE_A))
+        self.assertFalse(access.is_permanently_locked())
+
+    def test_read_only_for_key_a(self):
+        """Test 78 77 88 access bits"""
+        access = get_sector_access(bytes([0x78, 0x77, 0x88]))
+        self.assertEqual(access.conditions, (0b100, 0b100, 0b100, 0b011))
+        self.assertFalse(access.key_b_readable)
+        self.assertEqual(access.allowed_key_types(1, OP_READ), [KEY_TYPE_A, KEY_TYPE_B])
+        self.assertEqual(access.allowed_key_types(1, OP_WRITE), [KEY_TYPE_B])
+        self.assertFalse(access.is_allowed(3, OP_WRITE_KEY_A, KEY_TYPE_A))
+
+    def test_round_trip_all_combinations(self):
+        """Test that all 4096 encodings decode back"""
+        self.assertEqual(len(DECODE_TABLE), 4096)
+        for access_bytes, conditions in DECODE_TABLE.items():
+            self.assertEqual(encode_access_bits(conditions), access_bytes)
+
+    def test_inconsistent_bits_rejected(self):
+        """Test the inverted-bit consistency check"""
+        self.assertIsNone(decode_access_bits(bytes([0x00, 0x00, 0x00])))
+        self.assertIsNone(decode_access_bits(bytes([0xFF, 0x07, 0x81])))
+
+        bad_trailer = DEFAULT_KEY + bytes([0xFF, 0x0F, 0x80, 0x69]) + DEFAULT_KEY
+        is_valid, message = validate_trailer(bad_trailer)
+        self.assertFalse(is_valid)
+        self.assertGreater(len(message), 0)
+        self.assertIsNone(get_trailer_access(bad_trailer))
+
+        with self.assertRaises(ValueError):
+            build_trailer(DEFAULT_KEY, bytes([0xFF, 0x0F, 0x80]), DEFAULT_KEY)
+
+    def test_value_block_and_lock_detection(self):
+        """Test value block and permanent lock flags"""
+        access = get_sector_access(encode_access_bits((0b110, 0b001, 0b000, 0b110)))
+        self.assertTrue(access.is_value_block(0))
+        self.assertTrue(access.is_value_block(1))
+        self.assertFalse(access.is_value_block(2))
+        self.assertTrue(access.is_allowed(1, OP_DECREMENT, KEY_TYPE_A))
+        self.assertTrue(access.is_permanently_locked())
+
+    def test_block_groups(self):
+        """Test block to access group mapping"""
+        self.assertEqual([get_block_group(b, 4) for b in range(4)], [0, 1, 2, 3])
+        self.assertEqual(get_block_group(4, 16), 0)
+        self.assertEqual(get_block_group(5, 16), 1)
+        self.assertEqual(get_block_group(14, 16), 2)
+        self.assertEqual(get_block_group(15, 16), 3)
+
+    def test_parse_access_bits(self):
+        """Test trailer parsing helper"""
+        trailer = build_trailer(DEFAULT_KEY, bytes([0xFF, 0x07, 0x80]), DEFAULT_KEY)
+        parsed = parse_access_bits(trailer)
+        self.assertTrue(parsed["valid"])
+        self.assertEqual(parsed["conditions"], [0, 0, 0, 1])
+        self.assertEqual(parsed["gpb"], 0x69)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Tests for the access-condition-aware operation planner
+"""
+
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, DEFAULT_KEY
+from core.card_operations import CardOperations
+from core.authentication import AuthenticationManager
+from core.access_conditions import encode_access_bits
+from core.access_planner import AccessPlanner
+from core.dump import DumpEngine
+from tests.card_emulator import EmulatedCard, create_emulated_reader
+
+KEY_B = bytes([0xB0, 0xB1, 0xB2, 0xB3, 0xB4, 0xB5])
+
+class TestAccessPlanner(unittest.TestCase):
+    """Test cases for AccessPlanner"""
+
+    def setUp(self):
+        """Setup emulated card with a read-only-for-Key-A sector"""
+        self.card = EmulatedCard()
+        self.card.set_trailer(1, DEFAULT_KEY, bytes([0x78, 0x77, 0x88]), KEY_B)
+        self.card.set_block(4, bytes(range(16)))
+
+        self.reader_manager, self.connection = create_emulated_reader(self.card)
+        self.card_operations = CardOperations(self.reader_manager)
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations)
+        self.assertTrue(self.card_operations.detect_card())
+        self.planner = AccessPlanner(self.card_operations, self.auth_manager)
+
+    def test_write_uses_key_b(self):
+        """Test that writes pick the key type the access bits permit"""
+        key_map = {1: {KEY_TYPE_A: DEFAULT_KEY, KEY_TYPE_B: KEY_B}}
+        plan = self.planner.plan([(4, "read"), (5, "write"), (6, "read")], key_map)
+
+        self.assertEqual(plan.get_skipped(), [])
+        self.assertEqual({op.key_type for op in plan.operations}, {KEY_TYPE_B})
+
+        results = self.planner.execute(plan, {5: bytes([0xAA] * 16)})
+        self.assertEqual(results[4], bytes(range(16)))
+        self.assertTrue(results[5])
+        self.assertEqual(self.card.get_block(5), bytes([0xAA] * 16))
+
+    def test_impossible_operations_skipped_up_front(self):
+        """Test that operations without a permitted key are not attempted"""
+        key_map = {1: {KEY_TYPE_A: DEFAULT_KEY}}
+        plan = self.planner.plan([(4, "read"), (5, "write"), (9, "read")], key_map)
+
+        skipped = {op.block: op.reason for op in plan.get_skipped()}
+        self.assertIn("Key B", skipped[5])
+        self.assertIn("No key", skipped[9])
+
+        auths_before = self.connection.auth_count
+        results = self.planner.execute(plan)
+        self.assertEqual(self.connection.auth_count - auths_before, 1)
+        self.assertEqual(list(results), [4])
+
+    def test_trailer_read_once_per_card(self):
+        """Test that trailers are decoded once and reused"""
+        key_map = {1: {KEY_TYPE_A: DEFAULT_KEY}}
+        self.planner.plan([(4, "read")], key_map)
+        auths = self.connection.auth_count
+        self.planner.plan([(5, "read")], key_map)
+        self.assertEqual(self.connection.auth_count, auths)
+
+    def test_failed_trailer_read_not_cached(self):
+        """Test that a wrong key does not hide the trailer from a later plan"""
+        plan = self.planner.plan([(5, "write")], {1: {KEY_TYPE_B: DEFAULT_KEY}})
+        self.assertIn("could not be read", plan.get_skipped()[0].reason)
+
+        plan = self.planner.plan([(5, "write")], {1: {KEY_TYPE_B: KEY_B}})
+        self.assertEqual(plan.get_skipped(), [])
+        self.assertEqual(plan.operations[0].key_type, KEY_TYPE_B)
+
+    def test_dump_reads_with_permitted_key_type(self):
+        """Test that the dump engine retries blocks with the key type the trailer permits"""
+        self.card.set_trailer(2, DEFAULT_KEY, encode_access_bits((0b011, 0b011, 0b011, 0b011)), KEY_B)
+        self.card.set_block(8, bytes([8] * 16))
+        engine = DumpEngine(self.card_operations, self.auth_manager, self.planner)
+
+        key_map = {2: {KEY_TYPE_A: DEFAULT_KEY, KEY_TYPE_B: KEY_B}}
+        image = engine.dump(key_map, sectors=[2])
+        self.assertEqual(engine.last_report["failed_sectors"], [])
+        self.assertEqual(image.get_block(8), bytes([8] * 16))
+
+        # The decoded trailer sends the next dump straight to Key B
+        auths = self.connection.auth_count
+        image = engine.dump(key_map, sectors=[2])
+        self.assertTrue(image.is_sector_complete(2))
+        self.assertEqual(self.connection.auth_count - auths, 1)
+
+if __name__ == '__main__':
+    unittest.main()
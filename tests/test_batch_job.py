@@ -0,0 +1,205 @@
+"""
+Tests for manifest-driven batch jobs
+"""
+
+import json
+import tempfile
+import tracemalloc
+import unittest
+import sys
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.authentication import AuthenticationManager
+from core.card_operations import CardOperations
+from core.card_template import CardTemplate, compile_template
+from core.dump_library import DumpLibrary
+from core.batch_job import (
+    BatchJob, Manifest, ManifestError, MATCH_UID, STATUS_ASSIGNED, STATUS_OK
+)
+from tests.card_emulator import EmulatedCard, create_emulated_reader
+
+TEMPLATE = {
+    "name": "badge",
+    "sectors": {"1": {"data": {"4": "00" * 16}}},
+    "fields": [
+        {"name": "holder", "block": 4, "offset": 0, "length": 12, "encoding": "ascii"},
+        {"name": "number", "block": 4, "offset": 12, "length": 4, "encoding": "uint_be"}
+    ]
+}
+
+class TestManifest(unittest.TestCase):
+    """Test cases for streaming manifest parsing"""
+
+    def setUp(self):
+        """Create temporary directory"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        """Remove temporary directory"""
+        self.temp_dir.cleanup()
+
+    def test_csv_offsets(self):
+        """Test rows, quoted newlines and continuing from a saved offset"""
+        path = self.root / "orders.csv"
+        path.write_text('uid,holder,number\n01020304,"Ann\nLee",1\n,Bob,2\n\n0A0B0C0D,Cy,3\n')
+        rows = list(Manifest(path).rows())
+
+        self.assertEqual([row.index for row in rows], [0, 1, 2])
+        self.assertEqual(rows[0].uid, bytes([1, 2, 3, 4]))
+        self.assertEqual(rows[0].values, {"holder": "Ann\nLee", "number": "1"})
+        self.assertIsNone(rows[1].uid)
+        rest = list(Manifest(path).rows(rows[0].next_offset, 1))
+        self.assertEqual([row.values["holder"] for row in rest], ["Bob", "Cy"])
+        self.assertEqual(Manifest(path).row_at(rows[2].offset, 2).uid, bytes.fromhex("0A0B0C0D"))
+
+    def test_json_array_and_lines(self):
+        """Test JSON arrays parsed across chunk boundaries and JSON lines"""
+        records = [{"uid": f"0102030{i}", "holder": "Zoë" * i, "number": i} for i in range(5)]
+        array_path = self.root / "orders.json"
+        array_path.write_text(json.dumps(records, ensure_ascii=False, indent=1), encoding="utf-8")
+        lines_path = self.root / "orders.jsonl"
+        lines_path.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+        with mock.patch("core.batch_job.READ_CHUNK_SIZE", 7):
+            manifest = Manifest(array_path)
+            rows = list(manifest.rows())
+            self.assertEqual([row.values["holder"] for row in rows], [record["holder"] for record in records])
+            self.assertEqual(manifest.row_at(rows[3].offset, 3).values["number"], 3)
+            self.assertEqual(len(list(manifest.rows(rows[3].next_offset, 4))), 1)
+        rows = list(Manifest(lines_path).rows())
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(Manifest(lines_path).uid_index()[bytes.fromhex("01020304")], (4, rows[4].offset))
+
+        # Offsets of a manifest saved with a BOM still point at the rows
+        array_path.write_text(json.dumps(records), encoding="utf-8-sig")
+        rows = list(Manifest(array_path).rows())
+        self.assertEqual(Manifest(array_path).row_at(rows[1].offset, 1).values["number"], 1)
+
+        array_path.write_text('[{"holder": "x"}, ')
+        with self.assertRaises(ManifestError):
+            list(Manifest(array_path).rows())
+
+    def test_large_manifest_streams(self):
+        """Test rows are read without holding the manifest in memory"""
+        path = self.root / "large.csv"
+        with open(path, "w") as f:
+            f.write("holder,number\n")
+            for i in range(20000):
+                f.write(f"holder {i},{i}\n")
+
+        tracemalloc.start()
+        count = sum(1 for _ in Manifest(path).rows())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertEqual(count, 20000)
+        self.assertLess(peak, 1024 * 1024)
+
+class TestBatchJob(unittest.TestCase):
+    """Test cases for BatchJob on an emulated reader"""
+
+    def setUp(self):
+        """Set up emulated reader, manifest and library"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.reader_manager, self.connection = create_emulated_reader()
+        self.card_operations = CardOperations(self.reader_manager)
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations)
+        self.manifest_path = self.root / "orders.csv"
+        self.manifest_path.write_text("uid,holder,number\n" + "".join(
+            f"0102030{i},holder {i},{i}\n" for i in range(4)))
+        self.output_path = self.root / "results.jsonl"
+        self.library = DumpLibrary(self.root / "library")
+
+    def tearDown(self):
+        """Close library and remove temporary directory"""
+        self.library.close()
+        self.temp_dir.cleanup()
+
+    def make_job(self, match="sequence"):
+        """Create a job over the test manifest"""
+        program = compile_template(CardTemplate.from_dict(TEMPLATE))
+        return BatchJob(Manifest(self.manifest_path), program, self.output_path, self.library, match)
+
+    def run_cards(self, job, cards, max_cards=None):
+        """Present cards one after another to a line running job"""
+        queue = list(cards)
+        self.connection.present(queue.pop(0))
+
+        def next_card(result):
+            self.connection.remove()
+            if queue:
+                self.connection.present(queue.pop(0))
+
+        line = job.create_line(self.card_operations, self.auth_manager, on_result=next_card,
+                               signal=False, poll_interval=0.001)
+        return line.run(max_cards=max_cards or len(cards))
+
+    def output(self):
+        """Get result log entries"""
+        return [json.loads(line) for line in self.output_path.read_text().splitlines()]
+
+    def test_sequence_resume(self):
+        """Test rows go to cards in order and a new job continues after the last row"""
+        cards = [EmulatedCard(uid=bytes([9, 9, 9, i])) for i in range(4)]
+        job = self.make_job()
+        self.run_cards(job, cards[:2])
+        self.assertEqual(cards[1].get_block(4), b"holder 1\x00\x00\x00\x00" + (1).to_bytes(4, "big"))
+
+        job = self.make_job()
+        self.assertEqual(job.stats.resumed, 2)
+        stats = self.run_cards(job, cards[2:])
+        self.assertEqual(stats["encoded"], 2)
+        self.assertEqual(cards[3].get_block(4)[0:8], b"holder 3")
+        self.assertFalse(job.remaining())
+
+        ok = [entry for entry in self.output() if entry["status"] == STATUS_OK]
+        self.assertEqual([entry["row"] for entry in ok], [0, 1, 2, 3])
+        record = self.library.latest(cards[2].uid)
+        self.assertIsNotNone(record)
+        self.assertEqual(record.label, "orders.csv row 2")
+
+    def test_failed_card_row_goes_to_next_card(self):
+        """Test a failed card does not consume its row"""
+        bad = EmulatedCard(uid=bytes([7, 7, 7, 7]))
+        bad.set_trailer(1, bytes(6), bytes.fromhex("FF0780"), bytes(6))
+        good = EmulatedCard(uid=bytes([8, 8, 8, 8]))
+        job = self.make_job()
+        stats = self.run_cards(job, [bad, good])
+
+        self.assertEqual((stats["encoded"], stats["failed"]), (1, 1))
+        self.assertEqual(good.get_block(4)[0:8], b"holder 0")
+
+    def test_in_doubt_row_reserved_for_its_card(self):
+        """Test a row handed out right before a crash stays with that card"""
+        card = EmulatedCard(uid=bytes([5, 5, 5, 5]))
+        row = Manifest(self.manifest_path).row_at(18, 0)
+        with open(self.output_path, "w") as f:
+            f.write(json.dumps({"row": 0, "offset": row.offset, "next_offset": row.next_offset, "uid": "05050505",
+                                "status": STATUS_ASSIGNED}) + "\n")
+            f.write('{"row": 1, "offs')
+        other = EmulatedCard(uid=bytes([6, 6, 6, 6]))
+        job = self.make_job()
+        self.assertEqual(job.stats.in_doubt, 1)
+        self.run_cards(job, [other, card])
+
+        self.assertEqual(other.get_block(4)[0:8], b"holder 1")
+        self.assertEqual(card.get_block(4)[0:8], b"holder 0")
+
+    def test_uid_match(self):
+        """Test cards take the row with their UID and unknown cards fail"""
+        cards = [EmulatedCard(uid=bytes([1, 2, 3, i])) for i in (2, 0)]
+        stranger = EmulatedCard(uid=bytes([4, 4, 4, 4]))
+        job = self.make_job(MATCH_UID)
+        stats = self.run_cards(job, cards + [stranger])
+
+        self.assertEqual((stats["encoded"], stats["failed"]), (2, 1))
+        self.assertEqual(cards[0].get_block(4)[0:8], b"holder 2")
+        self.assertEqual(cards[1].get_block(4)[0:8], b"holder 0")
+        self.assertEqual(stranger.get_block(4), bytes(16))
+
+if __name__ == '__main__':
+    unittest.main()
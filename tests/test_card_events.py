@@ -0,0 +1,172 @@
+"""
+Tests for the continuous read mode and its event stream
+"""
+
+import io
+import json
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import KEY_TYPE_A, DEFAULT_KEY
+from core.authentication import AuthenticationManager
+from core.card_events import ContinuousReader, EventPublisher, StreamSink, UnixSocketSink
+from core.card_operations import CardOperations
+from tests.card_emulator import EmulatedCard, create_emulated_reader, TRANSPORT_ACCESS
+
+SECRET_KEY = bytes.fromhex("A0A1A2A3A4A5")
+
+class SlowSink:
+    """Sink taking a fixed time per line"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.lines = []
+
+    def write(self, data):
+        time.sleep(self.delay)
+        self.lines.append(json.loads(data))
+
+    def close(self):
+        pass
+
+class TestContinuousReader(unittest.TestCase):
+    """Test cases for ContinuousReader on an emulated reader"""
+
+    def setUp(self):
+        """Set up emulated reader"""
+        self.reader_manager, self.connection = create_emulated_reader()
+        self.card_operations = CardOperations(self.reader_manager)
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations)
+
+    def test_events_per_tap(self):
+        """Test one NDJSON record per tapped card with blocks and timings"""
+        cards = [EmulatedCard(uid=bytes([1, 2, 3, i])) for i in range(3)]
+        for i, card in enumerate(cards):
+            card.set_block(4, bytes([i]) * 16)
+        cards[1].set_trailer(2, SECRET_KEY, TRANSPORT_ACCESS, SECRET_KEY)
+
+        output = io.BytesIO()
+        publisher = EventPublisher(StreamSink(output))
+        queue = list(cards)
+        self.connection.present(queue.pop(0))
+        publish = publisher.publish
+
+        def publish_and_swap(record, detected=None):
+            publish(record, detected)
+            self.connection.remove()
+            if queue:
+                self.connection.present(queue.pop(0))
+        publisher.publish = publish_and_swap
+
+        reader = ContinuousReader(self.card_operations, self.auth_manager, publisher, [1, 2],
+                                  poll_interval=0.001)
+        reader.run(max_events=3)
+        publisher.close()
+
+        events = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([event["uid"] for event in events], ["01020300", "01020301", "01020302"])
+        self.assertEqual(events[2]["blocks"]["4"], "02" * 16)
+        self.assertEqual(len(events[0]["blocks"]), 8)
+        self.assertEqual(events[1]["unread_sectors"], [2])
+        self.assertTrue(events[0]["atr"].startswith("3B8F"))
+        self.assertIn("tap_to_event_ms", events[0]["timings"])
+        self.assertEqual(publisher.to_dict()["tap_to_event"]["count"], 3)
+
+    def test_key_map(self):
+        """Test sectors are read with configured keys"""
+        card = EmulatedCard()
+        card.set_trailer(1, SECRET_KEY, TRANSPORT_ACCESS, SECRET_KEY)
+        self.connection.present(card)
+        reader = ContinuousReader(self.card_operations, self.auth_manager, EventPublisher(SlowSink(0)), [0, 1],
+                                  key_map={0: {KEY_TYPE_A: DEFAULT_KEY}, 1: {KEY_TYPE_A: SECRET_KEY}})
+        record = reader.read_card(card.uid)
+        self.assertEqual(record["unread_sectors"], [])
+        self.assertEqual(len(record["blocks"]), 8)
+        # Key A is masked; Key B is readable data under the transport access bits
+        self.assertEqual(record["blocks"]["7"], "00" * 6 + TRANSPORT_ACCESS.hex().upper() + "69" +
+                         SECRET_KEY.hex().upper())
+
+        reader.include_keys = True
+        self.assertTrue(reader.read_card(card.uid)["blocks"]["7"].startswith(SECRET_KEY.hex().upper()))
+
+class TestEventPublisher(unittest.TestCase):
+    """Test cases for bounded event delivery"""
+
+    def test_slow_consumer_never_blocks(self):
+        """Test publishing stays fast and drops the oldest records when the sink lags"""
+        sink = SlowSink(0.02)
+        publisher = EventPublisher(sink, buffer_size=4)
+        start = time.perf_counter()
+        for i in range(20):
+            publisher.publish({"n": i}, time.monotonic())
+        self.assertLess(time.perf_counter() - start, 0.01)
+        publisher.close()
+
+        stats = publisher.to_dict()
+        self.assertGreater(stats["dropped"], 0)
+        self.assertEqual(stats["written"] + stats["dropped"], 20)
+        self.assertEqual(sink.lines[-1]["n"], 19)
+
+    def test_unix_socket_consumers(self):
+        """Test lines reach connected consumers and a stalled one is disconnected"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            sink = UnixSocketSink(Path(temp_dir) / "events.sock", send_timeout=0.05)
+            reader = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            reader.connect(str(sink.path))
+            stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stalled.connect(str(sink.path))
+            deadline = time.monotonic() + 1
+            while sink.client_count() < 2 and time.monotonic() < deadline:
+                time.sleep(0.005)
+
+            received = bytearray()
+
+            def drain():
+                while True:
+                    data = reader.recv(65536)
+                    if not data:
+                        return
+                    received.extend(data)
+            drainer = threading.Thread(target=drain, daemon=True)
+            drainer.start()
+
+            line = json.dumps({"blocks": "00" * 32768}).encode() + b"\n"
+            for _ in range(40):
+                sink.write(line)
+            self.assertEqual(sink.client_count(), 1)
+            sink.close()
+            drainer.join(1)
+            reader.close()
+            stalled.close()
+            self.assertEqual(len(received), 40 * len(line))
+            self.assertFalse(sink.path.exists())
+
+    def test_unix_socket_path(self):
+        """Test only a stale socket is replaced and a missing directory is created private"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "run" / "events.sock"
+            sink = UnixSocketSink(path)
+            self.assertEqual(path.parent.stat().st_mode & 0o777, 0o700)
+            with self.assertRaises(FileExistsError):
+                UnixSocketSink(path)
+            sink.close()
+
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(str(path))
+            stale.close()
+            UnixSocketSink(path).close()
+
+            path.write_text("not a socket")
+            with self.assertRaises(FileExistsError):
+                UnixSocketSink(path)
+            self.assertEqual(path.read_text(), "not a socket")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+"""
+Tests for card templates and the template compiler
+"""
+
+import json
+import tempfile
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B
+from core.access_conditions import encode_access_bits
+from core.authentication import AuthenticationManager
+from core.card_image import CardImage
+from core.card_operations import CardOperations
+from core.card_template import (
+    CardTemplate, STEP_LOAD_KEY, STEP_AUTH, STEP_READ, TemplateError, compile_template, encode_field_value,
+    load_template, save_template
+)
+from core.production import ImageTemplate, ProductionLine
+from tests.card_emulator import EmulatedCard, create_emulated_reader
+
+NEW_KEY_A = "112233445566"
+NEW_KEY_B = "AABBCCDDEEFF"
+
+TEMPLATE = {
+    "version": 1,
+    "name": "member card",
+    "card_type": "1k",
+    "sectors": {
+        "1": {
+            "data": {"4": "00" * 16, "5": "4D454D424552" + "00" * 10, "6": "FF" * 16},
+            "key_a": NEW_KEY_A, "access": [0, 0, 0, 1], "key_b": NEW_KEY_B
+        },
+        "2": {
+            "data": {"8": "11" * 16},
+            # Data readable with Key B only
+            "key_a": NEW_KEY_A, "access": [3, 3, 3, 3], "key_b": NEW_KEY_B
+        },
+        "3": {"data": {"12": "22" * 16}}
+    },
+    "fields": [
+        {"name": "uid", "block": 4, "offset": 0, "length": 7, "source": "uid"},
+        {"name": "serial", "block": 4, "offset": 8, "length": 4, "source": "counter",
+         "encoding": "uint_be", "start": 1000},
+        {"name": "holder", "block": 8, "offset": 0, "length": 16, "encoding": "ascii"}
+    ]
+}
+
+class TestCardTemplate(unittest.TestCase):
+    """Test cases for template parsing and validation"""
+
+    def test_round_trip(self):
+        """Test JSON load and save keep the layout"""
+        template = CardTemplate.from_dict(TEMPLATE)
+        template.validate()
+        self.assertEqual(template.sectors[1].access, encode_access_bits([0, 0, 0, 1]))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "template.json"
+            save_template(template, path)
+            loaded = load_template(path)
+        self.assertEqual(loaded.to_dict(), template.to_dict())
+        self.assertEqual(loaded.sectors[2].trailer, template.sectors[2].trailer)
+
+    def test_validation_errors(self):
+        """Test invalid layouts are rejected before any card is touched"""
+        cases = [
+            ("sectors", {"0": {"data": {"0": "00" * 16}}}),
+            ("sectors", {"1": {"data": {"7": "00" * 16}}}),
+            ("sectors", {"1": {"data": {"4": "00" * 15}}}),
+            ("sectors", {"1": {"key_a": NEW_KEY_A, "access": "FFFFFF", "key_b": NEW_KEY_B}}),
+            ("sectors", {"1": {"key_a": NEW_KEY_A}}),
+            ("fields", [{"name": "x", "block": 13, "length": 2}]),
+            ("fields", [{"name": "x", "block": 4, "offset": 10, "length": 7}]),
+            ("fields", [{"name": "x", "block": 4, "length": 4}, {"name": "y", "block": 4, "offset": 3, "length": 2}]),
+            ("fields", [{"name": "x", "block": 4, "length": 4, "source": "clock"}]),
+        ]
+        for key, value in cases:
+            with self.subTest(value=value):
+                data = json.loads(json.dumps(TEMPLATE))
+                data[key] = value
+                with self.assertRaises(TemplateError):
+                    CardTemplate.from_dict(data).validate()
+
+    def test_field_encodings(self):
+        """Test field value encodings"""
+        self.assertEqual(encode_field_value(258, "uint_be", 3), b"\x00\x01\x02")
+        self.assertEqual(encode_field_value(258, "uint_le", 2), b"\x02\x01")
+        self.assertEqual(encode_field_value(1234, "bcd", 3), b"\x00\x12\x34")
+        self.assertEqual(encode_field_value("AB", "ascii", 4), b"AB\x00\x00")
+        self.assertEqual(encode_field_value("0102", "bytes", 3), b"\x01\x02\x00")
+        for value, encoding, length in ((256, "uint_be", 1), (12345, "bcd", 2), ("ABC", "ascii", 2), ("é", "ascii", 2)):
+            with self.assertRaises(TemplateError):
+                encode_field_value(value, encoding, length)
+
+    def test_from_image(self):
+        """Test a dump becomes a template using its key map for trailer keys"""
+        image = CardImage()
+        image.set_block(5, b"\x05" * 16)
+        image.set_block(7, bytes(6) + bytes.fromhex("FF078069") + bytes(6))
+        image.key_map = {1: {KEY_TYPE_A: bytes.fromhex(NEW_KEY_A), KEY_TYPE_B: bytes.fromhex(NEW_KEY_B)}}
+        template = CardTemplate.from_image(image)
+        template.validate()
+        self.assertEqual(list(template.sectors), [1])
+        self.assertEqual(template.sectors[1].trailer[0:6], bytes.fromhex(NEW_KEY_A))
+
+    def test_from_image_unknown_keys(self):
+        """Test masked trailer keys missing from the key map are refused"""
+        image = CardImage()
+        image.set_block(5, b"\x05" * 16)
+        image.set_block(7, bytes(6) + bytes.fromhex("08778F69") + bytes(6))
+        with self.assertRaises(TemplateError):
+            CardTemplate.from_image(image)
+        self.assertFalse(CardTemplate.from_image(image, trailers=False).sectors[1].has_trailer)
+
+        # Key B is readable under transport access, so its zeros are the real key
+        image.set_block(7, bytes(6) + bytes.fromhex("FF078069") + bytes(6))
+        image.key_map = {1: {KEY_TYPE_A: bytes.fromhex(NEW_KEY_A)}}
+        self.assertEqual(CardTemplate.from_image(image).sectors[1].trailer[10:16], bytes(6))
+        image.key_map = {1: {KEY_TYPE_B: bytes.fromhex(NEW_KEY_B)}}
+        with self.assertRaises(TemplateError):
+            CardTemplate.from_image(image)
+
+class TestCardProgram(unittest.TestCase):
+    """Test cases for compiled programs on an emulated reader"""
+
+    def setUp(self):
+        """Set up emulated reader"""
+        self.reader_manager, self.connection = create_emulated_reader()
+        self.card_operations = CardOperations(self.reader_manager)
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations)
+        self.program = compile_template(CardTemplate.from_dict(TEMPLATE))
+
+    def test_program_shape(self):
+        """Test keys are loaded only when no slot holds them"""
+        kinds = [step.kind for step in self.program.write_steps]
+        self.assertEqual(kinds.count(STEP_LOAD_KEY), 1)
+        self.assertEqual(kinds.count(STEP_AUTH), 3)
+        verify_keys = [step.apdu[8] for step in self.program.verify_steps if step.kind == STEP_AUTH]
+        # Sector 2's trailer is proven with Key A as well; sector 1's Key B is readable data
+        self.assertEqual(verify_keys, [KEY_TYPE_A, KEY_TYPE_B, KEY_TYPE_A, KEY_TYPE_A])
+        trailer_reads = [step.block for step in self.program.verify_steps if step.kind == STEP_READ and step.block % 4 == 3]
+        self.assertEqual(trailer_reads, [7, 11])
+        self.assertEqual([step.kind for step in self.program.verify_steps].count(STEP_LOAD_KEY), 3)
+        self.assertEqual(self.program.unverified_blocks, [])
+
+    def test_run_patches_fields_per_card(self):
+        """Test variable fields differ per card while the rest is shared"""
+        cards = [EmulatedCard(uid=bytes([1, 2, 3, i])) for i in range(2)]
+        for index, card in enumerate(cards):
+            self.connection.present(card)
+            start = self.connection.apdu_count
+            result = self.program.run(self.reader_manager, card.uid, {"holder": f"Holder {index}"})
+            self.assertTrue(result.success, result)
+            self.assertEqual(self.connection.apdu_count - start, self.program.apdu_count())
+
+        self.assertEqual(cards[0].get_block(4)[0:12], bytes([1, 2, 3, 0, 0, 0, 0, 0, 0, 0, 0x03, 0xE8]))
+        self.assertEqual(cards[1].get_block(4)[0:12], bytes([1, 2, 3, 1, 0, 0, 0, 0, 0, 0, 0x03, 0xE9]))
+        self.assertEqual(cards[1].get_block(8), b"Holder 1" + bytes(8))
+        self.assertEqual(cards[1].get_block(5)[0:6], b"MEMBER")
+        self.assertEqual(cards[1].get_block(11)[10:16], bytes.fromhex(NEW_KEY_B))
+        self.assertEqual(self.program.counters["serial"], 1002)
+
+        with self.assertRaises(TemplateError):
+            self.program.prepare(cards[0].uid)
+
+    def test_verify_failure_keeps_counter(self):
+        """Test a card whose data differs fails verify and does not consume a serial"""
+        card = EmulatedCard()
+        self.connection.present(card)
+        self.program.prepare(card.uid, {"holder": "x"})
+        self.assertTrue(self.program.execute(self.reader_manager, self.program.write_steps).success)
+        card.set_block(12, bytes(16))
+        result = self.program.execute(self.reader_manager, self.program.verify_steps)
+        self.assertFalse(result.success)
+        self.assertEqual(result.failed_step.block, 12)
+        self.assertEqual(self.program.counters["serial"], 1000)
+
+    def test_production_line_uses_fewer_apdus(self):
+        """Test the compiled program in the production loop against the image template"""
+        self.program.value_provider = lambda uid: {"holder": uid.hex()}
+        line = ProductionLine(self.card_operations, self.auth_manager, self.program, signal=False)
+        card = EmulatedCard()
+        self.connection.present(card)
+        self.assertTrue(line.process_card(card.uid).success)
+        self.assertEqual(card.get_block(8)[0:8], card.uid.hex().encode())
+
+        image = CardImage()
+        for block in (4, 5, 6, 7, 8, 11, 12):
+            image.set_block(block, card.get_block(block))
+        image.key_map = {sector: {KEY_TYPE_A: bytes.fromhex(NEW_KEY_A), KEY_TYPE_B: bytes.fromhex(NEW_KEY_B)}
+                         for sector in (1, 2)}
+        image.set_block(7, bytes.fromhex(NEW_KEY_A) + card.get_block(7)[6:10] + bytes.fromhex(NEW_KEY_B))
+        image.set_block(11, bytes.fromhex(NEW_KEY_A) + card.get_block(11)[6:10] + bytes.fromhex(NEW_KEY_B))
+        image_template = ImageTemplate(image)
+        card = EmulatedCard(uid=bytes(4))
+        self.connection.present(card)
+        self.card_operations.set_detected_card(card.uid)
+        start = self.connection.apdu_count
+        self.assertTrue(image_template.write(self.card_operations, self.auth_manager))
+        # Compare the write phase: the compiled verify phase also proves both new keys
+        # and reads the trailers back, which the image template does not
+        self.assertLess(len(self.program.write_steps), self.connection.apdu_count - start)
+        self.assertTrue(image_template.verify(self.card_operations, self.auth_manager))
+
+if __name__ == '__main__':
+    unittest.main()
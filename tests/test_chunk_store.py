@@ -0,0 +1,90 @@
+"""
+Tests for the content-addressed chunk store
+"""
+
+import tempfile
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K
+from core.chunk_store import ChunkDumpStore, COMPRESSION_LZMA, COMPRESSION_ZLIB
+from core.dump_library import DumpLibrary
+from tests.card_images import make_image
+
+class TestChunkDumpStore(unittest.TestCase):
+    """Test cases for ChunkDumpStore"""
+
+    def setUp(self):
+        """Setup test fixtures"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.temp_dir.cleanup()
+
+    def test_round_trip_and_sector_access(self):
+        """Test images and single sectors are reconstructed for both compressors"""
+        for compression in (COMPRESSION_ZLIB, COMPRESSION_LZMA):
+            store = ChunkDumpStore(self.root / compression, compression=compression, frame_size=512)
+            images = [make_image(i, CARD_TYPE_MIFARE_4K if i % 2 else CARD_TYPE_MIFARE_1K) for i in range(20)]
+            refs = [store.put(image.to_bytes()) for image in images]
+            self.assertEqual(store.get(refs[3]), images[3].to_bytes())  # before flush
+            store.flush()
+            store.close()
+
+            store = ChunkDumpStore(self.root / compression, compression=COMPRESSION_ZLIB)
+            self.assertEqual(store.compression, compression)
+            for image, ref in zip(images, refs):
+                self.assertEqual(store.get(ref), image.to_bytes())
+                self.assertEqual(store.get_sector(ref, 1), image.get_sector(1))
+            self.assertEqual(store.get_sector(refs[1], 35), images[1].get_sector(35))
+            store.close()
+            self.assertEqual({path.stat().st_mode & 0o777 for path in (self.root / compression).iterdir()},
+                             {0o600})
+
+    def test_deduplication(self):
+        """Test shared sectors are stored once"""
+        store = ChunkDumpStore(self.root)
+        for i in range(100):
+            store.put(make_image(i).to_bytes())
+        store.flush()
+        stats = store.get_stats()
+        self.assertEqual(stats["manifests"], 100)
+        # 14 shared sectors plus sectors 0 and 1 per card
+        self.assertEqual(stats["chunks"], 14 + 2 * 100)
+        self.assertLess(stats["pack_bytes"], 100 * 1024 // 10)
+        store.close()
+
+    def test_delete_and_compact(self):
+        """Test compaction drops chunks no manifest references"""
+        store = ChunkDumpStore(self.root, frame_size=256)
+        refs = [store.put(make_image(i).to_bytes()) for i in range(10)]
+        store.flush()
+        for ref in refs[:5]:
+            store.delete(ref)
+        self.assertEqual(store.compact(), 10)
+        self.assertEqual(store.compact(), 0)
+        self.assertEqual(store.get(refs[7]), make_image(7).to_bytes())
+        with self.assertRaises(KeyError):
+            store.get(refs[0])
+        store.close()
+
+    def test_library_backend(self):
+        """Test the dump library works on top of the chunk store"""
+        library_dir = self.root / "library"
+        library = DumpLibrary(library_dir, store=ChunkDumpStore(library_dir / "chunks"))
+        dump_ids = library.add_many(make_image(i) for i in range(10))
+        record = library.get_record(dump_ids[4])
+        self.assertEqual(library.load(record).to_bytes(), make_image(4).to_bytes())
+        self.assertEqual(library.load_sector(record, 1), make_image(4).get_sector(1))
+        library.close()
+
+        with self.assertRaises(ValueError):
+            DumpLibrary(library_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+Tests for the headless command-line interface
+"""
+
+import contextlib
+import io
+import json
+import os
+import subprocess
+import tempfile
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import cli
+from config.constants import DEFAULT_KEY
+from core.dump_formats import load_image
+from core.remote_reader import ReaderBridgeAgent
+from tests.card_emulator import EmulatedCard, create_emulated_reader, TRANSPORT_ACCESS
+
+ROOT = Path(__file__).parent.parent
+SECRET_KEY = bytes.fromhex("1A2B3C4D5E6F")
+
+class TestCli(unittest.TestCase):
+    """Test cases for cli commands against an emulated reader behind a bridge agent"""
+
+    def setUp(self):
+        """Start an agent in front of the emulator"""
+        self.card = EmulatedCard()
+        for block in range(1, 64):
+            if (block + 1) % 4:
+                self.card.set_block(block, bytes([block] * 16))
+        local_manager, self.connection = create_emulated_reader(self.card)
+        self.agent = ReaderBridgeAgent(local_manager, "127.0.0.1", 0)
+        self.agent.start()
+        self.addCleanup(self.agent.stop)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def run_cli(self, *args):
+        """Run a command and return (exit code, parsed JSON output)"""
+        host, port = self.agent.address
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(io.StringIO()):
+            code = cli.main(["--remote", f"{host}:{port}", "--no-cache", *args])
+        text = stdout.getvalue()
+        return code, json.loads(text) if text else None
+
+    def test_detect_read_write(self):
+        """Test detect, read and write"""
+        code, result = self.run_cli("detect")
+        self.assertEqual(code, cli.EXIT_OK)
+        self.assertEqual(result["uid"], self.card.uid.hex().upper())
+        self.assertTrue(result["atr"].startswith("3B8F"))
+
+        code, result = self.run_cli("write", "5", "CD" * 16)
+        self.assertEqual(code, cli.EXIT_OK)
+        code, result = self.run_cli("read", "4", "5", "9")
+        self.assertEqual(code, cli.EXIT_OK)
+        self.assertEqual(result["blocks"], {"4": "04" * 16, "5": "CD" * 16, "9": "09" * 16})
+
+        self.card.set_trailer(2, SECRET_KEY, TRANSPORT_ACCESS, SECRET_KEY)
+        code, result = self.run_cli("read", "4", "9")
+        self.assertEqual(code, cli.EXIT_FAILED)
+        self.assertEqual(result["failed_blocks"], [9])
+
+    def test_keymap_dump_restore(self):
+        """Test finding keys, dumping with them and restoring the dump to another card"""
+        self.card.set_trailer(3, SECRET_KEY, TRANSPORT_ACCESS, SECRET_KEY)
+        keys_path = Path(self.temp_dir.name) / "keys.json"
+        code, result = self.run_cli("keymap", "--sectors", "0-3", "-o", str(keys_path))
+        self.assertEqual(code, cli.EXIT_FAILED)
+        self.assertEqual(result["unknown_sectors"], [3])
+        keys = json.loads(keys_path.read_text())
+        keys["3"] = {"A": SECRET_KEY.hex()}
+        keys_path.write_text(json.dumps(keys))
+
+        dump_path = Path(self.temp_dir.name) / "card.json"
+        code, result = self.run_cli("dump", "--sectors", "0-3", "--keys", str(keys_path), "-o", str(dump_path))
+        self.assertEqual(code, cli.EXIT_OK)
+        self.assertEqual(result["report"]["failed_sectors"], [])
+        self.assertEqual(load_image(dump_path).get_block(13), bytes([13] * 16))
+
+        blank = EmulatedCard(uid=bytes([9, 9, 9, 9]))
+        self.connection.present(blank)
+        code, result = self.run_cli("restore", str(dump_path))
+        self.assertEqual(code, cli.EXIT_OK)
+        self.assertEqual(blank.get_block(13), bytes([13] * 16))
+        self.assertEqual(blank.get_block(15)[:6], SECRET_KEY)
+
+        code, result = self.run_cli("restore", str(dump_path), "--no-trailers")
+        self.assertEqual(code, cli.EXIT_FAILED)
+
+    def test_no_card(self):
+        """Test a missing card ends with its own exit code and no output"""
+        self.connection.remove()
+        code, result = self.run_cli("dump")
+        self.assertEqual(code, cli.EXIT_NO_CARD)
+        self.assertIsNone(result)
+
+    def test_bench(self):
+        """Test bench reports dump times"""
+        code, result = self.run_cli("bench", "--iterations", "2", "--sectors", "0-1")
+        self.assertEqual(code, cli.EXIT_OK)
+        self.assertEqual(len(result["dump_ms"]), 2)
+        self.assertIn("B0", result["apdu_latency"])
+
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            cli.build_parser().parse_args(["bench", "--iterations", "0"])
+
+    def test_vault(self):
+        """Test creating the key vault and importing a key set into it"""
+        vault_path = Path(self.temp_dir.name) / "keys.vault"
+        keys_path = Path(self.temp_dir.name) / "keys.json"
+        keys_path.write_text(json.dumps({"3": {"A": SECRET_KEY.hex()}}))
+        self.addCleanup(os.environ.pop, cli.VAULT_PASSPHRASE_ENV, None)
+        os.environ[cli.VAULT_PASSPHRASE_ENV] = "secret"
+
+        code, result = self.run_cli("vault", "--vault", str(vault_path), "list")
+        self.assertEqual(code, cli.EXIT_FAILED)
+        self.assertFalse(vault_path.exists())
+
+        code, result = self.run_cli("vault", "--vault", str(vault_path), "create")
+        self.assertEqual(code, cli.EXIT_OK)
+        code, result = self.run_cli("vault", "--vault", str(vault_path), "add-key-set", "site", str(keys_path))
+        self.assertEqual(code, cli.EXIT_OK)
+        self.assertEqual(result["key_sets"], ["site"])
+        code, result = self.run_cli("vault", "--vault", str(vault_path), "create")
+        self.assertEqual(code, cli.EXIT_FAILED)
+
+        os.environ[cli.VAULT_PASSPHRASE_ENV] = "typo"
+        code, result = self.run_cli("vault", "--vault", str(vault_path), "list")
+        self.assertEqual(code, cli.EXIT_FAILED)
+
+    def test_no_qt_imports(self):
+        """Test the CLI imports neither PyQt5 nor the GUI package"""
+        script = ("import sys, cli; "
+                  "print(sorted(m for m in sys.modules if m.split('.')[0] in ('PyQt5', 'gui')))")
+        output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=dict(os.environ),
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "[]")
+
+if __name__ == '__main__':
+    unittest.main()
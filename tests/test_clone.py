@@ -0,0 +1,96 @@
+"""
+Tests for two-reader pipelined cloning
+"""
+
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import DEFAULT_KEY, KEY_TYPE_A, KEY_TYPE_B
+from core.authentication import AuthenticationManager
+from core.card_operations import CardOperations
+from core.clone import CloneEngine, TrailerRewrite
+from core.dump import DumpEngine
+from tests.card_emulator import EmulatedCard, create_emulated_reader, TRANSPORT_ACCESS
+
+SOURCE_KEY = bytes.fromhex("A1B2C3D4E5F6")
+NEW_KEY = bytes.fromhex("0102030405FF")
+READ_ONLY_ACCESS = bytes.fromhex("787788")
+
+def connect(card, apdu_delay=0.0):
+    """Create a dump engine on its own emulated reader"""
+    reader_manager, connection = create_emulated_reader(card, apdu_delay)
+    card_operations = CardOperations(reader_manager)
+    auth_manager = AuthenticationManager(reader_manager, card_operations)
+    card_operations.detect_card()
+    return DumpEngine(card_operations, auth_manager), connection
+
+class TestCloneEngine(unittest.TestCase):
+    """Test cases for CloneEngine"""
+
+    def setUp(self):
+        """Set up a source card with data and custom keys in sector 2"""
+        self.source_card = EmulatedCard(uid=bytes([0x11, 0x22, 0x33, 0x44]))
+        for block in range(1, 64):
+            if (block + 1) % 4:
+                self.source_card.set_block(block, bytes([block]) * 16)
+        self.source_card.set_trailer(2, SOURCE_KEY, READ_ONLY_ACCESS, SOURCE_KEY)
+        self.key_map = {sector: {KEY_TYPE_A: DEFAULT_KEY} for sector in range(16)}
+        self.key_map[2] = {KEY_TYPE_A: SOURCE_KEY, KEY_TYPE_B: SOURCE_KEY}
+
+    def test_clone_copies_data_and_trailers(self):
+        """Test data and trailers are copied, block 0 is left alone"""
+        target_card = EmulatedCard(uid=bytes([0x55, 0x66, 0x77, 0x88]))
+        source, _ = connect(self.source_card)
+        target, _ = connect(target_card)
+        result = CloneEngine(source, target).clone(self.key_map)
+
+        self.assertTrue(result.success, result.error)
+        self.assertEqual(result.cloned_sectors, list(range(16)))
+        for block in range(1, 64):
+            self.assertEqual(target_card.get_block(block), self.source_card.get_block(block), block)
+        self.assertEqual(target_card.get_block(0)[0:4], bytes([0x55, 0x66, 0x77, 0x88]))
+
+    def test_rewrites(self):
+        """Test key and access rewrites are applied to the cloned trailers"""
+        target_card = EmulatedCard()
+        source, _ = connect(self.source_card)
+        target, _ = connect(target_card)
+        rewrite = TrailerRewrite(key_a=NEW_KEY, access=TRANSPORT_ACCESS)
+        result = CloneEngine(source, target).clone(
+            self.key_map, default_rewrite=TrailerRewrite(key_b=NEW_KEY), rewrites={2: rewrite}, sectors=[1, 2])
+
+        self.assertTrue(result.success, result.error)
+        self.assertEqual(target_card.get_block(11), NEW_KEY + TRANSPORT_ACCESS + b"\x69" + SOURCE_KEY)
+        self.assertEqual(target_card.get_block(7)[10:16], NEW_KEY)
+        self.assertEqual(target_card.get_block(9), bytes([9]) * 16)
+        self.assertEqual(target_card.get_block(13), bytes(16))
+
+    def test_unknown_source_key(self):
+        """Test a sector that cannot be read stops the clone before it is written"""
+        target_card = EmulatedCard()
+        source, _ = connect(self.source_card)
+        target, _ = connect(target_card)
+        key_map = dict(self.key_map)
+        del key_map[2]
+        result = CloneEngine(source, target).clone(key_map)
+
+        self.assertFalse(result.success)
+        self.assertEqual(result.failed_sector, 2)
+        self.assertEqual(result.cloned_sectors, [0, 1])
+        self.assertEqual(target_card.get_block(8), bytes(16))
+
+    def test_readers_overlap(self):
+        """Test clone time approaches the slower reader instead of the sum"""
+        target_card = EmulatedCard()
+        source, _ = connect(self.source_card, apdu_delay=0.001)
+        target, _ = connect(target_card, apdu_delay=0.001)
+        result = CloneEngine(source, target).clone(self.key_map)
+
+        self.assertTrue(result.success, result.error)
+        self.assertLess(result.elapsed, 0.85 * (result.source_time + result.target_time))
+
+if __name__ == '__main__':
+    unittest.main()
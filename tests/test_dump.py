@@ -0,0 +1,106 @@
+"""
+Tests for DumpEngine and CardImage
+"""
+
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, DEFAULT_KEY
+from core.card_image import CardImage
+from core.card_operations import CardOperations
+from core.authentication import AuthenticationManager
+from core.dump import DumpEngine
+from tests.card_emulator import EmulatedCard, create_emulated_reader
+
+FULL_KEY_MAP = {sector: {KEY_TYPE_A: DEFAULT_KEY} for sector in range(16)}
+
+class TestDumpEngine(unittest.TestCase):
+    """Test cases for DumpEngine"""
+
+    def setUp(self):
+        """Setup emulated card with recognizable block contents"""
+        self.card = EmulatedCard()
+        for block in range(1, 64):
+            if (block + 1) % 4:
+                self.card.set_block(block, bytes([block] * 16))
+        self._connect()
+
+    def _connect(self, apdu_delay=0.0):
+        """Connect engine to the emulated card"""
+        self.reader_manager, self.connection = create_emulated_reader(self.card, apdu_delay)
+        self.card_operations = CardOperations(self.reader_manager)
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations)
+        self.assertTrue(self.card_operations.detect_card())
+        self.engine = DumpEngine(self.card_operations, self.auth_manager)
+
+    def test_full_dump(self):
+        """Test reading every sector"""
+        image = self.engine.dump(FULL_KEY_MAP)
+        self.assertTrue(image.is_complete())
+        self.assertEqual(image.uid, self.card.uid)
+        self.assertEqual(image.get_block(9), bytes([9] * 16))
+        # Key A is masked by the card but restored from the key map
+        self.assertEqual(image.get_trailer(2)[:6], DEFAULT_KEY)
+        self.assertEqual(image.to_bytes(), bytes(self.card.memory))
+
+    def test_removed_card_leaves_explicit_holes(self):
+        """Test partial image when the card leaves the field"""
+        self.connection.remove_after = self.connection.apdu_count + 30
+        image = self.engine.dump(FULL_KEY_MAP)
+
+        self.assertTrue(self.engine.last_report["card_removed"])
+        self.assertFalse(image.is_complete())
+        self.assertTrue(image.is_sector_complete(0))
+        self.assertGreater(image.coverage(), 0.0)
+        self.assertEqual(image.first_missing_sector(), image.get_missing_sectors()[0])
+
+    def test_deadline_reads_priorities_first(self):
+        """Test that priority data is captured within a tight budget"""
+        self._connect(apdu_delay=0.004)
+        self.engine.dump(FULL_KEY_MAP, sectors=[0])  # measure APDU latencies
+
+        image = CardImage()
+        image = self.engine.dump_with_deadline(0.08, priority_sectors=[9], priority_blocks=[21],
+                                               key_map=FULL_KEY_MAP, image=image)
+        self.assertTrue(image.has_block(21))
+        self.assertTrue(image.is_sector_complete(9))
+        self.assertFalse(image.is_complete())
+        self.assertLessEqual(self.engine.last_report["elapsed_ms"], 80 * 1.5)
+        self.assertTrue(self.engine.last_report["skipped_sectors"])
+
+    def test_unverified_keys_not_copied(self):
+        """Test that a supplied key the card never accepted stays out of the image"""
+        wrong_key = bytes.fromhex("DEADBEEF0000")
+        image = self.engine.dump({2: {KEY_TYPE_A: DEFAULT_KEY, KEY_TYPE_B: wrong_key}}, sectors=[2])
+
+        # Transport trailers return Key B readable
+        self.assertEqual(image.get_trailer(2), bytes(self.card.get_block(11)))
+        self.assertEqual(image.key_map[2], {KEY_TYPE_A: DEFAULT_KEY})
+        self.assertEqual(self.engine.verify_keys(image, 2, {KEY_TYPE_B: wrong_key}), {KEY_TYPE_A: DEFAULT_KEY})
+
+    def test_deadline_reports_failed_sectors(self):
+        """Test that a sector whose key was rejected is reported by a deadline dump"""
+        key_map = dict(FULL_KEY_MAP)
+        key_map[3] = {KEY_TYPE_A: bytes.fromhex("DEADBEEF0000")}
+        self.engine.dump_with_deadline(10.0, priority_sectors=[2, 3, 4], key_map=key_map, include_rest=False)
+        self.assertEqual(self.engine.last_report["failed_sectors"], [3])
+
+class TestCardImage(unittest.TestCase):
+    """Test cases for CardImage"""
+
+    def test_4k_geometry(self):
+        """Test 4K sector layout and coverage"""
+        image = CardImage.from_bytes(bytes(4096))
+        self.assertEqual(image.sector_count, 40)
+        self.assertEqual(list(image.get_sector_blocks(32))[:2], [128, 129])
+        self.assertEqual(image.get_trailer_block(39), 255)
+        self.assertEqual(image.coverage(), 1.0)
+
+        with self.assertRaises(ValueError):
+            CardImage.from_bytes(bytes(100))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Tests for the dump diff engine
+"""
+
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.access_conditions import build_trailer, encode_access_bits
+from core.data_utils import is_value_block_format
+from core.dump_diff import (
+    CATEGORY_DATA, CATEGORY_MANUFACTURER, CATEGORY_TRAILER, CATEGORY_VALUE,
+    diff_images, stack_images, diff_block_matrix, rank_by_similarity
+)
+from tests.card_images import make_image
+
+KEY = bytes.fromhex("FFFFFFFFFFFF")
+TRAILER = build_trailer(KEY, encode_access_bits((0, 0, 0, 1)), KEY)
+VALUE_BLOCK = bytes.fromhex("64000000 9BFFFFFF 64000000 05FA05FA".replace(" ", ""))
+
+class TestDumpDiff(unittest.TestCase):
+    """Test cases for the dump diff engine"""
+
+    def test_identical(self):
+        """Test equal images produce no differences"""
+        diff = diff_images(make_image(trailer=TRAILER), make_image(trailer=TRAILER))
+        self.assertTrue(diff.is_identical)
+        self.assertIn("identical", diff.format_report())
+
+    def test_categories(self):
+        """Test differences are classified by block role"""
+        left, right = make_image(trailer=TRAILER), make_image(trailer=TRAILER)
+        right.set_block(0, bytes(16))
+        right.set_block(1, bytes([1, 2, 3, 4]) + bytes([1] * 12))
+        right.set_block(7, build_trailer(KEY, encode_access_bits((0, 0, 0, 3)), KEY))
+        left.set_block(8, VALUE_BLOCK)
+
+        diff = diff_images(left, right)
+        categories = {block_diff.block: block_diff.category for block_diff in diff.blocks}
+        self.assertEqual(categories, {0: CATEGORY_MANUFACTURER, 1: CATEGORY_DATA,
+                                      7: CATEGORY_TRAILER, 8: CATEGORY_VALUE})
+        self.assertEqual(diff.blocks[1].offsets, [1, 2, 3])
+        self.assertEqual(diff.blocks[2].fields, ["access_bits"])
+        self.assertEqual(diff.changed_sectors(), [0, 1, 2])
+        self.assertIn("bytes 1-3", diff.format_report())
+
+    def test_value_block_by_access_conditions(self):
+        """Test blocks in value-configured groups are value differences"""
+        left, right = make_image(trailer=TRAILER), make_image(trailer=TRAILER)
+        trailer = build_trailer(KEY, encode_access_bits((0b110, 0, 0, 1)), KEY)
+        left.set_block(11, trailer)
+        right.set_block(11, trailer)
+        right.set_block(8, bytes(16))
+        diff = diff_images(left, right)
+        self.assertEqual(diff.blocks[0].category, CATEGORY_VALUE)
+
+    def test_missing_blocks_and_ignore_keys(self):
+        """Test uncaptured blocks are listed separately and keys can be ignored"""
+        left, right = make_image(trailer=TRAILER), make_image(trailer=TRAILER)
+        right.captured[5] = 0
+        right.set_block(3, bytes(6) + left.get_block(3)[6:10] + bytes(6))
+
+        diff = diff_images(left, right)
+        self.assertEqual(diff.left_only, [5])
+        self.assertEqual([block_diff.block for block_diff in diff.blocks], [3])
+        self.assertTrue(diff_images(left, right, ignore_keys=True).is_identical)
+
+    def test_batch_ranking(self):
+        """Test one image is ranked against many stacked images"""
+        reference = make_image(trailer=TRAILER)
+        candidates = []
+        for changed in range(5):
+            image = make_image(trailer=TRAILER)
+            for block in range(1, changed + 1):
+                image.set_block(block * 4 + 1, bytes(16))
+            candidates.append(image)
+        candidates.reverse()
+
+        data, captured = stack_images(candidates)
+        self.assertEqual(data.shape, (5, 1024))
+        matrix = diff_block_matrix(reference, data, captured)
+        self.assertEqual(matrix.sum(axis=1).tolist(), [4, 3, 2, 1, 0])
+        self.assertEqual(rank_by_similarity(reference, data, captured)[0], (4, 0))
+
+    def test_value_block_format(self):
+        """Test value block layout detection"""
+        self.assertTrue(is_value_block_format(VALUE_BLOCK))
+        self.assertFalse(is_value_block_format(bytes(16)))
+
+if __name__ == '__main__':
+    unittest.main()
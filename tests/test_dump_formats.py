@@ -0,0 +1,139 @@
+"""
+Tests for dump file formats
+"""
+
+import tempfile
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K
+from core.access_conditions import encode_access_bits
+from core.dump_formats import (
+    DumpFormatError, MCT_UNKNOWN_BLOCK, detect_format, iter_blocks, load_image, save_image,
+    convert, convert_directory
+)
+from tests.card_images import make_image
+
+KEY_A = bytes.fromhex("A0A1A2A3A4A5")
+KEY_B = bytes.fromhex("B0B1B2B3B4B5")
+
+class TestDumpFormats(unittest.TestCase):
+    """Test cases for dump format readers and writers"""
+
+    def setUp(self):
+        """Setup test fixtures"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.temp_dir.cleanup()
+
+    def test_detect_format(self):
+        """Test format detection by extension"""
+        self.assertEqual(detect_format(Path("card.MFD")), "mfd")
+        self.assertEqual(detect_format(Path("card.dump")), "mct")
+        self.assertEqual(detect_format(Path("card.eml")), "eml")
+        with self.assertRaises(DumpFormatError):
+            detect_format(Path("card.txt"))
+
+    def test_round_trip_all_formats(self):
+        """Test every format preserves full 1K and 4K images"""
+        for card_type in (CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K):
+            image = make_image(card_type=card_type)
+            for extension in (".mfd", ".dump", ".eml", ".json"):
+                path = self.path / f"card{card_type}{extension}"
+                save_image(image, path)
+                loaded = load_image(path)
+                self.assertEqual(loaded.card_type, card_type, extension)
+                self.assertEqual(loaded.to_bytes(), image.to_bytes(), extension)
+                self.assertEqual(loaded.uid, image.uid, extension)
+
+    def test_binary_streaming(self):
+        """Test binary import yields blocks in order"""
+        image = make_image()
+        path = self.path / "card.bin"
+        save_image(image, path)
+        blocks = list(iter_blocks(path))
+        self.assertEqual(len(blocks), 64)
+        self.assertEqual(blocks[5], (5, bytes([5] * 16)))
+
+    def test_mct_unknown_blocks_and_keys(self):
+        """Test MCT dumps mark uncaptured blocks and unknown keys"""
+        image = make_image()
+        image.captured[9] = 0
+        image.set_block(3, bytes(6) + bytes.fromhex("FF078069") + KEY_B)  # Key A masked by the card
+        image.set_block(7, bytes(6) + bytes.fromhex("FF078069") + KEY_B)
+        image.key_map = {0: {KEY_TYPE_A: KEY_A}}
+        image.apply_key_map(image.key_map)
+        path = self.path / "card.dump"
+        save_image(image, path)
+
+        lines = path.read_text().splitlines()
+        self.assertEqual(lines[0], "+Sector: 0")
+        self.assertIn(MCT_UNKNOWN_BLOCK, lines)
+        self.assertTrue(lines[4].startswith(KEY_A.hex().upper()))
+        self.assertEqual(lines[9], "-" * 12 + "FF078069" + KEY_B.hex().upper())
+
+        loaded = load_image(path)
+        self.assertFalse(loaded.has_block(9))
+        self.assertEqual(loaded.key_map[0][KEY_TYPE_A], KEY_A)
+        self.assertNotIn(KEY_TYPE_A, loaded.key_map.get(1, {}))
+
+    def test_json_keys_and_partial(self):
+        """Test JSON keeps sector keys and skips uncaptured blocks"""
+        image = make_image()
+        image.captured[1] = 0
+        # Trailer as read from a card that hides Key B
+        image.set_block(11, bytes(6) + encode_access_bits((0, 0, 0, 0b011)) + bytes([0x69]) + bytes(6))
+        image.apply_key_map({2: {KEY_TYPE_A: KEY_A, KEY_TYPE_B: KEY_B}})
+        path = self.path / "card.json"
+        save_image(image, path)
+
+        loaded = load_image(path)
+        self.assertFalse(loaded.has_block(1))
+        self.assertEqual(loaded.key_map[2], {KEY_TYPE_A: KEY_A, KEY_TYPE_B: KEY_B})
+        self.assertEqual(loaded.get_block(11)[:6], KEY_A)
+        self.assertEqual(loaded.get_block(11)[10:], KEY_B)
+
+    def test_apply_key_map_keeps_returned_keys(self):
+        """Test that keys the card returned are not overwritten"""
+        image = make_image()
+        image.set_block(7, bytes(6) + bytes.fromhex("FF078069") + KEY_B)  # Key B readable
+        image.apply_key_map({1: {KEY_TYPE_A: KEY_A, KEY_TYPE_B: bytes(6)}})
+        self.assertEqual(image.get_block(7), KEY_A + bytes.fromhex("FF078069") + KEY_B)
+        image.apply_key_map({2: {KEY_TYPE_A: KEY_A}})
+        self.assertEqual(image.get_block(11), bytes([11] * 16))
+
+    def test_invalid_files(self):
+        """Test malformed input is rejected"""
+        path = self.path / "bad.eml"
+        path.write_text("0011\n")
+        with self.assertRaises(DumpFormatError):
+            load_image(path)
+        path = self.path / "bad.mfd"
+        path.write_bytes(bytes(100))
+        with self.assertRaises(ValueError):
+            load_image(path)
+
+    def test_convert_and_directory(self):
+        """Test single-file and directory conversion"""
+        image = make_image()
+        source = self.path / "src"
+        source.mkdir()
+        save_image(image, source / "a.mfd")
+        save_image(image, source / "b.eml")
+        (source / "notes.txt").write_text("ignored")
+
+        convert(source / "a.mfd", self.path / "a.json")
+        self.assertEqual(load_image(self.path / "a.json").to_bytes(), image.to_bytes())
+
+        count = convert_directory(source, self.path / "out", "mct")
+        self.assertEqual(count, 2)
+        self.assertEqual(load_image(self.path / "out" / "b.dump").to_bytes(), image.to_bytes())
+
+if __name__ == '__main__':
+    unittest.main()
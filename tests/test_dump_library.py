@@ -0,0 +1,132 @@
+"""
+Tests for the indexed dump library
+"""
+
+import tempfile
+import threading
+import time
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K, DEFAULT_KEY
+from core.dump_library import DumpLibrary
+from tests.card_images import make_image
+
+def make_library_image(uid_byte, sector_1=b"\x11", card_type=CARD_TYPE_MIFARE_1K):
+    """Build a captured image with a distinct UID and configurable sector 1"""
+    image = make_image(bytes([uid_byte, 0x22, 0x33, 0x44]), card_type)
+    image.set_sector(1, sector_1 * 64)
+    return image
+
+class TestDumpLibrary(unittest.TestCase):
+    """Test cases for DumpLibrary"""
+
+    def setUp(self):
+        """Setup test fixtures"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.library = DumpLibrary(Path(self.temp_dir.name), station="station-1")
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.library.close()
+        self.temp_dir.cleanup()
+
+    def test_add_and_load(self):
+        """Test an image round-trips with coverage and key map"""
+        image = make_library_image(1)
+        image.captured[5] = 0
+        image.key_map = {0: {KEY_TYPE_A: DEFAULT_KEY, KEY_TYPE_B: DEFAULT_KEY}}
+        dump_id = self.library.add(image, label="enrolment")
+
+        record = self.library.get_record(dump_id)
+        self.assertEqual(record.uid, image.uid)
+        self.assertEqual(record.station, "station-1")
+        self.assertEqual(record.label, "enrolment")
+
+        loaded = self.library.load(dump_id)
+        self.assertEqual(loaded.to_bytes(), image.to_bytes())
+        self.assertFalse(loaded.has_block(5))
+        self.assertEqual(loaded.key_map, image.key_map)
+        self.assertEqual(self.library.load_sector(record, 1), image.get_sector(1))
+
+    def test_find_by_uid_and_query(self):
+        """Test UID lookups return newest first and filters combine"""
+        now = time.time()
+        first = self.library.add(make_library_image(1), created=now - 100)
+        second = self.library.add(make_library_image(1), created=now, station="station-2")
+        third = self.library.add(make_library_image(2, card_type=CARD_TYPE_MIFARE_4K), created=now - 50)
+
+        records = self.library.find_by_uid(make_library_image(1).uid)
+        self.assertEqual([r.dump_id for r in records], [second, first])
+        self.assertEqual(self.library.latest(make_library_image(1).uid).dump_id, second)
+        self.assertEqual(len(self.library.query(card_type=CARD_TYPE_MIFARE_4K)), 1)
+        self.assertEqual([r.dump_id for r in self.library.query(station="station-1", since=now - 75)], [third])
+        self.assertEqual(len(self.library.uids()), 2)
+
+    def test_sector_and_template_queries(self):
+        """Test sector hash lookups ignore incomplete sectors"""
+        template = make_library_image(9, b"\xAA")
+        matching = self.library.add_many([make_library_image(1, b"\xAA"), make_library_image(2, b"\xAA")])
+        self.library.add(make_library_image(3, b"\xBB"))
+        partial = make_library_image(4, b"\xAA")
+        partial.captured[4] = 0
+        self.library.add(partial)
+
+        found = self.library.find_by_sector(1, template.get_sector(1))
+        self.assertEqual(sorted(r.dump_id for r in found), sorted(matching))
+
+        found = self.library.find_matching_template(template, sectors=[1, 2, 3])
+        self.assertEqual(sorted(r.dump_id for r in found), sorted(matching))
+
+    def test_deduplicated_storage_and_delete(self):
+        """Test identical images share storage until the last one is deleted"""
+        image = make_library_image(1)
+        first, second = self.library.add_many([image, image], batch_size=1)
+        self.assertEqual(self.library.count(), 2)
+
+        self.assertTrue(self.library.delete(first))
+        self.assertEqual(self.library.load(second).to_bytes(), image.to_bytes())
+        self.assertTrue(self.library.delete(second))
+        self.assertFalse(self.library.delete(second))
+        self.assertEqual(self.library.count(), 0)
+        self.assertEqual(list(Path(self.temp_dir.name, "dumps").rglob("*.mfd")), [])
+        self.assertEqual(self.library.get_sector_hashes(second), {})
+
+    def test_storage_deleted_under_lock(self):
+        """Test a concurrent add cannot slip in between the index delete and the storage delete"""
+        dump_id = self.library.add(make_library_image(1))
+        store_delete = self.library.store.delete
+        lock_free = []
+
+        def delete(ref):
+            probe = threading.Thread(target=lambda: lock_free.append(self.library._lock.acquire(blocking=False)))
+            probe.start()
+            probe.join()
+            return store_delete(ref)
+        self.library.store.delete = delete
+
+        self.assertTrue(self.library.delete(dump_id))
+        self.assertEqual(lock_free, [False])
+
+    def test_reopen(self):
+        """Test the index persists across instances"""
+        dump_id = self.library.add(make_library_image(1))
+        self.library.close()
+        self.library = DumpLibrary(Path(self.temp_dir.name))
+        self.assertEqual(self.library.load(dump_id).uid, make_library_image(1).uid)
+
+    def test_files_are_private(self):
+        """Test the index and stored dumps are readable by the owner only"""
+        image = make_library_image(1)
+        image.key_map = {0: {KEY_TYPE_A: DEFAULT_KEY}}
+        self.library.add(image)
+        root = Path(self.temp_dir.name)
+        self.assertEqual(root.stat().st_mode & 0o777, 0o700)
+        for path in root.rglob("*"):
+            self.assertEqual(path.stat().st_mode & 0o777, 0o700 if path.is_dir() else 0o600, path)
+
+if __name__ == '__main__':
+    unittest.main()
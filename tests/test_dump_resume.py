@@ -0,0 +1,91 @@
+"""
+Tests for resumable partial dumps
+"""
+
+import tempfile
+import time
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import KEY_TYPE_A, DEFAULT_KEY
+from core.card_image import CardImage
+from core.card_operations import CardOperations
+from core.authentication import AuthenticationManager
+from core.dump import DumpEngine
+from core.dump_resume import PartialDumpStore
+from tests.card_emulator import EmulatedCard, create_emulated_reader
+
+FULL_KEY_MAP = {sector: {KEY_TYPE_A: DEFAULT_KEY} for sector in range(16)}
+
+class TestPartialDumpStore(unittest.TestCase):
+    """Test cases for PartialDumpStore"""
+
+    def setUp(self):
+        """Setup test fixtures"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.card = EmulatedCard()
+        for block in range(1, 64):
+            if (block + 1) % 4:
+                self.card.set_block(block, bytes([block] * 16))
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.temp_dir.cleanup()
+
+    def _tap(self, store, remove_after=None):
+        """Present the card once and dump until it leaves the field"""
+        reader_manager, connection = create_emulated_reader(self.card)
+        card_operations = CardOperations(reader_manager)
+        auth_manager = AuthenticationManager(reader_manager, card_operations)
+        self.assertTrue(card_operations.detect_card())
+        if remove_after is not None:
+            connection.remove_after = connection.apdu_count + remove_after
+        engine = DumpEngine(card_operations, auth_manager)
+        return engine.dump(FULL_KEY_MAP, resume_store=store), connection
+
+    def test_resume_after_card_removal(self):
+        """Test that a second tap continues from the first missing sector"""
+        store = PartialDumpStore(persist_dir=Path(self.temp_dir.name))
+
+        first, _ = self._tap(store, remove_after=40)
+        self.assertFalse(first.is_complete())
+        captured = first.captured_block_count()
+        self.assertIsNotNone(store.get(self.card.uid))
+
+        # Fresh store instance reads the persisted partial image
+        store = PartialDumpStore(persist_dir=Path(self.temp_dir.name))
+        second, connection = self._tap(store)
+        self.assertTrue(second.is_complete())
+        self.assertEqual(second.to_bytes(), bytes(self.card.memory))
+        # Sectors captured on the first tap are not read again
+        self.assertLess(connection.auth_count, 16)
+        self.assertGreater(captured, 0)
+        self.assertIsNone(store.get(self.card.uid))
+
+    def test_persisted_files_are_private(self):
+        """Test partial images holding keys are readable by the owner only"""
+        persist_dir = Path(self.temp_dir.name) / "partial"
+        store = PartialDumpStore(persist_dir=persist_dir)
+        image = CardImage(uid=self.card.uid)
+        image.key_map = {0: {KEY_TYPE_A: DEFAULT_KEY}}
+        store.put(image)
+        self.assertEqual(persist_dir.stat().st_mode & 0o777, 0o700)
+        self.assertEqual([path.stat().st_mode & 0o777 for path in persist_dir.iterdir()], [0o600])
+
+    def test_expired_partial_dump_is_dropped(self):
+        """Test TTL expiry"""
+        store = PartialDumpStore(ttl=0.01)
+        image = CardImage(uid=self.card.uid)
+        image.set_block(0, self.card.get_block(0))
+        store.put(image)
+        self.assertIs(store.get(self.card.uid), image)
+
+        time.sleep(0.02)
+        self.assertIsNone(store.get(self.card.uid))
+        self.assertEqual(len(store), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Tests for fleet analytics
+"""
+
+import csv
+import tempfile
+import unittest
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K, DEFAULT_KEY
+from core.access_conditions import build_trailer, encode_access_bits
+from core.dump_library import DumpLibrary
+from core.fleet_analytics import FleetArray
+from tests.card_images import make_image, mask_keys
+
+CUSTOM_KEY = bytes.fromhex("123456789ABC")
+TRANSPORT_ACCESS = encode_access_bits((0, 0, 0, 1))
+LOCKED_ACCESS = encode_access_bits((0b100, 0b100, 0b100, 0b011))
+
+TRANSPORT_TRAILER = build_trailer(DEFAULT_KEY, TRANSPORT_ACCESS, DEFAULT_KEY)
+
+def make_fleet_image(serial, rekeyed=False, card_type=CARD_TYPE_MIFARE_1K):
+    """Build an image; rekeyed cards use a custom key and stricter access in sector 1"""
+    image = make_image(serial, card_type, trailer=TRANSPORT_TRAILER)
+    if rekeyed:
+        image.set_block(image.get_trailer_block(1), build_trailer(CUSTOM_KEY, LOCKED_ACCESS, CUSTOM_KEY))
+    return image
+
+class TestFleetArray(unittest.TestCase):
+    """Test cases for FleetArray"""
+
+    def setUp(self):
+        """Setup test fixtures"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name)
+        self.images = [make_fleet_image(i, rekeyed=i % 4 == 0) for i in range(1, 41)]
+        self.fleet = FleetArray.from_images(self.images + [make_fleet_image(99, card_type=CARD_TYPE_MIFARE_4K)],
+                                            CARD_TYPE_MIFARE_1K)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.temp_dir.cleanup()
+
+    def test_packing(self):
+        """Test images are packed row by row and other card types skipped"""
+        self.assertEqual(self.fleet.data.shape, (40, 1024))
+        self.assertEqual(self.fleet.captured.shape, (40, 64))
+        self.assertEqual(self.fleet.uids[0], "00000001")
+        self.assertEqual(self.fleet.data[3].tobytes(), self.images[3].to_bytes())
+        self.assertEqual(self.fleet.key_a().shape, (40, 16, 6))
+
+    def test_factory_keys_and_profiles(self):
+        """Test factory key counts and access profile histograms"""
+        counts = self.fleet.factory_key_counts()
+        self.assertEqual(counts["key_a"][0], 40)
+        self.assertEqual(counts["key_a"][1], 30)
+
+        histogram = self.fleet.access_profile_histogram(1)
+        self.assertEqual(histogram, {TRANSPORT_ACCESS.hex().upper(): 30, LOCKED_ACCESS.hex().upper(): 10})
+        self.assertEqual(sum(self.fleet.access_profile_histogram().values()), 40 * 16)
+
+        self.fleet.captured[:, 7] = False
+        self.assertEqual(self.fleet.factory_key_counts()["either"][1], 0)
+        self.assertEqual(self.fleet.access_profile_histogram(1), {})
+
+    def test_masked_trailers(self):
+        """Test keys read back masked count as unknown rather than factory keys"""
+        images = [make_fleet_image(1), make_fleet_image(2)]
+        for image in images:
+            image.set_block(3, build_trailer(DEFAULT_KEY, LOCKED_ACCESS, DEFAULT_KEY))
+        fleet = FleetArray.from_images([mask_keys(images[0]), mask_keys(images[1], known=False)],
+                                       CARD_TYPE_MIFARE_1K)
+
+        counts = fleet.factory_key_counts()
+        self.assertEqual(counts["key_a"][0], 1)
+        self.assertEqual(counts["key_a_unknown"][0], 1)
+        self.assertEqual(counts["key_b"][0], 1)
+        self.assertEqual(counts["key_b_unknown"][0], 1)
+        # Transport access leaves Key B readable, so it is known without a key map
+        self.assertEqual(counts["key_a_unknown"][1], 1)
+        self.assertEqual(counts["key_b"][1], 2)
+
+        fleet.save(self.path / "masked")
+        reopened = FleetArray.open(self.path / "masked")
+        self.assertEqual(reopened.factory_key_counts()["key_a"][0], 1)
+        self.assertEqual(reopened.subset([1]).factory_key_counts()["key_a_unknown"][0], 1)
+
+    def test_variability_and_entropy(self):
+        """Test per-block variability and entropy"""
+        variability = self.fleet.block_variability()
+        entropy = self.fleet.block_entropy()
+        self.assertEqual(variability[2], 0.0)
+        self.assertEqual(entropy[2], 0.0)
+        self.assertGreater(variability[4], 0.9)   # serial block differs on every card
+        self.assertGreater(entropy[4], 0.0)
+        self.assertAlmostEqual(variability[7], 10 / 40)
+
+        histogram = self.fleet.byte_histogram()
+        self.assertEqual(histogram.shape, (1024, 256))
+        self.assertEqual(histogram[32, 2], 40)
+
+    def test_memmap_save_and_open(self):
+        """Test memory-mapped packing, .npy round trip and CSV export"""
+        library = DumpLibrary(self.path / "library")
+        library.add_many(self.images)
+        fleet = FleetArray.from_library(library, CARD_TYPE_MIFARE_1K, memmap_dir=self.path / "fleet")
+        library.close()
+        self.assertIsInstance(fleet.data, np.memmap)
+        fleet.save(self.path / "fleet")
+
+        reopened = FleetArray.open(self.path / "fleet")
+        self.assertEqual(reopened.card_type, CARD_TYPE_MIFARE_1K)
+        self.assertEqual(sorted(reopened.uids), sorted(self.fleet.uids))
+        self.assertEqual(sorted(row.tobytes() for row in reopened.data),
+                         sorted(row.tobytes() for row in self.fleet.data))
+
+        reopened.export_block_stats_csv(self.path / "blocks.csv")
+        reopened.export_sector_stats_csv(self.path / "sectors.csv")
+        with open(self.path / "blocks.csv") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 64)
+        self.assertEqual(rows[3]["trailer"], "1")
+        with open(self.path / "sectors.csv") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(rows[1]["factory_key_a"], "30")
+        self.assertEqual(rows[1]["profiles"], "2")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+Tests for KeyCache and its use by AuthenticationManager
+"""
+
+import os
+import stat
+import tempfile
+import time
+import unittest
+from unittest import mock
+from unittest.mock import Mock
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, DEFAULT_KEY, TRANSPORT_KEY
+from core.key_cache import KeyCache
+from core.card_operations import CardOperations
+from core.authentication import AuthenticationManager
+
+UID = bytes([0xDE, 0xAD, 0xBE, 0xEF])
+SECRET_KEY = bytes([0x11, 0x22, 0x33, 0x44, 0x55, 0x66])
+
+class TestKeyCache(unittest.TestCase):
+    """Test cases for KeyCache"""
+
+    def setUp(self):
+        """Setup test fixtures"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = Path(self.temp_dir.name) / "key_cache.json"
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.temp_dir.cleanup()
+
+    def test_persists_known_and_failed_keys(self):
+        """Test that known and failed keys survive a reload"""
+        cache = KeyCache(self.cache_file)
+        cache.record_success(UID, 3, KEY_TYPE_B, SECRET_KEY)
+        cache.record_failure(UID, 3, KEY_TYPE_B, DEFAULT_KEY)
+        cache.record_failure(UID, 3, KEY_TYPE_B, TRANSPORT_KEY)
+        cache.save()
+
+        reloaded = KeyCache(self.cache_file)
+        self.assertEqual(reloaded.get_known_key(UID, 3, KEY_TYPE_B), SECRET_KEY)
+        self.assertIsNone(reloaded.get_known_key(UID, 3, KEY_TYPE_A))
+        self.assertTrue(reloaded.is_known_failed(UID, 3, KEY_TYPE_B, DEFAULT_KEY))
+        self.assertTrue(reloaded.is_known_failed(UID, 3, KEY_TYPE_B, TRANSPORT_KEY))
+        self.assertFalse(reloaded.is_known_failed(UID, 3, KEY_TYPE_A, DEFAULT_KEY))
+        self.assertEqual(reloaded.get_key_map(UID), {3: {KEY_TYPE_B: SECRET_KEY}})
+
+    def test_failure_of_known_key_forgets_it(self):
+        """Test that a rekeyed sector drops its cached key"""
+        cache = KeyCache(self.cache_file)
+        cache.record_success(UID, 1, KEY_TYPE_A, DEFAULT_KEY)
+        cache.record_failure(UID, 1, KEY_TYPE_A, DEFAULT_KEY)
+
+        self.assertIsNone(cache.get_known_key(UID, 1, KEY_TYPE_A))
+        self.assertTrue(cache.is_known_failed(UID, 1, KEY_TYPE_A, DEFAULT_KEY))
+
+        cache.record_success(UID, 1, KEY_TYPE_A, DEFAULT_KEY)
+        self.assertFalse(cache.is_known_failed(UID, 1, KEY_TYPE_A, DEFAULT_KEY))
+
+    def test_failures_expire_and_are_not_stored_in_plaintext(self):
+        """Test that rejected keys are hashed on disk and forgotten after the TTL"""
+        cache = KeyCache(self.cache_file, failure_ttl=60)
+        cache.record_failure(UID, 2, KEY_TYPE_A, SECRET_KEY)
+        cache.save()
+        self.assertNotIn(SECRET_KEY.hex().upper(), self.cache_file.read_text().upper())
+        self.assertTrue(KeyCache(self.cache_file, failure_ttl=60).is_known_failed(UID, 2, KEY_TYPE_A, SECRET_KEY))
+
+        expired = KeyCache(self.cache_file, failure_ttl=0)
+        self.assertFalse(expired.is_known_failed(UID, 2, KEY_TYPE_A, SECRET_KEY))
+
+    def test_file_is_private_and_bounded(self):
+        """Test the cache file is owner-only, keeps the most recent cards and drops stale ones"""
+        cache = KeyCache(self.cache_file, max_cards=2)
+        for i in range(3):
+            cache.record_success(bytes([i]) * 4, 1, KEY_TYPE_A, SECRET_KEY)
+            time.sleep(0.01)
+        cache.save()
+        if os.name == "posix":
+            self.assertEqual(stat.S_IMODE(self.cache_file.stat().st_mode), 0o600)
+        reloaded = KeyCache(self.cache_file)
+        self.assertEqual(reloaded.card_count(), 2)
+        self.assertIsNone(reloaded.get_known_key(bytes(4), 1, KEY_TYPE_A))
+        self.assertEqual(KeyCache(self.cache_file, max_age=0).card_count(), 0)
+
+    def test_failed_save_is_retried(self):
+        """Test a cache that could not be written stays dirty"""
+        cache = KeyCache(self.cache_file)
+        cache.record_success(UID, 1, KEY_TYPE_A, SECRET_KEY)
+        with mock.patch("core.key_cache.write_private_file", side_effect=OSError("disk full")):
+            cache.save()
+        self.assertFalse(self.cache_file.exists())
+        cache.save()
+        self.assertEqual(KeyCache(self.cache_file).get_known_key(UID, 1, KEY_TYPE_A), SECRET_KEY)
+
+class TestAuthenticationWithKeyCache(unittest.TestCase):
+    """Test cases for cache-assisted authentication"""
+
+    def setUp(self):
+        """Setup test fixtures"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = KeyCache(Path(self.temp_dir.name) / "key_cache.json")
+
+        self.loaded_key = None
+        self.auth_attempts = 0
+
+        self.reader_manager = Mock()
+        self.reader_manager.is_connected.return_value = True
+        self.reader_manager.send_apdu.side_effect = self._send_apdu
+
+        self.card_operations = CardOperations(self.reader_manager)
+        self.card_operations.card_info.uid = UID
+        self.card_operations.card_info.present = True
+        self.card_operations.card_info.card_type = 1
+
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations, self.cache)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.temp_dir.cleanup()
+
+    def _send_apdu(self, command):
+        """Card that only accepts SECRET_KEY"""
+        if command[1] == 0x82:
+            self.loaded_key = bytes(command[5:11])
+            return [], 0x90, 0x00
+        if command[1] == 0x86:
+            self.auth_attempts += 1
+            if self.loaded_key == SECRET_KEY:
+                return [], 0x90, 0x00
+            return [], 0x63, 0x00
+        return [], 0x6A, 0x81
+
+    def test_default_sweep_records_failures(self):
+        """Test that a failed sweep is not repeated for the same card"""
+        self.assertFalse(self.auth_manager.try_default_keys(2, KEY_TYPE_A))
+        self.assertEqual(self.auth_attempts, 4)
+
+        self.auth_attempts = 0
+        self.assertFalse(self.auth_manager.try_default_keys(2, KEY_TYPE_A))
+        self.assertEqual(self.auth_attempts, 0)
+
+    def test_transient_failure_not_recorded(self):
+        """Test that statuses other than an auth rejection do not mark the key wrong"""
+        self.reader_manager.send_apdu.side_effect = lambda command: ([], 0x6F, 0x00)
+        self.assertFalse(self.auth_manager.authenticate_sector(2, KEY_TYPE_A, DEFAULT_KEY))
+        self.assertFalse(self.cache.is_known_failed(UID, 2, KEY_TYPE_A, DEFAULT_KEY))
+
+        # A rejection from a card that could not be reactivated proves nothing either
+        self.reader_manager.send_apdu.side_effect = self._send_apdu
+        self.reader_manager.reactivate_card.return_value = False
+        self.assertFalse(self.auth_manager.authenticate_sector(2, KEY_TYPE_A, DEFAULT_KEY))
+        self.assertFalse(self.cache.is_known_failed(UID, 2, KEY_TYPE_A, DEFAULT_KEY))
+
+    def test_represented_card_authenticates_first_try(self):
+        """Test that a cached key is tried before the dictionary"""
+        self.assertTrue(self.auth_manager.authenticate_sector(5, KEY_TYPE_A, SECRET_KEY))
+        self.auth_manager.clear_loaded_keys()
+
+        self.auth_attempts = 0
+        self.assertTrue(self.auth_manager.try_default_keys(5, KEY_TYPE_A))
+        self.assertEqual(self.auth_attempts, 1)
+        self.assertEqual(self.auth_manager.get_key_map(), {5: {KEY_TYPE_A: SECRET_KEY}})
+
+if __name__ == '__main__':
+    unittest.main()
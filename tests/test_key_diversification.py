@@ -0,0 +1,86 @@
+"""
+Tests for UID-based key diversification
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from cryptography.hazmat.primitives.ciphers import algorithms
+from cryptography.hazmat.primitives.cmac import CMAC
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B
+from core.key_diversification import (
+    AesCmacDiversifier, KeyDerivationEngine, create_diversifier
+)
+
+MASTER_KEY = bytes(range(16))
+UID = bytes([0x04, 0x7A, 0x3B, 0x12])
+
+class TestAesCmacDiversifier(unittest.TestCase):
+    """Test cases for AesCmacDiversifier"""
+
+    def test_derive_key_matches_cmac(self):
+        """Test derived key against a direct CMAC computation"""
+        cmac = CMAC(algorithms.AES(MASTER_KEY))
+        cmac.update(bytes([0x01]) + UID + bytes([5, KEY_TYPE_B]))
+        expected = cmac.finalize()[:6]
+
+        diversifier = AesCmacDiversifier(MASTER_KEY)
+        self.assertEqual(diversifier.derive_key(UID, 5, KEY_TYPE_B), expected)
+
+    def test_keys_differ_per_card_sector_and_type(self):
+        """Test that diversified keys are unique"""
+        diversifier = create_diversifier("aes-cmac", MASTER_KEY)
+        key_map = diversifier.derive_card_keys(UID, range(16))
+        keys = {key for sector_keys in key_map.values() for key in sector_keys.values()}
+        self.assertEqual(len(keys), 32)
+
+        other_card = diversifier.derive_card_keys(bytes([0x04, 0x7A, 0x3B, 0x13]), range(16))
+        self.assertNotEqual(key_map[0][KEY_TYPE_A], other_card[0][KEY_TYPE_A])
+
+    def test_invalid_master_key(self):
+        """Test rejection of wrong master key length"""
+        with self.assertRaises(ValueError):
+            AesCmacDiversifier(bytes(6))
+        with self.assertRaises(ValueError):
+            create_diversifier("unknown", MASTER_KEY)
+
+class TestKeyDerivationEngine(unittest.TestCase):
+    """Test cases for KeyDerivationEngine"""
+
+    def setUp(self):
+        """Setup test fixtures"""
+        self.engine = KeyDerivationEngine(AesCmacDiversifier(MASTER_KEY), cache_size=8)
+
+    def test_cache_is_bounded(self):
+        """Test LRU eviction of cached key maps"""
+        for i in range(20):
+            self.engine.derive_card_keys(bytes([0, 0, 0, i]))
+        self.assertEqual(len(self.engine._cache), 8)
+
+    def test_batch_matches_single_derivation(self):
+        """Test process-pool batch derivation"""
+        uids = [i.to_bytes(4, "big") for i in range(12)]
+        with patch('core.key_diversification.BATCH_CHUNK_SIZE', 4):
+            results = self.engine.derive_batch(uids, sector_count=40, processes=2)
+
+        single = AesCmacDiversifier(MASTER_KEY)
+        self.assertEqual(len(results), 12)
+        for uid in uids:
+            self.assertEqual(results[uid][39][KEY_TYPE_A], single.derive_key(uid, 39, KEY_TYPE_A))
+
+    def test_batch_derives_duplicates_once(self):
+        """Test a UID repeated in a batch is derived only once"""
+        uid = bytes([1, 2, 3, 4])
+        with patch.object(self.engine.diversifier, 'derive_card_keys',
+                          wraps=self.engine.diversifier.derive_card_keys) as derive:
+            results = self.engine.derive_batch([uid, uid, uid], processes=1)
+        self.assertEqual(list(results), [uid])
+        self.assertEqual(derive.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Tests for the encrypted key vault
+"""
+
+import tempfile
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import KEY_TYPE_A, KEY_TYPE_B, DEFAULT_KEY
+from core.key_vault import KeyVault, KeySet, VaultLockedError
+
+SITE_KEY = bytes([0x11, 0x22, 0x33, 0x44, 0x55, 0x66])
+MASTER_KEY = bytes(range(16))
+
+class TestKeyVault(unittest.TestCase):
+    """Test cases for KeyVault"""
+
+    def setUp(self):
+        """Setup test fixtures"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.vault_file = Path(self.temp_dir.name) / "keys.vault"
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.temp_dir.cleanup()
+
+    def _create_vault(self):
+        """Create a vault with one key set and one master"""
+        vault = KeyVault(self.vault_file, kdf_cost=2 ** 10)
+        self.assertTrue(vault.create("secret"))
+        vault.put_key_set(KeySet("site", {1: {KEY_TYPE_B: SITE_KEY}}, {KEY_TYPE_A: DEFAULT_KEY}))
+        vault.put_master("issuer", "aes-cmac", MASTER_KEY)
+        vault.save()
+        return vault
+
+    def test_round_trip(self):
+        """Test that saved key sets decrypt with the right passphrase"""
+        self._create_vault()
+
+        vault = KeyVault(self.vault_file)
+        self.assertTrue(vault.unlock("secret"))
+        self.assertEqual(vault.list_key_sets(), ["site"])
+        self.assertEqual(vault.list_masters(), ["issuer"])
+
+        key_set = vault.get_key_set("site")
+        self.assertEqual(key_set.get_key(1, KEY_TYPE_B), SITE_KEY)
+        self.assertEqual(key_set.get_key(7, KEY_TYPE_A), DEFAULT_KEY)
+        self.assertIsNone(key_set.get_key(7, KEY_TYPE_B))
+        self.assertIs(vault.get_key_set("site"), key_set)
+
+    def test_wrong_passphrase(self):
+        """Test that a wrong passphrase leaves the vault locked"""
+        self._create_vault()
+        self.assertNotIn(SITE_KEY.hex(), self.vault_file.read_text().lower())
+
+        vault = KeyVault(self.vault_file)
+        self.assertFalse(vault.unlock("wrong"))
+        self.assertFalse(vault.is_unlocked())
+        with self.assertRaises(VaultLockedError):
+            vault.list_key_sets()
+
+    def test_unlock_never_creates(self):
+        """Test that unlocking a missing vault fails and create refuses to overwrite"""
+        vault = KeyVault(self.vault_file, kdf_cost=2 ** 10)
+        self.assertFalse(vault.unlock("typo"))
+        self.assertFalse(self.vault_file.exists())
+
+        self._create_vault()
+        self.assertFalse(KeyVault(self.vault_file).create("other"))
+        self.assertTrue(KeyVault(self.vault_file).unlock("secret"))
+
+    def test_key_set_from_file(self):
+        """Test importing key sets from key map and key set files"""
+        key_map_file = Path(self.temp_dir.name) / "keys.json"
+        key_map_file.write_text('{"1": {"B": "%s"}}' % SITE_KEY.hex())
+        self.assertEqual(KeySet.from_file("site", key_map_file).get_key(1, KEY_TYPE_B), SITE_KEY)
+
+        key_set_file = Path(self.temp_dir.name) / "set.json"
+        key_set_file.write_text('{"default": {"A": "%s"}}' % DEFAULT_KEY.hex())
+        self.assertEqual(KeySet.from_file("site", key_set_file).get_key(9, KEY_TYPE_A), DEFAULT_KEY)
+
+        key_set_file.write_text('{}')
+        with self.assertRaises(ValueError):
+            KeySet.from_file("site", key_set_file)
+
+    def test_lock_clears_material(self):
+        """Test that locking drops decrypted keys"""
+        vault = self._create_vault()
+        engine = vault.get_derivation_engine("issuer")
+        self.assertEqual(len(engine.derive_key(bytes(4), 0, KEY_TYPE_A)), 6)
+        self.assertIs(vault.get_derivation_engine("issuer"), engine)
+
+        vault.lock()
+        with self.assertRaises(VaultLockedError):
+            vault.get_key_set("site")
+
+if __name__ == '__main__':
+    unittest.main()
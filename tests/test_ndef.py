@@ -0,0 +1,139 @@
+"""
+Tests for MAD parsing, lazy application reads and NDEF encoding
+"""
+
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K, DEFAULT_KEY, KEY_TYPE_A
+from core.authentication import AuthenticationManager
+from core.card_operations import CardOperations
+from core.dump import DumpEngine
+from core.mad import (
+    AID_NDEF, AID_FREE, AID_NOT_APPLICABLE, MadError, MadReader,
+    build_mad, mad_crc, parse_mad, parse_mad_image
+)
+from core.ndef import (
+    NdefError, NdefRecord, TLV_NDEF_MESSAGE, compile_ndef_image, decode_message, decode_ndef_area,
+    encode_message, encode_tlv, read_ndef
+)
+from tests.card_emulator import EmulatedCard, create_emulated_reader
+
+class TestMad(unittest.TestCase):
+    """Test cases for MAD encoding and parsing"""
+
+    def test_crc_reference(self):
+        """Test CRC against the NXP application note example MAD"""
+        mad1 = bytes.fromhex("0103E103E103E103E103E103E103E103E103E103E103E103E103E103E103E1")
+        self.assertEqual(mad_crc(mad1), 0x14)
+
+    def test_round_trip_v1_and_v2(self):
+        """Test built MADs parse back to the same directory"""
+        mad = build_mad({1: AID_NDEF, 2: AID_NDEF, 5: 0x1234})
+        parsed = parse_mad(mad.encode_v1(), 0xC1)
+        self.assertEqual(parsed.get_sectors(AID_NDEF), [1, 2])
+        self.assertEqual(parsed.get_applications(), {AID_NDEF: [1, 2], 0x1234: [5]})
+
+        mad = build_mad({20: AID_NDEF, 39: AID_NDEF}, CARD_TYPE_MIFARE_4K)
+        self.assertEqual(mad.aids[16], AID_NOT_APPLICABLE)
+        parsed = parse_mad(mad.encode_v1(), 0xC2, mad.encode_v2())
+        self.assertEqual(parsed.get_sectors(AID_NDEF), [20, 39])
+        self.assertEqual(parsed.aids[17], AID_FREE)
+
+    def test_corrupt_mad(self):
+        """Test CRC and DA bit are checked"""
+        data = bytearray(build_mad({1: AID_NDEF}).encode_v1())
+        with self.assertRaises(MadError):
+            parse_mad(bytes(data), 0x00)
+        data[5] ^= 0xFF
+        with self.assertRaises(MadError):
+            parse_mad(bytes(data), 0xC1)
+
+class TestNdef(unittest.TestCase):
+    """Test cases for NDEF records, TLVs and compiled images"""
+
+    def test_records_round_trip(self):
+        """Test text, URI, long and chunked records"""
+        records = [NdefRecord.text("Zażółć"), NdefRecord.uri("https://www.example.com/a"),
+                   NdefRecord.mime("application/octet-stream", bytes(300))]
+        decoded = decode_message(encode_message(records))
+        self.assertEqual(decoded[0].get_text(), "Zażółć")
+        self.assertEqual(decoded[1].payload[0], 0x02)
+        self.assertEqual(decoded[1].get_uri(), "https://www.example.com/a")
+        self.assertEqual(len(decoded[2].payload), 300)
+
+        chunked = bytes([0xB1, 1, 2]) + b"T" + b"\x02e" + bytes([0x56, 0, 3]) + b"n\xc5\x82"
+        self.assertEqual(decode_message(chunked)[0].get_text(), "ł")
+
+        with self.assertRaises(NdefError):
+            decode_message(bytes([0xD1, 1, 10]) + b"T")
+
+    def test_tlv_area(self):
+        """Test NULL TLVs are skipped and long TLV lengths are used"""
+        message = encode_message([NdefRecord.mime("a/b", bytes(400))])
+        area = b"\x00\x00" + encode_tlv(TLV_NDEF_MESSAGE, message) + b"\xFE"
+        self.assertEqual(area[3], 0xFF)
+        self.assertEqual(len(decode_ndef_area(area)[0].payload), 400)
+
+    def test_compiled_image(self):
+        """Test the compiled image carries a MAD pointing at the NDEF sectors"""
+        compiled = compile_ndef_image([NdefRecord.mime("a/b", bytes(200))])
+        mad = parse_mad_image(compiled.image)
+        self.assertEqual(mad.get_sectors(AID_NDEF), [1, 2, 3, 4, 5])
+        self.assertEqual(compiled.sectors, [0, 1, 2, 3, 4, 5])
+        self.assertEqual(compiled.block_count(), 3 + 5 * 4)
+        self.assertEqual(compiled.write_sequence[1][1][-1][0], 7)
+
+        compiled_4k = compile_ndef_image([NdefRecord.mime("a/b", bytes(900))], CARD_TYPE_MIFARE_4K)
+        self.assertNotIn(16, parse_mad_image(compiled_4k.image).get_sectors(AID_NDEF))
+        with self.assertRaises(NdefError):
+            compile_ndef_image([NdefRecord.mime("a/b", bytes(1000))], CARD_TYPE_MIFARE_1K)
+
+class TestMadReader(unittest.TestCase):
+    """Test cases for lazy application reads on an emulated card"""
+
+    def _connect(self, card):
+        """Connect a dump engine to an emulated card"""
+        reader_manager, connection = create_emulated_reader(card)
+        card_operations = CardOperations(reader_manager)
+        auth_manager = AuthenticationManager(reader_manager, card_operations)
+        self.assertTrue(card_operations.detect_card())
+        return card_operations, auth_manager, DumpEngine(card_operations, auth_manager), connection
+
+    def test_write_batch_and_read_lazily(self):
+        """Test one compiled image is written to several cards and read back by AID"""
+        compiled = compile_ndef_image([NdefRecord.uri("https://example.com/card")])
+        for uid_byte in (1, 2):
+            card = EmulatedCard(uid=bytes([uid_byte, 2, 3, 4]))
+            card_operations, auth_manager, engine, connection = self._connect(card)
+            self.assertTrue(compiled.write(card_operations, auth_manager))
+
+            card_operations, auth_manager, engine, connection = self._connect(card)
+            start = connection.apdu_count
+            records = read_ndef(engine)
+            self.assertEqual(records[0].get_uri(), "https://example.com/card")
+            lazy_apdus = connection.apdu_count - start
+            self.assertEqual(MadReader(engine).read_mad().get_sectors(AID_NDEF), [1])
+
+        card_operations, auth_manager, engine, connection = self._connect(card)
+        start = connection.apdu_count
+        key_map = {sector: {KEY_TYPE_A: DEFAULT_KEY} for sector in range(16)}
+        key_map.update(compiled.image.key_map)
+        image = engine.dump(key_map)
+        self.assertEqual(image.coverage(), 1.0)
+        self.assertLess(lazy_apdus * 3, connection.apdu_count - start)
+
+    def test_missing_application(self):
+        """Test reading an AID absent from the MAD"""
+        card = EmulatedCard()
+        card_operations, auth_manager, engine, connection = self._connect(card)
+        compile_ndef_image([NdefRecord.text("x")]).write(card_operations, auth_manager)
+        card_operations, auth_manager, engine, connection = self._connect(card)
+        with self.assertRaises(MadError):
+            MadReader(engine).read_application(0x1234)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Tests for the n-gram byte-pattern index
+"""
+
+import tempfile
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import CARD_TYPE_MIFARE_1K, CARD_TYPE_MIFARE_4K
+from core.card_image import CardImage
+from core.dump_library import DumpLibrary
+from core.ngram_index import image_ngrams
+from tests.card_images import make_image
+
+EMPLOYEE_ID = bytes.fromhex("C0FFEE1234")
+OLD_KEY = bytes.fromhex("A0A1A2A3A4A5")
+
+def make_serial_image(serial, card_type=CARD_TYPE_MIFARE_1K):
+    """Build an image with serial-dependent contents"""
+    return make_image(bytes([serial, 0x22, 0x33, 0x44]), card_type, fill=lambda block: bytes([serial, block & 0xFF]) * 8)
+
+class TestNgramIndex(unittest.TestCase):
+    """Test cases for n-gram search through the dump library"""
+
+    def setUp(self):
+        """Setup test fixtures"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.library = DumpLibrary(Path(self.temp_dir.name), ngram_index=True)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.library.close()
+        self.temp_dir.cleanup()
+
+    def test_image_ngrams_skip_uncaptured(self):
+        """Test n-grams are only taken from captured blocks"""
+        image = CardImage(CARD_TYPE_MIFARE_1K)
+        image.set_block(1, bytes(range(16)))
+        entries = {(int(entry >> 8), int(entry & 0xFF)) for entry in image_ngrams(image)}
+        self.assertEqual(len(entries), 13)
+        self.assertIn((0x00010203, 1), entries)
+
+    def test_search_finds_blocks(self):
+        """Test patterns are found inside and across blocks"""
+        images = [make_serial_image(i) for i in range(1, 6)]
+        images[1].set_block(5, bytes(10) + EMPLOYEE_ID + bytes(1))
+        images[3].set_block(8, bytes(14) + EMPLOYEE_ID[:2])
+        images[3].set_block(9, EMPLOYEE_ID[2:] + bytes(13))
+        big = make_serial_image(9, CARD_TYPE_MIFARE_4K)
+        big.set_block(200, OLD_KEY + bytes(10))
+        dump_ids = self.library.add_many(images + [big])
+
+        hits = self.library.search_bytes(EMPLOYEE_ID)
+        self.assertEqual(sorted((hit.dump_id, hit.block, hit.offset) for hit in hits),
+                         [(dump_ids[1], 5, 10), (dump_ids[3], 8, 14)])
+        self.assertEqual(self.library.search_uids(EMPLOYEE_ID), sorted([images[1].uid, images[3].uid]))
+
+        hits = self.library.search_bytes(OLD_KEY)
+        self.assertEqual([(hit.uid, hit.block) for hit in hits], [(big.uid, 200)])
+        self.assertEqual(self.library.search_bytes(bytes.fromhex("DEADBEEF")), [])
+        with self.assertRaises(ValueError):
+            self.library.search_bytes(b"\x01\x02")
+
+    def test_incremental_delete_and_rebuild(self):
+        """Test deletes update the index and existing dumps are indexed when enabling"""
+        image = make_serial_image(1)
+        image.set_block(4, EMPLOYEE_ID + bytes(11))
+        dump_id = self.library.add(image)
+        self.assertEqual(len(self.library.search_bytes(EMPLOYEE_ID)), 1)
+        self.library.delete(dump_id)
+        self.assertEqual(self.library.search_bytes(EMPLOYEE_ID), [])
+        self.assertEqual(self.library.ngram_index.entry_count(), 0)
+
+        self.library.close()
+        library_dir = Path(self.temp_dir.name) / "plain"
+        self.library = DumpLibrary(library_dir)
+        self.library.add(image)
+        with self.assertRaises(ValueError):
+            self.library.search_bytes(EMPLOYEE_ID)
+        self.library.close()
+
+        self.library = DumpLibrary(library_dir, ngram_index=True)
+        self.assertEqual(len(self.library.search_bytes(EMPLOYEE_ID)), 1)
+        self.library.close()
+
+        self.library = DumpLibrary(library_dir)
+        self.assertIsNotNone(self.library.ngram_index)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+"""
+Tests for the payload generation pipeline
+"""
+
+import itertools
+import threading
+import time
+import unittest
+import sys
+from concurrent import futures
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.authentication import AuthenticationManager
+from core.card_operations import CardOperations
+from core.card_template import CardTemplate, compile_template
+from core.payload_pipeline import EXECUTOR_PROCESS, PayloadPipeline, PipelineError
+from core.production import ProductionLine
+from tests.card_emulator import EmulatedCard, create_emulated_reader
+
+def square(key):
+    """Module-level generator usable by the process pool"""
+    return key * key
+
+class TestPayloadPipeline(unittest.TestCase):
+    """Test cases for PayloadPipeline"""
+
+    def test_source_order_with_out_of_order_completion(self):
+        """Test payloads finishing in reverse order are still delivered in order"""
+        def generate(key):
+            time.sleep(0.005 * (5 - key))
+            return f"payload {key}"
+
+        with PayloadPipeline(generate, range(5), depth=5) as pipeline:
+            delivered = [pipeline.take() for _ in range(5)]
+            with self.assertRaises(PipelineError):
+                pipeline.take()
+        self.assertEqual(delivered, [(key, f"payload {key}") for key in range(5)])
+
+    def test_backpressure(self):
+        """Test the source is only read depth items ahead of the consumer"""
+        pulled = []
+
+        def source():
+            for key in itertools.count():
+                pulled.append(key)
+                yield key
+
+        with PayloadPipeline(square, source(), depth=3) as pipeline:
+            self.assertEqual(len(pulled), 3)
+            self.assertEqual(pipeline.take(), (0, 0))
+            self.assertEqual(len(pulled), 4)
+            self.assertEqual(pipeline.pending_count(), 3)
+
+    def test_take_by_uid(self):
+        """Test cards arriving out of order get their own payloads"""
+        uids = [bytes([i]) * 4 for i in range(6)]
+        with PayloadPipeline(lambda uid: uid.hex(), uids, depth=3, key_by_uid=True) as pipeline:
+            self.assertEqual(pipeline.take(uids[2]), (uids[2], uids[2].hex()))
+            self.assertEqual(pipeline.take(uids[5]), (uids[5], uids[5].hex()))
+            self.assertEqual(pipeline.take(uids[0])[1], uids[0].hex())
+            self.assertEqual(pipeline.stats.on_demand, 1)
+            # uid 5 was generated on demand and is not generated again
+            self.assertEqual([pipeline.take(uid)[0] for uid in (uids[1], uids[3], uids[4])],
+                             [uids[1], uids[3], uids[4]])
+            self.assertEqual(pipeline.stats.on_demand, 1)
+
+    def test_generator_errors_propagate(self):
+        """Test a failing generator raises in the consumer"""
+        def generate(key):
+            raise ValueError(f"bad key {key}")
+
+        with PayloadPipeline(generate, range(2)) as pipeline:
+            with self.assertRaises(ValueError):
+                pipeline.take()
+
+    def test_timeout_keeps_payload(self):
+        """Test a take() that times out leaves its key at the head of the queue"""
+        release = threading.Event()
+
+        def generate(key):
+            if key == 0:
+                release.wait(5)
+            return f"payload {key}"
+
+        with PayloadPipeline(generate, range(3), depth=3) as pipeline:
+            with self.assertRaises(futures.TimeoutError):
+                pipeline.take(timeout=0.01)
+            release.set()
+            self.assertEqual([pipeline.take() for _ in range(3)],
+                             [(key, f"payload {key}") for key in range(3)])
+
+    def test_failed_generation_is_retried(self):
+        """Test the next take() after a generator error retries the same key"""
+        attempts = []
+
+        def generate(key):
+            attempts.append(key)
+            if attempts.count(key) == 1 and key == 0:
+                raise ValueError("transient")
+            return f"payload {key}"
+
+        with PayloadPipeline(generate, range(2)) as pipeline:
+            with self.assertRaises(ValueError):
+                pipeline.take()
+            self.assertEqual(pipeline.take(), (0, "payload 0"))
+            self.assertEqual(pipeline.take(), (1, "payload 1"))
+
+    def test_process_pool(self):
+        """Test generation in worker processes"""
+        with PayloadPipeline(square, range(4), depth=2, workers=2, executor=EXECUTOR_PROCESS) as pipeline:
+            self.assertEqual([pipeline.take()[1] for _ in range(4)], [0, 1, 4, 9])
+
+    def test_generation_overlaps_card_io(self):
+        """Test slow generation hides behind card I/O instead of adding to it"""
+        def generate(key):
+            time.sleep(0.02)
+            return key
+
+        start = time.perf_counter()
+        with PayloadPipeline(generate, range(10), depth=4) as pipeline:
+            for _ in range(10):
+                pipeline.take()
+                time.sleep(0.02)  # card I/O
+        elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 0.35)
+        self.assertLess(pipeline.stats.wait_time, 0.1)
+
+    def test_production_line_requeues_failed_payloads(self):
+        """Test serials from the pipeline skip no number when a card fails"""
+        template = CardTemplate.from_dict({
+            "sectors": {"1": {"data": {"4": "00" * 16}}},
+            "fields": [{"name": "serial", "block": 4, "length": 4, "encoding": "uint_be"}]
+        })
+        program = compile_template(template)
+        reader_manager, connection = create_emulated_reader()
+        card_operations = CardOperations(reader_manager)
+        auth_manager = AuthenticationManager(reader_manager, card_operations)
+
+        with PayloadPipeline(lambda key: {"serial": 500 + key}, itertools.count(), depth=4) as pipeline:
+            program.value_provider = pipeline.value_provider
+            line = ProductionLine(card_operations, auth_manager, program, signal=False,
+                                  on_result=pipeline.on_result)
+            locked = EmulatedCard(uid=bytes(4))
+            locked.set_trailer(1, bytes(6), bytes.fromhex("FF0780"), bytes(6))
+            cards = [EmulatedCard(uid=bytes([1, 1, 1, 1])), locked, EmulatedCard(uid=bytes([2, 2, 2, 2]))]
+            for card in cards:
+                connection.present(card)
+                line.process_card(card.uid)
+
+        self.assertEqual(cards[0].get_block(4)[0:4], (500).to_bytes(4, "big"))
+        self.assertEqual(cards[2].get_block(4)[0:4], (501).to_bytes(4, "big"))
+        self.assertEqual(pipeline.stats.requeued, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Tests for the production encoding loop
+"""
+
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import KEY_TYPE_A
+from core.access_conditions import build_trailer
+from core.authentication import AuthenticationManager
+from core.card_image import CardImage
+from core.card_operations import CardOperations
+from core.production import (
+    ImageTemplate, ProductionLine, ProductionResult, ProductionStats,
+    STAGE_DETECT, STAGE_WRITE, STAGE_VERIFY
+)
+from tests.card_emulator import EmulatedCard, create_emulated_reader, TRANSPORT_ACCESS
+
+NEW_KEY_A = bytes.fromhex("112233445566")
+NEW_KEY_B = bytes.fromhex("AABBCCDDEEFF")
+
+def make_template() -> ImageTemplate:
+    """Template writing sectors 1 and 2 with new keys"""
+    image = CardImage()
+    for block in (4, 5, 6, 8):
+        image.set_block(block, bytes([block]) * 16)
+    image.set_block(7, build_trailer(NEW_KEY_A, TRANSPORT_ACCESS, NEW_KEY_B))
+    image.set_block(11, build_trailer(NEW_KEY_A, TRANSPORT_ACCESS, NEW_KEY_B))
+    return ImageTemplate(image)
+
+class TestProductionLine(unittest.TestCase):
+    """Test cases for ProductionLine on an emulated reader"""
+
+    def setUp(self):
+        """Set up emulated reader and a queue of cards"""
+        self.reader_manager, self.connection = create_emulated_reader()
+        self.card_operations = CardOperations(self.reader_manager)
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations)
+        self.template = make_template()
+
+    def present_cards(self, cards):
+        """Start with the first card; each result swaps in the next one"""
+        queue = list(cards)
+        self.connection.present(queue.pop(0))
+
+        def next_card(result):
+            self.connection.remove()
+            if queue:
+                self.connection.present(queue.pop(0))
+        return next_card
+
+    def test_run_encodes_batch(self):
+        """Test cards are encoded, verified, and duplicates skipped"""
+        cards = [EmulatedCard(uid=bytes([1, 2, 3, i])) for i in range(3)]
+        locked = EmulatedCard(uid=bytes([9, 9, 9, 9]))
+        locked.set_trailer(1, NEW_KEY_B, TRANSPORT_ACCESS, NEW_KEY_B)
+        results = []
+        on_result = self.present_cards(cards + [cards[0], locked])
+
+        line = ProductionLine(self.card_operations, self.auth_manager, self.template,
+                              poll_interval=0.001,
+                              on_result=lambda result: (results.append(result), on_result(result)))
+        stats = line.run(max_cards=4)
+
+        self.assertEqual(stats["encoded"], 3)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["duplicates"], 1)
+        self.assertEqual(stats["failures_by_stage"], {STAGE_WRITE: 1})
+        self.assertAlmostEqual(stats["failure_rate"], 0.25)
+        self.assertTrue(results[3].duplicate)
+        self.assertEqual(stats["stages"][STAGE_VERIFY]["count"], 3)
+
+        for card in cards:
+            self.assertEqual(card.get_block(5), bytes([5]) * 16)
+            self.assertEqual(card.get_block(11)[0:6], NEW_KEY_A)
+        self.assertEqual(card.get_block(9), bytes(16))
+
+    def test_verify_detects_wrong_data(self):
+        """Test a block changed after writing fails verification"""
+        card = EmulatedCard()
+        self.connection.present(card)
+        original_write = self.template.write
+
+        def corrupting_write(card_operations, auth_manager):
+            success = original_write(card_operations, auth_manager)
+            card.set_block(4, bytes(16))
+            return success
+        self.template.write = corrupting_write
+
+        line = ProductionLine(self.card_operations, self.auth_manager, self.template, signal=False)
+        result = line.process_card(card.uid)
+        self.assertFalse(result.success)
+        self.assertEqual(result.failed_stage, STAGE_VERIFY)
+        self.assertNotIn(card.uid, line.processed_uids)
+
+    def test_processed_uids_are_skipped(self):
+        """Test UIDs from earlier runs are reported as duplicates without APDUs"""
+        card = EmulatedCard()
+        self.connection.present(card)
+        line = ProductionLine(self.card_operations, self.auth_manager, self.template,
+                              processed_uids=[card.uid], signal=False)
+        start = self.connection.apdu_count
+        result = line.process_card(card.uid)
+        self.assertTrue(result.duplicate)
+        self.assertIsNone(result.failed_stage)
+        self.assertEqual(self.connection.apdu_count, start)
+        self.assertIn(STAGE_DETECT, result.stage_times)
+
+class TestProductionStats(unittest.TestCase):
+    """Test cases for run statistics"""
+
+    def test_rate_window(self):
+        """Test cards/minute only counts completions inside the window"""
+        stats = ProductionStats(rate_window=60)
+        stats.started = 0.0
+        for second in range(0, 120, 2):
+            result = ProductionResult(bytes(4))
+            result.success = True
+            result.stage_times = {STAGE_WRITE: 0.1}
+            stats.record(result, now=float(second))
+        self.assertAlmostEqual(stats.cards_per_minute(now=119.0), 30.0)
+        self.assertAlmostEqual(stats.cycle.total, 6.0)
+
+if __name__ == '__main__':
+    unittest.main()
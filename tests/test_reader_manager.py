@@ -80,6 +80,63 @@ class TestReaderManager(unittest.TestCase):
         
         # Should not be called again
         callback_mock.assert_called_once_with(ReaderStatus.CONNECTING)
+    
+    def _connect_mock_card(self, uid):
+        """Attach a mock connection with a card of given UID"""
+        connection = Mock()
+        connection.control.return_value = ([0xE1, 0x00, 0x00, 0x00, 0x00], 0xE1, 0x00)
+        connection.transmit.return_value = (list(uid), 0x90, 0x00)
+        self.reader_manager.connection = connection
+        self.reader_manager.status = ReaderStatus.CONNECTED
+        return connection
+    
+    @patch('core.reader_manager.time.sleep')
+    def test_reactivate_card_confirms_uid(self, mock_sleep):
+        """Test card reactivation by RF field cycling"""
+        uid = bytes([0x01, 0x02, 0x03, 0x04])
+        connection = self._connect_mock_card(uid)
+        
+        self.assertTrue(self.reader_manager.reactivate_card(uid))
+        self.assertFalse(self.reader_manager.reactivate_card(bytes([0x09, 0x09, 0x09, 0x09])))
+        
+        field_commands = [call.args[1][-1] for call in connection.control.call_args_list]
+        self.assertEqual(field_commands, [0x00, 0x01, 0x00, 0x01])
+        
+        stats = self.reader_manager.get_reactivation_stats()
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual(stats["failures"], 1)
+        self.assertEqual(stats["method"], "field_reset")
+        self.assertIsNotNone(stats["average_ms"])
+    
+    def test_reactivate_card_falls_back_to_reconnect(self):
+        """Test reconnect fallback when field control is unsupported"""
+        uid = bytes([0x01, 0x02, 0x03, 0x04])
+        connection = self._connect_mock_card(uid)
+        connection.control.return_value = ([], 0x6A, 0x81)
+        
+        with patch.object(self.reader_manager, '_reactivate_by_reconnect', return_value=True) as reconnect:
+            self.assertTrue(self.reader_manager.reactivate_card(uid))
+            reconnect.assert_called_once()
+        
+        self.assertEqual(self.reader_manager.get_reactivation_stats()["method"], "reconnect")
+    
+    @patch('core.reader_manager.time.sleep')
+    def test_reactivate_card_falls_back_when_no_card(self, mock_sleep):
+        """Test reconnect runs when the card does not answer after a field reset"""
+        uid = bytes([0x01, 0x02, 0x03, 0x04])
+        connection = self._connect_mock_card(uid)
+        
+        # A method that finds no card is not remembered
+        connection.transmit.return_value = ([], 0x63, 0x00)
+        with patch.object(self.reader_manager, '_reactivate_by_reconnect', return_value=True):
+            self.assertFalse(self.reader_manager.reactivate_card(uid))
+        self.assertIsNone(self.reader_manager.get_reactivation_stats()["method"])
+        
+        connection.transmit.side_effect = [Exception("No card"), (list(uid), 0x90, 0x00)]
+        with patch.object(self.reader_manager, '_reactivate_by_reconnect', return_value=True) as reconnect:
+            self.assertTrue(self.reader_manager.reactivate_card(uid))
+            reconnect.assert_called_once()
+        self.assertEqual(self.reader_manager.get_reactivation_stats()["method"], "reconnect")
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,158 @@
+"""
+Tests for the reader service daemon and its Unix-socket API
+"""
+
+import socket
+import tempfile
+import time
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.authentication import AuthenticationManager
+from core.card_operations import CardOperations
+from core.reader_service import (
+    ReaderService, ReaderServiceClient, ReaderServiceError, recv_frame, send_frame,
+    EVENT_CARD_ARRIVAL, EVENT_CARD_REMOVAL, _Client
+)
+from tests.card_emulator import EmulatedCard, create_emulated_reader, TRANSPORT_ACCESS
+
+SECRET_KEY = bytes.fromhex("A0A1A2A3A4A5")
+
+class TestReaderService(unittest.TestCase):
+    """Test cases for ReaderService on an emulated reader"""
+
+    def setUp(self):
+        """Set up emulated reader and a running service"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.reader_manager, self.connection = create_emulated_reader()
+        self.card_operations = CardOperations(self.reader_manager)
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations)
+        self.card = EmulatedCard(uid=bytes([0x11, 0x22, 0x33, 0x44]))
+        self.card.set_block(4, bytes(range(16)))
+        self.card.set_trailer(2, SECRET_KEY, TRANSPORT_ACCESS, SECRET_KEY)
+        self.service = ReaderService(self.card_operations, self.auth_manager,
+                                     Path(self.temp_dir.name) / "reader.sock", poll_interval=0.005)
+        self.service.start()
+
+    def tearDown(self):
+        """Stop the service"""
+        self.service.stop()
+        self.temp_dir.cleanup()
+
+    def connect(self):
+        """Open a client on the service socket"""
+        client = ReaderServiceClient(self.service.path, timeout=5.0)
+        self.addCleanup(client.close)
+        return client
+
+    def test_two_clients_share_reader(self):
+        """Test two clients reading and writing through one reader"""
+        self.connection.present(self.card)
+        first, second = self.connect(), self.connect()
+
+        detected = first.call("detect")
+        self.assertTrue(detected["present"])
+        self.assertEqual(detected["uid"], "11223344")
+
+        self.assertEqual(second.call("read", block=4, key="FFFFFFFFFFFF"), bytes(range(16)).hex().upper())
+        self.assertTrue(first.call("write", block=9, data="AB" * 16, key=SECRET_KEY.hex()))
+        self.assertEqual(self.card.get_block(9), bytes([0xAB]) * 16)
+
+        dump = second.call("dump", sectors=[1, 2], key_map={"1": {"A": "FFFFFFFFFFFF"}, "2": {"A": SECRET_KEY.hex()}})
+        self.assertEqual(dump["uid"], "11223344")
+        self.assertEqual(dump["blocks"]["9"], "AB" * 16)
+        self.assertEqual(len(dump["blocks"]), 8)
+        self.assertEqual(dump["failed_sectors"], [])
+
+        metrics = first.call("metrics")
+        self.assertEqual(metrics["requests_served"], 4)
+        self.assertEqual(sorted(c["served"] for c in metrics["clients"].values()), [2, 2])
+        self.assertGreater(metrics["apdu_latency"]["B0"]["count"], 0)
+
+    def test_errors(self):
+        """Test failed operations answer with an error instead of dropping the client"""
+        client = self.connect()
+        with self.assertRaises(ReaderServiceError):
+            client.call("read", block=4)
+        self.connection.present(self.card)
+        client.call("detect")
+        with self.assertRaisesRegex(ReaderServiceError, "Authentication failed"):
+            client.call("read", block=8, key="FFFFFFFFFFFF")
+        with self.assertRaisesRegex(ReaderServiceError, "Unknown operation"):
+            client.call("format")
+        with self.assertRaises(ReaderServiceError):
+            client.call("write", block=4, data="zz")
+        self.assertEqual(client.call("read", block=8, key=SECRET_KEY.hex()), "00" * 16)
+
+    def test_fair_interleaving(self):
+        """Test a burst from one client does not hold back another client"""
+        self.connection.present(self.card)
+        self.connect().call("detect")
+        order = []
+        execute = self.service.execute
+
+        def recording_execute(message):
+            order.append(message["id"])
+            time.sleep(0.01)
+            return execute(message)
+        self.service.execute = recording_execute
+
+        burst = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        burst.connect(str(self.service.path))
+        self.addCleanup(burst.close)
+        for i in range(20):
+            send_frame(burst, {"id": f"burst-{i}", "op": "keymap"})
+        self.connect().call("keymap")
+        for _ in range(20):
+            self.assertTrue(recv_frame(burst)["ok"])
+
+        # Served on its first turn, not after the 20 queued ahead of it
+        self.assertLess(order.index(1), 4, order)
+
+    def test_card_events(self):
+        """Test subscribers are told about card arrival and removal"""
+        client = self.connect()
+        self.assertEqual(client.subscribe(), [EVENT_CARD_ARRIVAL, EVENT_CARD_REMOVAL])
+        self.connection.present(self.card)
+        arrival = client.next_event(timeout=2)
+        self.assertEqual(arrival["event"], EVENT_CARD_ARRIVAL)
+        self.assertEqual(arrival["uid"], "11223344")
+        self.assertEqual(client.call("read", block=4, key="FFFFFFFFFFFF"), bytes(range(16)).hex().upper())
+
+        self.connection.remove()
+        removal = client.next_event(timeout=2)
+        self.assertEqual(removal["event"], EVENT_CARD_REMOVAL)
+        with self.assertRaises(ReaderServiceError):
+            client.call("read", block=4)
+
+    def test_stalled_client_is_dropped(self):
+        """Test a client that stops reading is disconnected after the send timeout"""
+        server_side, client_side = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(client_side.close)
+        self.addCleanup(server_side.close)
+        client = _Client(1, server_side, send_timeout=0.05)
+        start = time.monotonic()
+        while client.send({"data": "00" * 65536}):
+            self.assertLess(time.monotonic() - start, 5.0)
+        self.assertFalse(client.connected)
+
+    def test_refuses_running_socket(self):
+        """Test a second service does not take over a socket still in use"""
+        second = ReaderService(self.card_operations, self.auth_manager, self.service.path)
+        with self.assertRaises(ReaderServiceError):
+            second.start()
+        self.assertIn("requests_served", self.connect().call("metrics"))
+
+        # A socket file left behind by a crashed service is replaced
+        self.service.stop()
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(str(self.service.path))
+        stale.close()
+        self.service.start()
+        self.assertIn("present", self.connect().call("detect"))
+
+if __name__ == '__main__':
+    unittest.main()
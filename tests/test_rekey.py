@@ -0,0 +1,161 @@
+"""
+Tests for fleet rekeying
+"""
+
+import json
+import tempfile
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.constants import CARD_TYPE_MIFARE_4K, DEFAULT_KEY, KEY_TYPE_A, KEY_TYPE_B
+from core.access_conditions import encode_access_bits
+from core.authentication import AuthenticationManager
+from core.card_operations import CardOperations
+from core.key_diversification import AesCmacDiversifier, KeyDerivationEngine
+from core.rekey import (
+    AccessProfile, RekeyError, RekeyJob, RekeyJournal,
+    EVENT_ALREADY, EVENT_DONE, EVENT_FAILED, EVENT_VERIFIED
+)
+from tests.card_emulator import EmulatedCard, create_emulated_reader, TRANSPORT_ACCESS
+
+NEW_KEY_A = bytes.fromhex("112233445566")
+NEW_KEY_B = bytes.fromhex("AABBCCDDEEFF")
+# Data readable with A or B, writable with B; trailer changeable with Key B only
+SITE_ACCESS = bytes.fromhex("7F0788")
+
+def new_key_map(sectors):
+    """Same new keys for every sector"""
+    return {sector: {KEY_TYPE_A: NEW_KEY_A, KEY_TYPE_B: NEW_KEY_B} for sector in sectors}
+
+class TestRekeyJob(unittest.TestCase):
+    """Test cases for RekeyJob on an emulated reader"""
+
+    def setUp(self):
+        """Set up emulated reader"""
+        self.reader_manager, self.connection = create_emulated_reader()
+        self.card_operations = CardOperations(self.reader_manager)
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.journal_path = Path(self.temp_dir.name) / "rekey.jsonl"
+
+    def tearDown(self):
+        """Remove journal directory"""
+        self.temp_dir.cleanup()
+
+    def run_cards(self, job, cards, max_cards=None):
+        """Present cards one after another to a line running job"""
+        queue = list(cards)
+        self.connection.present(queue.pop(0))
+
+        def next_card(result):
+            self.connection.remove()
+            if queue:
+                self.connection.present(queue.pop(0))
+
+        line = job.create_line(self.card_operations, self.auth_manager, on_result=next_card,
+                               signal=False, poll_interval=0.001)
+        return line.run(max_cards=max_cards or len(cards))
+
+    def test_rekey_batch(self):
+        """Test every card gets the new trailers and is journaled as done"""
+        cards = [EmulatedCard(uid=bytes([1, 2, 3, i])) for i in range(3)]
+        journal = RekeyJournal(self.journal_path)
+        job = RekeyJob(None, new_key_map([1, 2]), AccessProfile(SITE_ACCESS), journal=journal)
+        stats = self.run_cards(job, cards)
+
+        self.assertEqual(stats["encoded"], 3)
+        for card in cards:
+            self.assertEqual(card.get_block(7), NEW_KEY_A + SITE_ACCESS + b"\x69" + NEW_KEY_B)
+            self.assertEqual(card.get_block(11)[0:6], NEW_KEY_A)
+            self.assertEqual(card.get_block(3)[0:6], DEFAULT_KEY)
+        self.assertEqual(RekeyJournal(self.journal_path).completed_uids(), {card.uid for card in cards})
+        self.assertEqual(journal.get(cards[0].uid)["sectors"], {1: EVENT_VERIFIED, 2: EVENT_VERIFIED})
+
+    def test_diversified_keys(self):
+        """Test old and new keys derived per UID"""
+        old_engine = KeyDerivationEngine(AesCmacDiversifier(bytes(16)))
+        new_engine = KeyDerivationEngine(AesCmacDiversifier(bytes(range(16))))
+        cards = [EmulatedCard(uid=bytes([4, 5, 6, i])) for i in range(2)]
+        for card in cards:
+            keys = old_engine.derive_card_keys(card.uid)[1]
+            card.set_trailer(1, keys[KEY_TYPE_A], TRANSPORT_ACCESS, keys[KEY_TYPE_B])
+        job = RekeyJob(old_engine, new_engine, sectors=[1])
+        stats = self.run_cards(job, cards)
+
+        self.assertEqual(stats["encoded"], 2)
+        for card in cards:
+            keys = new_engine.derive_card_keys(card.uid)[1]
+            self.assertEqual(card.get_block(7)[0:6], keys[KEY_TYPE_A])
+
+    def test_4k_sector_layout(self):
+        """Test sectors 32-39 of a 4K card are rekeyed through their own trailer block"""
+        card = EmulatedCard(sectors=40)
+        card.set_block(135, bytes([0x35]) * 16)
+        with self.assertRaises(RekeyError):
+            RekeyJob(None, new_key_map([33]), AccessProfile(SITE_ACCESS))
+        job = RekeyJob(None, new_key_map([33]), AccessProfile(SITE_ACCESS), card_type=CARD_TYPE_MIFARE_4K)
+        stats = self.run_cards(job, [card])
+
+        self.assertEqual(stats["encoded"], 1)
+        self.assertEqual(card.get_block(card.trailer_block(33)), NEW_KEY_A + SITE_ACCESS + b"\x69" + NEW_KEY_B)
+        self.assertEqual(card.trailer_block(33), 159)
+        # Sector 32 is untouched
+        self.assertEqual(card.get_block(135), bytes([0x35]) * 16)
+
+    def test_resume_half_rekeyed_card(self):
+        """Test a card interrupted after some sectors is finished on the next pass"""
+        card = EmulatedCard()
+        card.set_trailer(1, NEW_KEY_A, SITE_ACCESS, NEW_KEY_B)
+        journal = RekeyJournal(self.journal_path)
+        journal.record(card.uid, "start")
+        journal.record(card.uid, "written", 1)
+        journal.record(card.uid, EVENT_FAILED, error="write failed")
+
+        journal = RekeyJournal(self.journal_path)
+        self.assertEqual(journal.incomplete_uids(), {card.uid})
+        job = RekeyJob({}, new_key_map([1, 2]), AccessProfile(SITE_ACCESS), journal=journal)
+        stats = self.run_cards(job, [card])
+
+        self.assertEqual(stats["encoded"], 1)
+        self.assertEqual(card.get_block(11)[0:6], NEW_KEY_A)
+        self.assertEqual(journal.get(card.uid)["status"], EVENT_DONE)
+        self.assertEqual(journal.incomplete_uids(), set())
+        events = [json.loads(line)["event"] for line in self.journal_path.read_text().splitlines()]
+        self.assertIn(EVENT_ALREADY, events)
+
+    def test_unknown_keys_fail_and_completed_cards_skip(self):
+        """Test a card with unknown keys is journaled failed and done cards are skipped"""
+        done = EmulatedCard(uid=bytes([7, 7, 7, 7]))
+        foreign = EmulatedCard(uid=bytes([8, 8, 8, 8]))
+        foreign.set_trailer(2, bytes(6), TRANSPORT_ACCESS, bytes(6))
+        journal = RekeyJournal()
+        journal.record(done.uid, EVENT_DONE)
+        job = RekeyJob(None, new_key_map([1, 2]), journal=journal)
+        stats = self.run_cards(job, [done, foreign], max_cards=1)
+
+        self.assertEqual(stats["duplicates"], 1)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(done.get_block(7)[0:6], DEFAULT_KEY)
+        state = journal.get(foreign.uid)
+        self.assertEqual(state["status"], EVENT_FAILED)
+        self.assertEqual(state["sectors"], {1: "written"})
+
+    def test_configuration_checks(self):
+        """Test invalid access bits, missing keys and lock warnings"""
+        with self.assertRaises(RekeyError):
+            AccessProfile(bytes.fromhex("FFFFFF"))
+        with self.assertRaises(RekeyError):
+            RekeyJob(None, {1: {KEY_TYPE_A: NEW_KEY_A}})
+        with self.assertRaises(RekeyError):
+            # Card size is not detected, so diversified keys need the sectors spelled out
+            RekeyJob(None, KeyDerivationEngine(AesCmacDiversifier(bytes(16))))
+        job = RekeyJob(None, new_key_map([1]), AccessProfile(sector_access={1: encode_access_bits([0, 0, 0, 7])}))
+        summary = "\n".join(job.describe())
+        self.assertIn("Sectors: 1", summary)
+        self.assertIn("PERMANENTLY", summary)
+
+if __name__ == '__main__':
+    unittest.main()
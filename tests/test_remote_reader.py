@@ -0,0 +1,171 @@
+"""
+Tests for the remote reader bridge over TCP
+"""
+
+import time
+import unittest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from smartcard.Exceptions import CardConnectionException
+
+from config.constants import KEY_TYPE_A, DEFAULT_KEY
+from core.authentication import AuthenticationManager
+from core.card_operations import CardOperations
+from core.card_template import CardTemplate, compile_template
+from core.dump import DumpEngine
+from core.reader_manager import ApduBatchError, ReaderManager, ReaderStatus
+from core.remote_reader import ReaderBridgeAgent, RemoteConnection
+from tests.card_emulator import EmulatedCard, create_emulated_reader, TRANSPORT_ACCESS
+
+SECRET_KEY = bytes.fromhex("A0A1A2A3A4A5")
+FULL_KEY_MAP = {sector: {KEY_TYPE_A: DEFAULT_KEY} for sector in range(16)}
+
+class TestRemoteReader(unittest.TestCase):
+    """Test cases for a ReaderManager talking to a localhost agent in front of the emulator"""
+
+    def setUp(self):
+        """Start an agent on an ephemeral port and connect a remote reader to it"""
+        self.card = EmulatedCard()
+        for block in range(1, 64):
+            if (block + 1) % 4:
+                self.card.set_block(block, bytes([block] * 16))
+        local_manager, self.connection = create_emulated_reader(self.card)
+        self.agent = ReaderBridgeAgent(local_manager, "127.0.0.1", 0)
+        self.agent.start()
+        self.addCleanup(self.agent.stop)
+
+        self.remote = RemoteConnection(*self.agent.address, reconnect_delay=0.01)
+        self.reader_manager = self.remote_manager(self.remote)
+        self.card_operations = CardOperations(self.reader_manager)
+        self.auth_manager = AuthenticationManager(self.reader_manager, self.card_operations)
+
+    def remote_manager(self, connection):
+        """Use connection in a ReaderManager without the monitoring thread"""
+        reader_manager = ReaderManager()
+        reader_manager.connection = connection
+        reader_manager.reader = connection.name
+        reader_manager.status = ReaderStatus.CONNECTED
+        self.addCleanup(connection.disconnect)
+        return reader_manager
+
+    def test_dump_one_round_trip_per_sector(self):
+        """Test a full dump crosses the network once per sector"""
+        self.assertTrue(self.card_operations.detect_card())
+        start = self.remote.round_trips
+
+        image = DumpEngine(self.card_operations, self.auth_manager).dump(FULL_KEY_MAP)
+        self.assertEqual(image.to_bytes(), bytes(self.card.memory))
+        self.assertEqual(self.remote.round_trips - start, 16)
+        self.assertEqual(self.agent.apdus, 1 + 16 * 6)
+
+    def test_failed_auth_and_reactivation(self):
+        """Test a rejected key ends its batch and the card is reactivated over the bridge"""
+        self.card.set_trailer(1, SECRET_KEY, TRANSPORT_ACCESS, SECRET_KEY)
+        self.assertTrue(self.card_operations.detect_card())
+        engine = DumpEngine(self.card_operations, self.auth_manager)
+
+        image = engine.dump({0: {KEY_TYPE_A: DEFAULT_KEY}, 1: {KEY_TYPE_A: DEFAULT_KEY},
+                             2: {KEY_TYPE_A: DEFAULT_KEY}}, sectors=[0, 1, 2])
+        self.assertEqual(engine.last_report["failed_sectors"], [1])
+        self.assertTrue(image.is_sector_complete(2))
+        # Reads of the rejected sector were never sent
+        self.assertEqual(self.connection.auth_count, 3)
+        self.assertEqual(self.reader_manager.get_reactivation_stats()["count"], 1)
+
+    def test_program_batches(self):
+        """Test a compiled template writes and verifies in one round-trip each"""
+        template = CardTemplate.from_dict({
+            "version": 1, "name": "remote", "card_type": "1k",
+            "sectors": {"1": {"data": {"4": "AB" * 16}}, "2": {"data": {"8": "CD" * 16}}}
+        })
+        program = compile_template(template)
+        self.assertTrue(self.card_operations.detect_card())
+        start = self.remote.round_trips
+
+        result = program.run(self.reader_manager, self.card.uid)
+        self.assertTrue(result.success)
+        self.assertEqual(self.remote.round_trips - start, 2)
+        self.assertEqual(self.card.get_block(8), bytes([0xCD]) * 16)
+
+    def test_card_removed_mid_batch(self):
+        """Test blocks read before the card left are kept"""
+        self.assertTrue(self.card_operations.detect_card())
+        self.connection.remove_after = self.connection.apdu_count + 4
+        image = DumpEngine(self.card_operations, self.auth_manager).dump(FULL_KEY_MAP)
+
+        self.assertTrue(image.has_block(1))
+        self.assertFalse(image.has_block(3))
+        self.assertIsNone(self.reader_manager.poll_card_uid())
+
+    def test_reconnect(self):
+        """Test a dropped connection is re-established on the next request"""
+        self.assertTrue(self.card_operations.detect_card())
+        self.agent.disconnect_clients()
+        time.sleep(0.01)
+
+        self.assertEqual(self.reader_manager.poll_card_uid(), self.card.uid)
+        self.assertEqual(self.remote.reconnects, 1)
+        self.assertEqual(self.reader_manager.get_atr()[:2], bytes([0x3B, 0x8F]))
+
+    def test_no_resend_after_response_timeout(self):
+        """Test a request that reached the agent is not sent again when its response is late"""
+        remote = RemoteConnection(*self.agent.address, response_timeout=0.05, reconnect_delay=0.01)
+        self.addCleanup(remote.disconnect)
+        handle = self.agent.handle
+        calls = []
+
+        def slow_handle(request_type, payload):
+            calls.append(request_type)
+            if len(calls) == 1:
+                time.sleep(0.2)
+            return handle(request_type, payload)
+        self.agent.handle = slow_handle
+
+        with self.assertRaises(CardConnectionException):
+            remote.transmit([0xFF, 0xCA, 0x00, 0x00, 0x00])
+        time.sleep(0.25)
+        self.assertEqual(len(calls), 1)
+        # The next request goes out on a new connection
+        self.assertEqual(bytes(remote.getATR()[:2]), bytes([0x3B, 0x8F]))
+        self.assertEqual(remote.reconnects, 1)
+
+    def test_connect_remote(self):
+        """Test ReaderManager.connect_remote reaches the reader behind the agent"""
+        reader_manager = ReaderManager()
+        self.assertTrue(reader_manager.connect_remote(*self.agent.address, monitor=False))
+        try:
+            info = reader_manager.get_reader_info()
+            self.assertTrue(info["connected"])
+            self.assertEqual(info["firmware_version"], "ACR1252U_EMU")
+            self.assertTrue(info["name"].startswith("tcp://127.0.0.1:"))
+        finally:
+            reader_manager.disconnect()
+        self.assertFalse(ReaderManager().connect_remote("127.0.0.1", 1))
+
+    def test_token_and_control_whitelist(self):
+        """Test an agent with a token rejects clients without it and foreign control codes"""
+        local_manager, _ = create_emulated_reader(self.card)
+        with self.assertRaises(ValueError):
+            ReaderBridgeAgent(local_manager, "0.0.0.0", 0)
+        agent = ReaderBridgeAgent(local_manager, "127.0.0.1", 0, token=b"secret")
+        agent.start()
+        self.addCleanup(agent.stop)
+
+        anonymous = RemoteConnection(*agent.address, reconnect_attempts=0)
+        self.addCleanup(anonymous.disconnect)
+        with self.assertRaises(ApduBatchError):
+            anonymous.getATR()
+        with self.assertRaises(CardConnectionException):
+            RemoteConnection(*agent.address, reconnect_attempts=0, token=b"wrong")
+
+        remote = RemoteConnection(*agent.address, token=b"secret")
+        self.addCleanup(remote.disconnect)
+        self.assertEqual(bytes(remote.getATR()[:2]), bytes([0x3B, 0x8F]))
+        with self.assertRaises(ApduBatchError):
+            remote.control(0x42000000, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -95,6 +95,23 @@ class TestValidators(unittest.TestCase):
         for data in invalid_data:
             is_valid, message = validate_write_data(data)
             self.assertFalse(is_valid, f"Data {data} should be invalid")
+    
+    def test_validate_access_conditions(self):
+        """Test access conditions validation"""
+        valid_access = ["FF0780", "FF 07 80 69", "78:77:88"]
+        for access in valid_access:
+            is_valid, message = validate_access_conditions(access)
+            self.assertTrue(is_valid, f"Access {access} should be valid: {message}")
+        
+        invalid_access = [
+            "",  # Empty
+            "FF07",  # Too short
+            "000000",  # Inconsistent inverted bits
+            "FF0781",  # Inconsistent inverted bits
+        ]
+        for access in invalid_access:
+            is_valid, message = validate_access_conditions(access)
+            self.assertFalse(is_valid, f"Access {access} should be invalid")
 
 if __name__ == '__main__':
     unittest.main()
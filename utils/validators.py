@@ -97,7 +97,7 @@ def validate_write_data(data: str) -> tuple[bool, str]:
 
 def validate_access_conditions(access: str) -> tuple[bool, str]:
     """
-    Validate access conditions format (3 bytes)
+    Validate access conditions (3 access bytes, optionally followed by GPB)
     
     Returns:
         tuple: (is_valid, error_message)
@@ -112,8 +112,13 @@ def validate_access_conditions(access: str) -> tuple[bool, str]:
     if not re.match(r'^[0-9A-F]*$', clean_access):
         return False, "Access conditions must contain only hex characters (0-9, A-F)"
     
-    # Check length (3 bytes = 6 hex characters)
-    if len(clean_access) != 6:
-        return False, "Access conditions must be exactly 3 bytes (6 hex characters)"
+    # Check length (3 bytes = 6 hex characters, 8 with general purpose byte)
+    if len(clean_access) not in (6, 8):
+        return False, "Access conditions must be 3 bytes (6 hex characters) or 4 bytes including GPB"
+    
+    # Check inverted-bit consistency
+    from core.access_conditions import decode_access_bits
+    if decode_access_bits(bytes.fromhex(clean_access[:6])) is None:
+        return False, "Access bits are inconsistent and would lock the sector"
     
     return True, ""